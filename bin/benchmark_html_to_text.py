@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+html_to_text engine benchmark.
+
+Runs every available engine (stdlib reference, pure-Python regex, lxml) over a
+corpus of anonymised email bodies, checks that each engine's (text, links)
+output matches the stdlib reference, and reports throughput.
+
+    python bin/benchmark_html_to_text.py                 # tests/fixtures/emails
+    python bin/benchmark_html_to_text.py --corpus DIR --repeat 50
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARENT_DIR = os.path.dirname(BASE_DIR)
+if PARENT_DIR not in sys.path:
+    sys.path.insert(0, PARENT_DIR)
+
+from toolbox.services.email_extractor import html_text
+
+DEFAULT_CORPUS = os.path.join(BASE_DIR, 'tests', 'fixtures', 'emails')
+
+
+def available_engines() -> dict:
+    engines = {
+        'stdlib': html_text.html_to_text_stdlib,
+        'regex': html_text.html_to_text_regex,
+    }
+    if html_text._etree is not None:
+        engines['lxml'] = html_text.html_to_text_lxml
+    return engines
+
+
+def load_corpus(path: str) -> dict:
+    corpus = {}
+    for file_path in sorted(glob.glob(os.path.join(path, '*.htm*'))):
+        with open(file_path, encoding='utf-8', errors='replace') as f:
+            corpus[os.path.basename(file_path)] = f.read()
+    return corpus
+
+
+def check_equivalence(corpus: dict, engines: dict) -> dict:
+    """{engine: [names of documents whose output differs from stdlib]}."""
+    reference = {name: html_text.html_to_text_stdlib(html) for name, html in corpus.items()}
+    return {
+        engine: [name for name, html in corpus.items() if fn(html) != reference[name]]
+        for engine, fn in engines.items()
+    }
+
+
+def time_engine(fn, corpus: dict, repeat: int) -> float:
+    """Seconds to convert the whole corpus `repeat` times."""
+    docs = list(corpus.values())
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in docs:
+            fn(html)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark html_to_text engines over an email corpus.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Directory of .html email bodies")
+    parser.add_argument("--repeat", type=int, default=20, help="Passes over the corpus per engine")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print(f"No .html files in {args.corpus}")
+        sys.exit(1)
+    total_bytes = sum(len(html.encode('utf-8')) for html in corpus.values())
+    engines = available_engines()
+
+    print(f"Corpus: {len(corpus)} emails, {total_bytes / 1024:.1f} KiB, {args.repeat} passes")
+    mismatches = check_equivalence(corpus, engines)
+    baseline = None
+    print(f"{'engine':<8} {'docs/s':>10} {'MiB/s':>8} {'speedup':>8}  output")
+    for engine, fn in engines.items():
+        elapsed = time_engine(fn, corpus, args.repeat)
+        baseline = baseline or elapsed
+        docs_per_sec = len(corpus) * args.repeat / elapsed
+        mib_per_sec = total_bytes * args.repeat / elapsed / (1024 * 1024)
+        output = "identical" if not mismatches[engine] else f"differs: {', '.join(mismatches[engine])}"
+        print(f"{engine:<8} {docs_per_sec:>10.0f} {mib_per_sec:>8.2f} {baseline / elapsed:>7.1f}x  {output}")
+
+    if any(mismatches.values()):
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Cold-start import time regression check.
+
+Imports each module in a fresh interpreter under `python -X importtime`, takes
+the median cumulative time over several runs and compares it with a budget.
+Exits 1 if any module is over budget, so it can gate changes that reintroduce
+eager SDK imports or import-time file reads on the short systemd timers
+(heartbeat, inbox scanner, classifier).
+
+    python bin/benchmark_import_time.py
+    python bin/benchmark_import_time.py --runs 9 --budget toolbox.lib.llm_gateway=150
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARENT_DIR = os.path.dirname(BASE_DIR)
+
+# Milliseconds, cumulative (the module and everything it imports)
+IMPORT_BUDGETS_MS = {
+    'toolbox.lib.llm_gateway': 250,
+    'toolbox.lib.drive_utils': 150,
+}
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|\s*(\S+)\s*$')
+
+
+def parse_importtime(stderr: str, module: str) -> int:
+    """Cumulative microseconds for `module` from -X importtime output."""
+    for line in stderr.splitlines():
+        m = _IMPORTTIME_LINE.match(line)
+        if m and m.group(3) == module:
+            return int(m.group(2))
+    raise ValueError(f"{module} not found in importtime output")
+
+
+def cold_import_ms(module: str, python: str = sys.executable) -> float:
+    """Import time of `module` in a fresh interpreter, in milliseconds."""
+    proc = subprocess.run(
+        [python, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PARENT_DIR, capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONPATH': PARENT_DIR},
+    )
+    return parse_importtime(proc.stderr, module) / 1000
+
+
+def measure(modules, runs: int) -> dict:
+    """{module: median cold import ms over `runs` fresh interpreters}."""
+    return {module: statistics.median(cold_import_ms(module) for _ in range(runs)) for module in modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if cold-start import time of key modules exceeds its budget.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module (median is reported)")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="Override or add a budget, e.g. toolbox.lib.llm_gateway=150")
+    args = parser.parse_args()
+
+    budgets = dict(IMPORT_BUDGETS_MS)
+    for item in args.budget:
+        module, _, ms = item.partition('=')
+        budgets[module] = float(ms)
+
+    results = measure(budgets, args.runs)
+    over = []
+    print(f"{'module':<32} {'median ms':>10} {'budget':>8}")
+    for module, ms in results.items():
+        flag = '' if ms <= budgets[module] else '  OVER BUDGET'
+        if flag:
+            over.append(module)
+        print(f"{module:<32} {ms:>10.1f} {budgets[module]:>8.0f}{flag}")
+
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Per-call provider overhead benchmark: fresh provider per call vs pooled.
+
+Before pooling, LLMGateway built a new provider object on every attempt: a new
+genai.Client / OpenAI client for Gemini and DeepSeek, and a bare requests.post
+(new TCP connection) for Ollama. This measures that overhead against the
+pooled instances returned by LLMGateway._get_provider_instance:
+
+  - client construction for Gemini and DeepSeek (no network);
+  - full Ollama round trips against a local keep-alive server that mimics
+    /api/generate, so connection setup is the only difference.
+
+Loopback numbers are a floor: against remote APIs every fresh client also
+pays DNS, TCP and TLS handshakes.
+
+    python bin/benchmark_provider_overhead.py --calls 200
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARENT_DIR = os.path.dirname(BASE_DIR)
+if PARENT_DIR not in sys.path:
+    sys.path.insert(0, PARENT_DIR)
+
+from toolbox.lib.llm_gateway import LLMGateway
+from toolbox.lib.providers import ollama
+from toolbox.lib.providers.deepseek import DeepSeekProvider
+from toolbox.lib.providers.gemini import GeminiProvider
+
+BENCH_KEY = 'benchmark-key-not-used-for-requests'
+
+
+class _OllamaStub(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive
+    disable_nagle_algorithm = True  # headers and body are separate writes; avoid delayed-ACK stalls
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({"response": '{"ok": true}', "prompt_eval_count": 10, "eval_count": 5}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _per_call_ms(fn, calls: int) -> float:
+    fn()  # warm imports and lazy module state
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1000
+
+
+def _report(label: str, fresh_ms: float, pooled_ms: float):
+    print(f"{label:<28} {fresh_ms:>10.3f} {pooled_ms:>10.3f} {fresh_ms / pooled_ms if pooled_ms else float('inf'):>8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-call provider overhead: fresh clients vs pooled.")
+    parser.add_argument("--calls", type=int, default=200, help="Calls per measurement")
+    args = parser.parse_args()
+
+    gateway = LLMGateway()
+    gateway.gemini_paid_key = gateway.gemini_paid_key or BENCH_KEY
+    gateway.deepseek_key = gateway.deepseek_key or BENCH_KEY
+
+    print(f"{'per call (ms)':<28} {'fresh':>10} {'pooled':>10} {'saving':>9}")
+
+    gemini_cfg = {'name': 'gemini-paid', 'model': 'gemini-2.0-flash'}
+    _report("gemini client setup",
+            _per_call_ms(lambda: GeminiProvider(model_name=gemini_cfg['model'], api_key=gateway.gemini_paid_key), args.calls),
+            _per_call_ms(lambda: gateway._get_provider_instance(gemini_cfg), args.calls))
+
+    deepseek_cfg = {'name': 'deepseek', 'model': 'deepseek-chat'}
+    _report("deepseek client setup",
+            _per_call_ms(lambda: DeepSeekProvider(model_name=deepseek_cfg['model'], api_key=gateway.deepseek_key)._gateway_client(), args.calls),
+            _per_call_ms(lambda: gateway._get_provider_instance(deepseek_cfg)._gateway_client(), args.calls))
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _OllamaStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ollama.OLLAMA_URL = f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+    ollama_cfg = {'name': 'ollama', 'model': 'gemma4:e2b'}
+    prompt, content = "Classify this document.", b"Invoice #1234 from Chase"
+    try:
+        _report("ollama round trip (local)",
+                _per_call_ms(lambda: ollama.OllamaProvider(model_name=ollama_cfg['model']).analyze(content, 'text/plain', prompt), args.calls),
+                _per_call_ms(lambda: gateway._get_provider_instance(ollama_cfg).analyze(content, 'text/plain', prompt), args.calls))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
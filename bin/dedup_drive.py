@@ -34,7 +34,8 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
-from toolbox.lib.drive_utils import get_drive_service
+from toolbox.lib.drive_utils import get_drive_service, resolve_folder_path, DriveBatch
+from toolbox.lib import drive_index
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger('dedup_drive')
@@ -44,25 +45,16 @@ logger = logging.getLogger('dedup_drive')
 
 def resolve_path(service, path: str) -> str:
     """Walk a slash-separated path from Drive root, return folder ID."""
-    parts = path.strip('/').split('/')
-    parent_id = 'root'
-    for part in parts:
-        q = (
-            f"name = '{part}'"
-            f" and mimeType = 'application/vnd.google-apps.folder'"
-            f" and '{parent_id}' in parents"
-            f" and trashed = false"
-        )
-        res = service.files().list(q=q, spaces='drive', fields='files(id, name)').execute()
-        files = res.get('files', [])
-        if not files:
-            raise ValueError(f"Folder not found: '{part}' (in path '{path}')")
-        parent_id = files[0]['id']
-    return parent_id
+    folder_id = resolve_folder_path(service, path, create=False)
+    if not folder_id:
+        raise ValueError(f"Folder not found: '{path}'")
+    return folder_id
 
 
 def list_files(service, folder_id: str) -> list[dict]:
     """List all non-trashed files (not folders) in a folder, handling pagination."""
+    if drive_index.is_fresh():
+        return drive_index.list_children(folder_id, folders=False)
     results = []
     page_token = None
     while True:
@@ -81,19 +73,51 @@ def list_files(service, folder_id: str) -> list[dict]:
     return results
 
 
-def trash_file(service, file_id: str, execute: bool) -> None:
+def trash_file(service, file_id: str, execute: bool, batch: DriveBatch | None = None) -> None:
     if execute:
-        service.files().update(fileId=file_id, body={'trashed': True}).execute()
+        request = service.files().update(fileId=file_id, body={'trashed': True})
+        if batch is not None:
+            batch.add(f'trash:{file_id}', request)
+            return
+        request.execute()
+        drive_index.forget_files([file_id])
 
 
-def move_file(service, file_id: str, source_id: str, target_id: str, execute: bool) -> None:
+def move_file(service, file_id: str, source_id: str, target_id: str, execute: bool,
+              batch: DriveBatch | None = None) -> None:
     if execute:
-        service.files().update(
+        request = service.files().update(
             fileId=file_id,
             addParents=target_id,
             removeParents=source_id,
             fields='id, parents',
-        ).execute()
+        )
+        if batch is not None:
+            batch.add(f'move:{file_id}', request)
+            return
+        request.execute()
+        drive_index.record_files([{'id': file_id, 'parents': [target_id]}])
+
+
+def flush_batch(batch: DriveBatch) -> tuple[int, int]:
+    """Execute queued trash/move requests; returns (succeeded, failed)."""
+    if not len(batch):
+        return 0, 0
+    ok = failed = 0
+    trashed_ids = []
+    for key, outcome in batch.execute().items():
+        action, file_id = key.split(':', 1)
+        if not outcome.ok:
+            logger.error(f'  {action} failed for {file_id}: {outcome.error}')
+            failed += 1
+            continue
+        ok += 1
+        if action == 'trash':
+            trashed_ids.append(file_id)
+        else:
+            drive_index.record_files([{'id': file_id, 'parents': outcome.response.get('parents', [])}])
+    drive_index.forget_files(trashed_ids)
+    return ok, failed
 
 
 def folder_is_empty(service, folder_id: str) -> bool:
@@ -129,6 +153,7 @@ def dedup_within_folder(service, folder_path: str, execute: bool) -> None:
         logger.info('No duplicates found.')
         return
 
+    batch = DriveBatch(service) if execute else None
     trashed = 0
     for name, group in sorted(dup_groups.items()):
         # Sort by modifiedTime descending — keep first (newest)
@@ -142,9 +167,12 @@ def dedup_within_folder(service, folder_path: str, execute: bool) -> None:
         )
         for f in rest:
             logger.info(f'  {"TRASH" if execute else "would trash"}: {f["id"]} ({f.get("modifiedTime", "")[:10]})')
-            trash_file(service, f['id'], execute)
+            trash_file(service, f['id'], execute, batch)
             trashed += 1
 
+    if batch is not None:
+        _, failed = flush_batch(batch)
+        trashed -= failed
     action = 'Trashed' if execute else 'Would trash'
     logger.info(f'{action} {trashed} duplicate files.')
 
@@ -167,20 +195,23 @@ def consolidate_folders(service, source_path: str, target_path: str, execute: bo
 
     target_names: set[str] = {f['name'] for f in target_files}
 
+    batch = DriveBatch(service) if execute else None
     trashed = moved = 0
     for f in sorted(source_files, key=lambda x: x['name']):
         name = f['name']
         if name in target_names:
             logger.info(f'  {"TRASH" if execute else "would trash"} (exists in target): {name}')
-            trash_file(service, f['id'], execute)
+            trash_file(service, f['id'], execute, batch)
             trashed += 1
         else:
             logger.info(f'  {"MOVE" if execute else "would move"}: {name}')
-            move_file(service, f['id'], source_id, target_id, execute)
+            move_file(service, f['id'], source_id, target_id, execute, batch)
             moved += 1
 
+    failed = flush_batch(batch)[1] if batch is not None else 0
+
     action = '' if execute else ' (dry-run)'
-    logger.info(f'{action} Done: {trashed} trashed, {moved} moved.')
+    logger.info(f'{action} Done: {trashed} trashed, {moved} moved.' + (f' {failed} failed.' if failed else ''))
 
     if execute and folder_is_empty(service, source_id):
         logger.info(f'Source folder is now empty — trashing it: {source_path}')
@@ -207,6 +238,11 @@ def main():
     logger.info(f'Mode: {mode}')
 
     service = get_drive_service()
+    try:
+        # A one-off CLI never starts a full-drive crawl; without an index it lists live
+        drive_index.sync(service, bootstrap_if_missing=False)
+    except Exception as e:
+        logger.warning(f'Drive index sync failed, using live listings: {e}')
 
     if args.folder:
         dedup_within_folder(service, args.folder, args.execute)
@@ -26,7 +26,8 @@ for p in (BASE_DIR, REPO_ROOT):
     if p not in sys.path:
         sys.path.insert(0, p)
 
-from toolbox.lib.drive_utils import get_drive_service
+from toolbox.lib.drive_utils import get_drive_service, resolve_folder_path
+from toolbox.lib import memory_index
 from toolbox.lib.telegram import send_message, escape
 from googleapiclient.http import MediaIoBaseUpload
 
@@ -39,30 +40,19 @@ MEMORY_ROOT_PATH = '01 - Second Brain/Memory'
 
 def _resolve_folder(service, path: str) -> str:
     """Resolve a slash-separated path to a folder ID, starting from root."""
-    parent = 'root'
-    for part in path.strip('/').split('/'):
-        q = (f"'{parent}' in parents and name = '{part}' "
-             f"and mimeType = 'application/vnd.google-apps.folder' and trashed = false")
-        results = service.files().list(q=q, fields='files(id)').execute()
-        files = results.get('files', [])
-        if not files:
-            raise FileNotFoundError(f"Folder not found: {part} (under {parent})")
-        parent = files[0]['id']
-    return parent
+    folder_id = resolve_folder_path(service, path, create=False)
+    if not folder_id:
+        raise FileNotFoundError(f"Folder not found: {path}")
+    return folder_id
 
 
 def _list_md_files(service, folder_id: str) -> list[dict]:
-    """Return all .md files in folder_id as list of {id, name}."""
+    """Return all .md files in folder_id as list of {id, name, md5Checksum}."""
     q = f"'{folder_id}' in parents and name contains '.md' and trashed = false"
-    results = service.files().list(q=q, fields='files(id, name)').execute()
+    results = service.files().list(q=q, fields='files(id, name, md5Checksum)').execute()
     return results.get('files', [])
 
 
-def _download(service, file_id: str) -> str:
-    raw = service.files().get_media(fileId=file_id).execute()
-    return raw.decode('utf-8') if isinstance(raw, bytes) else raw
-
-
 def _upload(service, file_id: str, content: str, dry_run: bool) -> None:
     if dry_run:
         return
@@ -183,9 +173,17 @@ def dedup_content(content: str, key_fn) -> tuple[str, int]:
 
 # ── Per-category runners ─────────────────────────────────────────────────────
 
-def dedup_file(service, file_id: str, filename: str, key_fn, dry_run: bool) -> int:
-    """Download, dedup, and re-upload one file. Returns number of blocks removed."""
-    content = _download(service, file_id)
+def dedup_file(service, file_id: str, filename: str, key_fn, dry_run: bool, md5: str | None = None) -> int:
+    """
+    Dedup and re-upload one file. Returns number of blocks removed.
+    Files the memory block index already saw clean at their current checksum are
+    skipped without downloading; otherwise the content comes from the index.
+    """
+    if memory_index.is_deduped(file_id, md5):
+        logger.debug(f'  {filename}: unchanged since last clean pass')
+        return 0
+    index, _ = memory_index.fetch(service, file_id, {'md5Checksum': md5} if md5 else None)
+    content = index.content
     if not content.strip():
         return 0
     cleaned, removed = dedup_content(content, key_fn)
@@ -193,6 +191,11 @@ def dedup_file(service, file_id: str, filename: str, key_fn, dry_run: bool) -> i
         logger.info(f'  {filename}: {removed} duplicate(s) removed'
                     + (' [dry-run, not uploading]' if dry_run else ''))
         _upload(service, file_id, cleaned, dry_run)
+        if dry_run:
+            return removed
+        index = memory_index.FileIndex.from_content(cleaned)
+        memory_index.save(file_id, index)
+    memory_index.mark_deduped(file_id, index.current_checksum())
     return removed
 
 
@@ -204,7 +207,7 @@ def run_travel(service, dry_run: bool) -> dict:
     if not travel:
         logger.info('  Travel.md not found, skipping')
         return {}
-    removed = dedup_file(service, travel['id'], 'Travel.md', _travel_key, dry_run)
+    removed = dedup_file(service, travel['id'], 'Travel.md', _travel_key, dry_run, travel.get('md5Checksum'))
     return {'Travel.md': removed}
 
 
@@ -218,7 +221,7 @@ def run_orders(service, dry_run: bool) -> dict:
     files = _list_md_files(service, folder_id)
     results = {}
     for f in files:
-        removed = dedup_file(service, f['id'], f['name'], _order_key, dry_run)
+        removed = dedup_file(service, f['id'], f['name'], _order_key, dry_run, f.get('md5Checksum'))
         results[f['name']] = removed
     return results
 
@@ -233,7 +236,7 @@ def run_receipts(service, dry_run: bool) -> dict:
     files = _list_md_files(service, folder_id)
     results = {}
     for f in files:
-        removed = dedup_file(service, f['id'], f['name'], _receipt_key, dry_run)
+        removed = dedup_file(service, f['id'], f['name'], _receipt_key, dry_run, f.get('md5Checksum'))
         results[f['name']] = removed
     return results
 
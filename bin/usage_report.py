@@ -2,8 +2,10 @@
 """
 Gemini spend reporting helper.
 
-Reads the shared cost ledger and summarizes Gemini usage by source so OpenClaw
-and Python script/service callers can be compared without a separate spend log.
+Summarizes Gemini usage by source from the shared cost ledger so OpenClaw and
+Python script/service callers can be compared without a separate spend log.
+Totals come from the incremental rollups in lib/usage_rollup, so a report only
+parses ledger lines appended since the last one.
 """
 import argparse
 import json
@@ -18,17 +20,7 @@ if PARENT_DIR not in sys.path:
     sys.path.insert(0, PARENT_DIR)
 
 from toolbox.lib.quota_manager import COST_LOG_PATH
-
-
-def _parse_record_day(record: dict) -> str | None:
-    stamp = record.get("timestamp") or record.get("date")
-    if not stamp:
-        return None
-    try:
-        normalized = stamp.replace("Z", "+00:00")
-        return datetime.fromisoformat(normalized).astimezone(timezone.utc).date().isoformat()
-    except Exception:
-        return stamp[:10] if len(stamp) >= 10 else None
+from toolbox.lib import llm_cache, usage_rollup
 
 
 def _record_source(record: dict) -> str:
@@ -59,7 +51,7 @@ def summarize_cost_records(records: list[dict], days: int = 7) -> dict[str, dict
 
     totals: dict[str, dict[str, float | int]] = defaultdict(lambda: {"records": 0, "tokens": 0, "cost": 0.0})
     for record in records:
-        rec_day = _parse_record_day(record)
+        rec_day = usage_rollup.record_day(record)
         if cutoff and rec_day and rec_day < cutoff:
             continue
 
@@ -88,14 +80,47 @@ def format_summary(totals: dict[str, dict[str, float | int]], days: int = 7) ->
     return "\n".join(lines)
 
 
+def format_routing_summary(totals: dict[str, dict[str, float | int]], days: int = 7) -> str:
+    if not totals:
+        return f"LLM routing ({days}d): no attempts"
+
+    lines = [f"LLM routing ({days}d):"]
+    for provider, data in sorted(totals.items()):
+        lines.append(
+            f"  {provider}: {data['successes']}/{data['attempts']} ok, {data['errors']} errors "
+            f"({data['json_errors']} JSON), {data['cache_hits']} cache hits, "
+            f"p50 {data['p50_sec']:.2f}s, p95 {data['p95_sec']:.2f}s"
+        )
+    return "\n".join(lines)
+
+
+def format_cache_summary(stats: dict[str, dict[str, int]], days: int = 7) -> str:
+    if not stats:
+        return f"LLM cache ({days}d): no lookups"
+
+    lines = [f"LLM cache ({days}d):"]
+    grand_hits = 0
+    grand_lookups = 0
+    for task_type, data in sorted(stats.items()):
+        lookups = data["hits"] + data["misses"]
+        rate = (data["hits"] / lookups * 100) if lookups else 0.0
+        lines.append(f"  {task_type}: {data['hits']}/{lookups} hits ({rate:.1f}%)")
+        grand_hits += data["hits"]
+        grand_lookups += lookups
+    grand_rate = (grand_hits / grand_lookups * 100) if grand_lookups else 0.0
+    lines.append(f"  Total: {grand_hits}/{grand_lookups} hits ({grand_rate:.1f}%)")
+    return "\n".join(lines)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Summarize Gemini spend by source.")
     parser.add_argument("--days", type=int, default=7, help="Number of recent days to include.")
     args = parser.parse_args()
 
-    records = load_cost_records()
-    totals = summarize_cost_records(records, days=args.days)
-    print(format_summary(totals, days=args.days))
+    usage_rollup.refresh()
+    print(format_summary(usage_rollup.cost_totals(days=args.days), days=args.days))
+    print(format_routing_summary(usage_rollup.routing_totals(days=args.days), days=args.days))
+    print(format_cache_summary(llm_cache.get_stats(days=args.days), days=args.days))
 
 
 if __name__ == "__main__":
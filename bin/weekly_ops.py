@@ -15,9 +15,9 @@ import logging
 from datetime import datetime, timezone
 
 from toolbox.lib.drive_utils import get_drive_service, BASE_DIR, CONFIG_PATH
+from toolbox.lib import drive_index, usage_rollup
 from toolbox.lib.telegram import send_message, escape
-from toolbox.lib.quota_manager import COST_LOG_PATH
-from toolbox.bin.usage_report import load_cost_records, summarize_cost_records, format_summary
+from toolbox.bin.usage_report import format_summary
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger("DriveTreeRefresh")
@@ -85,6 +85,12 @@ def crawl_folder(service, folder_id, folder_name, path_to_id, tree, depth=0):
     if not should_recurse(folder_name):
         return
 
+    if drive_index.is_fresh():
+        for child in drive_index.list_children(folder_id, folders=True):
+            child_path = f"{folder_name}/{child['name']}"
+            crawl_folder(service, child['id'], child_path, path_to_id, tree[folder_name]["children"], depth + 1)
+        return
+
     try:
         page_token = None
         while True:
@@ -123,9 +129,10 @@ def get_root_name(service, folder_id):
 
 
 def _weekly_spend_summary() -> str:
-    """Read cost_log.jsonl and return a 7-day spend summary string."""
+    """Roll up new cost_log.jsonl lines and return a 7-day spend summary string."""
     try:
-        totals = summarize_cost_records(load_cost_records(COST_LOG_PATH), days=7)
+        usage_rollup.refresh()
+        totals = usage_rollup.cost_totals(days=7)
         return format_summary(totals, days=7).replace("Gemini spend", "Spend")
     except Exception as e:
         return f"Spend: could not read cost log ({e})"
@@ -141,6 +148,10 @@ def main():
 
     logger.info(f"Connecting to Drive...")
     service = get_drive_service()
+    try:
+        drive_index.sync(service)
+    except Exception as e:
+        logger.warning(f"Drive index sync failed, crawling live: {e}")
 
     path_to_id = {}
     tree = {}
@@ -125,32 +125,10 @@ def load_health_folder_id():
 
 def get_or_create_drive_folder(service, subfolder_path, parent_id):
     """Create nested subfolders under an existing parent folder. Returns folder ID."""
-    parts = subfolder_path.split("/")
+    # Resolved through the shared toolbox folder path cache (sys.path set up by get_drive_service)
+    from toolbox.lib.drive_utils import resolve_folder_path
 
-    for folder_name in parts:
-        query = (
-            f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' "
-            f"and '{parent_id}' in parents and trashed=false"
-        )
-        results = service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get("files", [])
-
-        if files:
-            parent_id = files[0]["id"]
-        else:
-            file_metadata = {
-                "name": folder_name,
-                "mimeType": "application/vnd.google-apps.folder",
-                "parents": [parent_id],
-            }
-            folder = service.files().create(body=file_metadata, fields="id").execute()
-            parent_id = folder["id"]
-            logger.info("Created Drive folder: %s", folder_name)
-
-    return parent_id
-
-
-    return parent_id
+    return resolve_folder_path(service, subfolder_path, parent_id)
 
 
 def move_file_to_folder(service, file_id, current_parent_id, target_folder_id):
@@ -25,9 +25,13 @@ def analyze_with_gemini(content_bytes: bytes, mime_type: str, filename: str, fol
     """Old signature used by backfill.py"""
     warnings.warn("toolbox.lib.ai_engine.analyze_with_gemini is deprecated.", DeprecationWarning, stacklevel=2)
     from .drive_utils import SORTER_SYSTEM_PROMPT
+    from . import prompt_segments, folder_ranker
+    candidates = folder_ranker.FolderIndex(folder_paths_str.splitlines()).prompt_str(
+        filename, folder_ranker.content_text(content_bytes, mime_type), context_hint,
+    )
     full_prompt = SORTER_SYSTEM_PROMPT.format(
         context_hint=f"{context_hint}\nFILENAME: {filename}",
-        folder_paths=folder_paths_str
+        folder_paths=prompt_segments.schema(candidates)
     )
     data, reasoning, tokens = analyze_file(filename, content_bytes, mime_type, full_prompt)
     return data, tokens
@@ -0,0 +1,465 @@
+"""
+Local index of Drive file metadata, kept current via the Changes API.
+
+A one-time bootstrap lists every non-trashed file once; after that sync()
+replays only the changes since the stored page token. Tools that used to issue
+live files().list queries (backfill queue build, weekly tree crawl, duplicate
+checks, Memory file lookups, dedup_drive) ask the index instead when it is fresh
+and fall back to the live API otherwise.
+
+The same DB holds the folder path -> ID cache behind drive_utils.resolve_folder_path.
+It is seeded from config/drive_tree.json and entries are dropped when the Changes
+feed shows a cached folder was renamed, moved or trashed.
+
+Storage: config/drive_index.db (SQLite, WAL mode, shared across timers)
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger("toolbox.drive_index")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEX_PATH = os.path.join(BASE_DIR, 'config', 'drive_index.db')
+TREE_PATH = os.path.join(BASE_DIR, 'config', 'drive_tree.json')
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+FILE_FIELDS = "id, name, mimeType, md5Checksum, size, modifiedTime, createdTime, parents, trashed"
+DEFAULT_MAX_AGE_SEC = 15 * 60       # listings used to decide moves/dedup
+LOOKUP_MAX_AGE_SEC = 2 * 3600       # positive name lookups (misses are re-checked live)
+SQL_PARAM_CHUNK = 900               # bound IN (...) lists under SQLite's 999-parameter limit
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    md5 TEXT,
+    size INTEGER,
+    modified_time TEXT,
+    created_time TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_name ON files(name);
+CREATE TABLE IF NOT EXISTS file_parents (
+    file_id TEXT NOT NULL,
+    parent_id TEXT NOT NULL,
+    PRIMARY KEY (file_id, parent_id)
+);
+CREATE INDEX IF NOT EXISTS idx_file_parents_parent ON file_parents(parent_id);
+CREATE TABLE IF NOT EXISTS folder_paths (
+    base_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    folder_id TEXT NOT NULL,
+    PRIMARY KEY (base_id, path)
+);
+CREATE INDEX IF NOT EXISTS idx_folder_paths_folder ON folder_paths(folder_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+    conn = sqlite3.connect(INDEX_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _get_meta(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value) -> None:
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, None if value is None else str(value)))
+
+
+def _upsert(conn: sqlite3.Connection, files: Iterable[dict]) -> int:
+    count = 0
+    for f in files:
+        if f.get('trashed'):
+            _delete(conn, [f['id']])
+            continue
+        size = f.get('size')
+        conn.execute(
+            "INSERT OR REPLACE INTO files (id, name, mime_type, md5, size, modified_time, created_time) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (f['id'], f.get('name', ''), f.get('mimeType', ''), f.get('md5Checksum'),
+             int(size) if size is not None else None, f.get('modifiedTime'), f.get('createdTime')),
+        )
+        if 'parents' in f:
+            conn.execute("DELETE FROM file_parents WHERE file_id = ?", (f['id'],))
+            conn.executemany("INSERT OR IGNORE INTO file_parents (file_id, parent_id) VALUES (?, ?)",
+                             [(f['id'], p) for p in f.get('parents') or []])
+        count += 1
+    return count
+
+
+def _delete(conn: sqlite3.Connection, file_ids: Iterable[str]) -> None:
+    for fid in file_ids:
+        conn.execute("DELETE FROM files WHERE id = ?", (fid,))
+        conn.execute("DELETE FROM file_parents WHERE file_id = ?", (fid,))
+
+
+def _row_to_file(conn: sqlite3.Connection, row) -> dict:
+    fid, name, mime, md5, size, modified, created = row
+    parents = [r[0] for r in conn.execute("SELECT parent_id FROM file_parents WHERE file_id = ?", (fid,))]
+    f = {"id": fid, "name": name, "mimeType": mime, "parents": parents}
+    if md5 is not None:
+        f["md5Checksum"] = md5
+    if size is not None:
+        f["size"] = str(size)
+    if modified is not None:
+        f["modifiedTime"] = modified
+    if created is not None:
+        f["createdTime"] = created
+    return f
+
+
+def _folder_relocated(conn: sqlite3.Connection, f: dict) -> bool:
+    """True if a changed folder was trashed, renamed or re-parented relative to the index."""
+    if f.get('trashed'):
+        return True
+    row = conn.execute("SELECT name FROM files WHERE id = ?", (f['id'],)).fetchone()
+    if row is None:
+        # Not indexed (e.g. mid-bootstrap); only a cached path entry would care
+        return conn.execute("SELECT 1 FROM folder_paths WHERE folder_id = ? LIMIT 1", (f['id'],)).fetchone() is not None
+    if 'name' in f and f['name'] != row[0]:
+        return True
+    if 'parents' in f:
+        parents = {r[0] for r in conn.execute("SELECT parent_id FROM file_parents WHERE file_id = ?", (f['id'],))}
+        return parents != set(f['parents'] or [])
+    return False
+
+
+def _invalidate_folders(conn: sqlite3.Connection, folder_ids: Iterable[str]) -> None:
+    """Drop cached paths that resolve to (or through) the given folders."""
+    for fid in folder_ids:
+        for base_id, path in conn.execute("SELECT base_id, path FROM folder_paths WHERE folder_id = ?", (fid,)).fetchall():
+            conn.execute("DELETE FROM folder_paths WHERE base_id = ? AND (path = ? OR substr(path, 1, ?) = ?)",
+                         (base_id, path, len(path) + 1, path + '/'))
+        conn.execute("DELETE FROM folder_paths WHERE base_id = ?", (fid,))
+
+
+# ---------------------------------------------------------------------------
+# Sync
+# ---------------------------------------------------------------------------
+
+def bootstrap(service) -> int:
+    """Full listing of every non-trashed file. Returns the number of files indexed."""
+    # Take the cursor first so anything changed during the crawl is replayed by the next sync
+    start_token = service.changes().getStartPageToken().execute()['startPageToken']
+    conn = _connect()
+    total = 0
+    try:
+        with conn:
+            # Clearing meta drops synced_at, so readers fall back to live queries mid-bootstrap
+            conn.execute("DELETE FROM meta")
+            conn.execute("DELETE FROM folder_paths")
+            conn.execute("DELETE FROM files")
+            conn.execute("DELETE FROM file_parents")
+        page_token = None
+        while True:
+            params = {
+                "q": "trashed = false",
+                "spaces": "drive",
+                "fields": f"nextPageToken, files({FILE_FIELDS})",
+                "pageSize": 1000,
+            }
+            if page_token:
+                params["pageToken"] = page_token
+            result = service.files().list(**params).execute()
+            with conn:
+                total += _upsert(conn, result.get('files', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+        with conn:
+            _set_meta(conn, 'page_token', start_token)
+            _set_meta(conn, 'bootstrapped_at', time.time())
+            _set_meta(conn, 'synced_at', time.time())
+    finally:
+        conn.close()
+    logger.info(f"Drive index bootstrapped: {total} files")
+    return total
+
+
+def apply_changes(changes: Iterable[dict], new_token: Optional[str] = None) -> None:
+    """Apply a page of changes().list results (callers that already fetched changes can feed them in)."""
+    conn = _connect()
+    try:
+        with conn:
+            for change in changes:
+                f = change.get('file')
+                if change.get('removed') or not f:
+                    fid = change.get('fileId') or (f or {}).get('id')
+                    _invalidate_folders(conn, [fid])
+                    _delete(conn, [fid])
+                else:
+                    if f.get('mimeType') == FOLDER_MIME and _folder_relocated(conn, f):
+                        _invalidate_folders(conn, [f['id']])
+                    _upsert(conn, [f])
+            if new_token:
+                _set_meta(conn, 'page_token', new_token)
+    finally:
+        conn.close()
+
+
+def sync(service, bootstrap_if_missing: bool = True) -> int:
+    """
+    Bring the index up to date from the stored Changes cursor. Bootstraps on first use.
+    Returns the number of changes applied (or files indexed by a bootstrap).
+    """
+    conn = _connect()
+    try:
+        token = _get_meta(conn, 'page_token')
+    finally:
+        conn.close()
+    if not token:
+        return bootstrap(service) if bootstrap_if_missing else 0
+
+    applied = 0
+    while token:
+        result = service.changes().list(
+            pageToken=token,
+            fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))",
+            spaces='drive',
+            pageSize=1000,
+        ).execute()
+        changes = result.get('changes', [])
+        new_start = result.get('newStartPageToken')
+        token = result.get('nextPageToken')
+        apply_changes(changes, token or new_start)
+        applied += len(changes)
+
+    conn = _connect()
+    try:
+        with conn:
+            _set_meta(conn, 'synced_at', time.time())
+    finally:
+        conn.close()
+    if applied:
+        logger.info(f"Drive index synced: {applied} changes")
+    return applied
+
+
+def record_files(files: Iterable[dict]) -> None:
+    """
+    Write-through for our own mutations (create/rename/move) so the index stays fresh
+    between syncs. Partial dicts (e.g. {"id", "name"} after a rename) are merged into
+    the existing row.
+    """
+    conn = _connect()
+    try:
+        with conn:
+            for f in files:
+                row = conn.execute(
+                    "SELECT id, name, mime_type, md5, size, modified_time, created_time FROM files WHERE id = ?",
+                    (f['id'],),
+                ).fetchone()
+                if row:
+                    merged = {**_row_to_file(conn, row), **f}
+                    if merged['mimeType'] == FOLDER_MIME and _folder_relocated(conn, merged):
+                        _invalidate_folders(conn, [f['id']])
+                    _upsert(conn, [merged])
+                elif f.get('name'):
+                    _upsert(conn, [f])
+    except sqlite3.Error as e:
+        logger.warning(f"Drive index write-through failed: {e}")
+    finally:
+        conn.close()
+
+
+def forget_files(file_ids: Iterable[str]) -> None:
+    """Drop files we trashed or deleted ourselves."""
+    conn = _connect()
+    try:
+        with conn:
+            file_ids = list(file_ids)
+            _invalidate_folders(conn, file_ids)
+            _delete(conn, file_ids)
+    except sqlite3.Error as e:
+        logger.warning(f"Drive index write-through failed: {e}")
+    finally:
+        conn.close()
+
+
+def is_fresh(max_age_sec: float = DEFAULT_MAX_AGE_SEC) -> bool:
+    """True if the index exists and was synced within max_age_sec."""
+    if not os.path.exists(INDEX_PATH):
+        return False
+    try:
+        conn = _connect()
+        try:
+            synced_at = _get_meta(conn, 'synced_at')
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Drive index unavailable: {e}")
+        return False
+    return synced_at is not None and time.time() - float(synced_at) <= max_age_sec
+
+
+# ---------------------------------------------------------------------------
+# Queries (return dicts shaped like files().list results)
+# ---------------------------------------------------------------------------
+
+def list_children(parent_id: str, folders: Optional[bool] = None, name: Optional[str] = None) -> List[Dict]:
+    """Children of parent_id. folders=True/False restricts to folders/non-folders; name filters exactly."""
+    query = ("SELECT f.id, f.name, f.mime_type, f.md5, f.size, f.modified_time, f.created_time "
+             "FROM files f JOIN file_parents p ON p.file_id = f.id WHERE p.parent_id = ?")
+    params: list = [parent_id]
+    if folders is True:
+        query += " AND f.mime_type = ?"
+        params.append(FOLDER_MIME)
+    elif folders is False:
+        query += " AND f.mime_type != ?"
+        params.append(FOLDER_MIME)
+    if name is not None:
+        query += " AND f.name = ?"
+        params.append(name)
+    query += " ORDER BY f.name"
+    conn = _connect()
+    try:
+        return [_row_to_file(conn, row) for row in conn.execute(query, params).fetchall()]
+    finally:
+        conn.close()
+
+
+def get_file(file_id: str) -> Optional[Dict]:
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT id, name, mime_type, md5, size, modified_time, created_time FROM files WHERE id = ?",
+            (file_id,),
+        ).fetchone()
+        return _row_to_file(conn, row) if row else None
+    finally:
+        conn.close()
+
+
+def find_in_folder(parent_id: str, name: str) -> Optional[str]:
+    """ID of the first file named `name` in parent_id, or None."""
+    matches = list_children(parent_id, name=name)
+    return matches[0]['id'] if matches else None
+
+
+def child_names(parent_ids: Iterable[str], limit_per_parent: int = 200) -> Dict[str, List[str]]:
+    """{parent_id: names of its non-folder files, most recently modified first}, capped per parent in SQL."""
+    wanted = list(dict.fromkeys(parent_ids))
+    names: Dict[str, List[str]] = {}
+    if not wanted or not os.path.exists(INDEX_PATH):
+        return names
+    try:
+        conn = _connect()
+        try:
+            for start in range(0, len(wanted), SQL_PARAM_CHUNK):
+                chunk = wanted[start:start + SQL_PARAM_CHUNK]
+                rows = conn.execute(
+                    "SELECT parent_id, name FROM ("
+                    "  SELECT p.parent_id, f.name, ROW_NUMBER() OVER ("
+                    "    PARTITION BY p.parent_id ORDER BY f.modified_time DESC) AS rank"
+                    "  FROM file_parents p JOIN files f ON f.id = p.file_id"
+                    f"  WHERE p.parent_id IN ({','.join('?' * len(chunk))}) AND f.mime_type != ?"
+                    ") WHERE rank <= ? ORDER BY parent_id, rank",
+                    (*chunk, FOLDER_MIME, limit_per_parent),
+                ).fetchall()
+                for parent_id, name in rows:
+                    names.setdefault(parent_id, []).append(name)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Drive index unavailable: {e}")
+        return {}
+    return names
+
+
+# ---------------------------------------------------------------------------
+# Folder path cache
+# ---------------------------------------------------------------------------
+
+def _seed_paths(conn: sqlite3.Connection) -> None:
+    """(Re)load drive_tree.json path_to_id whenever the file changed since the last seed."""
+    try:
+        mtime = str(os.stat(TREE_PATH).st_mtime_ns)
+    except OSError:
+        return
+    if _get_meta(conn, 'paths_seeded') == mtime:
+        return
+    try:
+        with open(TREE_PATH) as f:
+            path_to_id = json.load(f).get('path_to_id', {})
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not seed folder paths from drive_tree.json: {e}")
+        return
+    # Once bootstrapped, skip tree entries the index already knows are gone
+    check = _get_meta(conn, 'bootstrapped_at') is not None
+    with conn:
+        for path, folder_id in path_to_id.items():
+            if check and conn.execute("SELECT 1 FROM files WHERE id = ?", (folder_id,)).fetchone() is None:
+                continue
+            conn.execute("INSERT OR REPLACE INTO folder_paths (base_id, path, folder_id) VALUES ('root', ?, ?)",
+                         (path.strip('/'), folder_id))
+        _set_meta(conn, 'paths_seeded', mtime)
+
+
+def lookup_folder_path(parts: List[str], base_id: str = 'root') -> tuple:
+    """
+    Longest cached prefix of the path segments under base_id.
+    Returns (number of segments resolved, folder id); (0, base_id) when nothing is cached.
+    """
+    if not parts:
+        return 0, base_id
+    prefixes = ['/'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+    try:
+        conn = _connect()
+        try:
+            if base_id == 'root':
+                _seed_paths(conn)
+            rows = dict(conn.execute(
+                f"SELECT path, folder_id FROM folder_paths WHERE base_id = ? AND path IN ({','.join('?' * len(prefixes))})",
+                [base_id, *prefixes],
+            ).fetchall())
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Folder path cache unavailable: {e}")
+        return 0, base_id
+    for depth in range(len(prefixes), 0, -1):
+        if prefixes[depth - 1] in rows:
+            return depth, rows[prefixes[depth - 1]]
+    return 0, base_id
+
+
+def remember_folder_paths(entries: Iterable[tuple], base_id: str = 'root') -> None:
+    """Cache (path, folder_id) pairs resolved under base_id."""
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO folder_paths (base_id, path, folder_id) VALUES (?, ?, ?)",
+                                 [(base_id, path.strip('/'), fid) for path, fid in entries])
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Folder path cache write failed: {e}")
+
+
+def forget_folder_paths(folder_ids: Iterable[str]) -> None:
+    """Drop cached paths through folders we know are gone (e.g. a cached ID returned 404)."""
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                _invalidate_folders(conn, folder_ids)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Folder path cache invalidation failed: {e}")
@@ -7,8 +7,10 @@ import io
 import json
 import logging
 import re
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
-from toolbox.lib.google_api import GoogleAuth
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+from toolbox.lib import drive_index, folder_ranker
 
 logger = logging.getLogger("DriveSorter.Drive")
 
@@ -39,14 +41,36 @@ def load_drive_tree():
         logger.error(f"Error loading drive_tree.json: {e}")
     return {}
 
-FOLDER_CONFIG = load_folder_config()
-DRIVE_TREE = load_drive_tree()
-ID_TO_PATH = {v: k for k, v in DRIVE_TREE.get('path_to_id', {}).items()}
+# FOLDER_CONFIG, DRIVE_TREE, ID_TO_PATH and the system folder IDs are loaded on
+# first access (module __getattr__), so importing this module reads no files.
+_LAZY_CONSTANTS = {
+    'FOLDER_CONFIG': lambda: load_folder_config(),
+    'DRIVE_TREE': lambda: load_drive_tree(),
+    'ID_TO_PATH': lambda: {v: k for k, v in get_drive_tree().get('path_to_id', {}).items()},
+    'INBOX_ID': lambda: get_folder_config().get('system', {}).get('inbox_id', ''),
+    'METADATA_FOLDER_ID': lambda: get_folder_config().get('system', {}).get('metadata_folder_id', ''),
+    'HISTORY_SHEET_ID': lambda: get_folder_config().get('system', {}).get('history_sheet_id', ''),
+}
 
-_system = FOLDER_CONFIG.get('system', {})
-INBOX_ID = _system.get('inbox_id', '')
-METADATA_FOLDER_ID = _system.get('metadata_folder_id', '')
-HISTORY_SHEET_ID = _system.get('history_sheet_id', '')
+def __getattr__(name):
+    loader = _LAZY_CONSTANTS.get(name)
+    if loader is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = loader()
+    return value
+
+def _lazy(name):
+    # A loaded (or test-patched) value lives in globals(); otherwise load it now
+    return globals()[name] if name in globals() else __getattr__(name)
+
+def get_folder_config():
+    return _lazy('FOLDER_CONFIG')
+
+def get_drive_tree():
+    return _lazy('DRIVE_TREE')
+
+def get_id_to_path():
+    return _lazy('ID_TO_PATH')
 
 # --- CONSTANTS ---
 _ALREADY_NAMED = re.compile(r'^\d{4}-\d{2}-\d{2} - ')
@@ -108,30 +132,50 @@ RULES:
 """
 
 def get_drive_service():
+    from toolbox.lib.google_api import GoogleAuth
     auth = GoogleAuth(base_dir=BASE_DIR)
     # Creds in config/
     creds = auth.get_credentials(token_filename='token_drive_sorter.json', credentials_filename='config/credentials.json')
     return auth.get_service('drive', 'v3', creds)
 
 def get_sheets_service():
+    from toolbox.lib.google_api import GoogleAuth
     auth = GoogleAuth(base_dir=BASE_DIR)
     creds = auth.get_credentials(token_filename='token_drive_sorter.json', credentials_filename='config/credentials.json')
     return auth.get_service('sheets', 'v4', creds)
 
-def get_category_prompt_str():
-    """Returns a sorted newline-separated list of all folder paths from drive_tree.json."""
-    path_to_id = DRIVE_TREE.get('path_to_id', {})
+_folder_index = None
+
+def get_folder_index():
+    """FolderIndex over drive_tree.json paths and the files filed under them (built once per process)."""
+    global _folder_index
+    if _folder_index is None:
+        path_to_id = get_drive_tree().get('path_to_id', {})
+        names_by_id = drive_index.child_names(path_to_id.values())
+        filed = {path: names_by_id.get(fid, []) for path, fid in path_to_id.items()}
+        _folder_index = folder_ranker.FolderIndex(path_to_id.keys(), filed)
+    return _folder_index
+
+def get_category_prompt_str(filename=None, text='', hint=''):
+    """
+    Returns a sorted newline-separated list of folder paths from drive_tree.json.
+    Given a filename (and optionally leading text / a context hint), only the
+    top-ranked candidate folders plus Review are listed (see folder_ranker).
+    """
+    path_to_id = get_drive_tree().get('path_to_id', {})
     if not path_to_id:
         logger.warning("drive_tree.json is empty or missing. Folder list will be empty.")
         return ""
-    return "\n".join(sorted(path_to_id.keys()))
+    if filename is None:
+        return "\n".join(sorted(path_to_id.keys()))
+    return get_folder_index().prompt_str(filename, text, hint)
 
 def resolve_folder_id(path_str, save_recommendation_callback=None):
     """Resolves a folder path string to a Drive folder ID via direct lookup in drive_tree.json."""
     if not path_str:
         return None
 
-    path_to_id = DRIVE_TREE.get('path_to_id', {})
+    path_to_id = get_drive_tree().get('path_to_id', {})
     folder_id = path_to_id.get(path_str)
 
     if not folder_id:
@@ -181,6 +225,7 @@ def download_file_content(service, file_id, mime_type):
     else:
         request = service.files().get_media(fileId=file_id)
         
+    from googleapiclient.http import MediaIoBaseDownload
     fh = io.BytesIO()
     downloader = MediaIoBaseDownload(fh, request)
     done = False
@@ -188,11 +233,22 @@ def download_file_content(service, file_id, mime_type):
         status, done = downloader.next_chunk()
     return fh.getvalue()
 
+def _http_status(error) -> int | None:
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
 def escape_query_string(s: str) -> str:
     """Escapes single quotes and backslashes for Google Drive API queries."""
     return s.replace("\\", "\\\\").replace("'", "\\'")
 
-def _find_or_create_folder(service, name: str, parent_id: str) -> str:
+def _find_folder(service, name: str, parent_id: str) -> str | None:
+    if parent_id != 'root' and drive_index.is_fresh(drive_index.LOOKUP_MAX_AGE_SEC):
+        matches = drive_index.list_children(parent_id, folders=True, name=name)
+        if matches:
+            return matches[0]['id']
     safe_name = escape_query_string(name)
     query = (
         f"'{parent_id}' in parents and name = '{safe_name}' "
@@ -200,24 +256,65 @@ def _find_or_create_folder(service, name: str, parent_id: str) -> str:
     )
     results = service.files().list(q=query, fields='files(id)').execute()
     files = results.get('files', [])
-    if files:
-        return files[0]['id']
+    return files[0]['id'] if files else None
+
+def _find_or_create_folder(service, name: str, parent_id: str) -> str:
+    fid = _find_folder(service, name, parent_id)
+    if fid:
+        return fid
 
     meta = {
         'name': name,
         'mimeType': 'application/vnd.google-apps.folder',
         'parents': [parent_id],
     }
-    return service.files().create(body=meta, fields='id').execute()['id']
+    fid = service.files().create(body=meta, fields='id').execute()['id']
+    drive_index.record_files([{'id': fid, 'name': name, 'mimeType': meta['mimeType'], 'parents': [parent_id]}])
+    logger.info(f'Created folder: {name} under {parent_id}')
+    return fid
+
+def resolve_folder_path(service, path: str, parent_id: str = 'root', create: bool = True) -> str | None:
+    """
+    Resolve a slash-separated folder path under parent_id (Drive root by default) to a
+    folder ID. Resolved prefixes are cached in the shared Drive index DB, so a path
+    resolved once (or listed in drive_tree.json) costs no API calls in any process.
+    Missing segments are created, or None is returned when create=False. A cached
+    folder that returns 404 is dropped from the cache and the path is walked again.
+    """
+    parts = [p for p in path.strip('/').split('/') if p]
+    while True:
+        depth, folder_id = drive_index.lookup_folder_path(parts, parent_id)
+        try:
+            return _walk_folder_path(service, parts, depth, folder_id, parent_id, create)
+        except Exception as e:
+            if depth == 0 or _http_status(e) != 404:
+                raise
+            logger.warning(f"Cached folder {folder_id} for {'/'.join(parts[:depth])} is gone; re-resolving")
+            drive_index.forget_folder_paths([folder_id])
+
+def _walk_folder_path(service, parts: list, depth: int, folder_id: str, parent_id: str, create: bool) -> str | None:
+    resolved = []
+    for i in range(depth, len(parts)):
+        if create:
+            folder_id = _find_or_create_folder(service, parts[i], folder_id)
+        else:
+            folder_id = _find_folder(service, parts[i], folder_id)
+            if not folder_id:
+                break
+        resolved.append(('/'.join(parts[:i + 1]), folder_id))
+    if resolved:
+        drive_index.remember_folder_paths(resolved, parent_id)
+    return folder_id
 
 def _resolve_path(service, path: str) -> str:
-    parts = path.strip('/').split('/')
-    parent_id = 'root'
-    for part in parts:
-        parent_id = _find_or_create_folder(service, part, parent_id)
-    return parent_id
+    return resolve_folder_path(service, path)
 
 def _get_file_in_folder(service, folder_id: str, filename: str) -> str | None:
+    # Index hits are trusted; a miss may just be a file created since the last sync
+    if drive_index.is_fresh(drive_index.LOOKUP_MAX_AGE_SEC):
+        file_id = drive_index.find_in_folder(folder_id, filename)
+        if file_id:
+            return file_id
     safe_filename = escape_query_string(filename)
     query = f"'{folder_id}' in parents and name = '{safe_filename}' and trashed = false"
     results = service.files().list(q=query, fields='files(id)').execute()
@@ -226,9 +323,18 @@ def _get_file_in_folder(service, folder_id: str, filename: str) -> str | None:
 
 def append_to_file(path: str, filename: str, content: str) -> None:
     """Append content to a file in Drive, creating it if needed."""
+    from googleapiclient.http import MediaIoBaseUpload
     service = get_drive_service()
     folder_id = _resolve_path(service, path)
-    file_id = _get_file_in_folder(service, folder_id, filename)
+    try:
+        file_id = _get_file_in_folder(service, folder_id, filename)
+    except Exception as e:
+        if _http_status(e) != 404:
+            raise
+        # The cached folder ID is stale (folder deleted or moved out of reach)
+        drive_index.forget_folder_paths([folder_id])
+        folder_id = _resolve_path(service, path)
+        file_id = _get_file_in_folder(service, folder_id, filename)
 
     if file_id:
         existing_bytes = download_file_content(service, file_id, 'text/plain')
@@ -240,21 +346,149 @@ def append_to_file(path: str, filename: str, content: str) -> None:
     else:
         media = MediaIoBaseUpload(io.BytesIO(content.encode()), mimetype='text/markdown')
         meta = {'name': filename, 'parents': [folder_id]}
-        service.files().create(body=meta, media_body=media, fields='id').execute()
+        created = service.files().create(body=meta, media_body=media, fields='id').execute()
+        drive_index.record_files([{'id': created['id'], 'name': filename, 'mimeType': 'text/markdown', 'parents': [folder_id]}])
         logger.info(f'Created Drive: {path}/{filename}')
 
-def move_file(service, file_id, target_folder_id, processed_name):
+# --- BATCHED MUTATIONS ---
+BATCH_MAX_REQUESTS = 100     # Drive's limit on sub-requests per HTTP batch
+BATCH_MAX_RETRIES = 4
+BATCH_BACKOFF_BASE = 1.0     # seconds; doubles per retry round
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+_RETRYABLE_403_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+@dataclass
+class BatchOutcome:
+    key: str
+    ok: bool
+    response: Any = None
+    error: Optional[Exception] = None
+    attempts: int = 0
+
+def _is_retryable(error) -> bool:
+    status = _http_status(error)
+    if status is None:
+        # No HTTP status: the whole batch call failed (network) — worth retrying
+        return not hasattr(error, 'resp')
+    if status == 403:
+        return any(reason in str(error) for reason in _RETRYABLE_403_REASONS)
+    return status in _RETRYABLE_STATUS
+
+class DriveBatch:
+    """
+    Coalesces Drive API requests into HTTP batch calls (up to BATCH_MAX_REQUESTS per
+    round trip). Sub-requests that fail with rate-limit/5xx errors are retried in a
+    later batch with exponential backoff; execute() returns {key: BatchOutcome} in the
+    order requests were added.
+
+        batch = DriveBatch(service)
+        batch.add(fid, service.files().update(fileId=fid, body={'trashed': True}))
+        for key, outcome in batch.execute().items(): ...
+    """
+
+    def __init__(self, service, max_batch=BATCH_MAX_REQUESTS, max_retries=BATCH_MAX_RETRIES,
+                 backoff_base=BATCH_BACKOFF_BASE, sleep=time.sleep):
+        self.service = service
+        self.max_batch = max(1, min(max_batch, BATCH_MAX_REQUESTS))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._sleep = sleep
+        self._pending = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, key, request) -> None:
+        """Queue an unexecuted HttpRequest (e.g. service.files().update(...)) under a unique key."""
+        self._pending.append((str(key), request))
+
+    def _run_chunk(self, chunk) -> dict:
+        results = {}
+
+        def callback(request_id, response, exception):
+            results[request_id] = (response, exception)
+
+        batch = self.service.new_batch_http_request(callback=callback)
+        for key, request in chunk:
+            batch.add(request, request_id=key)
+        try:
+            batch.execute()
+        except Exception as e:
+            logger.warning(f"Drive batch of {len(chunk)} failed: {e}")
+            return {key: (None, e) for key, _ in chunk}
+        return results
+
+    def execute(self) -> dict:
+        order = [key for key, _ in self._pending]
+        todo, self._pending = self._pending, []
+        outcomes = {}
+        attempt = 0
+        while todo:
+            attempt += 1
+            retry = []
+            for i in range(0, len(todo), self.max_batch):
+                chunk = todo[i:i + self.max_batch]
+                results = self._run_chunk(chunk)
+                for key, request in chunk:
+                    response, error = results.get(key, (None, RuntimeError("No response in batch")))
+                    if error is None:
+                        outcomes[key] = BatchOutcome(key, True, response, None, attempt)
+                    elif attempt <= self.max_retries and _is_retryable(error):
+                        retry.append((key, request))
+                    else:
+                        outcomes[key] = BatchOutcome(key, False, None, error, attempt)
+            if retry:
+                wait = self.backoff_base * (2 ** (attempt - 1))
+                logger.info(f"Retrying {len(retry)} Drive batch sub-requests in {wait:.1f}s")
+                self._sleep(wait)
+            todo = retry
+        return {key: outcomes[key] for key in order}
+
+# file_id -> parent ids, filled from listings so moves can skip the parents lookup
+_parent_cache: dict = {}
+
+def remember_parents(files, parent_id=None) -> None:
+    """
+    Record parents from a files().list response. Pass parent_id when the query was
+    "'<parent_id>' in parents" and the response did not ask for the parents field.
+    """
+    for f in files:
+        parents = f.get('parents') or ([parent_id] if parent_id else None)
+        if f.get('id') and parents:
+            _parent_cache[f['id']] = list(parents)
+
+def _lookup_parents(service, file_id) -> list:
+    file = service.files().get(fileId=file_id, fields='parents').execute()
+    return file.get('parents', [])
+
+def move_file(service, file_id, target_folder_id, processed_name, current_parents=None):
+    """
+    Move a file into target_folder_id. Parents come from current_parents, then the
+    listing cache, and only then a files().get; a move that fails with guessed parents
+    is retried once against the live parents.
+    """
+    known = current_parents if current_parents is not None else _parent_cache.get(file_id)
     try:
-        file = service.files().get(fileId=file_id, fields='parents').execute()
-        parents = file.get('parents', [])
-        previous_parents = ",".join(parents) if parents else ""
-        
-        service.files().update(
-            fileId=file_id,
-            addParents=target_folder_id,
-            removeParents=previous_parents,
-            fields='id, parents'
-        ).execute()
+        parents = list(known) if known is not None else _lookup_parents(service, file_id)
+        try:
+            service.files().update(
+                fileId=file_id,
+                addParents=target_folder_id,
+                removeParents=",".join(parents),
+                fields='id, parents'
+            ).execute()
+        except Exception as e:
+            if known is None:
+                raise
+            logger.info(f"Move with known parents failed ({e}); re-checking parents")
+            service.files().update(
+                fileId=file_id,
+                addParents=target_folder_id,
+                removeParents=",".join(_lookup_parents(service, file_id)),
+                fields='id, parents'
+            ).execute()
+        _parent_cache[file_id] = [target_folder_id]
+        drive_index.record_files([{'id': file_id, 'name': processed_name, 'parents': [target_folder_id]}])
         return True
     except Exception as e:
         logger.error(f"Move Error: {e}")
@@ -0,0 +1,117 @@
+"""
+Candidate folder preselection for the sorter prompt.
+
+Rather than listing every path from drive_tree.json in SORTER_SYSTEM_PROMPT,
+the sorter ranks folder paths against the file (its name, the start of its
+extracted text, any context hint) and sends only the top-K plus the Review
+folder. Each folder is a BM25 document made of its path tokens (weighted up)
+and the names of files already filed there (historical moves, read from the
+local drive index): "2024-03-01 - Chase - Monthly Statement" in
+Finance/Banking teaches that folder the words chase and statement.
+
+When the query matches nothing, the most-used folders fill the list so the
+model still gets a sensible choice.
+"""
+import re
+import math
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger("toolbox.folder_ranker")
+
+REVIEW_FOLDER = '00 - Staging/Review'
+DEFAULT_TOP_K = 30
+QUERY_TEXT_CHARS = 2000
+PATH_WEIGHT = 3          # path tokens count this many times against filed-name tokens
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r'[a-z][a-z0-9]+|\d{4}')
+_STOPWORDS = frozenset((
+    'and', 'the', 'for', 'of', 'to', 'in', 'on', 'at', 'by', 'with', 'from', 'or', 'an', 'is',
+    'are', 'be', 'this', 'that', 'your', 'you', 'our', 'we', 'it', 'as', 'was', 'will', 'not',
+    'pdf', 'jpg', 'jpeg', 'png', 'docx', 'txt', 'csv', 'doc', 'scan', 'file', 'filename',
+    'page', 'copy', 'img', 'misc', 'other', 'www', 'http', 'https', 'com',
+))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens (and 4-digit years) minus stopwords and file-name noise."""
+    return [t for t in _TOKEN.findall((text or '').lower()) if t not in _STOPWORDS]
+
+
+class FolderIndex:
+    """BM25 index over folder paths and the names of the files filed under them."""
+
+    def __init__(self, paths: Iterable[str], filed_names: Optional[Dict[str, List[str]]] = None):
+        filed_names = filed_names or {}
+        self.paths = sorted(set(p for p in paths if p))
+        self._usage = {p: len(filed_names.get(p, ())) for p in self.paths}
+        self._tf: List[Counter] = []
+        self._postings: Dict[str, List[int]] = {}
+        for i, path in enumerate(self.paths):
+            tf = Counter()
+            for token in tokenize(path.replace('/', ' ')):
+                tf[token] += PATH_WEIGHT
+            for name in filed_names.get(path, ()):
+                tf.update(tokenize(name))
+            self._tf.append(tf)
+            for token in tf:
+                self._postings.setdefault(token, []).append(i)
+        self._lengths = [sum(tf.values()) for tf in self._tf]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _idf(self, token: str) -> float:
+        n = len(self._postings.get(token, ()))
+        return math.log(1 + (len(self.paths) - n + 0.5) / (n + 0.5))
+
+    def scores(self, query: str) -> Dict[str, float]:
+        """{path: BM25 score} for paths sharing at least one token with the query."""
+        scores: Dict[int, float] = {}
+        for token in set(tokenize(query)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = self._idf(token)
+            for i in postings:
+                tf = self._tf[i][token]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[i] / (self._avg_length or 1))
+                scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return {self.paths[i]: s for i, s in scores.items()}
+
+    def rank(self, query: str, top_k: int = DEFAULT_TOP_K) -> List[str]:
+        """Best top_k paths for the query, topped up with the most-used folders."""
+        scores = self.scores(query)
+        ranked = sorted(scores, key=lambda p: (-scores[p], p))[:top_k]
+        if len(ranked) < top_k:
+            chosen = set(ranked)
+            by_usage = sorted((p for p in self.paths if p not in chosen), key=lambda p: (-self._usage[p], p))
+            ranked += by_usage[:top_k - len(ranked)]
+        return ranked
+
+    def candidates(self, filename: str, text: str = '', hint: str = '', top_k: int = DEFAULT_TOP_K) -> List[str]:
+        """Candidate destinations for one file: top_k ranked paths plus the Review folder, sorted."""
+        if len(self.paths) <= top_k:
+            selected = set(self.paths)
+        else:
+            query = ' '.join((filename or '', hint or '', (text or '')[:QUERY_TEXT_CHARS]))
+            selected = set(self.rank(query, top_k))
+        selected.add(REVIEW_FOLDER)
+        return sorted(selected)
+
+    def prompt_str(self, filename: str, text: str = '', hint: str = '', top_k: int = DEFAULT_TOP_K) -> str:
+        """Newline-separated candidate paths for SORTER_SYSTEM_PROMPT."""
+        return "\n".join(self.candidates(filename, text, hint, top_k))
+
+
+def content_text(content, mime_type: str) -> str:
+    """Leading text of a sorter payload for ranking ('' for binary content such as PDFs and images)."""
+    if not content or not (mime_type or '').startswith('text/'):
+        return ''
+    if isinstance(content, str):
+        return content[:QUERY_TEXT_CHARS]
+    return bytes(content[:QUERY_TEXT_CHARS * 4]).decode('utf-8', errors='ignore')[:QUERY_TEXT_CHARS]
@@ -0,0 +1,183 @@
+"""
+Content-addressed response cache for LLMGateway.
+Identical prompts (same task_type, tier, normalized prompt, content bytes and
+require_json flag) are answered from disk instead of re-calling a provider.
+Backed by SQLite in WAL mode so the hourly sorter, backfill and email extractor
+timers can share one cache concurrently.
+Storage: config/llm_cache.db
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger("toolbox.llm_cache")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_PATH = os.path.join(BASE_DIR, 'config', 'llm_cache.db')
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    task_type TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    provider TEXT,
+    model TEXT,
+    text TEXT NOT NULL,
+    json TEXT,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    day TEXT NOT NULL,
+    task_type TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, task_type)
+);
+"""
+
+_WS_RE = re.compile(r'\s+')
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so cosmetic formatting changes still hit the cache."""
+    return _WS_RE.sub(' ', prompt).strip()
+
+
+def make_key(task_type: str, tier: str, prompt: str, content_bytes: bytes = b'',
+             mime_type: str = 'text/plain', require_json: bool = False) -> str:
+    """Build the content address for a gateway call."""
+    prompt_hash = hashlib.sha256(normalize_prompt(prompt).encode('utf-8')).hexdigest()
+    content_hash = hashlib.sha256(content_bytes or b'').hexdigest()
+    raw = "|".join([task_type, tier, prompt_hash, content_hash, mime_type, "json" if require_json else "text"])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _bump_stat(conn: sqlite3.Connection, task_type: str, column: str) -> None:
+    day = datetime.now().strftime('%Y-%m-%d')
+    conn.execute(
+        f"INSERT INTO stats (day, task_type, {column}) VALUES (?, ?, 1) "
+        f"ON CONFLICT(day, task_type) DO UPDATE SET {column} = {column} + 1",
+        (day, task_type),
+    )
+
+
+def get(key: str, task_type: str, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> Optional[Dict[str, Any]]:
+    """Return the cached response for key, or None on miss/expiry. Records hit/miss counters."""
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                row = conn.execute(
+                    "SELECT provider, model, tier, text, json, tokens, created_at FROM responses WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row and now - row[6] > ttl_seconds:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    row = None
+                if row is None:
+                    _bump_stat(conn, task_type, "misses")
+                    return None
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                _bump_stat(conn, task_type, "hits")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache read failed: {e}")
+        return None
+
+    provider, model, tier, text, parsed, tokens, _ = row
+    return {
+        "text": text,
+        "json": json.loads(parsed) if parsed is not None else None,
+        "tokens": tokens,
+        "provider": provider,
+        "model": model,
+        "tier": tier,
+    }
+
+
+def put(key: str, task_type: str, result: Dict[str, Any],
+        max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+    """Store a successful gateway result and evict least-recently-used entries over the bounds."""
+    now = time.time()
+    parsed = json.dumps(result["json"]) if result.get("json") is not None else None
+    size = len(result["text"]) + (len(parsed) if parsed else 0)
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(key, task_type, tier, provider, model, text, json, tokens, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, task_type, result.get("tier", ""), result.get("provider"), result.get("model"),
+                     result["text"], parsed, result.get("tokens", 0), size, now, now),
+                )
+                _evict(conn, max_entries, max_bytes)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache write failed: {e}")
+
+
+def _evict(conn: sqlite3.Connection, max_entries: int, max_bytes: int) -> None:
+    count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+    if count <= max_entries and total <= max_bytes:
+        return
+    excess = max(0, count - max_entries)
+    freed = 0
+    dropped = 0
+    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+        if dropped >= excess and total - freed <= max_bytes:
+            break
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        freed += size
+        dropped += 1
+    logger.info(f"LLM cache evicted {dropped} entries ({freed} bytes)")
+
+
+def get_stats(days: Optional[int] = 7) -> Dict[str, Dict[str, int]]:
+    """Return {task_type: {"hits": n, "misses": n}} for the last `days` days (None = all time)."""
+    if not os.path.exists(CACHE_PATH):
+        return {}
+    query = "SELECT task_type, SUM(hits), SUM(misses) FROM stats"
+    params: tuple = ()
+    if days is not None:
+        cutoff = datetime.fromtimestamp(time.time() - days * 86400).strftime('%Y-%m-%d')
+        query += " WHERE day >= ?"
+        params = (cutoff,)
+    query += " GROUP BY task_type"
+    try:
+        conn = _connect()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache stats read failed: {e}")
+        return {}
+    return {task: {"hits": hits or 0, "misses": misses or 0} for task, hits, misses in rows}
@@ -3,22 +3,21 @@ Cost-optimized LLM routing and budget governance gateway.
 Implements Issue #149.
 """
 import os
-import yaml
 import logging
 import time
 import random
 import json
 import re
 import inspect
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Tuple
 
-from toolbox.lib import log_manager, quota_manager
-from toolbox.lib.providers.groq import GroqProvider
-from toolbox.lib.providers.ollama import OllamaProvider
-from toolbox.lib.providers.gemini import GeminiProvider
-from toolbox.lib.providers.deepseek import DeepSeekProvider
+from toolbox.lib import log_manager, log_sink, quota_manager, llm_cache, token_estimator, prompt_segments, provider_health
 from toolbox.lib.providers.base import ProviderSkip, RateLimitError, QuotaExhaustedError
 
 logger = logging.getLogger("toolbox.llm_gateway")
@@ -27,14 +26,44 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CONFIG_PATH = os.path.join(BASE_DIR, 'config', 'llm_routing.yaml')
 LLM_LOG_PATH = os.path.join(BASE_DIR, 'logs', 'llm_routing.jsonl')
 
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PROVIDER_CONCURRENCY = 4
+LATENCY_WINDOW = 200               # successful calls kept per (provider, model) for hedge delays
+LATENCY_SEED_BYTES = 256 * 1024    # tail of llm_routing.jsonl read to warm latency stats
+DEFAULT_CLIENT_MAX_IDLE_SEC = 600  # pooled provider clients unused this long are rebuilt
+
+# Provider instances shared by every gateway in the process: (name, key digest, model) -> entry
+_provider_pool: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+_provider_pool_lock = threading.Lock()
+
+_CONNECTION_ERROR_NAMES = frozenset((
+    'ConnectionError', 'APIConnectionError', 'ConnectError', 'RemoteProtocolError', 'ReadError', 'TransportError',
+))
+
+
+def _is_connection_error(exc: Exception) -> bool:
+    """Transport-level failures (refused, reset, stale keep-alive) after which a pooled client is rebuilt."""
+    if isinstance(exc, ConnectionError):
+        return True
+    if any(cls.__name__ in _CONNECTION_ERROR_NAMES for cls in type(exc).__mro__):
+        return True
+    return 'not reachable' in str(exc)
+
+
 class LLMGateway:
     def __init__(self):
         self.config = self._load_config()
+        token_estimator.configure(self.config.get('token_estimation'))
         self._init_secrets()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._semaphore_lock = threading.Lock()
+        self._latencies: Dict[Tuple[str, str], deque] = {}
+        self._latencies_seeded = False
 
     def _load_config(self) -> Dict:
         if not os.path.exists(CONFIG_PATH):
             raise FileNotFoundError(f"LLM routing config missing at {CONFIG_PATH}")
+        import yaml
         with open(CONFIG_PATH, 'r') as f:
             return yaml.safe_load(f)
 
@@ -57,40 +86,100 @@ class LLMGateway:
                 return f.read().strip()
         return None
 
-    def _get_provider_instance(self, provider_cfg: Dict[str, str]):
-        name = provider_cfg['name']
-        model = provider_cfg['model']
-        
-        if name == 'ollama':
-            return OllamaProvider(model_name=model)
-        elif name == 'groq':
-            return GroqProvider(model_name=model)
+    def _provider_key(self, name: str) -> Optional[str]:
+        if name in ('ollama', 'groq'):
+            return None
         elif name == 'deepseek':
             if not self.deepseek_key:
                 raise ValueError("DeepSeek key missing (DEEPSEEK_API_KEY in config/secrets.env)")
-            return DeepSeekProvider(model_name=model, api_key=self.deepseek_key)
+            return self.deepseek_key
         elif name == 'gemini-free':
             if not self.gemini_free_key:
                 raise ValueError("Gemini Free key missing (config/gemini_ai_studio_secret)")
-            return GeminiProvider(model_name=model, api_key=self.gemini_free_key)
+            return self.gemini_free_key
         elif name == 'gemini-paid':
             if not self.gemini_paid_key:
                 raise ValueError("Gemini Paid key missing (config/gemini_secret)")
-            return GeminiProvider(model_name=model, api_key=self.gemini_paid_key)
+            return self.gemini_paid_key
         else:
             raise ValueError(f"Unknown provider: {name}")
 
-    def _resolve_source(self, source: Optional[str]) -> str:
+    def _build_provider(self, name: str, model: str, key: Optional[str]):
+        # Keep-alive pool sized to the provider's in-flight cap: no more connections are ever needed
+        limits = self.config.get('concurrency', {}).get('providers', {})
+        pool_size = max(1, int(limits.get(name, DEFAULT_PROVIDER_CONCURRENCY)))
+        # Provider SDKs (google-genai, groq, openai) are imported on first use so a
+        # process only pays for the providers it actually calls
+        if name == 'ollama':
+            from toolbox.lib.providers.ollama import OllamaProvider
+            return OllamaProvider(model_name=model, pool_size=pool_size)
+        elif name == 'groq':
+            from toolbox.lib.providers.groq import GroqProvider
+            return GroqProvider(model_name=model)
+        elif name == 'deepseek':
+            from toolbox.lib.providers.deepseek import DeepSeekProvider
+            return DeepSeekProvider(model_name=model, api_key=key, pool_size=pool_size)
+        from toolbox.lib.providers.gemini import GeminiProvider
+        return GeminiProvider(model_name=model, api_key=key, pool_size=pool_size)
+
+    def _get_provider_instance(self, provider_cfg: Dict[str, str]):
+        """
+        Pooled provider for provider_cfg: one instance (and HTTP client) per
+        (provider, key, model) for the process lifetime. Entries idle longer than
+        clients.max_idle_sec, or whose last call failed at the connection level,
+        are rebuilt on next use.
+        """
+        name = provider_cfg['name']
+        model = provider_cfg['model']
+        key = self._provider_key(name)
+        pool_key = (name, hashlib.sha256(key.encode()).hexdigest()[:16] if key else '', model)
+        max_idle = self.config.get('clients', {}).get('max_idle_sec', DEFAULT_CLIENT_MAX_IDLE_SEC)
+        now = time.monotonic()
+        with _provider_pool_lock:
+            entry = _provider_pool.get(pool_key)
+            if entry is not None and now - entry['last_used'] > max_idle:
+                logger.info(f"Rebuilding {name}/{model} client after {now - entry['last_used']:.0f}s idle")
+                entry = None
+            if entry is None:
+                entry = {'provider': self._build_provider(name, model, key), 'last_used': now}
+                _provider_pool[pool_key] = entry
+            entry['last_used'] = now
+            return entry['provider']
+
+    def _discard_provider(self, provider_cfg: Dict[str, str]) -> None:
+        """Drop pooled clients for provider_cfg so the next call reconnects from scratch."""
+        with _provider_pool_lock:
+            for pool_key in [k for k in _provider_pool if k[0] == provider_cfg['name'] and k[2] == provider_cfg['model']]:
+                del _provider_pool[pool_key]
+
+    def _provider_semaphore(self, provider_name: str) -> threading.BoundedSemaphore:
+        """Per-provider in-flight cap, sized from the `concurrency.providers` block in llm_routing.yaml."""
+        with self._semaphore_lock:
+            sem = self._semaphores.get(provider_name)
+            if sem is None:
+                limits = self.config.get('concurrency', {}).get('providers', {})
+                sem = threading.BoundedSemaphore(max(1, int(limits.get(provider_name, DEFAULT_PROVIDER_CONCURRENCY))))
+                self._semaphores[provider_name] = sem
+            return sem
+
+    def _resolve_source(self, source: Optional[str], depth: int = 3) -> str:
+        """
+        Caller module for usage attribution. depth is how many frames above this one the
+        entry point's caller sits; frames in this file and in asyncio are skipped from there.
+        """
         if source:
             return source
 
+        import asyncio
         current_file = os.path.abspath(__file__)
+        asyncio_dir = os.path.dirname(os.path.abspath(asyncio.__file__)) + os.sep
         frame = inspect.currentframe()
         try:
-            frame = frame.f_back.f_back.f_back if frame and frame.f_back and frame.f_back.f_back and frame.f_back.f_back.f_back else None
+            for _ in range(depth):
+                frame = frame.f_back if frame else None
             while frame:
                 filename = os.path.abspath(frame.f_code.co_filename)
-                if filename != current_file:
+                if filename != current_file and not filename.startswith(asyncio_dir):
                     if filename.startswith(BASE_DIR):
                         rel = os.path.splitext(os.path.relpath(filename, BASE_DIR))[0]
                         return rel.replace(os.sep, '/')
@@ -100,19 +189,24 @@ class LLMGateway:
             del frame
         return "unknown"
 
-    def call(self, task_type: str, prompt: str, content_bytes: bytes = b'', mime_type: str = 'text/plain', require_json: bool = False, source: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+    def call(self, task_type: str, prompt: str, content_bytes: bytes = b'', mime_type: str = 'text/plain', require_json: bool = False, source: Optional[str] = None, use_cache: bool = True, **kwargs) -> Dict[str, Any]:
         """
         Unified entry point for LLM calls with routing and budget enforcement.
         If require_json is True, malformed JSON will trigger fallback to next provider.
+        Identical requests are served from the response cache (see llm_cache) unless use_cache is False.
+        Prompts may mark payload/schema segments (see prompt_segments) so that only payload is truncated.
         """
         # 1. Routing logic
         source = self._resolve_source(source)
-        # Estimate tokens (rough: 4 chars per token)
-        prompt_tokens = len(prompt) // 4
+        segments = prompt_segments.split(prompt)
+        prompt = prompt_segments.join(segments)
+        # Estimate input tokens: prompt text plus the attachment (PDF pages, images, text)
+        prompt_tokens = token_estimator.estimate_text(prompt)
+        content_tokens = token_estimator.estimate_content(content_bytes, mime_type)
         
         # Check for long-context override
         long_context_threshold = self.config.get('thresholds', {}).get('long_context_tokens', 200000)
-        if prompt_tokens > long_context_threshold:
+        if prompt_tokens + content_tokens > long_context_threshold:
             route = 'long-context'
         else:
             route = self.config.get('routes', {}).get(task_type)
@@ -128,163 +222,74 @@ class LLMGateway:
             logger.error(msg)
             raise ValueError(msg)
 
+        # 1b. Response cache (served before budget checks — a hit costs nothing)
+        cache_cfg = self.config.get('cache', {})
+        cache_key = None
+        if use_cache and cache_cfg.get('enabled') and task_type not in cache_cfg.get('skip_task_types', []):
+            cache_key = llm_cache.make_key(task_type, tier_name, prompt, content_bytes, mime_type, require_json)
+            cached = llm_cache.get(cache_key, task_type, ttl_seconds=cache_cfg.get('ttl_seconds', llm_cache.DEFAULT_TTL_SECONDS))
+            if cached:
+                logger.info(f"Cache hit for {task_type} ({cached['provider']}/{cached['model']})")
+                self._log_routing(task_type, tier_name, {"name": cached['provider'], "model": cached['model']}, 0, 0, "cache_hit", "", 1, 0, prompt_tokens + content_tokens, source=source)
+                return {**cached, "tokens": 0, "cost": 0.0, "tier": tier_name, "cache_hit": True}
+
         # 2. Budget Enforcement (Daily)
         daily_usd_limit = self.config.get('budgets', {}).get('daily_usd', 2.0)
         current_usd = quota_manager.get_total_usd_used()
         if current_usd >= daily_usd_limit:
             msg = f"Daily LLM budget exceeded: ${current_usd:.4f} >= ${daily_usd_limit:.4f}"
             logger.error(msg)
-            self._log_routing(task_type, tier_name, {}, prompt_tokens, 0, "blocked", msg, source=source)
+            self._log_routing(task_type, tier_name, {}, prompt_tokens + content_tokens, 0, "blocked", msg, source=source)
             raise RuntimeError(msg)
 
         # 3. Context / Token Caps (Enforce Hard Truncation)
         token_cap = self.config.get('token_caps', {}).get(tier_name, 4000)
+        bytes_saved = 0
         if prompt_tokens > token_cap:
-            logger.warning(f"Prompt tokens ({prompt_tokens}) exceed cap for tier {tier_name} ({token_cap}). Truncating.")
-            prompt = prompt[:token_cap * 4]
-            prompt_tokens = token_cap
+            logger.warning(f"Prompt tokens ({prompt_tokens}) exceed cap for tier {tier_name} ({token_cap}). Truncating payload.")
+            prompt, prompt_tokens, bytes_saved = prompt_segments.truncate(segments, token_cap)
 
         per_task_usd_limit = self.config.get('budgets', {}).get('per_task_usd', 0.20)
 
-        # 4. Try providers in tier (Fallback Chain)
-        last_exception = None
+        # 4. Try providers in tier (Fallback Chain, optionally hedged), best-ranked first
         attempts_chain = []
-        degraded_providers = quota_manager.get_degraded_providers()
+        providers, ranking = self._rank_providers(task_type, tier['providers'], require_json, attempts_chain)
+        ctx = {
+            "task_type": task_type,
+            "tier_name": tier_name,
+            "prompt": prompt,
+            "prompt_tokens": prompt_tokens + content_tokens,
+            "content_bytes": content_bytes,
+            "mime_type": mime_type,
+            "require_json": require_json,
+            "source": source,
+            "per_task_usd_limit": per_task_usd_limit,
+            "bytes_saved": bytes_saved,
+            "degraded_providers": quota_manager.get_degraded_providers(),
+            "ranking": ranking,
+        }
 
-        for provider_cfg in tier['providers']:
-            try:
-                # Pre-call Cost Estimation
-                model_name = provider_cfg['model']
-                provider_name = provider_cfg['name']
-
-                # Circuit Breaker: Skip degraded providers
-                if provider_name in degraded_providers:
-                    logger.info(f"Skipping degraded provider: {provider_name}")
-                    attempts_chain.append({"provider": provider_name, "model": model_name, "result": "degraded", "error": "Provider marked as degraded for today"})
-                    continue
+        hedge_cfg = tier.get('hedge', {})
+        if hedge_cfg.get('enabled') and len(providers) > 1:
+            result, last_exception = self._call_hedged(providers, ctx, attempts_chain, hedge_cfg)
+        else:
+            result, last_exception = None, None
+            for provider_cfg in providers:
+                result, exc = self._try_provider(provider_cfg, ctx, attempts_chain)
+                if result:
+                    break
+                if exc:
+                    last_exception = exc
 
-                cost_per_m = self.config.get('costs', {}).get(model_name)
-                if cost_per_m is None:
-                    cost_per_m = self.config.get('costs', {}).get(provider_name, 0.10)
-                
-                est_cost = (prompt_tokens * cost_per_m) / 1_000_000
-                if est_cost > per_task_usd_limit:
-                    msg = f"Estimated task cost ${est_cost:.4f} exceeds limit ${per_task_usd_limit:.4f} for provider {provider_name}/{model_name}"
-                    logger.warning(msg)
-                    attempts_chain.append({"provider": provider_name, "model": model_name, "result": "blocked", "error": msg})
-                    continue
+        if result:
+            if cache_key:
+                llm_cache.put(
+                    cache_key, task_type, result,
+                    max_entries=cache_cfg.get('max_entries', llm_cache.DEFAULT_MAX_ENTRIES),
+                    max_bytes=int(cache_cfg.get('max_mb', 50) * 1024 * 1024),
+                )
+            return result
 
-                provider = self._get_provider_instance(provider_cfg)
-                if not provider.supports(mime_type):
-                    attempts_chain.append({
-                        "provider": provider_name,
-                        "model": model_name,
-                        "result": "unsupported_mime",
-                        "error": f"{mime_type} is not supported",
-                    })
-                    continue
-                
-                # Retry loop (Exponential Backoff with Jitter)
-                for attempt in range(3):
-                    start_time = time.time()
-                    try:
-                        if attempt > 0:
-                            delay = (2 ** attempt) + random.uniform(0, 1)
-                            logger.info(f"Retrying {provider_name} in {delay:.1f}s (attempt {attempt+1}/3)...")
-                            time.sleep(delay)
-                            
-                        # Execute call
-                        # Ensure content_bytes is NOT dropped for text/plain if provided
-                        data_to_send = content_bytes if content_bytes else b''
-                        result_text, actual_tokens = provider.analyze(data_to_send, mime_type, prompt)
-                        latency = time.time() - start_time
-                        
-                        # --- JSON Validation (if requested) ---
-                        parsed_json = None
-                        if require_json:
-                            try:
-                                parsed_json = _parse_json(result_text)
-                            except Exception as e:
-                                logger.warning(f"Provider {provider_name} returned invalid JSON: {e}")
-                                attempts_chain.append({"provider": provider_name, "model": model_name, "result": "json_error", "error": str(e)})
-                                self._log_routing(task_type, tier_name, provider_cfg, actual_tokens, 0, "json_error", str(e), attempt+1, latency, prompt_tokens, source=source)
-                                last_exception = e
-                                break # Fail this provider, try next one in tier (outer loop)
-
-                        # Calculate actual cost
-                        cost = (actual_tokens * cost_per_m) / 1_000_000
-                        
-                        # Post-call budget enforcement
-                        if cost > per_task_usd_limit:
-                            msg = f"Actual task cost ${cost:.4f} exceeded limit ${per_task_usd_limit:.4f}"
-                            logger.error(msg)
-                            self._log_routing(task_type, tier_name, provider_cfg, actual_tokens, cost, "blocked", msg, attempt+1, latency, prompt_tokens, source=source)
-                            raise RuntimeError(msg)
-
-                        # Record usage
-                        quota_manager.record_llm_usage(
-                            actual_tokens,
-                            cost,
-                            metadata={
-                                "source": source,
-                                "task_type": task_type,
-                                "provider": provider_name,
-                                "model": model_name,
-                            },
-                        )
-                        
-                        # Log success
-                        self._log_routing(task_type, tier_name, provider_cfg, actual_tokens, cost, "success", "", attempt+1, latency, prompt_tokens, source=source)
-                        
-                        return {
-                            "text": result_text,
-                            "json": parsed_json,
-                            "tokens": actual_tokens,
-                            "cost": cost,
-                            "provider": provider_name,
-                            "model": model_name,
-                            "tier": tier_name
-                        }
-                    except RateLimitError as e:
-                        latency = time.time() - start_time
-                        last_exception = e
-                        logger.warning(f"Provider {provider_name} rate limited: {e}")
-                        self._log_routing(task_type, tier_name, provider_cfg, 0, 0, "rate_limit", str(e), attempt+1, latency, prompt_tokens, source=source)
-                        if attempt < 2: # Continue to next retry in inner loop
-                            continue
-                        else:
-                            attempts_chain.append({"provider": provider_name, "model": model_name, "result": "rate_limit_exhausted", "error": str(e)})
-                            break # Try next provider in outer loop
-                    except QuotaExhaustedError as e:
-                        latency = time.time() - start_time
-                        logger.error(f"Quota exhausted for {provider_name}: {e}. Tripping circuit breaker.")
-                        quota_manager.mark_provider_degraded(provider_name)
-                        attempts_chain.append({"provider": provider_name, "model": model_name, "result": "quota_exhausted", "error": str(e)})
-                        self._log_routing(task_type, tier_name, provider_cfg, 0, 0, "quota_exhausted", str(e), attempt+1, latency, prompt_tokens, source=source)
-                        break # Try next provider in tier (outer loop)
-                    except ProviderSkip as e:
-                        latency = time.time() - start_time
-                        logger.warning(f"Provider {provider_name} skipped: {e}")
-                        attempts_chain.append({"provider": provider_name, "model": model_name, "result": "skipped", "error": str(e)})
-                        self._log_routing(task_type, tier_name, provider_cfg, 0, 0, "skipped", str(e), attempt+1, latency, prompt_tokens, source=source)
-                        break # Try next provider in tier
-                    except Exception as e:
-                        latency = time.time() - start_time
-                        last_exception = e
-                        err_msg = str(e).upper()
-                        attempts_chain.append({"provider": provider_name, "model": model_name, "result": "error", "error": str(e)})
-                        self._log_routing(task_type, tier_name, provider_cfg, 0, 0, "error", str(e), attempt+1, latency, prompt_tokens, source=source)
-                        
-                        # Retry only on very specific transient errors NOT already caught by RateLimitError
-                        if any(x in err_msg for x in ["TIMEOUT", "CONNECTION_ERROR"]):
-                            continue
-                        break # Other errors → try next provider
-                        
-            except Exception as e:
-                logger.warning(f"Failed to use provider {provider_cfg['name']}: {e}")
-                last_exception = e
-                continue
-                
         # 5. Final Failure
         if last_exception:
             err_msg = str(last_exception)
@@ -292,10 +297,337 @@ class LLMGateway:
             err_msg = f"No provider completed successfully. Attempts: {attempts_chain}"
         else:
             err_msg = "No valid providers available."
-        self._log_routing(task_type, tier_name, {}, prompt_tokens, 0, "failure", f"Attempts: {attempts_chain}. Error: {err_msg}", source=source)
+        self._log_routing(task_type, tier_name, {}, prompt_tokens + content_tokens, 0, "failure", f"Attempts: {attempts_chain}. Error: {err_msg}", source=source, bytes_saved=bytes_saved, ranking=ranking)
         raise RuntimeError(f"All providers in tier {tier_name} failed. Last error: {err_msg}")
 
-    def _log_routing(self, task_type: str, tier: str, provider: Dict, tokens: int, cost: float, result: str, error: str = "", attempt: int = 1, latency: float = 0, est_tokens: int = 0, source: str = "unknown"):
+    def _try_provider(self, provider_cfg: Dict[str, str], ctx: Dict[str, Any], attempts_chain: List[Dict]) -> Tuple[Optional[Dict[str, Any]], Optional[Exception]]:
+        """
+        Run one provider of a tier, including its retry loop.
+        Returns (result, None) on success, or (None, last_exception) when the chain should move on.
+        """
+        task_type = ctx['task_type']
+        tier_name = ctx['tier_name']
+        prompt = ctx['prompt']
+        mime_type = ctx['mime_type']
+        source = ctx['source']
+        per_task_usd_limit = ctx['per_task_usd_limit']
+        last_exception = None
+
+        try:
+            # Pre-call Cost Estimation
+            model_name = provider_cfg['model']
+            provider_name = provider_cfg['name']
+            # Re-estimate with this provider's tokenizer family (memoized per prompt)
+            prompt_tokens = token_estimator.estimate(
+                prompt, ctx['content_bytes'], mime_type,
+                family=token_estimator.family_for(provider_name, model_name),
+            )
+
+            # Circuit Breaker: Skip degraded providers
+            if provider_name in ctx['degraded_providers']:
+                logger.info(f"Skipping degraded provider: {provider_name}")
+                attempts_chain.append({"provider": provider_name, "model": model_name, "result": "degraded", "error": "Provider marked as degraded for today"})
+                return None, None
+
+            cost_per_m = self.config.get('costs', {}).get(model_name)
+            if cost_per_m is None:
+                cost_per_m = self.config.get('costs', {}).get(provider_name, 0.10)
+            
+            est_cost = (prompt_tokens * cost_per_m) / 1_000_000
+            if est_cost > per_task_usd_limit:
+                msg = f"Estimated task cost ${est_cost:.4f} exceeds limit ${per_task_usd_limit:.4f} for provider {provider_name}/{model_name}"
+                logger.warning(msg)
+                attempts_chain.append({"provider": provider_name, "model": model_name, "result": "blocked", "error": msg})
+                return None, None
+
+            provider = self._get_provider_instance(provider_cfg)
+            if not provider.supports(mime_type):
+                attempts_chain.append({
+                    "provider": provider_name,
+                    "model": model_name,
+                    "result": "unsupported_mime",
+                    "error": f"{mime_type} is not supported",
+                })
+                return None, None
+            
+            # Retry loop (Exponential Backoff with Jitter)
+            hedge_won = ctx.get('hedge_won')
+            for attempt in range(3):
+                if hedge_won is not None and hedge_won.is_set():
+                    return None, None  # another hedged provider already answered
+                start_time = time.time()
+                try:
+                    if attempt > 0:
+                        delay = (2 ** attempt) + random.uniform(0, 1)
+                        logger.info(f"Retrying {provider_name} in {delay:.1f}s (attempt {attempt+1}/3)...")
+                        if hedge_won is None:
+                            time.sleep(delay)
+                        elif hedge_won.wait(delay):
+                            return None, None
+                        
+                    # Execute call
+                    # Ensure content_bytes is NOT dropped for text/plain if provided
+                    data_to_send = ctx['content_bytes'] if ctx['content_bytes'] else b''
+                    with self._provider_semaphore(provider_name):
+                        result_text, actual_tokens = provider.analyze(data_to_send, mime_type, prompt)
+                    latency = time.time() - start_time
+                    
+                    # --- JSON Validation (if requested) ---
+                    parsed_json = None
+                    if ctx['require_json']:
+                        try:
+                            parsed_json = _parse_json(result_text)
+                        except Exception as e:
+                            logger.warning(f"Provider {provider_name} returned invalid JSON: {e}")
+                            attempts_chain.append({"provider": provider_name, "model": model_name, "result": "json_error", "error": str(e)})
+                            self._record_health(provider_cfg, task_type, "json_error", latency)
+                            self._log_routing(task_type, tier_name, provider_cfg, actual_tokens, 0, "json_error", str(e), attempt+1, latency, prompt_tokens, source=source, bytes_saved=ctx['bytes_saved'], ranking=ctx['ranking'])
+                            return None, e # Fail this provider, try next one in tier
+
+                    # Calculate actual cost
+                    cost = (actual_tokens * cost_per_m) / 1_000_000
+                    
+                    # Post-call budget enforcement
+                    if cost > per_task_usd_limit:
+                        msg = f"Actual task cost ${cost:.4f} exceeded limit ${per_task_usd_limit:.4f}"
+                        logger.error(msg)
+                        self._log_routing(task_type, tier_name, provider_cfg, actual_tokens, cost, "blocked", msg, attempt+1, latency, prompt_tokens, source=source, bytes_saved=ctx['bytes_saved'], ranking=ctx['ranking'])
+                        raise RuntimeError(msg)
+
+                    # A hedged loser still spent tokens: record its cost, but flag it as discarded
+                    won = ctx['claim_win']() if ctx.get('claim_win') else True
+                    self._record_latency(provider_name, model_name, latency)
+                    self._record_health(provider_cfg, task_type, "success", latency)
+
+                    # Record usage
+                    metadata = {
+                        "source": source,
+                        "task_type": task_type,
+                        "provider": provider_name,
+                        "model": model_name,
+                    }
+                    if not won:
+                        metadata["hedge"] = "discarded"
+                    quota_manager.record_llm_usage(actual_tokens, cost, metadata=metadata)
+                    
+                    # Log success
+                    self._log_routing(task_type, tier_name, provider_cfg, actual_tokens, cost, "success" if won else "hedge_discarded", "", attempt+1, latency, prompt_tokens, source=source, bytes_saved=ctx['bytes_saved'], ranking=ctx['ranking'])
+                    if not won:
+                        return None, None
+                    
+                    return {
+                        "text": result_text,
+                        "json": parsed_json,
+                        "tokens": actual_tokens,
+                        "cost": cost,
+                        "provider": provider_name,
+                        "model": model_name,
+                        "tier": tier_name,
+                        "cache_hit": False,
+                    }, None
+                except RateLimitError as e:
+                    latency = time.time() - start_time
+                    last_exception = e
+                    logger.warning(f"Provider {provider_name} rate limited: {e}")
+                    self._record_health(provider_cfg, task_type, "failure", latency)
+                    self._log_routing(task_type, tier_name, provider_cfg, 0, 0, "rate_limit", str(e), attempt+1, latency, prompt_tokens, source=source, bytes_saved=ctx['bytes_saved'], ranking=ctx['ranking'])
+                    if attempt < 2: # Continue to next retry in inner loop
+                        continue
+                    else:
+                        attempts_chain.append({"provider": provider_name, "model": model_name, "result": "rate_limit_exhausted", "error": str(e)})
+                        break # Try next provider
+                except QuotaExhaustedError as e:
+                    latency = time.time() - start_time
+                    logger.error(f"Quota exhausted for {provider_name}: {e}. Tripping circuit breaker.")
+                    quota_manager.mark_provider_degraded(provider_name)
+                    self._record_health(provider_cfg, task_type, "failure", latency)
+                    attempts_chain.append({"provider": provider_name, "model": model_name, "result": "quota_exhausted", "error": str(e)})
+                    self._log_routing(task_type, tier_name, provider_cfg, 0, 0, "quota_exhausted", str(e), attempt+1, latency, prompt_tokens, source=source, bytes_saved=ctx['bytes_saved'], ranking=ctx['ranking'])
+                    break # Try next provider in tier
+                except ProviderSkip as e:
+                    latency = time.time() - start_time
+                    logger.warning(f"Provider {provider_name} skipped: {e}")
+                    attempts_chain.append({"provider": provider_name, "model": model_name, "result": "skipped", "error": str(e)})
+                    self._log_routing(task_type, tier_name, provider_cfg, 0, 0, "skipped", str(e), attempt+1, latency, prompt_tokens, source=source, bytes_saved=ctx['bytes_saved'], ranking=ctx['ranking'])
+                    break # Try next provider in tier
+                except Exception as e:
+                    latency = time.time() - start_time
+                    last_exception = e
+                    err_msg = str(e).upper()
+                    attempts_chain.append({"provider": provider_name, "model": model_name, "result": "error", "error": str(e)})
+                    self._record_health(provider_cfg, task_type, "failure", latency)
+                    self._log_routing(task_type, tier_name, provider_cfg, 0, 0, "error", str(e), attempt+1, latency, prompt_tokens, source=source, bytes_saved=ctx['bytes_saved'], ranking=ctx['ranking'])
+                    if _is_connection_error(e):
+                        self._discard_provider(provider_cfg)
+                    
+                    # Retry only on very specific transient errors NOT already caught by RateLimitError
+                    if any(x in err_msg for x in ["TIMEOUT", "CONNECTION_ERROR"]):
+                        continue
+                    break # Other errors → try next provider
+                    
+        except Exception as e:
+            logger.warning(f"Failed to use provider {provider_cfg['name']}: {e}")
+            last_exception = e
+
+        return None, last_exception
+
+    def _call_hedged(self, providers: List[Dict[str, str]], ctx: Dict[str, Any], attempts_chain: List[Dict], hedge_cfg: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Exception]]:
+        """
+        Hedged fallback chain: start the first provider and, if it has not answered within the
+        hedge delay (p95 of its recent latency), race the next provider in parallel.
+        The first valid response wins; slower calls finish in the background and are recorded
+        as hedge_discarded (their cost still lands in quota_manager). Once a provider has won,
+        the others stop retrying instead of calling their provider again.
+        """
+        win_lock = threading.Lock()
+        won = threading.Event()
+
+        def claim_win() -> bool:
+            with win_lock:
+                if won.is_set():
+                    return False
+                won.set()
+                return True
+
+        ctx = {**ctx, "claim_win": claim_win, "hedge_won": won}
+        queue = list(providers)
+        max_parallel = max(2, int(hedge_cfg.get('max_parallel', 2)))
+        running: Dict[Any, Dict[str, str]] = {}
+        last_exception = None
+
+        pool = ThreadPoolExecutor(max_workers=min(max_parallel, len(providers)), thread_name_prefix="llm-hedge")
+
+        def launch() -> Dict[str, str]:
+            cfg = queue.pop(0)
+            running[pool.submit(self._try_provider, cfg, ctx, attempts_chain)] = cfg
+            return cfg
+
+        try:
+            current = launch()
+            while running:
+                timeout = None
+                if queue and len(running) < max_parallel:
+                    timeout = self._hedge_delay(current, hedge_cfg)
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    slow = current
+                    current = launch()
+                    logger.info(f"Hedging {slow['name']} (>{timeout:.1f}s) with {current['name']}")
+                    continue
+                for fut in done:
+                    running.pop(fut)
+                    result, exc = fut.result()
+                    if result:
+                        return result, None
+                    if exc:
+                        last_exception = exc
+                if queue and len(running) < max_parallel:
+                    current = launch()
+        finally:
+            # Losers cannot be interrupted mid-request; let them finish without blocking the caller
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        return None, last_exception
+
+    def _rank_providers(self, task_type: str, providers: List[Dict[str, str]], require_json: bool,
+                        attempts_chain: List[Dict]) -> Tuple[List[Dict[str, str]], Optional[List[Dict[str, Any]]]]:
+        """
+        Tier providers in the order to try them (see provider_health). Providers skipped for
+        a high failure rate are recorded in attempts_chain. Without an enabled `adaptive`
+        block, the configured order is used and no ranking is logged.
+        """
+        adaptive = self.config.get('adaptive', {})
+        if not adaptive.get('enabled') or len(providers) < 2:
+            return list(providers), None
+        settings = {k: v for k, v in adaptive.items() if k != 'enabled'}
+        ordered, skipped, ranking = provider_health.rank(task_type, providers, require_json, settings)
+        for provider_cfg in skipped:
+            logger.info(f"Adaptive routing skipping {provider_cfg['name']}/{provider_cfg['model']} for {task_type}")
+            attempts_chain.append({"provider": provider_cfg['name'], "model": provider_cfg['model'], "result": "adaptive_skip",
+                                   "error": "Failure rate above adaptive.skip_failure_rate"})
+        return ordered, ranking
+
+    def _record_health(self, provider_cfg: Dict[str, str], task_type: str, outcome: str, latency: float) -> None:
+        adaptive = self.config.get('adaptive', {})
+        if adaptive.get('enabled'):
+            provider_health.record(provider_cfg['name'], provider_cfg['model'], task_type, outcome, latency,
+                                   alpha=float(adaptive.get('alpha', provider_health.DEFAULTS['alpha'])))
+
+    def _record_latency(self, provider_name: str, model_name: str, latency: float) -> None:
+        with self._semaphore_lock:
+            self._latencies.setdefault((provider_name, model_name), deque(maxlen=LATENCY_WINDOW)).append(latency)
+
+    def _hedge_delay(self, provider_cfg: Dict[str, str], hedge_cfg: Dict[str, Any]) -> float:
+        """Seconds to wait on a provider before hedging: the configured percentile of its recent successful latencies."""
+        self._seed_latencies()
+        default_delay = float(hedge_cfg.get('default_delay_sec', 5.0))
+        with self._semaphore_lock:
+            samples = sorted(self._latencies.get((provider_cfg['name'], provider_cfg['model']), ()))
+        if len(samples) < int(hedge_cfg.get('min_samples', 20)):
+            delay = default_delay
+        else:
+            pct = float(hedge_cfg.get('percentile', 95))
+            delay = samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+        return min(max(delay, float(hedge_cfg.get('min_delay_sec', 1.0))), float(hedge_cfg.get('max_delay_sec', 30.0)))
+
+    def _seed_latencies(self) -> None:
+        """Load recent success latencies from the tail of llm_routing.jsonl (once per process)."""
+        with self._semaphore_lock:
+            if self._latencies_seeded:
+                return
+            self._latencies_seeded = True
+        if not os.path.exists(LLM_LOG_PATH):
+            return
+        try:
+            with open(LLM_LOG_PATH, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - LATENCY_SEED_BYTES))
+                lines = f.read().decode('utf-8', errors='ignore').splitlines()[1:]
+        except OSError as e:
+            logger.warning(f"Could not read routing log for hedge latencies: {e}")
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('result') == 'success' and entry.get('latency_sec'):
+                self._record_latency(entry.get('provider'), entry.get('model'), float(entry['latency_sec']))
+
+    def call_many(self, requests: List[Dict[str, Any]], max_workers: Optional[int] = None) -> List[Any]:
+        """
+        Dispatch a batch of gateway calls concurrently. Each request is a dict of call() kwargs.
+        Every item keeps the full routing/fallback/retry/budget behavior of call(); per-provider
+        in-flight calls are capped by the `concurrency` block in llm_routing.yaml.
+        Results are returned in input order; a failed item yields its exception instead of raising.
+        """
+        if not requests:
+            return []
+        # Resolve the caller here — worker threads have no useful stack to inspect
+        default_source = self._resolve_source(None, depth=2)
+        prepared = [{**req, "source": req.get("source") or default_source} for req in requests]
+
+        def _run(req: Dict[str, Any]) -> Any:
+            try:
+                return self.call(**req)
+            except Exception as e:
+                return e
+
+        if len(prepared) == 1:
+            return [_run(prepared[0])]
+
+        workers = max_workers or self.config.get('concurrency', {}).get('max_workers', DEFAULT_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=min(workers, len(prepared)), thread_name_prefix="llm-gateway") as pool:
+            return list(pool.map(_run, prepared))
+
+    async def acall(self, task_type: str, prompt: str, source: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        """Async variant of call(). Runs in a worker thread so provider SDKs stay synchronous."""
+        import asyncio
+        # An awaited coroutine's caller is the awaiting coroutine; a top-level one is driven by asyncio
+        source = self._resolve_source(source, depth=2)
+        return await asyncio.to_thread(self.call, task_type, prompt, source=source, **kwargs)
+
+    def _log_routing(self, task_type: str, tier: str, provider: Dict, tokens: int, cost: float, result: str, error: str = "", attempt: int = 1, latency: float = 0, est_tokens: int = 0, source: str = "unknown", bytes_saved: int = 0, ranking: Optional[List[Dict[str, Any]]] = None):
         log_entry = {
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "source": source,
@@ -309,23 +641,34 @@ class LLMGateway:
             "result": result,
             "attempt": attempt,
             "latency_sec": round(latency, 2),
+            "bytes_saved": bytes_saved,
             "error": error
         }
-        os.makedirs(os.path.dirname(LLM_LOG_PATH), exist_ok=True)
+        if ranking is not None:
+            log_entry["ranking"] = ranking
         try:
-            with open(LLM_LOG_PATH, 'a') as f:
-                f.write(json.dumps(log_entry) + "\n")
+            log_sink.write(LLM_LOG_PATH, json.dumps(log_entry))
         except Exception as e:
-            logger.error(f"Failed to write LLM routing log: {e}")
+            logger.error(f"Failed to queue LLM routing log: {e}")
 
 # Global instance for easy access
 _gateway = None
+_gateway_lock = threading.Lock()
 
-def call_llm(task_type: str, prompt: str, require_json: bool = False, source: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+def _get_gateway() -> LLMGateway:
     global _gateway
     if _gateway is None:
-        _gateway = LLMGateway()
-    return _gateway.call(task_type, prompt, require_json=require_json, source=source, **kwargs)
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+def call_llm(task_type: str, prompt: str, require_json: bool = False, source: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+    return _get_gateway().call(task_type, prompt, require_json=require_json, source=source, **kwargs)
+
+def call_many_llm(requests: List[Dict[str, Any]], max_workers: Optional[int] = None) -> List[Any]:
+    """Concurrent batch of call_llm requests (dicts of call kwargs); see LLMGateway.call_many."""
+    return _get_gateway().call_many(requests, max_workers=max_workers)
 
 def _parse_json(text: str) -> dict:
     """Robustly extract JSON from LLM markdown-wrapped text."""
@@ -350,3 +693,18 @@ def call_json_llm(task_type: str, prompt: str, **kwargs) -> tuple[dict, str, int
     data = res['json']
     reasoning = data.get('reasoning', '') or res['text'][:200]
     return data, reasoning, res['tokens']
+
+def call_json_llm_many(requests: List[Dict[str, Any]], max_workers: Optional[int] = None) -> List[Any]:
+    """Batch variant of call_json_llm. Returns (json_dict, reasoning, tokens) per request,
+    in input order, or the exception raised for that request.
+    """
+    results = call_many_llm([{**req, "require_json": True} for req in requests], max_workers=max_workers)
+    out = []
+    for res in results:
+        if isinstance(res, Exception):
+            out.append(res)
+            continue
+        data = res['json']
+        reasoning = data.get('reasoning', '') or res['text'][:200]
+        out.append((data, reasoning, res['tokens']))
+    return out
@@ -1,11 +1,12 @@
 import os
 import json
 import logging
-from logging.handlers import RotatingFileHandler
 import threading
 from datetime import datetime, timezone
 import uuid
 
+from toolbox.lib import log_sink
+
 
 def _utc_now_iso():
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
@@ -41,12 +42,29 @@ class JsonlFormatter(logging.Formatter):
 
         return _json_dumps(entry)
 
+class SinkFileHandler(logging.Handler):
+    """Formats in the caller and hands the line to the background log sink (rotation included)."""
+    def __init__(self, filename, maxBytes=0, backupCount=0):
+        super().__init__()
+        self.baseFilename = os.path.abspath(filename)
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+
+    def emit(self, record):
+        try:
+            log_sink.write(self.baseFilename, self.format(record), self.maxBytes, self.backupCount)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        log_sink.flush()
+
 class LogManager:
     """
     Unified Logging System for the Toolbox.
     - Writes structured JSONL logs to a local file.
-    - Supports rotation.
-    - Thread-safe and Multi-instance.
+    - Supports rotation (safe across concurrent timer processes).
+    - Thread-safe and Multi-instance; file writes happen on the log_sink thread.
     """
     _instances = {}
     _lock = threading.Lock()
@@ -79,7 +97,7 @@ class LogManager:
             self.logger.addHandler(ch)
             
             # File Handler (JSONL)
-            self.file_handler = RotatingFileHandler(
+            self.file_handler = SinkFileHandler(
                 self.log_file, maxBytes=10*1024*1024, backupCount=7
             )
             self.file_handler.setFormatter(JsonlFormatter())
@@ -0,0 +1,229 @@
+"""
+Background JSONL log sink shared by the routing log, the cost log and LogManager.
+
+Callers hand over a finished line with write(); a daemon thread per process
+drains the queue every FLUSH_INTERVAL_SEC, groups lines by file and appends each
+group with a single O_APPEND write, so the LLM hot path never opens a file.
+
+  - fsync runs at most once per FSYNC_INTERVAL_SEC per file, and always on
+    flush() and at interpreter exit (atexit drains the queue first).
+  - Size-based rotation (max_bytes/backup_count, same naming as
+    RotatingFileHandler) happens under an fcntl lock on `<path>.lock`, and the
+    file is reopened for every batch, so concurrent timers never append to a
+    file another process has just renamed.
+  - Files without max_bytes are never rotated; O_APPEND keeps concurrent
+    writers from interleaving within a line.
+
+Processes that leave via os._exit (fork-context multiprocessing children) skip
+atexit and must call flush() themselves.
+"""
+import os
+import time
+import fcntl
+import queue
+import atexit
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger("toolbox.log_sink")
+
+FLUSH_INTERVAL_SEC = 0.5   # how long the writer collects lines before a batch write
+FSYNC_INTERVAL_SEC = 5.0   # per-file fsync cadence between explicit flushes
+MAX_BATCH = 1000           # lines per batch before writing early
+MAX_QUEUE = 100_000        # beyond this, write() falls back to a synchronous append
+
+_STOP = object()
+
+_state_lock = threading.Lock()
+_queue: queue.Queue | None = None
+_thread: threading.Thread | None = None
+_closed = False
+
+# Writer-thread bookkeeping: {path: monotonic time of last fsync}, files written since
+_last_fsync: dict = {}
+_dirty: set = set()
+
+
+def write(path: str, line: str, max_bytes: int = 0, backup_count: int = 0) -> None:
+    """Queue one line (without trailing newline) for appending to `path`."""
+    item = (path, line, max_bytes, backup_count)
+    if _closed or not _ensure_started():
+        _write_group(path, [line], max_bytes, backup_count, sync=True)
+        return
+    try:
+        _queue.put_nowait(item)
+    except queue.Full:
+        _write_group(path, [line], max_bytes, backup_count, sync=True)
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """Block until everything queued so far is written and fsynced. False on timeout."""
+    with _state_lock:
+        q, thread = _queue, _thread
+    if q is None or thread is None or not thread.is_alive():
+        return True
+    done = threading.Event()
+    q.put(done)
+    return done.wait(timeout)
+
+
+def shutdown(timeout: float = 5.0) -> None:
+    """Drain the queue and stop the writer; later writes go straight to disk."""
+    global _closed
+    with _state_lock:
+        _closed = True
+        q, thread = _queue, _thread
+    if q is None or thread is None or not thread.is_alive():
+        return
+    q.put(_STOP)
+    thread.join(timeout)
+
+
+def _ensure_started() -> bool:
+    global _queue, _thread
+    if _thread is not None and _thread.is_alive():
+        return True
+    with _state_lock:
+        if _closed:
+            return False
+        if _thread is None or not _thread.is_alive():
+            _queue = queue.Queue(maxsize=MAX_QUEUE)
+            _thread = threading.Thread(target=_run, args=(_queue,), name="log-sink", daemon=True)
+            try:
+                _thread.start()
+            except RuntimeError:  # interpreter shutting down
+                _thread = None
+                return False
+    return True
+
+
+def _reset_after_fork() -> None:
+    """The child inherits neither the writer thread nor responsibility for the parent's queue."""
+    global _queue, _thread, _closed, _state_lock
+    _state_lock = threading.Lock()
+    _queue, _thread, _closed = None, None, False
+    _last_fsync.clear()
+    _dirty.clear()
+
+
+def _run(q: queue.Queue) -> None:
+    while True:
+        batch, waiters, stop = [q.get()], [], False
+        deadline = time.monotonic() + FLUSH_INTERVAL_SEC
+        while len(batch) < MAX_BATCH:
+            item = batch[-1]
+            if item is _STOP or isinstance(item, threading.Event):
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(q.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        groups: dict = {}
+        for item in batch:
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            else:
+                path, line, max_bytes, backup_count = item
+                group = groups.setdefault(path, [[], max_bytes, backup_count])
+                group[0].append(line)
+
+        force_sync = stop or bool(waiters)
+        if stop:
+            # Anything queued behind the sentinel still belongs to this process
+            while True:
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, tuple):
+                    path, line, max_bytes, backup_count = item
+                    group = groups.setdefault(path, [[], max_bytes, backup_count])
+                    group[0].append(line)
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+
+        for path, (lines, max_bytes, backup_count) in groups.items():
+            _write_group(path, lines, max_bytes, backup_count, sync=force_sync)
+        if force_sync:
+            _sync_dirty()
+        for done in waiters:
+            done.set()
+        if stop:
+            return
+
+
+def _write_group(path: str, lines: list, max_bytes: int, backup_count: int, sync: bool = False) -> None:
+    data = "".join(line + "\n" for line in lines).encode("utf-8")
+    now = time.monotonic()
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        rotating = bool(max_bytes and backup_count > 0)
+        with _rotation_lock(path) if rotating else nullcontext():
+            if rotating:
+                _maybe_rotate(path, len(data), max_bytes, backup_count)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                if sync or now - _last_fsync.get(path, 0.0) >= FSYNC_INTERVAL_SEC:
+                    os.fsync(fd)
+                    _last_fsync[path] = now
+                    _dirty.discard(path)
+                else:
+                    _dirty.add(path)
+            finally:
+                os.close(fd)
+    except Exception as e:
+        logger.error(f"Failed to write {len(lines)} line(s) to {path}: {e}")
+
+
+def _sync_dirty() -> None:
+    for path in list(_dirty):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            _last_fsync[path] = time.monotonic()
+        except OSError as e:
+            logger.error(f"Failed to fsync {path}: {e}")
+        _dirty.discard(path)
+
+
+@contextmanager
+def _rotation_lock(path: str):
+    """Exclusive cross-process lock held while checking size, rotating and appending."""
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _maybe_rotate(path: str, incoming: int, max_bytes: int, backup_count: int) -> None:
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return
+    if size == 0 or size + incoming <= max_bytes:
+        return
+    for i in range(backup_count - 1, 0, -1):
+        src, dst = f"{path}.{i}", f"{path}.{i + 1}"
+        if os.path.exists(src):
+            os.replace(src, dst)
+    os.replace(path, f"{path}.1")
+
+
+atexit.register(shutdown)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
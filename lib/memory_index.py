@@ -0,0 +1,368 @@
+"""
+Block index for Memory markdown files.
+
+Memory files (Orders/*.md, Receipts/*.md, Travel.md, ...) are '---'-separated
+markdown blocks, normally headed '## YYYY-MM-DD — ...'. For every Drive file the
+index keeps each block's byte offsets, header date, entity_id marker, content hash
+and text, tagged with the md5Checksum of the content it was built from:
+
+  - while Drive's md5Checksum matches, a file can be read whole or by date
+    without downloading it, and dedup checks only look at one date's blocks;
+  - appends re-split only the last block instead of the whole file;
+  - when another writer appended to the file, only the tail is fetched (HTTP
+    Range request) and the result is verified against Drive's checksum.
+
+Storage: config/memory_index.db (SQLite, WAL mode, shared across timers)
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import sqlite3
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("toolbox.memory_index")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEX_PATH = os.path.join(BASE_DIR, 'config', 'memory_index.db')
+
+# Same separator as writers.block_exists; the separator belongs to the block before it
+_SEPARATOR = re.compile(r'\n---\s*\n?')
+_HEADER_DATE = re.compile(r'\s*## (\d{4}-\d{2}-\d{2})')
+_ANY_DATE = re.compile(r'## (\d{4}-\d{2}-\d{2})')
+_ENTITY = re.compile(r'<!-- entity_id: (\S+) -->')
+_FULL_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id TEXT PRIMARY KEY,
+    md5 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    deduped_md5 TEXT
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    file_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    date TEXT,
+    entity_id TEXT,
+    content_hash TEXT NOT NULL,
+    raw TEXT NOT NULL,
+    PRIMARY KEY (file_id, seq)
+);
+CREATE TABLE IF NOT EXISTS block_dates (
+    file_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_block_dates ON block_dates(file_id, date);
+CREATE INDEX IF NOT EXISTS idx_blocks_date ON blocks(file_id, date);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+    conn = sqlite3.connect(INDEX_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _md5(content: str) -> str:
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+class _Block:
+    __slots__ = ("raw", "text", "date", "dates", "entity_id", "content_hash", "nbytes")
+
+    def __init__(self, raw: str, text: str):
+        self.raw = raw            # block text plus its trailing separator
+        self.text = text          # block text as block_exists sees it
+        m = _HEADER_DATE.match(text)
+        self.date = m.group(1) if m else None
+        self.dates = set(_ANY_DATE.findall(text))
+        m = _ENTITY.search(text)
+        self.entity_id = m.group(1) if m else None
+        self.content_hash = hashlib.sha1(text.strip().encode('utf-8')).hexdigest()
+        self.nbytes = len(raw.encode('utf-8'))
+
+
+def _parse(content: str) -> List[_Block]:
+    blocks = []
+    pos = 0
+    for m in _SEPARATOR.finditer(content):
+        blocks.append(_Block(content[pos:m.end()], content[pos:m.start()]))
+        pos = m.end()
+    if pos < len(content):
+        blocks.append(_Block(content[pos:], content[pos:]))
+    return blocks
+
+
+class FileIndex:
+    """
+    In-memory block index of one Memory file. The blocks' raw text tiles the file
+    exactly, so `content` reproduces it byte for byte.
+    """
+
+    def __init__(self, blocks: Optional[List[_Block]] = None, checksum: Optional[str] = None):
+        self._blocks: List[_Block] = []
+        self._by_date: Dict[str, List[int]] = {}
+        self._content: Optional[str] = None
+        self.checksum = checksum    # md5 of the content as last synced with Drive / the DB
+        self.dirty_from = 0         # first block not yet persisted
+        self._extend(blocks or [])
+
+    @classmethod
+    def from_content(cls, content: str) -> "FileIndex":
+        return cls(_parse(content), checksum=_md5(content))
+
+    def _extend(self, blocks: List[_Block]) -> None:
+        for block in blocks:
+            seq = len(self._blocks)
+            self._blocks.append(block)
+            for date in block.dates:
+                self._by_date.setdefault(date, []).append(seq)
+
+    def _truncate(self, seq: int) -> str:
+        """Drop blocks from seq onwards; returns their raw text."""
+        dropped = self._blocks[seq:]
+        for i, block in enumerate(dropped, start=seq):
+            for date in block.dates:
+                self._by_date[date].remove(i)
+                if not self._by_date[date]:
+                    del self._by_date[date]
+        del self._blocks[seq:]
+        self.dirty_from = min(self.dirty_from, seq)
+        return ''.join(b.raw for b in dropped)
+
+    # --- reads ---
+
+    @property
+    def content(self) -> str:
+        if self._content is None:
+            self._content = ''.join(b.raw for b in self._blocks)
+        return self._content
+
+    @property
+    def size(self) -> int:
+        return sum(b.nbytes for b in self._blocks)
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def current_checksum(self) -> str:
+        if self.checksum is None:
+            self.checksum = _md5(self.content)
+        return self.checksum
+
+    def block_exists(self, date: str, *identifiers: str) -> bool:
+        """Same answer as writers.block_exists(self.content, date, *identifiers)."""
+        if _FULL_DATE.fullmatch(date or ''):
+            candidates = (self._blocks[i] for i in self._by_date.get(date, ()))
+        else:
+            candidates = iter(self._blocks)
+        needle = f'## {date}'
+        for block in candidates:
+            if needle in block.text and all(ident in block.text for ident in identifiers if ident):
+                return True
+        return False
+
+    def blocks_for_date(self, date: str) -> List[str]:
+        """Stripped text of blocks whose header starts with '## {date}'."""
+        needle = f'## {date}'
+        candidates = ((self._blocks[i] for i in self._by_date.get(date, ()))
+                      if _FULL_DATE.fullmatch(date or '') else iter(self._blocks))
+        return [b.text.strip() for b in candidates if b.text.strip().startswith(needle)]
+
+    # --- edits ---
+
+    def append(self, new_content: str) -> None:
+        """content.rstrip('\\n') + '\\n\\n' + new_content, re-splitting only the tail."""
+        if not self._blocks:
+            self._extend(_parse(new_content))
+        else:
+            seq = len(self._blocks) - 1
+            while seq > 0 and not self._blocks[seq].raw.strip('\n'):
+                seq -= 1
+            tail = self._truncate(seq)
+            self._extend(_parse(tail.rstrip('\n') + '\n\n' + new_content))
+        self._content = None
+        self.checksum = None
+
+    def replace(self, old_text: str, new_text: str) -> bool:
+        """Replace the first occurrence of old_text, re-splitting from the block where it starts."""
+        content = self.content
+        pos = content.find(old_text)
+        if pos < 0:
+            return False
+        seq, offset = 0, 0
+        while seq < len(self._blocks) - 1 and offset + len(self._blocks[seq].raw) <= pos:
+            offset += len(self._blocks[seq].raw)
+            seq += 1
+        tail = self._truncate(seq)
+        self._extend(_parse(tail.replace(old_text, new_text, 1)))
+        self._content = None
+        self.checksum = None
+        return True
+
+
+# ---------------------------------------------------------------------------
+# Persistence
+# ---------------------------------------------------------------------------
+
+def save(file_id: str, index: FileIndex) -> None:
+    """Persist blocks changed since the last save (all of them for a fresh index)."""
+    checksum = index.current_checksum()
+    start = sum(b.nbytes for b in index._blocks[:index.dirty_from])
+    rows, date_rows = [], []
+    for seq in range(index.dirty_from, len(index)):
+        b = index._blocks[seq]
+        rows.append((file_id, seq, start, start + b.nbytes, b.date, b.entity_id, b.content_hash, b.raw))
+        date_rows.extend((file_id, seq, d) for d in b.dates)
+        start += b.nbytes
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM blocks WHERE file_id = ? AND seq >= ?", (file_id, index.dirty_from))
+                conn.execute("DELETE FROM block_dates WHERE file_id = ? AND seq >= ?", (file_id, index.dirty_from))
+                conn.executemany("INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                conn.executemany("INSERT INTO block_dates VALUES (?, ?, ?)", date_rows)
+                conn.execute(
+                    "INSERT INTO files (file_id, md5, size, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(file_id) DO UPDATE SET md5 = excluded.md5, size = excluded.size, "
+                    "updated_at = excluded.updated_at",
+                    (file_id, checksum, start, time.time()),
+                )
+        finally:
+            conn.close()
+        index.dirty_from = len(index)
+    except sqlite3.Error as e:
+        logger.warning(f"Memory index write failed for {file_id}: {e}")
+
+
+def load(file_id: str) -> Optional[FileIndex]:
+    """The stored index for file_id (possibly stale — compare .checksum with Drive's md5Checksum)."""
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT md5 FROM files WHERE file_id = ?", (file_id,)).fetchone()
+            if not row:
+                return None
+            raws = [r[0] for r in conn.execute("SELECT raw FROM blocks WHERE file_id = ? ORDER BY seq", (file_id,))]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Memory index unavailable: {e}")
+        return None
+    index = FileIndex([_Block(raw, _SEPARATOR.split(raw, 1)[0]) for raw in raws], checksum=row[0])
+    index.dirty_from = len(index)
+    return index
+
+
+def query_date(file_id: str, checksum: Optional[str], date: str) -> Optional[List[str]]:
+    """
+    Blocks headed '## {date}' straight from the DB, or None when the stored index is
+    not for `checksum` (caller must refresh).
+    """
+    if not checksum or not _FULL_DATE.fullmatch(date or ''):
+        return None
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT md5 FROM files WHERE file_id = ?", (file_id,)).fetchone()
+            if not row or row[0] != checksum:
+                return None
+            raws = [r[0] for r in conn.execute(
+                "SELECT raw FROM blocks WHERE file_id = ? AND date = ? ORDER BY seq", (file_id, date))]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Memory index unavailable: {e}")
+        return None
+    return [_SEPARATOR.split(raw, 1)[0].strip() for raw in raws]
+
+
+def is_deduped(file_id: str, checksum: Optional[str]) -> bool:
+    """True if dedup_memory already found the file at this checksum clean."""
+    if not checksum:
+        return False
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT deduped_md5 FROM files WHERE file_id = ?", (file_id,)).fetchone()
+    finally:
+        conn.close()
+    return bool(row) and row[0] == checksum
+
+
+def mark_deduped(file_id: str, checksum: str) -> None:
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("UPDATE files SET deduped_md5 = ? WHERE file_id = ?", (checksum, file_id))
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Drive sync
+# ---------------------------------------------------------------------------
+
+def _decode(data) -> str:
+    return data.decode('utf-8') if isinstance(data, bytes) else data
+
+
+def _fetch_tail(service, file_id: str, index: FileIndex, meta: dict) -> Optional[FileIndex]:
+    """Extend a stale index with what another writer appended, downloading only the tail."""
+    if len(index) == 0 or not meta.get('size') or int(meta['size']) <= index.size:
+        return None
+    # Appends strip trailing newlines before adding, so only the last block's text
+    # up to those newlines is guaranteed to survive
+    seq = len(index) - 1
+    while seq > 0 and not index._blocks[seq].raw.strip('\n'):
+        seq -= 1
+    start = sum(b.nbytes for b in index._blocks[:seq])
+    stable = ''.join(b.raw for b in index._blocks[seq:]).rstrip('\n').encode('utf-8')
+    request = service.files().get_media(fileId=file_id)
+    request.headers['Range'] = f'bytes={start}-'
+    tail = request.execute()
+    tail = tail if isinstance(tail, bytes) else tail.encode('utf-8')
+    if not tail.startswith(stable):
+        return None
+    index._truncate(seq)
+    index._extend(_parse(tail.decode('utf-8')))
+    index._content = None
+    index.checksum = None
+    if index.current_checksum() != meta.get('md5Checksum'):
+        return None
+    return index
+
+
+def fetch(service, file_id: str, meta: Optional[dict] = None) -> tuple:
+    """
+    Current index for a Drive file, downloading as little as possible.
+    Returns (FileIndex, file metadata with md5Checksum/size/version).
+    """
+    if meta is None or 'md5Checksum' not in meta:
+        meta = service.files().get(fileId=file_id, fields='md5Checksum, size, version').execute()
+    md5 = meta.get('md5Checksum')
+    index = load(file_id)
+    if index is not None and md5 and index.checksum == md5:
+        return index, meta
+    if index is not None and md5:
+        try:
+            refreshed = _fetch_tail(service, file_id, index, meta)
+        except Exception as e:
+            logger.info(f"Tail fetch failed for {file_id}, downloading whole file: {e}")
+            refreshed = None
+        if refreshed is not None:
+            save(file_id, refreshed)
+            return refreshed, meta
+    index = FileIndex.from_content(_decode(service.files().get_media(fileId=file_id).execute()))
+    index.dirty_from = 0
+    save(file_id, index)
+    return index, meta
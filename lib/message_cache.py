@@ -0,0 +1,168 @@
+"""
+Shared cache of parsed Gmail messages.
+The email extractor, inbox scanner, sweep and Uptown response KB all parse the
+same messages (base64 bodies, HTML-to-text, attachment discovery); the parsed
+dict is stored here once per message id, zlib-compressed, with the Gmail
+historyId it was parsed at so label changes can be detected. Message bodies
+never change, so a cached entry can also stand in for a messages.get call.
+Backed by SQLite in WAL mode so the extractor and inbox scanner timers can
+share one cache; least-recently-used entries are evicted past the bounds.
+Storage: config/message_cache.db
+"""
+import os
+import json
+import time
+import zlib
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger("toolbox.message_cache")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_PATH = os.path.join(BASE_DIR, 'config', 'message_cache.db')
+
+DEFAULT_MAX_ENTRIES = 20000
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024  # compressed
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    history_id TEXT,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_last_access ON messages(last_access);
+"""
+
+# SQLite's default limit on bound parameters per statement is 999
+_CHUNK = 500
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot cache {type(value).__name__}")
+
+
+def _object_hook(obj):
+    if len(obj) == 1 and "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def _encode(email: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(email, default=_default).encode('utf-8'), 6)
+
+
+def _decode(blob: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(blob).decode('utf-8'), object_hook=_object_hook)
+
+
+def get_many(message_ids, history_ids: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Cached parses for the given ids ({id: email}; misses are absent). With
+    history_ids, entries parsed at a different historyId are skipped as stale.
+    """
+    ids = list(dict.fromkeys(message_ids))
+    if not ids:
+        return {}
+    found = {}
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                for i in range(0, len(ids), _CHUNK):
+                    chunk = ids[i:i + _CHUNK]
+                    marks = ",".join("?" * len(chunk))
+                    rows = conn.execute(
+                        f"SELECT id, history_id, data FROM messages WHERE id IN ({marks})", chunk,
+                    ).fetchall()
+                    hits = []
+                    for mid, history_id, blob in rows:
+                        wanted = (history_ids or {}).get(mid)
+                        if wanted and history_id != wanted:
+                            continue
+                        try:
+                            found[mid] = _decode(blob)
+                        except (zlib.error, ValueError) as e:
+                            logger.warning(f"Dropping unreadable cached message {mid}: {e}")
+                            conn.execute("DELETE FROM messages WHERE id = ?", (mid,))
+                            continue
+                        hits.append(mid)
+                    if hits:
+                        conn.execute(
+                            f"UPDATE messages SET last_access = ? WHERE id IN ({','.join('?' * len(hits))})",
+                            [now, *hits],
+                        )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Message cache read failed: {e}")
+        return {}
+    return found
+
+
+def get(message_id: str, history_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Cached parse for one message, or None (also when cached at another historyId)."""
+    return get_many([message_id], {message_id: history_id} if history_id else None).get(message_id)
+
+
+def put_many(entries, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+    """Store (message_id, history_id, email) tuples and evict least-recently-used entries over the bounds."""
+    now = time.time()
+    rows = []
+    for message_id, history_id, email in entries:
+        try:
+            blob = _encode(email)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Message {message_id} not cached: {e}")
+            continue
+        rows.append((message_id, history_id or None, blob, len(blob), now))
+    if not rows:
+        return
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO messages (id, history_id, data, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                _evict(conn, max_entries, max_bytes)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Message cache write failed: {e}")
+
+
+def put(message_id: str, history_id: Optional[str], email: Dict[str, Any], **bounds) -> None:
+    put_many([(message_id, history_id, email)], **bounds)
+
+
+def _evict(conn: sqlite3.Connection, max_entries: int, max_bytes: int) -> None:
+    count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM messages").fetchone()
+    if count <= max_entries and total <= max_bytes:
+        return
+    excess = max(0, count - max_entries)
+    freed = 0
+    dropped = 0
+    for mid, size in conn.execute("SELECT id, size FROM messages ORDER BY last_access ASC").fetchall():
+        if dropped >= excess and total - freed <= max_bytes:
+            break
+        conn.execute("DELETE FROM messages WHERE id = ?", (mid,))
+        freed += size
+        dropped += 1
+    logger.info(f"Message cache evicted {dropped} entries ({freed} bytes)")
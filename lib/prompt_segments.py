@@ -0,0 +1,135 @@
+"""
+Prompt segments for structure-aware truncation in LLMGateway.
+
+Prompt builders wrap the parts of a prompt in segment markers:
+
+    prompt = EXTRACT_PROMPT.format(body=prompt_segments.payload(body))
+
+When a prompt exceeds its tier's token cap, the gateway shrinks only the
+payload segments (email bodies, document text) middle-out, so instructions,
+output schemas, folder lists and examples reach the model intact. Text outside
+any marker counts as instructions. A prompt with no markers at all is treated
+as one payload: it loses its middle and keeps the leading instructions and
+trailing rules. Markers are stripped before a prompt is cached or sent.
+"""
+import re
+import logging
+from typing import Callable, List, Tuple
+
+from toolbox.lib import token_estimator
+
+logger = logging.getLogger("toolbox.prompt_segments")
+
+INSTRUCTIONS = 'instructions'
+SCHEMA = 'schema'
+EXAMPLES = 'examples'
+PAYLOAD = 'payload'
+KINDS = (INSTRUCTIONS, SCHEMA, EXAMPLES, PAYLOAD)
+
+# Share of a shrunk payload kept from its start; the rest comes from its end
+HEAD_SHARE = 0.6
+ELISION = "\n[…]\n"
+MAX_PASSES = 8
+
+# STX kind US text ETX — control characters that do not occur in prompt text
+_START, _SEP, _END = '\x02', '\x1f', '\x03'
+_MARKER = re.compile(f"{_START}({'|'.join(KINDS)}){_SEP}(.*?){_END}", re.DOTALL)
+_CONTROL = str.maketrans('', '', _START + _SEP + _END)
+
+Segments = List[Tuple[str, str]]
+
+
+def mark(kind: str, text: str) -> str:
+    """Wrap text as a segment of the given kind for use inside a prompt template."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown prompt segment kind '{kind}' (expected one of {', '.join(KINDS)})")
+    return f"{_START}{kind}{_SEP}{str(text).translate(_CONTROL)}{_END}"
+
+
+def payload(text: str) -> str:
+    return mark(PAYLOAD, text)
+
+
+def schema(text: str) -> str:
+    return mark(SCHEMA, text)
+
+
+def examples(text: str) -> str:
+    return mark(EXAMPLES, text)
+
+
+def split(prompt: str) -> Segments:
+    """[(kind, text), ...] in prompt order. An unmarked prompt is a single payload."""
+    if _START not in prompt:
+        return [(PAYLOAD, prompt)]
+    segments = []
+    pos = 0
+    for m in _MARKER.finditer(prompt):
+        if m.start() > pos:
+            segments.append((INSTRUCTIONS, prompt[pos:m.start()]))
+        segments.append((m.group(1), m.group(2)))
+        pos = m.end()
+    if pos < len(prompt):
+        segments.append((INSTRUCTIONS, prompt[pos:]))
+    return segments
+
+
+def join(segments: Segments) -> str:
+    """The prompt text as sent to providers, without markers."""
+    return ''.join(text for _, text in segments)
+
+
+def middle_out(text: str, keep_chars: int) -> str:
+    """Keep roughly keep_chars of text from its start and end, eliding the middle."""
+    if keep_chars >= len(text):
+        return text
+    if keep_chars <= 0:
+        return ''
+    head = int(keep_chars * HEAD_SHARE)
+    tail = keep_chars - head
+    return text[:head] + ELISION + (text[-tail:] if tail else '')
+
+
+def truncate(segments: Segments, token_cap: int,
+             estimate: Callable[[str], int] = token_estimator.estimate_text) -> Tuple[str, int, int]:
+    """
+    Shrink payload segments until the joined prompt fits token_cap.
+    Returns (prompt, estimated_tokens, bytes_saved). Instructions, schema and
+    examples are never cut; if they alone exceed the cap the payload is dropped
+    and the rest is sent as is.
+    """
+    full = join(segments)
+    tokens = estimate(full)
+    if tokens <= token_cap:
+        return full, tokens, 0
+
+    sizes = [len(text) if kind == PAYLOAD else 0 for kind, text in segments]
+    total_payload = sum(sizes)
+    if not total_payload:
+        logger.warning(f"Prompt ({tokens} tokens) exceeds cap {token_cap} but has no payload to shrink; sending intact.")
+        return full, tokens, 0
+
+    fixed_tokens = estimate(join([s for s in segments if s[0] != PAYLOAD]))
+    if fixed_tokens >= token_cap:
+        logger.warning(f"Prompt instructions alone ({fixed_tokens} tokens) exceed cap {token_cap}; dropping payload.")
+        ratio = 0.0
+    else:
+        payload_tokens = max(1, tokens - fixed_tokens)
+        ratio = (token_cap - fixed_tokens) / payload_tokens
+
+    result, result_tokens = full, tokens
+    for _ in range(MAX_PASSES):
+        result = join([
+            (kind, middle_out(text, int(size * ratio)) if kind == PAYLOAD else text)
+            for (kind, text), size in zip(segments, sizes)
+        ])
+        result_tokens = estimate(result)
+        if result_tokens <= token_cap or ratio == 0.0:
+            break
+        # Elision markers and boundary effects make the cut overshoot: scale down and retry
+        ratio *= token_cap / result_tokens * 0.98
+        if int(total_payload * ratio) == 0:
+            ratio = 0.0
+
+    bytes_saved = len(full.encode('utf-8')) - len(result.encode('utf-8'))
+    return result, result_tokens, bytes_saved
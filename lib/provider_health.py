@@ -0,0 +1,161 @@
+"""
+Per-(provider, model, task_type) health for adaptive ordering within a tier.
+
+Each attempt LLMGateway makes is folded into exponentially weighted moving
+averages (EWMA):
+  - latency_ewma      seconds; failures can only raise it (timeouts), never lower it
+  - json_error_rate   share of answers that failed JSON validation
+  - failure_rate      share of attempts that errored, were rate limited or hit quota
+Updates are single upserts, so the hourly sorter, backfill and extractor timers
+all feed, and read, the same numbers.
+
+rank() orders a tier's providers by expected seconds to a usable answer
+(latency / success probability), weighted by their position in
+llm_routing.yaml so the configured preference wins unless the data clearly
+disagrees. Providers with fewer than min_samples attempts keep their configured
+place. A provider whose failure rate is at or above skip_failure_rate is
+skipped until probe_after_sec has passed since its last attempt; the next call
+after that probes it. Ranking never adds or removes tiers or budget checks:
+every provider still passes LLMGateway's cost, degraded and budget gates.
+Storage: config/provider_health.db (WAL mode, shared across processes)
+"""
+import os
+import time
+import logging
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("toolbox.provider_health")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEALTH_PATH = os.path.join(BASE_DIR, 'config', 'provider_health.db')
+
+# Overridden by the `adaptive` block in llm_routing.yaml
+DEFAULTS = {
+    "alpha": 0.2,                # EWMA weight of the newest attempt
+    "min_samples": 5,            # attempts before stats may move or skip a provider
+    "default_latency_sec": 5.0,  # assumed latency for providers without enough samples
+    "static_bias": 0.5,          # score penalty per configured position (0 = pure data order)
+    "skip_failure_rate": 0.8,
+    "probe_after_sec": 300,
+}
+MIN_SUCCESS_PROB = 0.05
+
+OUTCOMES = ("success", "json_error", "failure")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS provider_stats (
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    task_type TEXT NOT NULL,
+    latency_ewma REAL NOT NULL,
+    json_error_rate REAL NOT NULL,
+    failure_rate REAL NOT NULL,
+    samples INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (provider, model, task_type)
+);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(HEALTH_PATH), exist_ok=True)
+    conn = sqlite3.connect(HEALTH_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def record(provider: str, model: str, task_type: str, outcome: str, latency: float = 0.0,
+           alpha: float = DEFAULTS["alpha"]) -> None:
+    """Fold one attempt (`success`, `json_error` or `failure`) into the EWMAs."""
+    if outcome not in OUTCOMES:
+        raise ValueError(f"Unknown provider outcome {outcome!r}; expected one of {OUTCOMES}")
+    params = {
+        "provider": provider, "model": model, "task_type": task_type,
+        "latency": max(0.0, latency), "json_error": float(outcome == "json_error"),
+        "failure": float(outcome == "failure"), "alpha": alpha, "now": time.time(),
+    }
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO provider_stats (provider, model, task_type, latency_ewma, json_error_rate, "
+                    "failure_rate, samples, updated_at) "
+                    "VALUES (:provider, :model, :task_type, :latency, :json_error, :failure, 1, :now) "
+                    "ON CONFLICT(provider, model, task_type) DO UPDATE SET "
+                    "latency_ewma = latency_ewma + :alpha * ("
+                    "  CASE WHEN :failure > 0 THEN MAX(:latency, latency_ewma) ELSE :latency END - latency_ewma), "
+                    "json_error_rate = json_error_rate + :alpha * (:json_error - json_error_rate), "
+                    "failure_rate = failure_rate + :alpha * (:failure - failure_rate), "
+                    "samples = samples + 1, updated_at = :now",
+                    params,
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Provider health write failed: {e}")
+
+
+def stats(task_type: str) -> Dict[Tuple[str, str], Dict[str, float]]:
+    """{(provider, model): {latency_ewma, json_error_rate, failure_rate, samples, updated_at}} for task_type."""
+    if not os.path.exists(HEALTH_PATH):
+        return {}
+    try:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                "SELECT provider, model, latency_ewma, json_error_rate, failure_rate, samples, updated_at "
+                "FROM provider_stats WHERE task_type = ?", (task_type,),
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Provider health read failed: {e}")
+        return {}
+    return {
+        (provider, model): {"latency_ewma": latency, "json_error_rate": json_rate, "failure_rate": failure_rate,
+                            "samples": samples, "updated_at": updated_at}
+        for provider, model, latency, json_rate, failure_rate, samples, updated_at in rows
+    }
+
+
+def rank(task_type: str, providers: List[Dict[str, str]], require_json: bool = False,
+         settings: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, str]], List[Dict[str, str]], List[Dict[str, Any]]]:
+    """
+    Order a tier's providers for task_type.
+    Returns (ordered, skipped, ranking) where ranking lists every provider with
+    its score (lower is better) in the order tried, skipped ones last.
+    """
+    cfg = {**DEFAULTS, **(settings or {})}
+    known = stats(task_type)
+    now = time.time()
+    scored = []
+    for index, provider_cfg in enumerate(providers):
+        row = known.get((provider_cfg['name'], provider_cfg['model']))
+        latency, success, samples, skip = float(cfg["default_latency_sec"]), 1.0, 0, False
+        if row and row["samples"] >= cfg["min_samples"]:
+            samples = row["samples"]
+            latency = row["latency_ewma"]
+            success = 1.0 - row["failure_rate"]
+            if require_json:
+                success *= 1.0 - row["json_error_rate"]
+            skip = (row["failure_rate"] >= cfg["skip_failure_rate"]
+                    and now - row["updated_at"] < cfg["probe_after_sec"])
+        expected = latency / max(success, MIN_SUCCESS_PROB)
+        score = expected * (1.0 + cfg["static_bias"] * index)
+        scored.append((skip, score, index, provider_cfg, samples))
+
+    if all(entry[0] for entry in scored):
+        # Never leave a tier empty: with every provider unhealthy, try them all, best score first
+        scored = [(False, score, index, provider_cfg, samples) for _, score, index, provider_cfg, samples in scored]
+    scored.sort(key=lambda entry: (entry[0], entry[1], entry[2]))
+
+    ordered = [entry[3] for entry in scored if not entry[0]]
+    skipped = [entry[3] for entry in scored if entry[0]]
+    ranking = [{"provider": provider_cfg['name'], "model": provider_cfg['model'], "score": round(score, 3),
+                "samples": samples, "skipped": skip}
+               for skip, score, _, provider_cfg, samples in scored]
+    return ordered, skipped, ranking
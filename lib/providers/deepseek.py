@@ -28,9 +28,24 @@ def _get_client():
 class DeepSeekProvider(AIProvider):
     name = "DeepSeek"
 
-    def __init__(self, model_name: str = None, api_key: str = None):
+    def __init__(self, model_name: str = None, api_key: str = None, pool_size: int = None):
         self.model_name = model_name or DEEPSEEK_MODEL
         self.api_key = api_key
+        self.pool_size = pool_size
+        self._client = None
+
+    def _gateway_client(self):
+        """OpenAI client built on first use and kept, so its keep-alive pool is reused across calls."""
+        if self._client is None:
+            from openai import OpenAI
+            kwargs = {}
+            if self.pool_size:
+                import httpx
+                from openai import DefaultHttpxClient
+                kwargs['http_client'] = DefaultHttpxClient(limits=httpx.Limits(
+                    max_connections=self.pool_size, max_keepalive_connections=self.pool_size))
+            self._client = OpenAI(api_key=self.api_key, base_url="https://api.deepseek.com", **kwargs)
+        return self._client
 
     def supports(self, mime_type: str) -> bool:
         # DeepSeek handles text only
@@ -41,8 +56,7 @@ class DeepSeekProvider(AIProvider):
         full_prompt = f"{prompt}\n\nCONTENT TO ANALYZE:\n{text_content}"
 
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=self.api_key, base_url="https://api.deepseek.com")
+            client = self._gateway_client()
             resp = client.chat.completions.create(
                 model=self.model_name,
                 messages=[{'role': 'user', 'content': full_prompt}],
@@ -48,10 +48,17 @@ def _get_client(is_paid=False):
 class GeminiProvider(AIProvider):
     name = "Gemini"
 
-    def __init__(self, model_name: str = None, api_key: str = None):
+    def __init__(self, model_name: str = None, api_key: str = None, pool_size: int = None):
         self.model_name = model_name
         self.api_key = api_key
-        self._gateway_client = genai.Client(api_key=api_key) if api_key else None
+        self._gateway_client = None
+        if api_key:
+            http_options = None
+            if pool_size:
+                import httpx
+                http_options = types.HttpOptions(client_args={'limits': httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size)})
+            self._gateway_client = genai.Client(api_key=api_key, http_options=http_options)
 
     def supports(self, mime_type: str) -> bool:
         # Gemini handles almost everything
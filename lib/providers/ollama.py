@@ -5,6 +5,7 @@ import os
 import time
 import logging
 import requests
+import requests.adapters
 from .base import AIProvider, ProviderSkip
 
 logger = logging.getLogger("DriveSorter.AI.Ollama")
@@ -15,8 +16,15 @@ OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'gemma4:e2b')
 class OllamaProvider(AIProvider):
     name = "Ollama"
 
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, pool_size: int = None):
         self.model_name = model_name or OLLAMA_MODEL
+        # Keep-alive session: the gateway reuses one provider per model, so the
+        # TCP connection to the Ollama server survives across calls.
+        self._session = requests.Session()
+        if pool_size:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
 
     def supports(self, mime_type: str) -> bool:
         return mime_type == 'text/plain'
@@ -30,7 +38,7 @@ class OllamaProvider(AIProvider):
         }
         try:
             start = time.time()
-            response = requests.post(OLLAMA_URL, json=payload, timeout=30)
+            response = self._session.post(OLLAMA_URL, json=payload, timeout=30)
             duration = time.time() - start
             
             if response.status_code == 200:
@@ -1,15 +1,32 @@
 """
 Shared daily Gemini token quota tracker.
 Both main.py (hourly sorter) and backfill.py write here after each Gemini call.
-Uses write-to-temp-then-rename for atomic updates (safe if both run concurrently).
-Config: config/quota_state.json
+
+Storage is a snapshot plus an append-only delta journal:
+  - config/quota_state.json          snapshot (atomic write-to-temp-then-rename)
+  - config/quota_state.json.journal  one JSON delta per recorded call
+  - config/quota_state.json.lock     fcntl lock serialising writers across timers
+Writers append a delta under the lock instead of rewriting the snapshot, so
+concurrent processes never lose updates. Readers keep an in-memory view and only
+re-read when the snapshot or journal changed on disk (stat check), so budget
+checks on the hot path do no JSON parsing. The journal is folded into the
+snapshot once it grows past COMPACT_BYTES.
+
+cost_log.jsonl lines go through the background log_sink writer; call
+log_sink.flush() before reading the file back in the same process.
 """
 import os
+import copy
 import json
+import fcntl
 import logging
 import tempfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
+from toolbox.lib import log_sink
+
 logger = logging.getLogger("DriveSorter.AI.Quota")
 
 # --- CONFIG ---
@@ -21,35 +38,156 @@ COST_LOG_PATH = os.path.join(BASE_DIR, 'logs', 'cost_log.jsonl')
 
 DAILY_BUDGET = 1500000  # Default 1.5M tokens
 FILES_PER_RUN = 100     # Default files to process per run
+COMPACT_BYTES = 64 * 1024  # Fold the journal into the snapshot past this size
 
-def load() -> dict:
-    """Load current quota state."""
-    today = datetime.now().strftime('%Y-%m-%d')
-    if os.path.exists(QUOTA_PATH):
+# Serialises access within a process (LLMGateway.call_many runs calls on threads);
+# the fcntl lock file does the same across processes.
+_lock = threading.RLock()
+
+# In-memory view: {"key": (path, snapshot stat, journal offset), "snapshot": dict, "state": dict}
+_view: dict = {}
+
+
+def _journal_path() -> str:
+    return QUOTA_PATH + '.journal'
+
+
+@contextmanager
+def _file_lock():
+    """Exclusive cross-process lock for journal appends, compaction and snapshot writes."""
+    os.makedirs(os.path.dirname(QUOTA_PATH), exist_ok=True)
+    with _lock, open(QUOTA_PATH + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
         try:
-            with open(QUOTA_PATH, 'r') as f:
-                state = json.load(f)
-                if state.get('date') == today:
-                    return state
-        except Exception as e:
-            logger.error(f"Error loading quota_state.json: {e}")
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _today() -> str:
+    return datetime.now().strftime('%Y-%m-%d')
+
 
-    # First use today — reset daily counters, preserve config fields
+def _fresh_state(today: str, previous: dict | None = None) -> dict:
+    """First use today — reset daily counters, preserve config fields."""
+    previous = previous or {}
     return {
         "date": today,
         "total_tokens_used": 0,
         "total_usd_used": 0.0,
-        "daily_budget": DAILY_BUDGET,
-        "files_per_run": FILES_PER_RUN,
+        "daily_budget": previous.get("daily_budget", DAILY_BUDGET),
+        "files_per_run": previous.get("files_per_run", FILES_PER_RUN),
         "sorter_calls_today": 0,
         "degraded_providers": [],  # Providers that hit monthly caps today
         "spend_by_task": {},       # Aggregate spend per task_type
     }
 
 
-def save(state: dict) -> None:
-    """Atomically write quota state."""
-    os.makedirs(os.path.dirname(QUOTA_PATH), exist_ok=True)
+def _stat_key(path: str):
+    try:
+        st = os.stat(path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+
+def _apply_delta(state: dict, delta: dict) -> None:
+    if delta.get("date") != state.get("date"):
+        return
+    if delta.get("tokens"):
+        state["total_tokens_used"] = state.get("total_tokens_used", 0) + delta["tokens"]
+    if delta.get("usd"):
+        state["total_usd_used"] = state.get("total_usd_used", 0.0) + delta["usd"]
+        if delta.get("task"):
+            task_spend = state.setdefault("spend_by_task", {})
+            task_spend[delta["task"]] = task_spend.get(delta["task"], 0.0) + delta["usd"]
+    if delta.get("calls"):
+        state["sorter_calls_today"] = state.get("sorter_calls_today", 0) + delta["calls"]
+    if delta.get("degraded") and delta["degraded"] not in state.setdefault("degraded_providers", []):
+        state["degraded_providers"].append(delta["degraded"])
+
+
+def _read_snapshot() -> dict:
+    if os.path.exists(QUOTA_PATH):
+        try:
+            with open(QUOTA_PATH, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading quota_state.json: {e}")
+    return {}
+
+
+def _refresh() -> dict:
+    """Bring the in-memory view up to date with disk and return it (not a copy)."""
+    with _lock:
+        today = _today()
+        snap_key = _stat_key(QUOTA_PATH)
+        journal = _journal_path()
+        journal_size = (_stat_key(journal) or (0, 0, 0))[1]
+
+        cached = _view.get("key")
+        if not cached or cached[0] != QUOTA_PATH or cached[1] != snap_key or journal_size < cached[2]:
+            # Snapshot replaced (compaction / direct write) or journal truncated: rebuild
+            snapshot = _read_snapshot()
+            _view["snapshot"] = snapshot
+            _view["state"] = copy.deepcopy(snapshot) if snapshot.get("date") == today else _fresh_state(today, snapshot)
+            offset = 0
+        else:
+            offset = cached[2]
+            if _view["state"].get("date") != today:
+                _view["state"] = _fresh_state(today, _view["state"])
+
+        if journal_size > offset:
+            offset = _replay_journal(journal, offset, _view["state"], _view["snapshot"].get("journal_gen", 0))
+
+        _view["key"] = (QUOTA_PATH, snap_key, offset)
+        return _view["state"]
+
+
+def _replay_journal(journal: str, offset: int, state: dict, gen: int) -> int:
+    """Apply complete journal lines from offset; returns the new offset."""
+    try:
+        with open(journal, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read()
+    except FileNotFoundError:
+        return 0
+    end = chunk.rfind(b'\n') + 1  # ignore a partially written trailing line
+    for line in chunk[:end].splitlines():
+        try:
+            delta = json.loads(line)
+        except ValueError:
+            continue
+        # Lines from before the last compaction are already in the snapshot
+        if delta.get("gen", 0) == gen:
+            _apply_delta(state, delta)
+    return offset + end
+
+
+def _append_delta(delta: dict) -> dict:
+    """Durably record a delta for today and return the refreshed state."""
+    with _file_lock():
+        state = _refresh()
+        delta = {"gen": _view["snapshot"].get("journal_gen", 0), "date": state["date"], **delta}
+        try:
+            with open(_journal_path(), 'a') as f:
+                f.write(json.dumps(delta) + '\n')
+        except Exception as e:
+            logger.error(f"Failed to append quota journal: {e}")
+        state = _refresh()
+        if os.path.getsize(_journal_path()) > COMPACT_BYTES:
+            _compact(state)
+        return state
+
+
+def _compact(state: dict) -> None:
+    """Fold the journal into a new snapshot generation. Caller holds the file lock."""
+    _write_snapshot({**state, "journal_gen": _view["snapshot"].get("journal_gen", 0) + 1})
+    open(_journal_path(), 'w').close()
+    _refresh()
+
+
+def _write_snapshot(state: dict) -> None:
     dir_ = os.path.dirname(QUOTA_PATH)
     try:
         with tempfile.NamedTemporaryFile('w', dir=dir_, delete=False, suffix='.tmp') as f:
@@ -60,28 +198,34 @@ def save(state: dict) -> None:
         logger.error(f"Failed to save quota_state.json: {e}")
 
 
+def load() -> dict:
+    """Load current quota state (a copy of the in-memory view)."""
+    return copy.deepcopy(_refresh())
+
+
+def save(state: dict) -> None:
+    """Atomically overwrite quota state (snapshot becomes authoritative, journal is reset)."""
+    os.makedirs(os.path.dirname(QUOTA_PATH), exist_ok=True)
+    with _file_lock():
+        _refresh()
+        _write_snapshot({**state, "journal_gen": _view["snapshot"].get("journal_gen", 0) + 1})
+        if os.path.exists(_journal_path()):
+            open(_journal_path(), 'w').close()
+        _refresh()
+
+
 def record_tokens(tokens: int) -> dict:
     """Add tokens to today's total and persist. Returns updated state."""
-    state = load()
-    state["total_tokens_used"] = state.get("total_tokens_used", 0) + tokens
-    save(state)
-    return state
+    return copy.deepcopy(_append_delta({"tokens": tokens}))
 
 
 def record_llm_usage(tokens: int, usd_cost: float, metadata: dict | None = None) -> dict:
     """Record both tokens and USD cost for a single LLM call."""
-    state = load()
-    state["total_tokens_used"] = state.get("total_tokens_used", 0) + tokens
-    state["total_usd_used"] = state.get("total_usd_used", 0.0) + usd_cost
-
+    delta = {"tokens": tokens, "usd": usd_cost}
     # Aggregate by task type
     if metadata and metadata.get("task_type"):
-        task = metadata["task_type"]
-        task_spend = state.get("spend_by_task", {})
-        task_spend[task] = task_spend.get(task, 0.0) + usd_cost
-        state["spend_by_task"] = task_spend
-
-    save(state)
+        delta["task"] = metadata["task_type"]
+    state = copy.deepcopy(_append_delta(delta))
 
     record = {
         "timestamp": datetime.now().isoformat(),
@@ -90,10 +234,8 @@ def record_llm_usage(tokens: int, usd_cost: float, metadata: dict | None = None)
     }
     if metadata:
         record.update({k: v for k, v in metadata.items() if v is not None})
-    os.makedirs(os.path.dirname(COST_LOG_PATH), exist_ok=True)
     try:
-        with open(COST_LOG_PATH, 'a') as f:
-            f.write(json.dumps(record) + '\n')
+        log_sink.write(COST_LOG_PATH, json.dumps(record))
     except Exception as e:
         logger.error(f"Failed to append Gemini usage record to cost_log.jsonl: {e}")
 
@@ -102,28 +244,25 @@ def record_llm_usage(tokens: int, usd_cost: float, metadata: dict | None = None)
 
 def mark_provider_degraded(provider_name: str) -> None:
     """Mark a provider as degraded (monthly cap hit) for the rest of the day."""
-    state = load()
-    degraded = set(state.get("degraded_providers", []))
-    if provider_name not in degraded:
-        degraded.add(provider_name)
-        state["degraded_providers"] = list(degraded)
-        save(state)
-        logger.warning(f"Provider {provider_name} marked as DEGRADED for today.")
+    if provider_name in _refresh().get("degraded_providers", []):
+        return
+    _append_delta({"degraded": provider_name})
+    logger.warning(f"Provider {provider_name} marked as DEGRADED for today.")
 
 
 def get_degraded_providers() -> list[str]:
     """Return list of providers currently degraded."""
-    return load().get("degraded_providers", [])
+    return list(_refresh().get("degraded_providers", []))
 
 
 def get_total_usd_used() -> float:
     """Return today's total USD usage."""
-    return load().get("total_usd_used", 0.0)
+    return _refresh().get("total_usd_used", 0.0)
 
 
 def remaining() -> int:
     """How many tokens are left in today's budget."""
-    state = load()
+    state = _refresh()
     return max(0, state.get("daily_budget", DAILY_BUDGET) - state.get("total_tokens_used", 0))
 
 
@@ -134,14 +273,12 @@ def is_exhausted() -> bool:
 
 def record_call() -> None:
     """Track calls to Gemini per day (for RPD monitoring)."""
-    state = load()
-    state['sorter_calls_today'] = state.get('sorter_calls_today', 0) + 1
-    save(state)
+    _append_delta({"calls": 1})
 
 
 def is_rpd_exhausted() -> bool:
     """Check if we've exceeded the free-tier RPD (e.g. 1500 calls/day)."""
-    state = load()
+    state = _refresh()
     # 1400 as safety margin before falling back to paid
     return state.get('sorter_calls_today', 0) >= 1400
 
@@ -164,9 +301,7 @@ def log_cost(run_type_or_record: str | dict, files_processed: int = 0, tokens_us
             "cost_usd_est": round(cost, 6),
         }
 
-    os.makedirs(os.path.dirname(COST_LOG_PATH), exist_ok=True)
     try:
-        with open(COST_LOG_PATH, 'a') as f:
-            f.write(json.dumps(record) + '\n')
+        log_sink.write(COST_LOG_PATH, json.dumps(record))
     except Exception as e:
         logger.error(f"Failed to write cost_log.jsonl: {e}")
@@ -27,10 +27,8 @@ def get_memory_blocks(service, path: str, date_str: str) -> List[str]:
     path: relative to '01 - Second Brain/Memory/'
     date_str: YYYY-MM-DD
     """
-    from toolbox.lib.drive_utils import get_drive_service
-    from toolbox.services.email_extractor.writers import get_memory_content, MEMORY_ROOT
-    
-    # get_memory_content handles the Drive interaction
+    from toolbox.services.email_extractor.writers import get_memory_blocks as get_indexed_blocks
+
     # category is the first part of the path, filename is the rest
     parts = path.strip('/').split('/')
     if len(parts) > 1:
@@ -42,14 +40,9 @@ def get_memory_blocks(service, path: str, date_str: str) -> List[str]:
         
     if not filename.endswith('.md'):
         filename += '.md'
-        
-    content = get_memory_content(category, filename)
-    if not content:
-        return []
-        
-    # Extract blocks starting with '## {date_str}'
-    blocks = content.split('\n---')
-    return [b.strip() for b in blocks if b.strip().startswith(f'## {date_str}')]
+
+    # The memory block index answers date lookups without downloading the whole file
+    return get_indexed_blocks(category, filename, date_str)
 
 # --- Markdown Helpers ---
 def build_stat_card(num: Any, label: str, icon: Optional[str] = None) -> str:
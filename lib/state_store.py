@@ -0,0 +1,486 @@
+"""
+Shared SQLite state store for the drive organizer, backfill, email extractor
+and inbox scanner timers (replaces their per-service JSON state files).
+
+Typed tables, all keyed by a per-service namespace:
+  - processed_ids      item_id -> last seen value (e.g. analyzed file name)
+  - failure_cooldowns  item_id -> failure metadata with next_retry_at
+  - queue_items        FIFO work queue (AUTOINCREMENT seq, O(1) dequeue)
+  - page_tokens        API cursors (Drive changes token, Gmail historyId)
+  - documents          free-form top-level state keys, one JSON row per key
+
+Views returned by StateStore buffer their changes in memory and behave like
+the dicts/lists the services used before, so a dry run never touches disk.
+StateStore.commit() writes only the rows that changed, in one short
+transaction, so saves cost O(changed items) rather than O(state size).
+Storage: config/state.db (WAL mode, shared across processes)
+"""
+import abc
+import os
+import json
+import time
+import logging
+import sqlite3
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger("toolbox.state_store")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_DB_PATH = os.path.join(BASE_DIR, 'config', 'state.db')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_ids (
+    namespace TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    value TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, item_id)
+);
+CREATE TABLE IF NOT EXISTS failure_cooldowns (
+    namespace TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    next_retry_at TEXT,
+    PRIMARY KEY (namespace, item_id)
+);
+CREATE TABLE IF NOT EXISTS queue_items (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    item_id TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_queue_items_ns ON queue_items(namespace, seq);
+CREATE TABLE IF NOT EXISTS page_tokens (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    token TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, name)
+);
+CREATE TABLE IF NOT EXISTS documents (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS migrations (
+    namespace TEXT PRIMARY KEY,
+    source TEXT,
+    migrated_at REAL NOT NULL
+);
+"""
+
+_DELETED = object()
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, sort_keys=True)
+
+
+class _KeyedView(MutableMapping, abc.ABC):
+    """Write-back mapping over one namespace of a keyed table."""
+
+    table = ""
+
+    def __init__(self, store: "StateStore", namespace: str):
+        self.store = store
+        self.namespace = namespace
+        self._pending: Dict[str, Any] = {}
+        self._cleared = False
+
+    # Subclasses map between Python values and row columns
+    @abc.abstractmethod
+    def _decode(self, row) -> Any:
+        """Python value for a row returned by _select."""
+
+    @abc.abstractmethod
+    def _write(self, conn: sqlite3.Connection, key: str, value: Any) -> None:
+        """Upsert key's row inside the caller's transaction."""
+
+    @abc.abstractmethod
+    def _select(self, key: str):
+        """The stored row for key, or None."""
+
+    def __getitem__(self, key):
+        if key in self._pending:
+            value = self._pending[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        if self._cleared:
+            raise KeyError(key)
+        row = self._select(key)
+        if row is None:
+            raise KeyError(key)
+        return self._decode(row)
+
+    def __setitem__(self, key, value):
+        self._pending[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._pending[key] = _DELETED
+
+    def _stored_keys(self) -> List[str]:
+        if self._cleared:
+            return []
+        rows = self.store._conn().execute(
+            f"SELECT item_id FROM {self.table} WHERE namespace = ?", (self.namespace,)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set()
+        for key in self._stored_keys():
+            seen.add(key)
+            if self._pending.get(key) is not _DELETED:
+                yield key
+        for key, value in list(self._pending.items()):
+            if key not in seen and value is not _DELETED:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def clear(self) -> None:
+        self._pending.clear()
+        self._cleared = True
+
+    def replace(self, mapping: Dict[str, Any]) -> None:
+        """Buffer a full replacement of this namespace (used when importing plain dicts)."""
+        self.clear()
+        self._pending.update(mapping)
+
+    def _flush(self, conn: sqlite3.Connection) -> None:
+        if self._cleared:
+            conn.execute(f"DELETE FROM {self.table} WHERE namespace = ?", (self.namespace,))
+        for key, value in self._pending.items():
+            if value is _DELETED:
+                conn.execute(f"DELETE FROM {self.table} WHERE namespace = ? AND item_id = ?",
+                             (self.namespace, key))
+            else:
+                self._write(conn, key, value)
+        self._pending.clear()
+        self._cleared = False
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.namespace!r}, {len(self)} items)"
+
+
+class ProcessedIds(_KeyedView):
+    """item_id -> last seen value (a string), e.g. file_id -> last analyzed name."""
+
+    table = "processed_ids"
+
+    def _select(self, key):
+        return self.store._conn().execute(
+            "SELECT value FROM processed_ids WHERE namespace = ? AND item_id = ?",
+            (self.namespace, key),
+        ).fetchone()
+
+    def _decode(self, row):
+        return row[0]
+
+    def _write(self, conn, key, value):
+        conn.execute(
+            "INSERT OR REPLACE INTO processed_ids (namespace, item_id, value, updated_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, value, time.time()),
+        )
+
+
+class FailureCooldowns(_KeyedView):
+    """item_id -> failure metadata dict; next_retry_at is also stored as its own column."""
+
+    table = "failure_cooldowns"
+
+    def _select(self, key):
+        return self.store._conn().execute(
+            "SELECT payload FROM failure_cooldowns WHERE namespace = ? AND item_id = ?",
+            (self.namespace, key),
+        ).fetchone()
+
+    def _decode(self, row):
+        return json.loads(row[0])
+
+    def _write(self, conn, key, value):
+        conn.execute(
+            "INSERT OR REPLACE INTO failure_cooldowns (namespace, item_id, payload, next_retry_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, _dumps(value), (value or {}).get("next_retry_at")),
+        )
+
+
+class WorkQueue:
+    """
+    FIFO queue of JSON items. pop(0) reads the head row by seq and only records the
+    consumed position; commit() deletes the consumed range with one statement, so
+    neither dequeue nor save scales with queue length.
+    """
+
+    def __init__(self, store: "StateStore", namespace: str):
+        self.store = store
+        self.namespace = namespace
+        self._head = 0          # highest stored seq consumed so far
+        self._appended: List[Any] = []
+        self._cleared = False
+
+    def _stored_count(self) -> int:
+        if self._cleared:
+            return 0
+        return self.store._conn().execute(
+            "SELECT COUNT(*) FROM queue_items WHERE namespace = ? AND seq > ?",
+            (self.namespace, self._head),
+        ).fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._stored_count() + len(self._appended)
+
+    def __bool__(self) -> bool:
+        if self._appended:
+            return True
+        if self._cleared:
+            return False
+        return self.store._conn().execute(
+            "SELECT 1 FROM queue_items WHERE namespace = ? AND seq > ? LIMIT 1",
+            (self.namespace, self._head),
+        ).fetchone() is not None
+
+    def __iter__(self) -> Iterator[Any]:
+        if not self._cleared:
+            rows = self.store._conn().execute(
+                "SELECT payload FROM queue_items WHERE namespace = ? AND seq > ? ORDER BY seq",
+                (self.namespace, self._head),
+            ).fetchall()
+            for (payload,) in rows:
+                yield json.loads(payload)
+        yield from list(self._appended)
+
+    def append(self, item: Any) -> None:
+        self._appended.append(item)
+
+    def extend(self, items) -> None:
+        self._appended.extend(items)
+
+    def popleft(self) -> Any:
+        if not self._cleared:
+            row = self.store._conn().execute(
+                "SELECT seq, payload FROM queue_items WHERE namespace = ? AND seq > ? ORDER BY seq LIMIT 1",
+                (self.namespace, self._head),
+            ).fetchone()
+            if row:
+                self._head = row[0]
+                return json.loads(row[1])
+        if self._appended:
+            return self._appended.pop(0)
+        raise IndexError("pop from empty queue")
+
+    def pop(self, index: int = -1) -> Any:
+        if index != 0:
+            raise IndexError("WorkQueue only supports pop(0)")
+        return self.popleft()
+
+    def clear(self) -> None:
+        self._appended.clear()
+        self._cleared = True
+
+    def replace(self, items) -> None:
+        self.clear()
+        self._appended.extend(items)
+
+    def _flush(self, conn: sqlite3.Connection) -> None:
+        if self._cleared:
+            conn.execute("DELETE FROM queue_items WHERE namespace = ?", (self.namespace,))
+        elif self._head:
+            conn.execute("DELETE FROM queue_items WHERE namespace = ? AND seq <= ?",
+                         (self.namespace, self._head))
+        conn.executemany(
+            "INSERT INTO queue_items (namespace, item_id, payload) VALUES (?, ?, ?)",
+            [(self.namespace, item.get("id") if isinstance(item, dict) else None, json.dumps(item))
+             for item in self._appended],
+        )
+        self._appended.clear()
+        self._cleared = False
+        self._head = 0
+
+    def __repr__(self) -> str:
+        return f"WorkQueue({self.namespace!r}, {len(self)} items)"
+
+
+class StateDocument(dict):
+    """
+    Plain dict of free-form top-level state keys. Remembers what was loaded so
+    save_document() only rewrites keys this process actually changed; keys another
+    process updated in the meantime are left alone.
+    """
+
+    def __init__(self, namespace: str, data: Dict[str, Any]):
+        super().__init__(data)
+        self.namespace = namespace
+        self.baseline = {k: _dumps(v) for k, v in data.items()}
+
+
+class StateStore:
+    """One connection to the shared state DB plus the write-back views created from it."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or STATE_DB_PATH
+        self._connection: Optional[sqlite3.Connection] = None
+        self._views: list = []
+        self._tokens: Dict[tuple, Optional[str]] = {}
+        self._documents: list = []
+        self._migrations: list = []
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._connection = conn
+        return self._connection
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- views ---
+
+    def _view(self, cls, namespace: str):
+        for view in self._views:
+            if type(view) is cls and view.namespace == namespace:
+                return view
+        view = cls(self, namespace)
+        self._views.append(view)
+        return view
+
+    def processed(self, namespace: str) -> ProcessedIds:
+        return self._view(ProcessedIds, namespace)
+
+    def failures(self, namespace: str) -> FailureCooldowns:
+        return self._view(FailureCooldowns, namespace)
+
+    def queue(self, namespace: str) -> WorkQueue:
+        return self._view(WorkQueue, namespace)
+
+    def adopt(self, kind: str, namespace: str, value):
+        """
+        Return the view for (kind, namespace). If value is a plain dict/list (tests,
+        or code that assigned a fresh container), buffer it as the full new contents.
+        """
+        view = getattr(self, kind)(namespace)
+        if value is not view:
+            view.replace(value or ({} if kind != "queue" else []))
+        return view
+
+    # --- page tokens ---
+
+    def get_page_token(self, namespace: str, name: str = "default") -> Optional[str]:
+        if (namespace, name) in self._tokens:
+            return self._tokens[(namespace, name)]
+        row = self._conn().execute(
+            "SELECT token FROM page_tokens WHERE namespace = ? AND name = ?", (namespace, name)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_page_token(self, namespace: str, name: str, token: Optional[str]) -> None:
+        self._tokens[(namespace, name)] = token
+
+    # --- documents ---
+
+    def document(self, namespace: str) -> StateDocument:
+        rows = self._conn().execute(
+            "SELECT key, value FROM documents WHERE namespace = ?", (namespace,)
+        ).fetchall()
+        return StateDocument(namespace, {k: json.loads(v) for k, v in rows})
+
+    def save_document(self, namespace: str, doc: Dict[str, Any]) -> None:
+        """Buffer the keys of doc that differ from what was loaded (or from disk, for plain dicts)."""
+        if isinstance(doc, StateDocument) and doc.namespace == namespace:
+            baseline = doc.baseline
+        else:
+            baseline = self.document(namespace).baseline
+        self._documents.append((namespace, dict(doc), baseline))
+        if isinstance(doc, StateDocument):
+            doc.baseline = {k: _dumps(v) for k, v in doc.items()}
+
+    # --- persistence ---
+
+    def commit(self) -> None:
+        """Write every buffered change in a single transaction."""
+        conn = self._conn()
+        with conn:
+            for view in self._views:
+                view._flush(conn)
+            now = time.time()
+            for (namespace, name), token in self._tokens.items():
+                conn.execute(
+                    "INSERT OR REPLACE INTO page_tokens (namespace, name, token, updated_at) VALUES (?, ?, ?, ?)",
+                    (namespace, name, token, now),
+                )
+            for namespace, doc, baseline in self._documents:
+                for key, value in doc.items():
+                    encoded = _dumps(value)
+                    if baseline.get(key) != encoded:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO documents (namespace, key, value) VALUES (?, ?, ?)",
+                            (namespace, key, encoded),
+                        )
+                for key in baseline.keys() - doc.keys():
+                    conn.execute("DELETE FROM documents WHERE namespace = ? AND key = ?", (namespace, key))
+            for namespace, source in self._migrations:
+                conn.execute(
+                    "INSERT OR REPLACE INTO migrations (namespace, source, migrated_at) VALUES (?, ?, ?)",
+                    (namespace, source, now),
+                )
+        self._tokens.clear()
+        self._documents.clear()
+        self._migrations.clear()
+
+    def migrate_json(self, namespace: str, legacy_path: str,
+                     importer: Callable[["StateStore", dict], None]) -> bool:
+        """
+        One-time import of a legacy JSON state file into this store. Returns True if
+        data was imported. The imported rows and the migration marker are written in
+        one transaction. A legacy file that exists but cannot be read raises, and no
+        marker is recorded, so the import is retried on the next run instead of the
+        service starting from empty state. The legacy file is left in place (rename it
+        once verified).
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM migrations WHERE namespace = ?", (namespace,)).fetchone():
+            return False
+        data = None
+        if os.path.exists(legacy_path):
+            try:
+                with open(legacy_path) as f:
+                    data = json.load(f)
+            except Exception as e:
+                logger.error(f"Could not read legacy state {legacy_path}: {e}")
+                raise RuntimeError(f"Legacy state {legacy_path} could not be read; not migrating {namespace}") from e
+            if not isinstance(data, dict):
+                raise RuntimeError(f"Legacy state {legacy_path} is not a JSON object; not migrating {namespace}")
+            importer(self, data)
+        self._migrations.append((namespace, legacy_path if data is not None else None))
+        self.commit()
+        if data is not None:
+            logger.info(f"Imported legacy state {os.path.basename(legacy_path)} into {namespace}")
+            return True
+        return False
+
+
+def store_for(*values) -> StateStore:
+    """Return the StateStore behind the first view among values, or a fresh one."""
+    for value in values:
+        store = getattr(value, "store", None)
+        if isinstance(store, StateStore):
+            return store
+    return StateStore()
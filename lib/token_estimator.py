@@ -0,0 +1,194 @@
+"""
+Prompt and attachment token estimates for LLMGateway routing and budget checks.
+
+Each provider family gets an estimator: an offline tiktoken encoding when one is
+configured and installed (token_estimation.tokenizers in llm_routing.yaml),
+otherwise a character-class heuristic calibrated per family. Attachments are
+counted too: PDF pages and images at Gemini's per-page / per-tile rates, text
+payloads like prompts, other binaries by size. Counts are memoized, so the
+routing, truncation and cost checks of one call only scan the prompt once.
+Custom estimators can be plugged in with register().
+"""
+import re
+import math
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("toolbox.token_estimator")
+
+DEFAULT_FAMILY = 'default'
+
+# Multiplier on the heuristic count; BPE vocabularies differ in how much of
+# English they merge (larger vocab -> fewer tokens per word).
+DEFAULT_CALIBRATION = {
+    'gemini': 1.0,
+    'llama': 0.95,
+    'deepseek': 1.05,
+    DEFAULT_FAMILY: 1.05,   # routing happens before the provider is known: lean high
+}
+
+# Attachment rates (Gemini documents 258 tokens per PDF page and per 768px image tile)
+TOKENS_PER_PDF_PAGE = 258
+TOKENS_PER_IMAGE_TILE = 258
+IMAGE_TILE_PX = 768
+SMALL_IMAGE_PX = 384
+IMAGE_BYTES_PER_TILE = 150 * 1024   # tile guess when the image header is unreadable
+BINARY_BYTES_PER_TOKEN = 8          # docx/pptx etc. are zipped XML; text is extracted before sending
+
+_WORD = re.compile(r'[A-Za-z]+')
+_LONG_WORD = re.compile(r'[A-Za-z]{13,}')
+_DIGITS = re.compile(r'\d')
+_SYMBOL = re.compile(r'[^\w\s]')
+_NEWLINES = re.compile(r'\n+')
+_WIDE = re.compile(r'[⺀-鿿가-힯぀-ヿ＀-￯]')
+_PDF_PAGE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+
+MEMO_SIZE = 512
+
+_lock = threading.Lock()
+_estimators: Dict[str, Callable[[str], int]] = {}
+_config: dict = {}
+# (kind, family, hash, length) -> tokens. Keyed on the object's hash rather than the
+# object itself so memoized prompts and attachments are not kept alive.
+_memo: "OrderedDict[tuple, int]" = OrderedDict()
+
+
+def _memoized(key: tuple, compute: Callable[[], int]) -> int:
+    with _lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+    value = compute()
+    with _lock:
+        _memo[key] = value
+        if len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return value
+
+
+def family_for(provider_name: str, model: str = '') -> str:
+    """Tokenizer family of a provider/model from llm_routing.yaml."""
+    name = f"{provider_name} {model}".lower()
+    if 'gemini' in name or 'gemma' in name:
+        return 'gemini'
+    if 'deepseek' in name:
+        return 'deepseek'
+    if 'llama' in name or provider_name in ('groq', 'ollama'):
+        return 'llama'
+    return DEFAULT_FAMILY
+
+
+def heuristic_tokens(text: str) -> int:
+    """
+    Character-class estimate of a BPE token count: ~1.3 tokens per English word
+    (more for long runs like hashes or base64), digits in groups of ~3, most
+    symbols a token each, CJK about a token per char and other non-ASCII letters
+    about one per two chars. Dense content (JSON, IDs, URLs, tables) therefore
+    counts higher than len/4, plain prose about the same.
+    """
+    if not text:
+        return 0
+    words = len(_WORD.findall(text))
+    tokens = words * 1.3
+    tokens += sum(len(w) - 12 for w in _LONG_WORD.findall(text)) / 3
+    tokens += len(_DIGITS.findall(text)) / 3
+    tokens += len(_SYMBOL.findall(text)) * 0.8
+    tokens += len(_NEWLINES.findall(text)) * 0.5
+    if not text.isascii():
+        wide = len(_WIDE.findall(text))
+        other = sum(1 for ch in text if ord(ch) > 127) - wide
+        tokens += wide + other / 2
+    return max(1, math.ceil(tokens))
+
+
+def configure(config: Optional[dict]) -> None:
+    """Apply the token_estimation block of llm_routing.yaml (calibration, tokenizers)."""
+    global _config
+    with _lock:
+        _config = dict(config or {})
+        _estimators.clear()
+        _memo.clear()
+
+
+def register(family: str, estimator: Callable[[str], int]) -> None:
+    """Plug in an estimator (text -> tokens) for a family, e.g. a provider's own tokenizer."""
+    with _lock:
+        _estimators[family] = estimator
+        _memo.clear()
+
+
+def _tiktoken_estimator(encoding_name: str) -> Optional[Callable[[str], int]]:
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.info(f"tiktoken encoding {encoding_name} unavailable ({e}); using heuristic")
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def _estimator(family: str) -> Callable[[str], int]:
+    with _lock:
+        estimator = _estimators.get(family)
+        if estimator is not None:
+            return estimator
+        encoding_name = _config.get('tokenizers', {}).get(family)
+        calibration = {**DEFAULT_CALIBRATION, **_config.get('calibration', {})}
+    estimator = _tiktoken_estimator(encoding_name) if encoding_name else None
+    if estimator is None:
+        factor = calibration.get(family, calibration[DEFAULT_FAMILY])
+        estimator = lambda text: max(1, math.ceil(heuristic_tokens(text) * factor)) if text else 0
+    with _lock:
+        return _estimators.setdefault(family, estimator)
+
+
+def _estimate_text(text: str, family: str) -> int:
+    return _memoized(('text', family, hash(text), len(text)), lambda: _estimator(family)(text))
+
+
+def _image_tokens(content: bytes) -> int:
+    try:
+        import io
+        from PIL import Image
+        with Image.open(io.BytesIO(content)) as img:
+            width, height = img.size
+    except Exception:
+        return TOKENS_PER_IMAGE_TILE * max(1, math.ceil(len(content) / IMAGE_BYTES_PER_TILE))
+    if width <= SMALL_IMAGE_PX and height <= SMALL_IMAGE_PX:
+        return TOKENS_PER_IMAGE_TILE
+    tiles = math.ceil(width / IMAGE_TILE_PX) * math.ceil(height / IMAGE_TILE_PX)
+    return TOKENS_PER_IMAGE_TILE * tiles
+
+
+def _count_content(content: bytes, mime_type: str, family: str) -> int:
+    if 'pdf' in mime_type:
+        pages = len(_PDF_PAGE.findall(content))
+        return TOKENS_PER_PDF_PAGE * max(1, pages)
+    if mime_type.startswith('image/'):
+        return _image_tokens(content)
+    if mime_type.startswith('text/') or mime_type == 'application/json':
+        return _estimate_text(content.decode('utf-8', errors='ignore'), family)
+    return math.ceil(len(content) / BINARY_BYTES_PER_TOKEN)
+
+
+def estimate_text(text: str, family: str = DEFAULT_FAMILY) -> int:
+    """Estimated tokens for a prompt string."""
+    return _estimate_text(text, family) if text else 0
+
+
+def estimate_content(content_bytes: bytes, mime_type: str = 'text/plain', family: str = DEFAULT_FAMILY) -> int:
+    """Estimated tokens for an attachment sent alongside the prompt."""
+    if not content_bytes:
+        return 0
+    content = bytes(content_bytes)
+    mime_type = mime_type or ''
+    return _memoized(('content', family, mime_type, hash(content), len(content)),
+                     lambda: _count_content(content, mime_type, family))
+
+
+def estimate(prompt: str, content_bytes: bytes = b'', mime_type: str = 'text/plain',
+             family: str = DEFAULT_FAMILY) -> int:
+    """Estimated input tokens for a call: prompt plus attachment."""
+    return estimate_text(prompt, family) + estimate_content(content_bytes, mime_type, family)
@@ -0,0 +1,326 @@
+"""
+Incremental rollups of the LLM ledgers (cost_log.jsonl and llm_routing.jsonl).
+
+refresh() reads only the bytes appended since the last run (a saved offset and
+inode per ledger) and folds them into per-day / per-source / per-provider
+aggregates. Reports query the aggregates, so their cost depends on the number
+of days and groups asked for, not on ledger size.
+
+  - cost_daily       records, tokens, USD from cost_log.jsonl
+  - routing_daily    attempts, successes, errors, JSON errors, cache hits,
+                     tokens, USD from llm_routing.jsonl
+  - routing_latency  success latency histogram (geometric buckets) for p50/p95
+
+Rotation: if a ledger's inode changes, the rest of the old generation is read
+from its rotated sibling (`<path>.1`, ...) before starting the new file at 0; a
+file that shrank in place (copytruncate) restarts at 0. Aggregates and the
+cursor are committed in one BEGIN IMMEDIATE transaction, so concurrent reports
+never double-count and a crash mid-ingest re-reads the same bytes.
+Storage: config/usage_rollup.db (WAL mode, shared across processes)
+"""
+import os
+import glob
+import json
+import math
+import logging
+import sqlite3
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+from toolbox.lib import log_sink, quota_manager, llm_gateway
+
+logger = logging.getLogger("toolbox.usage_rollup")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROLLUP_PATH = os.path.join(BASE_DIR, 'config', 'usage_rollup.db')
+
+LATENCY_BUCKET_BASE = 1.25   # each bucket is 25% wider than the last (~12% percentile error)
+ERROR_RESULTS = ('error', 'json_error', 'rate_limit', 'quota_exhausted', 'failure')
+GROUP_COLUMNS = ('day', 'source', 'provider', 'model')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cursors (
+    ledger TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cost_daily (
+    day TEXT NOT NULL,
+    source TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    records INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    usd REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, source, provider, model)
+);
+CREATE TABLE IF NOT EXISTS routing_daily (
+    day TEXT NOT NULL,
+    source TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    json_errors INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    usd REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, source, provider, model)
+);
+CREATE TABLE IF NOT EXISTS routing_latency (
+    day TEXT NOT NULL,
+    source TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, source, provider, model, bucket)
+);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(ROLLUP_PATH), exist_ok=True)
+    conn = sqlite3.connect(ROLLUP_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _ledgers() -> Dict[str, str]:
+    return {"cost": quota_manager.COST_LOG_PATH, "routing": llm_gateway.LLM_LOG_PATH}
+
+
+def record_day(record: dict) -> Optional[str]:
+    """UTC day of a ledger record ('timestamp' or legacy 'date'), or None if undated."""
+    stamp = record.get("timestamp") or record.get("date")
+    if not stamp:
+        return None
+    try:
+        normalized = stamp.replace("Z", "+00:00")
+        return datetime.fromisoformat(normalized).astimezone(timezone.utc).date().isoformat()
+    except Exception:
+        return stamp[:10] if len(stamp) >= 10 else None
+
+
+def latency_bucket(latency_sec: float) -> int:
+    if latency_sec <= 0:
+        return 0
+    return max(0, math.ceil(math.log(latency_sec * 1000) / math.log(LATENCY_BUCKET_BASE)))
+
+
+def bucket_upper_sec(bucket: int) -> float:
+    return LATENCY_BUCKET_BASE ** bucket / 1000
+
+
+class _Batch:
+    """In-memory aggregates for one ingest, written with one upsert per group."""
+
+    def __init__(self):
+        self.lines = 0
+        self.cost = defaultdict(lambda: [0, 0, 0.0])
+        self.routing = defaultdict(lambda: [0, 0, 0, 0, 0, 0, 0.0])
+        self.latency = defaultdict(int)
+
+    def add(self, ledger: str, record: dict) -> None:
+        self.lines += 1
+        key = (record_day(record) or "",
+               record.get("source") or record.get("run_type") or "unknown",
+               record.get("provider") or "unknown",
+               record.get("model") or "unknown")
+        if ledger == "cost":
+            row = self.cost[key]
+            row[0] += 1
+            row[1] += int(record.get("tokens_used", record.get("actual_tokens", 0)) or 0)
+            row[2] += float(record.get("cost_usd_est", record.get("cost_usd", 0.0)) or 0.0)
+            return
+        result = record.get("result", "")
+        row = self.routing[key]
+        row[0] += 1
+        row[1] += result == "success"
+        row[2] += result in ERROR_RESULTS
+        row[3] += result == "json_error"
+        row[4] += result == "cache_hit"
+        row[5] += int(record.get("actual_tokens", 0) or 0)
+        row[6] += float(record.get("cost_usd", 0.0) or 0.0)
+        if result == "success" and record.get("latency_sec"):
+            self.latency[key + (latency_bucket(float(record["latency_sec"])),)] += 1
+
+    def write(self, conn: sqlite3.Connection) -> None:
+        conn.executemany(
+            "INSERT INTO cost_daily (day, source, provider, model, records, tokens, usd) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(day, source, provider, model) DO UPDATE SET "
+            "records = records + excluded.records, tokens = tokens + excluded.tokens, usd = usd + excluded.usd",
+            [key + tuple(row) for key, row in self.cost.items()],
+        )
+        conn.executemany(
+            "INSERT INTO routing_daily (day, source, provider, model, attempts, successes, errors, json_errors, "
+            "cache_hits, tokens, usd) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(day, source, provider, model) DO UPDATE SET "
+            "attempts = attempts + excluded.attempts, successes = successes + excluded.successes, "
+            "errors = errors + excluded.errors, json_errors = json_errors + excluded.json_errors, "
+            "cache_hits = cache_hits + excluded.cache_hits, tokens = tokens + excluded.tokens, usd = usd + excluded.usd",
+            [key + tuple(row) for key, row in self.routing.items()],
+        )
+        conn.executemany(
+            "INSERT INTO routing_latency (day, source, provider, model, bucket, count) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(day, source, provider, model, bucket) DO UPDATE SET count = count + excluded.count",
+            [key + (count,) for key, count in self.latency.items()],
+        )
+
+
+def _read_from(handle, offset: int, ledger: str, batch: _Batch, to_eof: bool = False) -> int:
+    """Fold complete lines after `offset` into batch; return the offset after the last one consumed."""
+    handle.seek(offset)
+    for raw in handle:
+        if not raw.endswith(b"\n") and not to_eof:
+            break  # a writer is mid-line; pick it up next time
+        offset += len(raw)
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            batch.add(ledger, json.loads(line))
+        except (json.JSONDecodeError, UnicodeDecodeError, ValueError, TypeError, AttributeError):
+            continue
+    return offset
+
+
+def _rotated_generation(path: str, inode: int) -> Optional[str]:
+    for candidate in sorted(glob.glob(glob.escape(path) + ".*")):
+        if candidate.endswith(".lock"):
+            continue
+        try:
+            if os.stat(candidate).st_ino == inode:
+                return candidate
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def _ingest(conn: sqlite3.Connection, ledger: str, path: str) -> int:
+    try:
+        handle = open(path, "rb")
+    except FileNotFoundError:
+        return 0
+    with handle:
+        st = os.fstat(handle.fileno())
+        batch = _Batch()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT path, inode, offset FROM cursors WHERE ledger = ?", (ledger,)).fetchone()
+            offset = 0
+            if row and row[0] == path:
+                _, inode, offset = row
+                if inode != st.st_ino:
+                    rotated = _rotated_generation(path, inode)
+                    if rotated:
+                        with open(rotated, "rb") as old:
+                            _read_from(old, offset, ledger, batch, to_eof=True)
+                    else:
+                        logger.warning(f"{ledger} ledger rotated and previous generation not found; "
+                                       f"lines after offset {offset} were not rolled up")
+                    offset = 0
+                elif st.st_size < offset:
+                    logger.warning(f"{ledger} ledger shrank ({st.st_size} < {offset}); re-reading from start")
+                    offset = 0
+            offset = _read_from(handle, offset, ledger, batch)
+            batch.write(conn)
+            conn.execute("INSERT OR REPLACE INTO cursors (ledger, path, inode, offset) VALUES (?, ?, ?, ?)",
+                         (ledger, path, st.st_ino, offset))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return batch.lines
+
+
+def refresh() -> int:
+    """Roll up everything appended to the ledgers since the last refresh. Returns lines ingested."""
+    log_sink.flush()
+    total = 0
+    try:
+        conn = _connect()
+        try:
+            for ledger, path in _ledgers().items():
+                total += _ingest(conn, ledger, path)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Usage rollup refresh failed: {e}")
+    return total
+
+
+def _where_days(days: Optional[int]):
+    # Undated legacy records are always included, matching summarize_cost_records
+    if days is None:
+        return "", ()
+    cutoff = (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat()
+    return " WHERE (day >= ? OR day = '')", (cutoff,)
+
+
+def _group_column(by: str) -> str:
+    if by not in GROUP_COLUMNS:
+        raise ValueError(f"Cannot group usage rollups by {by!r}; expected one of {GROUP_COLUMNS}")
+    return by
+
+
+def _query(sql: str, params: tuple) -> list:
+    if not os.path.exists(ROLLUP_PATH):
+        return []
+    try:
+        conn = _connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Usage rollup read failed: {e}")
+        return []
+
+
+def cost_totals(days: Optional[int] = 7, by: str = "source") -> Dict[str, Dict[str, float]]:
+    """{group: {"records", "tokens", "cost"}} from cost_log rollups (same shape as summarize_cost_records)."""
+    column = _group_column(by)
+    where, params = _where_days(days)
+    rows = _query(f"SELECT {column}, SUM(records), SUM(tokens), SUM(usd) FROM cost_daily{where} GROUP BY {column}", params)
+    return {group: {"records": records, "tokens": tokens, "cost": usd} for group, records, tokens, usd in rows}
+
+
+def _percentile(buckets: list, share: float) -> float:
+    total = sum(count for _, count in buckets)
+    if not total:
+        return 0.0
+    seen = 0
+    for bucket, count in sorted(buckets):
+        seen += count
+        if seen >= share * total:
+            return round(bucket_upper_sec(bucket), 3)
+    return round(bucket_upper_sec(max(bucket for bucket, _ in buckets)), 3)
+
+
+def routing_totals(days: Optional[int] = 7, by: str = "provider") -> Dict[str, Dict[str, float]]:
+    """{group: attempts, successes, errors, json_errors, cache_hits, tokens, cost, p50_sec, p95_sec}."""
+    column = _group_column(by)
+    where, params = _where_days(days)
+    rows = _query(
+        f"SELECT {column}, SUM(attempts), SUM(successes), SUM(errors), SUM(json_errors), SUM(cache_hits), "
+        f"SUM(tokens), SUM(usd) FROM routing_daily{where} GROUP BY {column}", params)
+    latency = defaultdict(list)
+    for group, bucket, count in _query(
+            f"SELECT {column}, bucket, SUM(count) FROM routing_latency{where} GROUP BY {column}, bucket", params):
+        latency[group].append((bucket, count))
+
+    totals = {}
+    for group, attempts, successes, errors, json_errors, cache_hits, tokens, usd in rows:
+        totals[group] = {
+            "attempts": attempts, "successes": successes, "errors": errors, "json_errors": json_errors,
+            "cache_hits": cache_hits, "tokens": tokens, "cost": usd,
+            "p50_sec": _percentile(latency[group], 0.50),
+            "p95_sec": _percentile(latency[group], 0.95),
+        }
+    return totals
@@ -7,6 +7,7 @@ Usage:
   python backfill.py --count-only   # survey all folders, print scope, no Gemini
   python backfill.py --dry-run      # process but don't rename/move
   python backfill.py --limit 50     # cap files this run (default from quota_state)
+  python backfill.py --concurrency 8  # classify 8 files per batch in parallel
   python backfill.py                # real run
 """
 import argparse
@@ -25,12 +26,12 @@ repo_root = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
 if repo_root not in sys.path:
     sys.path.append(repo_root)
 
-from toolbox.lib.llm_gateway import call_json_llm
-from toolbox.lib import quota_manager
+from toolbox.lib.llm_gateway import call_json_llm_many
+from toolbox.lib import quota_manager, state_store, drive_index, prompt_segments, folder_ranker
 from toolbox.lib.telegram import send_message
 from toolbox.lib.drive_utils import (
     get_drive_service, get_sheets_service,
-    download_file_content, move_file,
+    download_file_content, DriveBatch,
     resolve_folder_id, get_category_prompt_str,
     get_ai_supported_mime, SORTER_SYSTEM_PROMPT,
     INBOX_ID, HISTORY_SHEET_ID, CONFIG_PATH, ID_TO_PATH,
@@ -39,7 +40,7 @@ from toolbox.lib.drive_utils import (
 # --- CONFIG ---
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 CONFIG_DIR = os.path.join(BASE_DIR, 'config')
-STATE_PATH = os.path.join(CONFIG_DIR, 'backfill_state.json')
+STATE_PATH = os.path.join(CONFIG_DIR, 'backfill_state.json')  # legacy, imported once into state.db
 CACHE_PATH = os.path.join(CONFIG_DIR, 'gemini_cache.json')
 TREE_PATH  = os.path.join(CONFIG_DIR, 'drive_tree.json')
 LOG_FILE   = os.path.join(BASE_DIR, 'logs', 'backfill.log')
@@ -49,6 +50,7 @@ MIDNIGHT_BUFFER_SECS = 300  # stop 5 min before midnight
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger("DriveSorter.Backfill")
+os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)  # logs/ is not tracked
 fh = RotatingFileHandler(LOG_FILE, maxBytes=5*1024*1024, backupCount=3)
 fh.setFormatter(logging.Formatter('%(asctime)s | %(levelname)s | %(message)s'))
 logger.addHandler(fh)
@@ -58,23 +60,39 @@ logger.addHandler(fh)
 # State helpers
 # ---------------------------------------------------------------------------
 
+STATE_NAMESPACE = 'backfill'
+_SCALAR_KEYS = ('last_run', 'total_processed', 'extra_folder_map', 'extra_map_built_at')
+
+
+def _import_legacy_state(store, data: dict) -> None:
+    store.queue(STATE_NAMESPACE).replace(data.get('pending', []))
+    store.set_page_token(STATE_NAMESPACE, 'changes', data.get('changes_page_token'))
+    store.save_document(STATE_NAMESPACE, {k: data[k] for k in _SCALAR_KEYS if k in data})
+
+
 def load_state() -> dict:
-    if os.path.exists(STATE_PATH):
-        try:
-            with open(STATE_PATH) as f:
-                return json.load(f)
-        except Exception as e:
-            logger.warning(f"Could not read backfill_state.json: {e}")
-    return {"pending": [], "last_run": None, "total_processed": 0,
-            "changes_page_token": None, "extra_folder_map": {}, "extra_map_built_at": None}
+    """
+    pending is a WorkQueue backed by state.db (pop(0) is O(1)); the Drive changes
+    cursor lives in page_tokens and the remaining scalars in documents.
+    """
+    store = state_store.StateStore()
+    store.migrate_json(STATE_NAMESPACE, STATE_PATH, _import_legacy_state)
+    doc = store.document(STATE_NAMESPACE)
+    state = {"last_run": None, "total_processed": 0, "extra_folder_map": {}, "extra_map_built_at": None}
+    state.update(doc)
+    state['pending'] = store.queue(STATE_NAMESPACE)
+    state['changes_page_token'] = store.get_page_token(STATE_NAMESPACE, 'changes')
+    return state
 
 
 def save_state(state: dict) -> None:
-    os.makedirs(CONFIG_DIR, exist_ok=True)
-    tmp = STATE_PATH + '.tmp'
-    with open(tmp, 'w') as f:
-        json.dump(state, f, indent=2)
-    os.replace(tmp, STATE_PATH)
+    """Commit queue pops/appends, the changes cursor and any changed scalars."""
+    store = state_store.store_for(state.get('pending'))
+    # A freshly built list replaces the queue; re-attach the view so later pops stay O(1)
+    state['pending'] = store.adopt('queue', STATE_NAMESPACE, state.get('pending'))
+    store.set_page_token(STATE_NAMESPACE, 'changes', state.get('changes_page_token'))
+    store.save_document(STATE_NAMESPACE, {k: state.get(k) for k in _SCALAR_KEYS})
+    store.commit()
 
 
 # ---------------------------------------------------------------------------
@@ -168,12 +186,15 @@ def _crawl_for_backfill(service, folder_id, path, path_to_id):
         return
     path_to_id[path] = folder_id
     try:
-        results = service.files().list(
-            q=f"'{folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            fields="files(id, name)",
-            pageSize=200
-        ).execute()
-        for child in results.get('files', []):
+        if drive_index.is_fresh():
+            children = drive_index.list_children(folder_id, folders=True)
+        else:
+            children = service.files().list(
+                q=f"'{folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false",
+                fields="files(id, name)",
+                pageSize=200
+            ).execute().get('files', [])
+        for child in children:
             _crawl_for_backfill(service, child['id'], f"{path}/{child['name']}", path_to_id)
     except Exception as e:
         logger.error(f"Error crawling {path}: {e}")
@@ -295,6 +316,9 @@ def build_queue(service, state: dict) -> list:
     logger.info(f"Tree folders: {len(tree_data['path_to_id'])}, extra (Media/Archive): {len(extra)}")
 
     pending = []
+    use_index = drive_index.is_fresh()
+    if use_index:
+        logger.info("  [Index] Listing folders from the local Drive index")
 
     for folder_path in sorted(path_to_id.keys()):
         folder_id = path_to_id[folder_path]
@@ -302,12 +326,15 @@ def build_queue(service, state: dict) -> list:
             continue  # handled by hourly sorter
 
         try:
-            results = service.files().list(
-                q=f"'{folder_id}' in parents and trashed = false and mimeType != 'application/vnd.google-apps.folder'",
-                fields="files(id, name, mimeType, createdTime)",
-                pageSize=1000
-            ).execute()
-            files = results.get('files', [])
+            if use_index:
+                files = drive_index.list_children(folder_id, folders=False)
+            else:
+                results = service.files().list(
+                    q=f"'{folder_id}' in parents and trashed = false and mimeType != 'application/vnd.google-apps.folder'",
+                    fields="files(id, name, mimeType, createdTime)",
+                    pageSize=1000
+                ).execute()
+                files = results.get('files', [])
         except Exception as e:
             logger.error(f"Error listing {folder_path}: {e}")
             continue
@@ -438,6 +465,10 @@ def run(args):
         return
 
     state = load_state()
+    try:
+        drive_index.sync(service)
+    except Exception as e:
+        logger.warning(f"Drive index sync failed, using live listings: {e}")
 
     # Check quota (backfill respects sorter's reserved slice)
     if quota_manager.is_backfill_budget_exhausted():
@@ -463,7 +494,7 @@ def run(args):
             return
 
     limit = args.limit or quota_manager.load().get('files_per_run', quota_manager.FILES_PER_RUN)
-    folder_paths_str = get_category_prompt_str()
+    concurrency = max(1, args.concurrency)
 
     processed = moved = renamed = errors = 0
     move_details = []   # (original, new_name, folder_path)
@@ -471,7 +502,7 @@ def run(args):
     error_details = []  # (name, error_str)
     moved_fids = set()
 
-    logger.info(f"Starting backfill run: {len(state['pending'])} queued, limit={limit}, dry_run={dry_run}")
+    logger.info(f"Starting backfill run: {len(state['pending'])} queued, limit={limit}, concurrency={concurrency}, dry_run={dry_run}")
 
     while state['pending'] and processed < limit:
         if quota_manager.is_backfill_budget_exhausted():
@@ -481,72 +512,115 @@ def run(args):
             logger.info("Approaching midnight, stopping to preserve quota boundary.")
             break
 
-        item = state['pending'].pop(0)
-        fid  = item['id']
-        name = item['name']
-        mime = item['mimeType']
-        folder_id   = item['folder_id']
-        folder_path = item['folder_path']
-
-        try:
-            content = download_file_content(service, fid, mime)
-            if not content:
-                save_state(state)
+        batch_size = min(concurrency, limit - processed)
+        batch = []
+        while state['pending'] and len(batch) < batch_size:
+            batch.append(state['pending'].pop(0))
+
+        # Downloads stay serial (the Drive client is not thread-safe); only LLM calls fan out
+        ready = []
+        for item in batch:
+            try:
+                content = download_file_content(service, item['id'], item['mimeType'])
+            except Exception as e:
+                logger.error(f"  [Error] {item['name']}: {e}")
+                errors += 1
+                error_details.append((item['name'], str(e)))
+                continue
+            if content:
+                ready.append((item, content))
+
+        requests = []
+        for item, content in ready:
+            context_hint = f"File in folder: {item['folder_path']}. Created: {item.get('createdTime', '')}. Filename: {item['name']}"
+            text = folder_ranker.content_text(content, get_ai_supported_mime(item['mimeType'], item['name']))
+            folder_paths_str = get_category_prompt_str(item['name'], text, hint=item['folder_path'])
+            requests.append({
+                "task_type": 'automation',
+                "prompt": SORTER_SYSTEM_PROMPT.format(
+                    context_hint=context_hint,
+                    folder_paths=prompt_segments.schema(folder_paths_str)
+                ),
+                "content_bytes": content,
+                "mime_type": item['mimeType'],
+                "filename": item['name'],
+            })
+        outcomes = call_json_llm_many(requests)
+
+        # Renames and moves for the whole batch go out as one combined update per file,
+        # coalesced into a single HTTP batch round trip
+        mutations = DriveBatch(service)
+        planned = {}
+
+        for (item, _), outcome in zip(ready, outcomes):
+            fid  = item['id']
+            name = item['name']
+            folder_id = item['folder_id']
+
+            try:
+                if isinstance(outcome, Exception):
+                    raise outcome
+                analysis, reasoning, tokens = outcome
+
+                new_name   = generate_new_name(analysis, name, item.get('createdTime', ''))
+                confidence = analysis.get('confidence', 'Low')
+                folder_target = analysis.get('folder_path')
+
+                logger.info(f"  [AI] {name} -> {new_name} ({confidence})")
+
+                if not dry_run:
+                    do_rename = new_name != name and confidence in ('High', 'Medium')
+                    target_id = resolve_folder_id(folder_target)
+                    do_move = confidence == 'High' and bool(target_id) and target_id != folder_id
+                    if do_rename or do_move:
+                        params = {'fileId': fid, 'body': {'name': new_name} if do_rename else {}, 'fields': 'id, name, parents'}
+                        if do_move:
+                            params.update(addParents=target_id, removeParents=folder_id)
+                        mutations.add(fid, service.files().update(**params))
+                        planned[fid] = (item, new_name, confidence, folder_target, target_id, do_rename, do_move)
+                        continue
+
+                processed += 1
+                state['total_processed'] = state.get('total_processed', 0) + 1
+
+            except Exception as e:
+                logger.error(f"  [Error] {name}: {e}")
+                errors += 1
+                error_details.append((name, str(e)))
+
+        ts = time.strftime("%Y-%m-%d %H:%M:%S")
+        for fid, result in (mutations.execute() if len(mutations) else {}).items():
+            item, new_name, confidence, folder_target, target_id, do_rename, do_move = planned[fid]
+            name = item['name']
+            folder_path = item['folder_path']
+            if not result.ok:
+                logger.error(f"  [Error] {name}: {result.error}")
+                errors += 1
+                error_details.append((name, str(result.error)))
                 continue
 
-            context_hint = f"File in folder: {folder_path}. Created: {item.get('createdTime', '')}. Filename: {name}"
-            full_prompt = SORTER_SYSTEM_PROMPT.format(
-                context_hint=context_hint,
-                folder_paths=folder_paths_str
-            )
-            analysis, reasoning, tokens = call_json_llm(
-                task_type='automation',
-                prompt=full_prompt,
-                content_bytes=content,
-                mime_type=mime,
-                filename=name
-            )
-
-            new_name   = generate_new_name(analysis, name, item.get('createdTime', ''))
-            confidence = analysis.get('confidence', 'Low')
-            folder_target = analysis.get('folder_path')
-
-            logger.info(f"  [AI] {name} -> {new_name} ({confidence})")
-
-            if not dry_run:
-                ts = time.strftime("%Y-%m-%d %H:%M:%S")
-
-                if new_name != name and confidence in ('High', 'Medium'):
-                    service.files().update(fileId=fid, body={'name': new_name}).execute()
-                    renamed += 1
-                    logger.info(f"  [Renamed] {new_name}")
-                    target_id_for_log = resolve_folder_id(folder_target) or 'Unknown'
-                    target_path_for_log = ID_TO_PATH.get(target_id_for_log, folder_path)
-                    log_to_sheet(ts, fid, name, new_name, target_id_for_log, target_path_for_log, f'Backfill-Rename ({confidence})')
-
-                target_id = resolve_folder_id(folder_target)
-                if confidence == 'High' and target_id and target_id != folder_id:
-                    if move_file(service, fid, target_id, new_name):
-                        moved += 1
-                        moved_fids.add(fid)
-                        full_path = ID_TO_PATH.get(target_id, folder_target or folder_path)
-                        move_details.append((name, new_name, folder_target or full_path))
-                        logger.info(f"  [Moved] -> {folder_target}")
-                        if new_name == name:
-                            log_to_sheet(ts, fid, name, new_name, target_id, full_path, 'Backfill-Move')
-
-                if new_name != name and confidence == 'Medium' and fid not in moved_fids:
-                    rename_details.append((name, new_name))
+            drive_index.record_files([{'id': fid, 'name': new_name, **({'parents': [target_id]} if do_move else {})}])
+            if do_rename:
+                renamed += 1
+                logger.info(f"  [Renamed] {new_name}")
+                target_id_for_log = target_id or 'Unknown'
+                target_path_for_log = ID_TO_PATH.get(target_id_for_log, folder_path)
+                log_to_sheet(ts, fid, name, new_name, target_id_for_log, target_path_for_log, f'Backfill-Rename ({confidence})')
+            if do_move:
+                moved += 1
+                moved_fids.add(fid)
+                full_path = ID_TO_PATH.get(target_id, folder_target or folder_path)
+                move_details.append((name, new_name, folder_target or full_path))
+                logger.info(f"  [Moved] -> {folder_target}")
+                if new_name == name:
+                    log_to_sheet(ts, fid, name, new_name, target_id, full_path, 'Backfill-Move')
+            if new_name != name and confidence == 'Medium' and fid not in moved_fids:
+                rename_details.append((name, new_name))
 
             processed += 1
             state['total_processed'] = state.get('total_processed', 0) + 1
-            save_state(state)
 
-        except Exception as e:
-            logger.error(f"  [Error] {name}: {e}")
-            errors += 1
-            error_details.append((name, str(e)))
-            save_state(state)
+        save_state(state)
 
     elapsed = int(time.time() - start)
     remaining_queue = len(state['pending'])
@@ -589,6 +663,7 @@ def parse_args():
     parser.add_argument('--count-cached', action='store_true', help="Print queue size from local state; no Drive API calls")
     parser.add_argument('--dry-run',      action='store_true', help="Analyze files but don't rename or move")
     parser.add_argument('--limit',        type=int, default=0, help="Max files to process this run (default: from quota_state)")
+    parser.add_argument('--concurrency',  type=int, default=1, help="Files classified in parallel per batch via LLMGateway.call_many (default: 1, serial)")
     return parser.parse_args()
 
 
@@ -9,6 +9,9 @@ import sys
 import logging
 import json
 import re
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 from io import BytesIO
 
@@ -23,24 +26,32 @@ from toolbox.lib.log_manager import LogManager, log
 logger = LogManager.get_instance("ai-sorter").logger
 
 from toolbox.lib.drive_utils import (
-    get_drive_service, download_file_content, move_file,
+    get_drive_service, download_file_content, move_file, remember_parents,
     resolve_folder_id, get_category_prompt_str,
     INBOX_ID, ID_TO_PATH, _ALREADY_NAMED, _SKIP_MIME_TYPES,
     SORTER_SYSTEM_PROMPT, escape_query_string
 )
 from toolbox.lib.telegram import send_message, drive_file_link
 from toolbox.lib.llm_gateway import call_json_llm
-from toolbox.lib import quota_manager
+from toolbox.lib import quota_manager, state_store, drive_index, prompt_segments, folder_ranker
 from toolbox.lib.entity_ids import render_entity_comment, order_entity_id, travel_entity_id, build_entity_id, canonicalize_key
 from toolbox.lib.entity_memory import EntityMemory
+from toolbox.services.drive_organizer.pipeline import run_pipeline
 
 # --- CONFIG ---
 stats = None # Global stats placeholder
-STATE_PATH = os.path.join(BASE_DIR, 'config', 'ai_sorter_state.json')
+STATE_PATH = os.path.join(BASE_DIR, 'config', 'ai_sorter_state.json')  # legacy, imported once into state.db
 MIN_EXTRACTED_PDF_TEXT_CHARS = 80
 MAX_EXTRACTED_PDF_TEXT_CHARS = 12000
 FAILURE_COOLDOWN_MAX_HOURS = 24
 
+# scan_folder pipeline sizing
+DOWNLOAD_WORKERS = 4        # Drive download threads (each with its own client)
+PDF_EXTRACT_PROCESSES = 2   # pypdf extraction worker processes
+PDF_PROCESS_MIN_BYTES = 256 * 1024  # smaller PDFs extract faster inline than via a worker process
+LLM_CONCURRENCY = 4         # classification calls in flight (gateway still applies per-provider limits)
+PIPELINE_DEPTH = 8          # files in flight across all stages (backpressure)
+
 class RunStats:
     def __init__(self, app_name="ai-sorter"):
         self.app_name = app_name
@@ -96,23 +107,27 @@ class RunStats:
             
         return "\n".join(lines)
 
+STATE_NAMESPACE = "ai_sorter"
+
+def _import_legacy_state(store, data):
+    store.processed(f"{STATE_NAMESPACE}.analyzed").replace(data.get("analyzed_ids", {}))
+    store.failures(f"{STATE_NAMESPACE}.failed").replace(data.get("failed_ids", {}))
+
 def load_state():
-    if os.path.exists(STATE_PATH):
-        try:
-            with open(STATE_PATH) as f:
-                state = json.load(f)
-                state.setdefault("analyzed_ids", {})
-                state.setdefault("failed_ids", {})
-                return state
-        except:
-            pass
-    return {"analyzed_ids": {}, "failed_ids": {}} # file_id -> last_analyzed_name / failure metadata
+    """analyzed_ids: file_id -> last_analyzed_name, failed_ids: file_id -> failure metadata."""
+    store = state_store.StateStore()
+    store.migrate_json(STATE_NAMESPACE, STATE_PATH, _import_legacy_state)
+    return {
+        "analyzed_ids": store.processed(f"{STATE_NAMESPACE}.analyzed"),
+        "failed_ids": store.failures(f"{STATE_NAMESPACE}.failed"),
+    }
 
 def save_state(state):
-    tmp = STATE_PATH + '.tmp'
-    with open(tmp, 'w') as f:
-        json.dump(state, f, indent=2)
-    os.replace(tmp, STATE_PATH)
+    """Persist only the analyzed/failed entries that changed during this run."""
+    store = state_store.store_for(state.get("analyzed_ids"), state.get("failed_ids"))
+    store.adopt("processed", f"{STATE_NAMESPACE}.analyzed", state.get("analyzed_ids"))
+    store.adopt("failures", f"{STATE_NAMESPACE}.failed", state.get("failed_ids"))
+    store.commit()
 
 def _now_utc():
     return datetime.now(timezone.utc)
@@ -255,8 +270,22 @@ def _maybe_flag_new_trip(folder_path, filename, fid):
             origin="ai-sorter"
         )
 
+def _find_duplicate(files, filename, checksum=None):
+    for f in files:
+        # 1. Check by Checksum (if binary) - Detects same content with different names
+        if checksum and f.get('md5Checksum') == checksum:
+            return f['id'], "hash_match"
+
+        # 2. Check by Name
+        if f.get('name') == filename:
+            return f['id'], "name_match"
+    return None, None
+
 def check_duplicate(service, target_folder_id, filename, checksum=None):
     """Check if a file with same name or same MD5 exists in the target folder."""
+    if drive_index.is_fresh():
+        return _find_duplicate(drive_index.list_children(target_folder_id), filename, checksum)
+
     # List files in the target folder to perform in-memory check
     # Note: md5Checksum is NOT a searchable field in Drive API 'q' parameter.
     q = f"'{target_folder_id}' in parents and trashed = false"
@@ -267,16 +296,9 @@ def check_duplicate(service, target_folder_id, filename, checksum=None):
             fields="nextPageToken, files(id, name, md5Checksum)",
             pageToken=page_token
         ).execute()
-        files = res.get('files', [])
-
-        for f in files:
-            # 1. Check by Checksum (if binary) - Detects same content with different names
-            if checksum and f.get('md5Checksum') == checksum:
-                return f['id'], "hash_match"
-
-            # 2. Check by Name
-            if f.get('name') == filename:
-                return f['id'], "name_match"
+        dup_id, dup_type = _find_duplicate(res.get('files', []), filename, checksum)
+        if dup_id:
+            return dup_id, dup_type
 
         page_token = res.get('nextPageToken')
         if not page_token:
@@ -321,7 +343,150 @@ def post_process_memory(analysis, final_name, fid):
     except Exception as e:
         logger.error(f"Failed to update memory for {entity}: {e}")
 
-def scan_folder(folder_id, dry_run=True, csv_path='sorter_dry_run.csv', limit=None, mode='scan', folder_name="Inbox", service=None, recursive=True, state=None):
+def _download_stage(service, service_factory):
+    """Stage 1: fetch file bytes. Each download thread gets its own Drive client (httplib2 is not thread-safe)."""
+    local = threading.local()
+
+    def _service():
+        if service_factory is None:
+            return service
+        if not hasattr(local, "service"):
+            local.service = service_factory()
+        return local.service
+
+    def download(f, _):
+        name, mime = f['name'], f['mimeType']
+        try:
+            return download_file_content(_service(), f['id'], mime), mime
+        except Exception as dl_err:
+            if '500' in str(dl_err) or 'internalError' in str(dl_err).lower():
+                logger.warning(f"  [Export] {name}: Drive export 500, classifying by name only")
+                return f"File: {name}\n(Export failed; classify by filename only)".encode('utf-8'), 'text/plain'
+            raise
+
+    return download
+
+
+def _extract_stage(get_pool):
+    """Stage 2: PDF text extraction. Large PDFs go to a process pool (pypdf is CPU-bound); the rest run inline."""
+    def extract(f, downloaded):
+        content, mime = downloaded
+        if mime == "application/pdf" and len(content) >= PDF_PROCESS_MIN_BYTES:
+            pool = get_pool()
+            if pool is not None:
+                return pool.submit(prepare_content_for_llm, content, mime, f['name'])
+        return prepare_content_for_llm(content, mime, f['name'])
+
+    return extract
+
+
+def _classify_stage():
+    """Stage 3: LLM classification (bounded by the LLM thread pool and the gateway's provider limits)."""
+    def classify(f, prepared):
+        llm_content, llm_mime = prepared
+        # Only the folders most relevant to this file are offered (see folder_ranker)
+        folder_paths_str = get_category_prompt_str(f['name'], folder_ranker.content_text(llm_content, llm_mime))
+        full_prompt = SORTER_SYSTEM_PROMPT.format(
+            context_hint=f"Filename: {f['name']}",
+            folder_paths=prompt_segments.schema(folder_paths_str)
+        )
+        analysis, reasoning, tokens_this_run = call_json_llm(
+            task_type='automation',
+            prompt=full_prompt,
+            content_bytes=llm_content,
+            mime_type=llm_mime,
+            filename=f['name']
+        )
+        return analysis
+
+    return classify
+
+
+def _commit_analysis(f, analysis, folder_id, dry_run, service, state, progress):
+    """
+    Stage 4 (serial, caller's thread): rename/dedup/move and state updates for one
+    classified file. progress['name'] tracks the Drive name if a later step fails.
+    """
+    name = f['name']
+    fid = f['id']
+    checksum = f.get('md5Checksum', '')
+    current_name = name
+
+    new_name = analysis.get('new_filename', name)
+    folder_path = analysis.get('folder_path', '')
+    confidence = str(analysis.get('confidence', 'Low')).strip().capitalize()
+
+    print(f"  [AI] {name} -> {new_name} ({confidence})")
+    log("FILE_ANALYZED", "SUCCESS", f"Analyzed {name}", data={
+        "file_id": fid,
+        "original_name": name,
+        "new_name": new_name,
+        "confidence": confidence,
+        "category": folder_path
+    }, app_name=stats.app_name)
+
+    # --- ACTION LOGIC ---
+    if not dry_run:
+        # 1. Handle Low Confidence or Unresolvable Routing
+        if confidence == 'Low' or not folder_path or folder_path == 'Unknown':
+            folder_path = '00 - Staging/Review'
+            logger.info(f"  [Routing] Low confidence or unknown; routing to Review: {name}")
+
+        target_id = resolve_folder_id(folder_path)
+        if not target_id:
+            folder_path = '00 - Staging/Review'
+            target_id = resolve_folder_id(folder_path)
+            logger.warning(f"  [Routing] Target path unresolvable; routing to Review: {folder_path}")
+
+        # 2. Rename (High/Medium only, otherwise keep name for review)
+        if new_name != name and confidence in ['High', 'Medium']:
+            try:
+                service.files().update(fileId=fid, body={'name': new_name}).execute()
+                drive_index.record_files([{'id': fid, 'name': new_name}])
+                stats.renamed += 1
+                log("FILE_RENAMED", "SUCCESS", f"Renamed {name} -> {new_name}", data={"file_id": fid}, app_name=stats.app_name)
+                current_name = progress['name'] = new_name
+            except Exception as ren_err:
+                logger.error(f"  [Rename Error] {name}: {ren_err}")
+
+        # 3. Deduplication Check
+        if target_id and target_id != folder_id:
+            dup_id, dup_type = check_duplicate(service, target_id, current_name, checksum)
+            if dup_id:
+                logger.info(f"  [Dedup] Duplicate found in target ({dup_type}): {current_name}")
+                stats.swept += 1
+                log("FILE_SKIPPED", "INFO", f"Skipped duplicate {current_name}", data={"file_id": fid, "dup_id": dup_id}, app_name=stats.app_name)
+            else:
+                # 4. Move
+                if move_file(service, fid, target_id, current_name):
+                    stats.moved += 1
+                    stats._moved_fids.add(fid)
+                    full_path = ID_TO_PATH.get(target_id, folder_path)
+                    stats.move_details.append((name, current_name, full_path, fid))
+                    log("FILE_MOVED", "SUCCESS", f"Moved {current_name} to {full_path}", data={
+                        "file_id": fid,
+                        "target_id": target_id,
+                        "target_path": full_path
+                    }, app_name=stats.app_name)
+
+                    # 5. Memory Integration (High/Medium only)
+                    if confidence in ['High', 'Medium']:
+                        post_process_memory(analysis, current_name, fid)
+
+        # Update state cache
+        state["analyzed_ids"][fid] = current_name
+
+    clear_file_failure(state, fid)
+    stats.processed += 1
+
+
+def scan_folder(folder_id, dry_run=True, csv_path='sorter_dry_run.csv', limit=None, mode='scan', folder_name="Inbox", service=None, recursive=True, state=None, service_factory=None):
+    """
+    Classify and file everything in folder_id. Downloads, PDF extraction and LLM calls
+    overlap across files (see pipeline.py); renames, moves and state updates are applied
+    serially in listing order. Pass service_factory to give download threads their own
+    Drive clients; without it downloads run on the calling thread with `service`.
+    """
     if not service:
         service = get_drive_service()
     
@@ -337,26 +502,25 @@ def scan_folder(folder_id, dry_run=True, csv_path='sorter_dry_run.csv', limit=No
         fields="files(id, name, mimeType, createdTime, modifiedTime, md5Checksum)"
     ).execute()
     files = results.get('files', [])
+    remember_parents(files, folder_id)
     
     print(f"Found {len(files)} files in {folder_name}. Processing...")
 
-    folder_paths_str = get_category_prompt_str()
+    subfolders = []
 
-    for f in files:
-        if limit and stats.processed >= limit:
-            break
+    def can_admit(in_flight):
+        return not limit or stats.processed + in_flight < limit
 
+    def admit(f):
         name = f['name']
         fid = f['id']
         mime = f['mimeType']
-        checksum = f.get('md5Checksum', '')
-        modified_time = f.get('modifiedTime', '')
 
-        # Recursion
+        # Recursion (scanned once this folder's files are done)
         if mime == 'application/vnd.google-apps.folder':
             if recursive:
-                scan_folder(fid, dry_run, csv_path, limit, mode, folder_name=f"{folder_name}/{name}", service=service, recursive=recursive, state=state)
-            continue
+                subfolders.append(f)
+            return False
 
         # 1. Skip logic: don't re-analyze what hasn't changed
         # If the name is already standardized AND we've seen this ID before, skip it.
@@ -366,116 +530,65 @@ def scan_folder(folder_id, dry_run=True, csv_path='sorter_dry_run.csv', limit=No
             if state["analyzed_ids"][fid] == name:
                 logger.debug(f"Skipping already standardized file: {name}")
                 stats.processed += 1
-                continue
+                return False
 
         # Skip reserved files
-        if name == 'Health Connect.zip': continue
-        if name.startswith('[MANUAL] '): continue
-        if mime in _SKIP_MIME_TYPES: continue
+        if name == 'Health Connect.zip': return False
+        if name.startswith('[MANUAL] '): return False
+        if mime in _SKIP_MIME_TYPES: return False
 
-        skip_failed, skip_reason = should_skip_failed_file(state, fid, name, checksum, modified_time)
+        skip_failed, skip_reason = should_skip_failed_file(state, fid, name, checksum=f.get('md5Checksum', ''),
+                                                           modified_time=f.get('modifiedTime', ''))
         if skip_failed:
             logger.info(f"  [Cooldown] Skipping {name}: {skip_reason}")
             stats.processed += 1
-            continue
+            return False
+        return True
 
+    def commit(f, analysis, error):
+        progress = {'name': f['name']}
         try:
-            current_name = name
-            try:
-                content = download_file_content(service, fid, mime)
-            except Exception as dl_err:
-                if '500' in str(dl_err) or 'internalError' in str(dl_err).lower():
-                    logger.warning(f"  [Export] {name}: Drive export 500, classifying by name only")
-                    content = f"File: {name}\n(Export failed; classify by filename only)".encode('utf-8')
-                    mime = 'text/plain'
-                else:
-                    raise
-
-            # --- AI ANALYSIS ---
-            full_prompt = SORTER_SYSTEM_PROMPT.format(
-                context_hint=f"Filename: {name}",
-                folder_paths=folder_paths_str
-            )
-            llm_content, llm_mime = prepare_content_for_llm(content, mime, name)
-            analysis, reasoning, tokens_this_run = call_json_llm(
-                task_type='automation',
-                prompt=full_prompt,
-                content_bytes=llm_content,
-                mime_type=llm_mime,
-                filename=name
-            )
-            
-            new_name = analysis.get('new_filename', name)
-            folder_path = analysis.get('folder_path', '')
-            confidence = str(analysis.get('confidence', 'Low')).strip().capitalize()
-
-            print(f"  [AI] {name} -> {new_name} ({confidence})")
-            log("FILE_ANALYZED", "SUCCESS", f"Analyzed {name}", data={
-                "file_id": fid,
-                "original_name": name,
-                "new_name": new_name,
-                "confidence": confidence,
-                "category": folder_path
-            }, app_name=stats.app_name)
-
-            # --- ACTION LOGIC ---
-            if not dry_run:
-                # 1. Handle Low Confidence or Unresolvable Routing
-                if confidence == 'Low' or not folder_path or folder_path == 'Unknown':
-                    folder_path = '00 - Staging/Review'
-                    logger.info(f"  [Routing] Low confidence or unknown; routing to Review: {name}")
-
-                target_id = resolve_folder_id(folder_path)
-                if not target_id:
-                    folder_path = '00 - Staging/Review'
-                    target_id = resolve_folder_id(folder_path)
-                    logger.warning(f"  [Routing] Target path unresolvable; routing to Review: {folder_path}")
-
-                # 2. Rename (High/Medium only, otherwise keep name for review)
-                if new_name != name and confidence in ['High', 'Medium']:
-                    try:
-                        service.files().update(fileId=fid, body={'name': new_name}).execute()
-                        stats.renamed += 1
-                        log("FILE_RENAMED", "SUCCESS", f"Renamed {name} -> {new_name}", data={"file_id": fid}, app_name=stats.app_name)
-                        current_name = new_name
-                    except Exception as ren_err:
-                        logger.error(f"  [Rename Error] {name}: {ren_err}")
-
-                # 3. Deduplication Check
-                if target_id and target_id != folder_id:
-                    dup_id, dup_type = check_duplicate(service, target_id, current_name, checksum)
-                    if dup_id:
-                        logger.info(f"  [Dedup] Duplicate found in target ({dup_type}): {current_name}")
-                        stats.swept += 1
-                        log("FILE_SKIPPED", "INFO", f"Skipped duplicate {current_name}", data={"file_id": fid, "dup_id": dup_id}, app_name=stats.app_name)
-                    else:
-                        # 4. Move
-                        if move_file(service, fid, target_id, current_name):
-                            stats.moved += 1
-                            stats._moved_fids.add(fid)
-                            full_path = ID_TO_PATH.get(target_id, folder_path)
-                            stats.move_details.append((name, current_name, full_path, fid))
-                            log("FILE_MOVED", "SUCCESS", f"Moved {current_name} to {full_path}", data={
-                                "file_id": fid,
-                                "target_id": target_id,
-                                "target_path": full_path
-                            }, app_name=stats.app_name)
-                            
-                            # 5. Memory Integration (High/Medium only)
-                            if confidence in ['High', 'Medium']:
-                                post_process_memory(analysis, current_name, fid)
-
-                # Update state cache
-                state["analyzed_ids"][fid] = current_name
-
-            clear_file_failure(state, fid)
-            stats.processed += 1
-                
+            if error is not None:
+                raise error
+            _commit_analysis(f, analysis, folder_id, dry_run, service, state, progress)
         except Exception as e:
+            current_name = progress['name']
             logger.error(f"  [Error] {current_name}: {e}")
-            record_file_failure(state, fid, current_name, checksum, modified_time, e)
+            record_file_failure(state, f['id'], current_name, f.get('md5Checksum', ''), f.get('modifiedTime', ''), e)
             stats.errors += 1
-            stats.error_details.append((current_name, str(e), fid))
+            stats.error_details.append((current_name, str(e), f['id']))
+
+    extract_pool = []
+
+    def get_extract_pool():
+        if not extract_pool and PDF_EXTRACT_PROCESSES > 0:
+            try:
+                extract_pool.append(ProcessPoolExecutor(
+                    max_workers=PDF_EXTRACT_PROCESSES, mp_context=multiprocessing.get_context("spawn")))
+            except Exception as e:
+                logger.warning(f"PDF extraction process pool unavailable, extracting inline: {e}")
+                extract_pool.append(None)
+        return extract_pool[0] if extract_pool else None
+
+    download_workers = DOWNLOAD_WORKERS if service_factory is not None else 1
+    with ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="sorter-dl") as download_pool, \
+         ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="sorter-llm") as llm_pool:
+        stages = [
+            (download_pool if service_factory is not None else None, _download_stage(service, service_factory)),
+            (None, _extract_stage(get_extract_pool)),
+            (llm_pool, _classify_stage()),
+        ]
+        try:
+            run_pipeline(files, stages, commit, depth=PIPELINE_DEPTH, can_admit=can_admit, admit=admit)
+        finally:
+            if extract_pool and extract_pool[0] is not None:
+                extract_pool[0].shutdown()
+
+    for sub in subfolders:
+        if limit and stats.processed >= limit:
+            break
+        scan_folder(sub['id'], dry_run, csv_path, limit, mode, folder_name=f"{folder_name}/{sub['name']}",
+                    service=service, recursive=recursive, state=state, service_factory=service_factory)
 
 def sweep_drive_root(dry_run=True, service=None, state=None):
     """Special mode to only look at root and move obvious stuff to Inbox."""
@@ -485,9 +598,10 @@ def sweep_drive_root(dry_run=True, service=None, state=None):
     print("Sweeping Drive Root...")
     results = service.files().list(
         q="'root' in parents and trashed = false",
-        fields="files(id, name, mimeType)"
+        fields="files(id, name, mimeType, parents)"
     ).execute()
     files = results.get('files', [])
+    remember_parents(files)
     
     for f in files:
         name = f['name']
@@ -529,6 +643,10 @@ def run(argv=None):
     
     state = load_state()
     service = get_drive_service()
+    try:
+        drive_index.sync(service)
+    except Exception as e:
+        logger.warning(f"Drive index sync failed, using live listings: {e}")
 
     # 1. Sweep Root -> Inbox
     execute = args.run or args.execute
@@ -542,7 +660,8 @@ def run(argv=None):
         mode='inbox', 
         service=service, 
         recursive=args.recursive,
-        state=state
+        state=state,
+        service_factory=get_drive_service,
     )
 
     # 3. Finalize
@@ -0,0 +1,97 @@
+"""
+Staged, order-preserving pipeline used by the drive organizer scan.
+
+Each admitted item flows through a list of stages; a stage either runs on an
+executor (download threads, LLM threads) or inline on the calling thread, and an
+inline stage may hand back a Future (e.g. PDF extraction on a process pool).
+Results are committed on the calling thread in admission order, so Drive
+mutations and state writes stay serial. At most `depth` items are in flight,
+which bounds memory (downloaded bytes) and provides backpressure: a slow LLM
+stage stops new downloads instead of queueing the whole folder.
+"""
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+_END = object()
+
+
+class _Entry:
+    __slots__ = ("item", "stage", "value", "error", "future", "done")
+
+    def __init__(self, item):
+        self.item = item
+        self.stage = 0
+        self.value = None
+        self.error = None
+        self.future = None
+        self.done = False
+
+
+def _advance(entry, stages):
+    """Run inline stages / submit the next executor stage until the entry is waiting or done."""
+    while entry.error is None and entry.stage < len(stages):
+        executor, fn = stages[entry.stage]
+        entry.stage += 1
+        if executor is not None:
+            entry.future = executor.submit(fn, entry.item, entry.value)
+            return
+        try:
+            result = fn(entry.item, entry.value)
+        except Exception as e:
+            entry.error = e
+            break
+        if isinstance(result, Future):
+            entry.future = result
+            return
+        entry.value = result
+    entry.done = True
+
+
+def run_pipeline(items, stages, commit, depth=8, can_admit=None, admit=None):
+    """
+    Push items through stages and commit each result in input order.
+
+    stages:    list of (executor | None, fn(item, value) -> value); the first stage gets value=None.
+    commit:    commit(item, value, error) on the calling thread; error is the exception raised
+               by any stage (later stages are skipped for that item).
+    can_admit: can_admit(in_flight) -> bool, checked before pulling each item (e.g. run limits).
+    admit:     admit(item) -> bool, inline filter; False drops the item without entering the pipeline.
+    """
+    source = iter(items)
+    in_flight = deque()
+    exhausted = False
+
+    while True:
+        while not exhausted and len(in_flight) < depth and (can_admit is None or can_admit(len(in_flight))):
+            item = next(source, _END)
+            if item is _END:
+                exhausted = True
+                break
+            if admit is not None and not admit(item):
+                continue
+            entry = _Entry(item)
+            _advance(entry, stages)
+            in_flight.append(entry)
+
+        while in_flight and in_flight[0].done:
+            entry = in_flight.popleft()
+            commit(entry.item, entry.value, entry.error)
+
+        if not in_flight:
+            if exhausted or (can_admit is not None and not can_admit(0)):
+                return
+            continue
+
+        running = [e.future for e in in_flight if e.future is not None]
+        if running:
+            wait(running, return_when=FIRST_COMPLETED)
+        for entry in in_flight:
+            future = entry.future
+            if future is None or not future.done():
+                continue
+            entry.future = None
+            try:
+                entry.value = future.result()
+            except Exception as e:
+                entry.error = e
+            _advance(entry, stages)
@@ -16,7 +16,7 @@ if os.path.dirname(BASE_DIR) not in sys.path:
     sys.path.insert(0, os.path.dirname(BASE_DIR))
 
 from toolbox.lib.telegram import send_message, escape
-from ..scanner import html_to_text, load_state, save_state
+from ..scanner import email_text, load_state, save_state
 from ..writers import append_to_memory
 
 logger = logging.getLogger('EmailExtractor.Digests')
@@ -37,8 +37,12 @@ Email content:
 
 def _call_llm(text: str) -> list[dict]:
     from toolbox.lib.llm_gateway import call_llm
-    res = call_llm(task_type='automation', prompt=EXTRACT_PROMPT.format(text=text[:8000]))
-    raw = res.get('text', '')
+    from toolbox.lib import prompt_segments
+    res = call_llm(task_type='automation', prompt=EXTRACT_PROMPT.format(text=prompt_segments.payload(text[:8000])))
+    return _parse_articles(res.get('text', ''))
+
+
+def _parse_articles(raw: str) -> list[dict]:
     if not raw:
         return []
     try:
@@ -68,18 +72,46 @@ def _is_known_sender(from_header: str, known_senders: dict) -> str | None:
     return None
 
 
-def process(email: dict, known_senders: dict, raw_senders: dict = None) -> bool:
+def _email_text(email: dict) -> str:
+    return email_text(email)[0]
+
+
+def prefetch_articles(emails: list[dict], known_senders: dict, raw_senders: dict = None) -> dict[str, list[dict]]:
+    """
+    Run article extraction for a batch of digest emails concurrently via LLMGateway.call_many.
+    Only known (non-raw) senders need the LLM. Returns {email id: articles} for process().
+    """
+    from toolbox.lib.llm_gateway import call_many_llm
+    raw_senders = raw_senders or {}
+    batch = [
+        e for e in emails
+        if not _is_known_sender(e['from'], raw_senders) and _is_known_sender(e['from'], known_senders)
+    ]
+    if not batch:
+        return {}
+    results = call_many_llm([
+        {'task_type': 'automation', 'prompt': EXTRACT_PROMPT.format(text=_email_text(e)[:8000])}
+        for e in batch
+    ])
+    articles = {}
+    for email, res in zip(batch, results):
+        if isinstance(res, Exception):
+            logger.error(f'Digest extraction failed ({email["subject"][:50]}): {res}')
+            continue
+        articles[email['id']] = _parse_articles(res.get('text', ''))
+    return articles
+
+
+def process(email: dict, known_senders: dict, raw_senders: dict = None, articles: list[dict] | None = None) -> bool:
     raw_senders = raw_senders or {}
     from_header = email['from']
     subject = email['subject']
     date = email['date']
-    html = email.get('html', '')
-    plain = email.get('plain', '')
 
     source_name = _is_known_sender(from_header, raw_senders)
     if source_name:
         # Raw senders: store body verbatim, no LLM extraction
-        text, _ = html_to_text(html) if html else (plain, [])
+        text, _ = email_text(email)
         # Light cleanup: collapse whitespace, drop blank lines
         lines_clean = [l.strip() for l in text.splitlines() if l.strip()]
         body = re.sub(r'\n{3,}', '\n\n', '\n'.join(lines_clean)).strip()
@@ -113,13 +145,9 @@ def process(email: dict, known_senders: dict, raw_senders: dict = None) -> bool:
             logger.info(f'Unknown digest sender, flagged: {from_header}')
         return False
 
-    # Extract text from HTML (preferred) or plain
-    if html:
-        text, _ = html_to_text(html)
-    else:
-        text = plain
-
-    articles = _call_llm(text)
+    # Use prefetched extraction when the caller batched it, else extract from HTML (preferred) or plain
+    if articles is None:
+        articles = _call_llm(_email_text(email))
     if not articles:
         logger.warning(f'No articles extracted from {source_name} ({subject})')
         return False
@@ -24,7 +24,7 @@ if os.path.dirname(BASE_DIR) not in sys.path:
 
 from ..writers import append_to_memory, update_in_memory
 from ..enrichment import enrich_order
-from ..scanner import html_to_text
+from ..scanner import email_text
 from toolbox.lib.entity_ids import order_entity_id, render_entity_comment
 
 logger = logging.getLogger('EmailExtractor.Orders')
@@ -75,11 +75,11 @@ def _is_order_email(subject: str, plain: str) -> bool:
 def _get_body(email: dict) -> str:
     plain = email.get('plain') or ''
     html_raw = email.get('html') or ''
-    # If plain contains HTML tags it's not true plain text — use html_to_text instead
+    # If plain contains HTML tags it's not true plain text — use the HTML body as text instead
     if plain and not re.search(r'<[a-zA-Z]+[\s>]', plain[:500]):
         return plain
     if html_raw:
-        text, _ = html_to_text(html_raw)
+        text, _ = email_text(email)
         return text
     return plain
 
@@ -474,10 +474,11 @@ def _extract_items_llm(vendor: str, subject: str, body: str) -> dict:
     Falls back to empty dict on failure.
     """
     from toolbox.lib.llm_gateway import call_llm, _parse_json
+    from toolbox.lib import prompt_segments
     prompt = EXTRACT_PROMPT.format(
         vendor=vendor,
         subject=subject,
-        body=_prep_for_llm(body)[:4000],
+        body=prompt_segments.payload(_prep_for_llm(body)[:4000]),
     )
     try:
         res = call_llm(task_type='high-stakes', prompt=prompt)
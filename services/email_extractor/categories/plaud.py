@@ -76,10 +76,11 @@ def _parse_date_and_subject(date_str, raw_subject):
 def _extract_details_llm(subject: str, date_str: str, text: str) -> dict:
     """Use LLM to extract summary, outline, and actionables."""
     from toolbox.lib.llm_gateway import call_llm, _parse_json
+    from toolbox.lib import prompt_segments
     prompt = EXTRACT_PROMPT.format(
         subject=subject,
         date_str=date_str,
-        text=text[:8000] # Increased context window slightly
+        text=prompt_segments.payload(text[:8000]) # Increased context window slightly
     )
     try:
         res = call_llm(task_type='automation', prompt=prompt)
@@ -92,6 +93,7 @@ def _extract_details_llm(subject: str, date_str: str, text: str) -> dict:
 def _categorize_recording(subject: str, text: str) -> str:
     """Route Plaud notes into a stable top-level category."""
     from toolbox.lib.llm_gateway import call_llm, _parse_json
+    from toolbox.lib import prompt_segments
 
     prompt = """\
 Categorize this voice recording transcript into exactly one of these categories:
@@ -115,7 +117,7 @@ Return ONLY valid JSON:
     try:
         res = call_llm(
             task_type='automation',
-            prompt=prompt.format(subject=subject, text=text[:4000]),
+            prompt=prompt.format(subject=subject, text=prompt_segments.payload(text[:4000])),
         )
         category = _parse_json(res.get('text', '')).get('category', 'Other')
         return category if category in valid else 'Other'
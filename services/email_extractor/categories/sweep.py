@@ -16,7 +16,7 @@ if BASE_DIR not in sys.path:
 if os.path.dirname(BASE_DIR) not in sys.path:
     sys.path.insert(0, os.path.dirname(BASE_DIR))
 
-from ..scanner import html_to_text, get_full_email, save_state
+from ..scanner import email_text, get_full_email
 
 logger = logging.getLogger('EmailExtractor.Sweep')
 
@@ -43,10 +43,11 @@ Return ONLY valid JSON: {{"category": "...", "reason": "one sentence", "vendor":
 
 def _classify_email(sender: str, subject: str, body: str) -> dict:
     from toolbox.lib.llm_gateway import call_llm, _parse_json
+    from toolbox.lib import prompt_segments
     try:
         res = call_llm(
             task_type='automation',
-            prompt=CLASSIFY_PROMPT.format(sender=sender, subject=subject, body=body[:1500])
+            prompt=CLASSIFY_PROMPT.format(sender=sender, subject=subject, body=prompt_segments.payload(body[:1500]))
         )
         result = _parse_json(res.get('text', ''))
         return result if result else {'category': 'unknown', 'reason': 'Empty LLM response', 'vendor': sender}
@@ -147,8 +148,8 @@ def run(service, config: dict, state: dict) -> str | None:
 
     logger.info(f'Sweep: {len(unknown_by_sender)} unknown senders after filtering')
 
+    # Saved by main.run together with the rest of the state, and only once Memory has flushed
     state['last_sweep_run'] = today.isoformat()
-    save_state(state)
 
     if not unknown_by_sender:
         return 'Sweep: no new senders found'
@@ -163,9 +164,7 @@ def run(service, config: dict, state: dict) -> str | None:
             time.sleep(7)  # stay under 10 req/min free tier limit
         try:
             full = get_full_email(service, info['sample_id'])
-            html = full.get('html', '')
-            plain = full.get('plain', '')
-            body, _ = html_to_text(html) if html else (plain, [])
+            body, _ = email_text(full)
             # Light cleanup for LLM
             body_lines = [l.strip() for l in body.splitlines() if l.strip()]
             body_clean = '\n'.join(body_lines)
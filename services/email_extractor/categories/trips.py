@@ -204,6 +204,7 @@ def _trip_url(vendor: str, confirmation: str) -> str:
 def _extract_trip_details_llm(trip_type: str, vendor: str, subject: str, body: str) -> dict:
     """Use LLM Gateway to extract type-specific itinerary details."""
     from toolbox.lib.llm_gateway import call_llm, _parse_json
+    from toolbox.lib import prompt_segments
     prompts = {
         'Flight': FLIGHT_PROMPT,
         'Hotel': HOTEL_PROMPT,
@@ -213,7 +214,7 @@ def _extract_trip_details_llm(trip_type: str, vendor: str, subject: str, body: s
     template = prompts.get(trip_type)
     if not template:
         return {}
-    prompt = template.format(vendor=vendor, subject=subject, body=body[:4000])
+    prompt = template.format(vendor=vendor, subject=subject, body=prompt_segments.payload(body[:4000]))
     try:
         res = call_llm(task_type='high-stakes', prompt=prompt)
         return _parse_json(res.get('text', ''))
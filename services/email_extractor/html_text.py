@@ -0,0 +1,188 @@
+"""
+HTML-to-text engines behind scanner.html_to_text.
+
+Every engine returns (text, links) with the contract of the original HTMLParser
+extractor: script/style/head content is dropped, http(s) hrefs are collected in
+document order, block elements start a new line, runs of 3+ newlines collapse to
+one blank line and the result is stripped.
+
+  - lxml (optional): libxml2 parses and streams events into the same handler.
+    Source <head> tags are renamed before parsing, so the handler skips what the
+    document marked as head rather than the head libxml2 implies or discards.
+  - regex: a single-pass pure-Python tokenizer, used when lxml is not installed.
+  - stdlib: the original html.parser subclass, kept as the reference for
+    bin/benchmark_html_to_text.py and the equivalence tests.
+"""
+import re
+from html import unescape
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree as _etree
+except ImportError:  # optional fast path
+    _etree = None
+
+_SKIP_TAGS = frozenset(('script', 'style', 'head'))
+_BLOCK_TAGS = frozenset(('p', 'br', 'div', 'li', 'h1', 'h2', 'h3', 'h4', 'tr'))
+_BLANK_RUNS = re.compile(r'\n{3,}')
+
+
+def _finish(parts: list) -> str:
+    return _BLANK_RUNS.sub('\n\n', ''.join(parts)).strip()
+
+
+# --- stdlib (reference) ---
+
+class _HTMLTextExtractor(HTMLParser):
+    """Strip HTML tags, preserve links as [url], add newlines at block elements."""
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._skip = False
+        self._links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip = True
+        if tag == 'a':
+            for name, val in attrs:
+                if name == 'href' and val and val.startswith('http'):
+                    self._links.append(val)
+        if tag in _BLOCK_TAGS:
+            self._parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = False
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._parts.append(data)
+
+    def get_text(self) -> str:
+        return _finish(self._parts)
+
+    def get_links(self) -> list:
+        return self._links
+
+
+def html_to_text_stdlib(html: str):
+    p = _HTMLTextExtractor()
+    try:
+        p.feed(html)
+    except Exception:
+        pass
+    return p.get_text(), p.get_links()
+
+
+# --- regex (pure-Python fallback) ---
+
+# A start/end tag, or a comment / doctype / processing instruction to drop
+_TOKEN = re.compile(
+    r'<(/?)([a-zA-Z][^\t\n\r\f />\x00]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>'
+    r'|<!--.*?(?:-->|$)|<![^>]*>|<\?[^>]*>',
+    re.DOTALL,
+)
+_HREF = re.compile(r'(?:^|[\s/])href\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'=<>`]+))', re.IGNORECASE)
+_RAW_TEXT_END = {tag: re.compile(rf'</{tag}[\t\n\r\f />]', re.IGNORECASE) for tag in ('script', 'style')}
+
+
+def html_to_text_regex(html: str):
+    parts = []
+    links = []
+    skip = False
+    pos = 0
+    n = len(html)
+    while pos < n:
+        m = _TOKEN.search(html, pos)
+        if m is None:
+            if not skip:
+                parts.append(unescape(html[pos:]))
+            break
+        if m.start() > pos and not skip:
+            parts.append(unescape(html[pos:m.start()]))
+        pos = m.end()
+        tag = m.group(2)
+        if tag is None:
+            continue  # comment / doctype
+        tag = tag.lower()
+        if m.group(1):
+            if tag in _SKIP_TAGS:
+                skip = False
+            continue
+        self_closing = m.group(3).rstrip().endswith('/')
+        if tag in _SKIP_TAGS:
+            skip = not self_closing
+        if tag == 'a':
+            href = _HREF.search(m.group(3))
+            if href:
+                val = unescape(next(g for g in href.groups() if g is not None))
+                if val.startswith('http'):
+                    links.append(val)
+        if tag in _BLOCK_TAGS:
+            parts.append('\n')
+        if tag in _RAW_TEXT_END and not self_closing:
+            # Script/style bodies are raw text: jump straight to the closing tag
+            end = _RAW_TEXT_END[tag].search(html, pos)
+            pos = end.start() if end else n
+    return _finish(parts), links
+
+
+# --- lxml (optional fast path) ---
+
+# libxml2 opens an implied <head> for e.g. a leading <title> and drops a <head> that
+# follows body content; an alias it does not know is passed through where it stands
+_HEAD_ALIAS = 'x-source-head'
+_HEAD_TAG = re.compile(r'<(/?)head(?=[\t\n\r\f />])', re.IGNORECASE)
+_LXML_SKIP_TAGS = (_SKIP_TAGS - {'head'}) | {_HEAD_ALIAS}
+
+
+class _Target:
+    """lxml parser target: receives the same start/end/data events as the stdlib parser."""
+    def __init__(self):
+        self.parts = []
+        self.links = []
+        self.skip = False
+
+    def start(self, tag, attrib):
+        if tag in _LXML_SKIP_TAGS:
+            self.skip = True
+        if tag == 'a':
+            href = attrib.get('href')
+            if href and href.startswith('http'):
+                self.links.append(href)
+        if tag in _BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def end(self, tag):
+        if tag in _LXML_SKIP_TAGS:
+            self.skip = False
+
+    def data(self, data):
+        if not self.skip:
+            self.parts.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return _finish(self.parts), self.links
+
+
+def html_to_text_lxml(html: str):
+    target = _Target()
+    parser = _etree.HTMLParser(target=target, no_network=True)
+    parser.feed(_HEAD_TAG.sub(rf'<\1{_HEAD_ALIAS}', html))
+    return parser.close()
+
+
+def html_to_text(html: str):
+    """Returns (plain_text, links_list)."""
+    if not html:
+        return '', []
+    if _etree is not None:
+        try:
+            return html_to_text_lxml(html)
+        except Exception:
+            pass  # e.g. input libxml2 refuses — the pure-Python engine copes
+    return html_to_text_regex(html)
@@ -2,7 +2,9 @@
 Email extraction pipeline — daily Gmail scan → 01 - Second Brain/Memory/ in Drive.
 
 First run (no state file): in:inbox + all emails from today (incl. archived/deleted).
-Subsequent runs: all mail since last_run date.
+Subsequent runs: messages added since the stored Gmail historyId (falls back to all
+mail since last_run date when the historyId has expired). One scan covers every
+category; messages are routed to categories locally by sender.
 
 Categories: orders, receipts, trips, digests.
 """
@@ -23,8 +25,9 @@ logger = LogManager.get_instance("email-extractor").logger
 from toolbox.lib.telegram import send_message, escape, monit_link
 from .scanner import (
     get_gmail_service, load_config, load_state, save_state,
-    fetch_category_emails,
+    scan_categories, mark_for_retry,
 )
+from .writers import buffered_memory
 from .categories import orders, receipts, trips, digests, sweep, google_brief, plaud
 
 LOW_CONFIDENCE_THRESHOLD = 0.7
@@ -51,6 +54,12 @@ def _route_result(result, summaries, category, low_confidence_list):
         summaries[category].append(summary)
 
 
+def _unprocessed(emails, state):
+    """Drop emails whose thread an earlier category already processed this run."""
+    done = set(state.get('processed_threads', []))
+    return [e for e in emails if not e.get('thread_id') or e['thread_id'] not in done]
+
+
 def run():
     config = load_config()
     state = load_state()
@@ -75,125 +84,148 @@ def run():
     known_digest_senders = config.get('digests', {}).get('known_senders', {})
     raw_digest_senders = config.get('digests', {}).get('raw_senders', {})
 
-    # --- Orders ---
-    logger.info('Fetching orders...')
-    order_emails = fetch_category_emails(service, 'orders', config,
-                                          state=state, after_date=after_date, first_run=first_run)
-    for email in order_emails:
-        try:
-            result = orders.process(email, state)
-            if result:
-                _route_result(result, summaries, 'orders', low_confidence)
-                # Mark thread as processed if successful
-                if email.get('thread_id'):
-                    state['processed_threads'].append(email['thread_id'])
-        except Exception as e:
-            logger.error(f'Order processing error ({email["subject"][:50]}): {e}')
-            errors += 1
-            error_details.append(f'orders/{email["subject"][:40]}: {type(e).__name__}')
+    all_digest_senders = {**known_digest_senders, **raw_digest_senders}
+    categories = {name: config.get(name, {}) for name in ('orders', 'receipts', 'trips', 'google_brief', 'plaud')}
+    categories['digests'] = {'senders': all_digest_senders}
 
-    # --- Receipts ---
-    logger.info('Fetching receipts...')
-    receipt_emails = fetch_category_emails(service, 'receipts', config,
-                                            state=state, after_date=after_date, first_run=first_run)
-    for email in receipt_emails:
-        try:
-            result = receipts.process(email, state)
-            if result:
-                _route_result(result, summaries, 'receipts', low_confidence)
-                if email.get('thread_id'):
-                    state['processed_threads'].append(email['thread_id'])
-        except Exception as e:
-            logger.error(f'Receipt processing error ({email["subject"][:50]}): {e}')
-            errors += 1
-            error_details.append(f'receipts/{email["subject"][:40]}: {type(e).__name__}')
+    # Memory files are loaded once and uploaded once at the end of the block,
+    # no matter how many entries each category appends or updates
+    with buffered_memory() as memory:
+        logger.info('Scanning Gmail...')
+        by_category = scan_categories(service, categories, state, after_date=after_date,
+                                      first_run=first_run, service_factory=get_gmail_service)
 
-    # --- Trips ---
-    logger.info('Fetching trips...')
-    trip_emails = fetch_category_emails(service, 'trips', config,
-                                         state=state, after_date=after_date, first_run=first_run)
-    for email in trip_emails:
-        try:
-            result = trips.process(email, state)
-            if result:
-                _route_result(result, summaries, 'trips', low_confidence)
-                if email.get('thread_id'):
-                    state['processed_threads'].append(email['thread_id'])
-        except Exception as e:
-            logger.error(f'Trip processing error ({email["subject"][:50]}): {e}')
-            errors += 1
-            error_details.append(f'trips/{email["subject"][:40]}: {type(e).__name__}')
+        # --- Orders ---
+        logger.info('Processing orders...')
+        order_emails = _unprocessed(by_category['orders'], state)
+        for email in order_emails:
+            try:
+                result = orders.process(email, state)
+                if result:
+                    _route_result(result, summaries, 'orders', low_confidence)
+                    # Mark thread as processed if successful
+                    if email.get('thread_id'):
+                        state['processed_threads'].append(email['thread_id'])
+            except Exception as e:
+                logger.error(f'Order processing error ({email["subject"][:50]}): {e}')
+                errors += 1
+                mark_for_retry(state, email['id'], email.get('retry_attempts', 0))
+                error_details.append(f'orders/{email["subject"][:40]}: {type(e).__name__}')
 
-    # --- Digests ---
-    logger.info('Fetching digests...')
-    all_digest_senders = {**known_digest_senders, **raw_digest_senders}
-    digest_emails = fetch_category_emails(
-        service, 'digests',
-        {'digests': {'senders': all_digest_senders}},
-        state=state, after_date=after_date, first_run=first_run,
-    )
-    for email in digest_emails:
-        try:
-            result = digests.process(email, known_digest_senders, raw_digest_senders)
-            if result:
-                _route_result(result, summaries, 'digests', low_confidence)
-                if email.get('thread_id'):
-                    state['processed_threads'].append(email['thread_id'])
-        except Exception as e:
-            logger.error(f'Digest processing error ({email["subject"][:50]}): {e}')
-            errors += 1
-            error_details.append(f'digests/{email["subject"][:40]}: {type(e).__name__}')
+        # --- Receipts ---
+        logger.info('Processing receipts...')
+        receipt_emails = _unprocessed(by_category['receipts'], state)
+        for email in receipt_emails:
+            try:
+                result = receipts.process(email, state)
+                if result:
+                    _route_result(result, summaries, 'receipts', low_confidence)
+                    if email.get('thread_id'):
+                        state['processed_threads'].append(email['thread_id'])
+            except Exception as e:
+                logger.error(f'Receipt processing error ({email["subject"][:50]}): {e}')
+                errors += 1
+                mark_for_retry(state, email['id'], email.get('retry_attempts', 0))
+                error_details.append(f'receipts/{email["subject"][:40]}: {type(e).__name__}')
+
+        # --- Trips ---
+        logger.info('Processing trips...')
+        trip_emails = _unprocessed(by_category['trips'], state)
+        for email in trip_emails:
+            try:
+                result = trips.process(email, state)
+                if result:
+                    _route_result(result, summaries, 'trips', low_confidence)
+                    if email.get('thread_id'):
+                        state['processed_threads'].append(email['thread_id'])
+            except Exception as e:
+                logger.error(f'Trip processing error ({email["subject"][:50]}): {e}')
+                errors += 1
+                mark_for_retry(state, email['id'], email.get('retry_attempts', 0))
+                error_details.append(f'trips/{email["subject"][:40]}: {type(e).__name__}')
 
-    # --- Google CC Daily Brief ---
-    logger.info('Fetching Google CC brief...')
-    brief_emails = fetch_category_emails(service, 'google_brief', config,
-                                         state=state, after_date=after_date, first_run=first_run)
-    for email in brief_emails:
+        # --- Digests ---
+        logger.info('Processing digests...')
+        digest_emails = _unprocessed(by_category['digests'], state)
+        # Digest extraction is independent per email, so the LLM calls fan out concurrently
         try:
-            result = google_brief.process(email, state)
-            if result:
-                _route_result(result, summaries, 'google_brief', low_confidence)
-                if email.get('thread_id'):
-                    state['processed_threads'].append(email['thread_id'])
+            digest_articles = digests.prefetch_articles(digest_emails, known_digest_senders, raw_digest_senders)
         except Exception as e:
-            logger.error(f'Google brief error ({email["subject"][:50]}): {e}')
-            errors += 1
-            error_details.append(f'google_brief/{email["subject"][:40]}: {type(e).__name__}')
+            logger.error(f'Digest prefetch failed, falling back to per-email extraction: {e}')
+            digest_articles = {}
+        for email in digest_emails:
+            try:
+                result = digests.process(email, known_digest_senders, raw_digest_senders,
+                                         articles=digest_articles.get(email.get('id')))
+                if result:
+                    _route_result(result, summaries, 'digests', low_confidence)
+                    if email.get('thread_id'):
+                        state['processed_threads'].append(email['thread_id'])
+            except Exception as e:
+                logger.error(f'Digest processing error ({email["subject"][:50]}): {e}')
+                errors += 1
+                mark_for_retry(state, email['id'], email.get('retry_attempts', 0))
+                error_details.append(f'digests/{email["subject"][:40]}: {type(e).__name__}')
+
+        # --- Google CC Daily Brief ---
+        logger.info('Processing Google CC brief...')
+        brief_emails = _unprocessed(by_category['google_brief'], state)
+        for email in brief_emails:
+            try:
+                result = google_brief.process(email, state)
+                if result:
+                    _route_result(result, summaries, 'google_brief', low_confidence)
+                    if email.get('thread_id'):
+                        state['processed_threads'].append(email['thread_id'])
+            except Exception as e:
+                logger.error(f'Google brief error ({email["subject"][:50]}): {e}')
+                errors += 1
+                mark_for_retry(state, email['id'], email.get('retry_attempts', 0))
+                error_details.append(f'google_brief/{email["subject"][:40]}: {type(e).__name__}')
+
+        # --- Plaud ---
+        logger.info('Processing Plaud emails...')
+        plaud_emails = _unprocessed(by_category['plaud'], state)
+        for email in plaud_emails:
+            try:
+                result = plaud.process(email, state, service=service)
+                if result:
+                    _route_result(result, summaries, 'plaud', low_confidence)
+                    if email.get('thread_id'):
+                        state['processed_threads'].append(email['thread_id'])
+            except Exception as e:
+                logger.error(f'Plaud processing error ({email["subject"][:50]}): {e}')
+                errors += 1
+                mark_for_retry(state, email['id'], email.get('retry_attempts', 0))
+                error_details.append(f'plaud/{email["subject"][:40]}: {type(e).__name__}')
 
-    # --- Plaud ---
-    logger.info('Fetching Plaud emails...')
-    plaud_emails = fetch_category_emails(service, 'plaud', config,
-                                         state=state, after_date=after_date, first_run=first_run)
-    for email in plaud_emails:
+        # --- Weekly sweep ---
+        logger.info('Running sweep (weekly)...')
         try:
-            result = plaud.process(email, state, service=service)
+            result = sweep.run(service, config, state)
             if result:
-                _route_result(result, summaries, 'plaud', low_confidence)
-                if email.get('thread_id'):
-                    state['processed_threads'].append(email['thread_id'])
+                _route_result(result, summaries, 'sweep', low_confidence)
         except Exception as e:
-            logger.error(f'Plaud processing error ({email["subject"][:50]}): {e}')
+            logger.error(f'Sweep error: {e}')
             errors += 1
-            error_details.append(f'plaud/{email["subject"][:40]}: {type(e).__name__}')
-
-    # --- Weekly sweep ---
-    logger.info('Running sweep (weekly)...')
-    try:
-        result = sweep.run(service, config, state)
-        if result:
-            _route_result(result, summaries, 'sweep', low_confidence)
-    except Exception as e:
-        logger.error(f'Sweep error: {e}')
+            error_details.append(f'sweep: {type(e).__name__}')
+
+    for label, err in memory.failures:
         errors += 1
-        error_details.append(f'sweep: {type(e).__name__}')
-
-    # Update last_run and harden state
-    state['last_run'] = date.today().isoformat()
-    # Deduplicate and limit thread history to last 500
-    state['processed_threads'] = list(set(state.get('processed_threads', [])))[-500:]
-    # Deduplicate and limit entity history to last 1000
-    state['processed_entities'] = list(set(state.get('processed_entities', [])))[-1000:]
-    save_state(state)
+        error_details.append(f'memory/{label}: {type(err).__name__}')
+
+    if memory.failures:
+        # Don't persist state (last_run, processed threads, order status) so the next run
+        # redoes the lost writes; block_exists keeps re-appended entries from duplicating
+        logger.error(f'{len(memory.failures)} Memory file(s) failed to upload; state not saved')
+    else:
+        # Update last_run and harden state
+        state['last_run'] = date.today().isoformat()
+        # Deduplicate and limit thread history to last 500
+        state['processed_threads'] = list(set(state.get('processed_threads', [])))[-500:]
+        # Deduplicate and limit entity history to last 1000
+        state['processed_entities'] = list(set(state.get('processed_entities', [])))[-1000:]
+        save_state(state)
 
     # Build Telegram message — only send if there's something to report
     total = sum(len(v) for v in summaries.values())
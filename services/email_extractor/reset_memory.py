@@ -17,33 +17,12 @@ if os.path.dirname(BASE_DIR) not in sys.path:
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
 logger = logging.getLogger('reset_memory')
 
-from toolbox.lib.drive_utils import get_drive_service
+from toolbox.lib.drive_utils import get_drive_service, resolve_folder_path
 
 MEMORY_ROOT = '01 - Second Brain/Memory'
 STATE_FILE = os.path.join(BASE_DIR, 'config', 'email_extractor_state.json')
 
 
-def _find_folder(service, name: str, parent_id: str) -> str | None:
-    query = (
-        f"'{parent_id}' in parents and name = '{name}' "
-        f"and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-    )
-    results = service.files().list(q=query, fields='files(id)').execute()
-    files = results.get('files', [])
-    return files[0]['id'] if files else None
-
-
-def _resolve_path(service, path: str) -> str | None:
-    parts = path.strip('/').split('/')
-    parent_id = 'root'
-    for part in parts:
-        fid = _find_folder(service, part, parent_id)
-        if not fid:
-            return None
-        parent_id = fid
-    return parent_id
-
-
 def _list_md_files(service, folder_id: str) -> list[dict]:
     """Recursively list all .md files under folder_id."""
     found = []
@@ -60,7 +39,7 @@ def _list_md_files(service, folder_id: str) -> list[dict]:
 def run():
     service = get_drive_service()
 
-    memory_id = _resolve_path(service, MEMORY_ROOT)
+    memory_id = resolve_folder_path(service, MEMORY_ROOT, create=False)
     if not memory_id:
         logger.info(f'Memory folder not found at {MEMORY_ROOT} — nothing to delete')
     else:
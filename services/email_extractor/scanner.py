@@ -7,12 +7,14 @@ import json
 import logging
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timezone
 from email.utils import parsedate_to_datetime
-from html.parser import HTMLParser
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-STATE_PATH = os.path.join(BASE_DIR, 'config', 'email_extractor_state.json')
+STATE_PATH = os.path.join(BASE_DIR, 'config', 'email_extractor_state.json')  # legacy, imported once into state.db
 CONFIG_PATH = os.path.join(BASE_DIR, 'config', 'email_extractor_config.json')
 
 if BASE_DIR not in sys.path:
@@ -22,6 +24,8 @@ if os.path.dirname(BASE_DIR) not in sys.path:
 
 from toolbox.lib.google_api import GoogleAuth
 from toolbox.lib.log_manager import LogManager
+from toolbox.lib import state_store, message_cache
+from toolbox.services.email_extractor.html_text import html_to_text
 
 # Initialize centralized logger
 log_manager = LogManager.get_instance('email-extractor')
@@ -46,22 +50,25 @@ def load_config() -> dict:
         return json.load(f)
 
 
+STATE_NAMESPACE = 'email_extractor'
+
+
+def _import_legacy_state(store, data: dict) -> None:
+    store.save_document(STATE_NAMESPACE, data)
+
+
 def load_state() -> dict:
-    if os.path.exists(STATE_PATH):
-        try:
-            with open(STATE_PATH) as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return {}
+    """State keys live as one row each in state.db; the returned dict tracks what was loaded."""
+    with state_store.StateStore() as store:
+        store.migrate_json(STATE_NAMESPACE, STATE_PATH, _import_legacy_state)
+        return store.document(STATE_NAMESPACE)
 
 
 def save_state(state: dict) -> None:
-    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
-    tmp = STATE_PATH + '.tmp'
-    with open(tmp, 'w') as f:
-        json.dump(state, f, indent=2)
-    os.replace(tmp, STATE_PATH)
+    """Write only the top-level keys this process changed since load_state()."""
+    with state_store.StateStore() as store:
+        store.save_document(STATE_NAMESPACE, state)
+        store.commit()
 
 
 def _build_sender_query(senders: dict, sender_domains: dict = None) -> str:
@@ -100,52 +107,6 @@ def _fetch_messages(service, query: str, after_date: str = None,
     return messages
 
 
-class _HTMLTextExtractor(HTMLParser):
-    """Strip HTML tags, preserve links as [url], add newlines at block elements."""
-    def __init__(self):
-        super().__init__()
-        self._parts = []
-        self._skip = False
-        self._links = []
-
-    def handle_starttag(self, tag, attrs):
-        if tag in ('script', 'style', 'head'):
-            self._skip = True
-        if tag == 'a':
-            for name, val in attrs:
-                if name == 'href' and val and val.startswith('http'):
-                    self._links.append(val)
-        if tag in ('p', 'br', 'div', 'li', 'h1', 'h2', 'h3', 'h4', 'tr'):
-            self._parts.append('\n')
-
-    def handle_endtag(self, tag):
-        if tag in ('script', 'style', 'head'):
-            self._skip = False
-
-    def handle_data(self, data):
-        if not self._skip:
-            self._parts.append(data)
-
-    def get_text(self) -> str:
-        import re
-        text = ''.join(self._parts)
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        return text.strip()
-
-    def get_links(self) -> list:
-        return self._links
-
-
-def html_to_text(html: str):
-    """Returns (plain_text, links_list)."""
-    p = _HTMLTextExtractor()
-    try:
-        p.feed(html)
-    except Exception:
-        pass
-    return p.get_text(), p.get_links()
-
-
 def _extract_body(payload: dict):
     """Recursively extract plain text and HTML from a message payload."""
     plain = ''
@@ -240,10 +201,208 @@ def get_attachment(service, message_id: str, attachment_id: str):
     return base64.urlsafe_b64decode(data + '==')
 
 
+def email_text(email: dict):
+    """(text, links) for a parsed email — the HTML body as text when there is one, else plain."""
+    if 'text' not in email:
+        html = email.get('html', '')
+        email['text'], email['links'] = html_to_text(html) if html else (email.get('plain', ''), [])
+    return email['text'], email.get('links', [])
+
+
+def parse_gmail_messages(msgs: list) -> dict:
+    """
+    Parse raw message resources through the shared message cache: {id: email | Exception}.
+    A message already parsed by any service is reused; if its historyId moved on, only
+    the labels are refreshed. New parses include the email_text() pass.
+    """
+    cached = message_cache.get_many(m['id'] for m in msgs if m.get('id'))
+    emails = {}
+    to_store = []
+    for msg in msgs:
+        mid = msg.get('id', '')
+        history_id = msg.get('historyId')
+        email = cached.get(mid)
+        try:
+            if email is None:
+                email = parse_gmail_message(msg)
+                email_text(email)
+            elif history_id and email.get('history_id') != history_id:
+                email['label_ids'] = msg.get('labelIds', [])
+            else:
+                emails[mid] = email
+                continue
+        except Exception as e:
+            emails[mid] = e
+            continue
+        email['history_id'] = history_id or ''
+        emails[mid] = email
+        if mid:
+            to_store.append((mid, history_id, email))
+    message_cache.put_many(to_store)
+    return emails
+
+
+def parse_gmail_message_cached(msg: dict) -> dict:
+    """parse_gmail_message backed by the shared message cache."""
+    email = parse_gmail_messages([msg])[msg.get('id', '')]
+    if isinstance(email, Exception):
+        raise email
+    return email
+
+
 def get_full_email(service, message_id: str) -> dict:
-    """Fetch and parse a full email message."""
+    """Fetch and parse a full email message (served from the message cache when parsed before)."""
+    cached = message_cache.get(message_id)
+    if cached is not None:
+        return cached
     msg = service.users().messages().get(userId='me', id=message_id).execute()
-    return parse_gmail_message(msg)
+    return parse_gmail_message_cached(msg)
+
+
+# --- BATCHED FETCH ---
+GMAIL_BATCH_SIZE = 50        # Gmail allows 100 sub-requests per batch but throttles large batches
+GMAIL_FETCH_WORKERS = 4      # concurrent batches when a service_factory is given
+GMAIL_MAX_RETRIES = 5
+GMAIL_BACKOFF_BASE = 1.0     # seconds; doubles per retry round
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+_RETRYABLE_403_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+def _http_status(error):
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error) -> bool:
+    status = _http_status(error)
+    if status is None:
+        # No HTTP status: the whole batch call failed (network) — worth retrying
+        return not hasattr(error, 'resp')
+    if status == 403:
+        return any(reason in str(error) for reason in _RETRYABLE_403_REASONS)
+    return status in _RETRYABLE_STATUS
+
+
+def _retry_after(error) -> float:
+    """Seconds from a Retry-After header on a 429/503 response, else 0."""
+    resp = getattr(error, 'resp', None)
+    try:
+        return float(resp.get('retry-after', 0)) if resp is not None else 0.0
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+def _batch_get(service, message_ids: list, get_kwargs: dict) -> dict:
+    """One HTTP batch of messages.get; returns {id: (response, error)}."""
+    results = {}
+
+    def callback(request_id, response, exception):
+        results[request_id] = (response, exception)
+
+    batch = service.new_batch_http_request(callback=callback)
+    for mid in message_ids:
+        batch.add(service.users().messages().get(userId='me', id=mid, **get_kwargs), request_id=mid)
+    try:
+        batch.execute()
+    except Exception as e:
+        logger.warning(f'Gmail batch of {len(message_ids)} failed: {e}')
+        return {mid: (None, e) for mid in message_ids}
+    return results
+
+
+def _fetch_chunk(service, message_ids: list, get_kwargs: dict,
+                 max_retries: int, backoff_base: float, sleep) -> dict:
+    """Fetch one chunk, re-batching rate-limited/5xx sub-requests with exponential backoff."""
+    fetched = {}
+    todo = list(message_ids)
+    attempt = 0
+    while todo:
+        attempt += 1
+        results = _batch_get(service, todo, get_kwargs)
+        retry = []
+        wait = backoff_base * (2 ** (attempt - 1))
+        for mid in todo:
+            response, error = results.get(mid, (None, RuntimeError('No response in batch')))
+            if error is None:
+                fetched[mid] = response
+            elif attempt <= max_retries and _is_retryable(error):
+                retry.append(mid)
+                wait = max(wait, _retry_after(error))
+            else:
+                fetched[mid] = error
+        if retry:
+            logger.info(f'Retrying {len(retry)} Gmail sub-requests in {wait:.1f}s')
+            sleep(wait)
+        todo = retry
+    return fetched
+
+
+def _batch_fetch(service, message_ids, get_kwargs: dict, service_factory=None,
+                 workers: int = GMAIL_FETCH_WORKERS, batch_size: int = GMAIL_BATCH_SIZE,
+                 max_retries: int = GMAIL_MAX_RETRIES, backoff_base: float = GMAIL_BACKOFF_BASE,
+                 sleep=time.sleep) -> dict:
+    """Raw messages.get results {id: resource | Exception} in input order (duplicates dropped)."""
+    ids = list(dict.fromkeys(message_ids))
+    batch_size = max(1, min(batch_size, 100))
+    chunks = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+
+    fetched = {}
+    if service_factory is None or workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            fetched.update(_fetch_chunk(service, chunk, get_kwargs, max_retries, backoff_base, sleep))
+    else:
+        local = threading.local()
+
+        def run(chunk):
+            if not hasattr(local, 'service'):
+                local.service = service_factory()
+            return _fetch_chunk(local.service, chunk, get_kwargs, max_retries, backoff_base, sleep)
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            for part in pool.map(run, chunks):
+                fetched.update(part)
+    return {mid: fetched[mid] for mid in ids}
+
+
+def get_full_emails(service, message_ids, service_factory=None, **batch_options) -> dict:
+    """
+    Fetch and parse many messages through HTTP batch requests.
+    Returns {message_id: email dict | Exception} in input order (duplicates dropped).
+    Batches run on up to `workers` threads when service_factory is given — each thread
+    builds its own service, since a googleapiclient service is not thread-safe;
+    otherwise they run one after another on `service`. Messages already in the
+    shared message cache are not fetched again.
+    """
+    ids = list(dict.fromkeys(message_ids))
+    cached = message_cache.get_many(ids)
+    fetched = _batch_fetch(service, [mid for mid in ids if mid not in cached], {},
+                           service_factory, **batch_options)
+    parsed = parse_gmail_messages([r for r in fetched.values() if not isinstance(r, Exception)])
+    emails = {}
+    for mid in ids:
+        if mid in cached:
+            emails[mid] = cached[mid]
+        elif isinstance(fetched[mid], Exception):
+            emails[mid] = fetched[mid]
+        else:
+            emails[mid] = parsed.get(mid, RuntimeError('Message id missing from response'))
+    return emails
+
+
+def get_message_senders(service, message_ids, service_factory=None, **batch_options) -> dict:
+    """{message_id: From header | Exception}, fetched as metadata only (no bodies)."""
+    senders = {}
+    get_kwargs = {'format': 'metadata', 'metadataHeaders': ['From']}
+    for mid, result in _batch_fetch(service, message_ids, get_kwargs, service_factory, **batch_options).items():
+        if isinstance(result, Exception):
+            senders[mid] = result
+            continue
+        headers = result.get('payload', {}).get('headers', [])
+        senders[mid] = next((h['value'] for h in headers if h['name'].lower() == 'from'), '')
+    return senders
 
 
 def _sender_email(from_header: str) -> str:
@@ -269,11 +428,12 @@ def _match_sender(from_header: str, senders: dict, sender_domains: dict = None)
 
 def fetch_category_emails(service, category: str, config: dict,
                           state: dict = None, after_date: str = None, 
-                          first_run: bool = False) -> list:
+                          first_run: bool = False, service_factory=None) -> list:
     """
     Fetch and parse emails for a given category.
     Returns list of dicts: email metadata + body + matched vendor name.
-    Skips threads already marked as processed in state.
+    Skips threads already marked as processed in state. Messages are fetched in
+    HTTP batches; pass service_factory to run the batches concurrently.
     """
     cat_config = config.get(category, {})
     senders = cat_config.get('senders', {})
@@ -292,6 +452,7 @@ def fetch_category_emails(service, category: str, config: dict,
 
     results = []
     seen_ids = set()
+    to_fetch = []
     
     # Thread-level hardening: skip threads already fully processed
     processed_threads = set(state.get('processed_threads', [])) if state else set()
@@ -305,16 +466,207 @@ def fetch_category_emails(service, category: str, config: dict,
         if thread_id and thread_id in processed_threads:
             logger.debug(f"Skipping already processed thread: {thread_id}")
             continue
+        to_fetch.append(m['id'])
 
-        try:
-            full = get_full_email(service, m['id'])
-            vendor = _match_sender(full['from'], senders, sender_domains)
-            if vendor:
-                full['vendor'] = vendor
-                results.append(full)
-        except Exception as e:
-            logger.warning(f'Failed to fetch message {m["id"]}: {e}')
+    if to_fetch:
+        logger.debug(f'Fetching {len(to_fetch)} {category} messages')
+    for mid, full in get_full_emails(service, to_fetch, service_factory=service_factory).items():
+        if isinstance(full, Exception):
+            logger.warning(f'Failed to fetch message {mid}: {full}')
+            continue
+        vendor = _match_sender(full['from'], senders, sender_domains)
+        if vendor:
+            full['vendor'] = vendor
+            results.append(full)
 
     # Process oldest first so confirmation emails precede shipped/delivered
     results.sort(key=lambda e: e['date_dt'])
     return results
+
+
+# --- UNIFIED SCAN ---
+HISTORY_STATE_KEY = 'gmail_history_id'
+RETRY_STATE_KEY = 'gmail_retry_ids'   # {message_id: failed attempts} refetched on the next scan
+MAX_RETRY_ATTEMPTS = 5        # give up on a message after this many failed runs
+MAX_QUERY_TERMS = 50          # from: terms per fallback list query
+_SKIP_LABELS = {'SPAM', 'TRASH', 'DRAFT'}
+
+
+class SenderIndex:
+    """
+    Sender address / domain -> [(category, vendor)] across every category, so one
+    message list can be routed locally instead of running a from: query per category.
+    Matching follows _match_sender: exact address first, then the sender's domain.
+    """
+
+    def __init__(self, categories: dict):
+        self.by_email = {}
+        self.by_domain = {}
+        for category, cat_config in categories.items():
+            for sender, vendor in (cat_config.get('senders') or {}).items():
+                self.by_email.setdefault(sender.lower(), []).append((category, vendor))
+            for domain, vendor in (cat_config.get('sender_domains') or {}).items():
+                self.by_domain.setdefault(domain.lower(), []).append((category, vendor))
+
+    def __bool__(self):
+        return bool(self.by_email or self.by_domain)
+
+    def match(self, from_header: str) -> dict:
+        """{category: vendor} for every category the sender belongs to."""
+        email = _sender_email(from_header)
+        routes = {}
+        for category, vendor in self.by_email.get(email, ()):
+            routes.setdefault(category, vendor)
+        if '@' in email:
+            for category, vendor in self.by_domain.get(email.rpartition('@')[2], ()):
+                routes.setdefault(category, vendor)
+        return routes
+
+    def queries(self, max_terms: int = MAX_QUERY_TERMS) -> list:
+        """from: queries covering every sender and domain, at most max_terms each."""
+        terms = list(self.by_email) + [f'@{d}' for d in self.by_domain]
+        return [
+            '(' + ' OR '.join(f'from:{t}' for t in terms[i:i + max_terms]) + ')'
+            for i in range(0, len(terms), max_terms)
+        ]
+
+
+def current_history_id(service) -> str | None:
+    """The mailbox's latest historyId; read it before listing so nothing falls in the gap."""
+    try:
+        return service.users().getProfile(userId='me').execute().get('historyId')
+    except Exception as e:
+        logger.warning(f'Could not read Gmail historyId: {e}')
+        return None
+
+
+def list_history(service, start_history_id: str, label_id: str = None) -> list | None:
+    """
+    Messages that arrived since start_history_id — or, with label_id, that arrived in
+    or were moved into that label — excluding spam, trash and drafts. Returns None
+    when the historyId has expired (404) and the caller must fall back to a search.
+    """
+    messages = []
+    seen = set()
+    page_token = None
+    history_types = ['messageAdded', 'labelAdded'] if label_id else ['messageAdded']
+    while True:
+        params = {'userId': 'me', 'startHistoryId': start_history_id, 'historyTypes': history_types}
+        if label_id:
+            params['labelId'] = label_id
+        if page_token:
+            params['pageToken'] = page_token
+        try:
+            result = service.users().history().list(**params).execute()
+        except Exception as e:
+            if _http_status(e) == 404:
+                return None
+            raise
+        for record in result.get('history', []):
+            added = [a.get('message', {}) for a in record.get('messagesAdded', [])]
+            added += [a.get('message', {}) for a in record.get('labelsAdded', [])
+                      if label_id and label_id in a.get('labelIds', [])]
+            for m in added:
+                if m.get('id') and m['id'] not in seen and not _SKIP_LABELS.intersection(m.get('labelIds', [])):
+                    seen.add(m['id'])
+                    messages.append(m)
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            break
+    return messages
+
+
+def mark_for_retry(state: dict, item_id: str, attempts: int = 0, error: Exception = None,
+                   key: str = RETRY_STATE_KEY) -> None:
+    """
+    Queue a Gmail message (or thread) id in state[key] for the next run, which
+    fetches it again even though the historyId has moved past it. attempts is how
+    often it has already failed; a 404 error means it is gone and is not queued.
+    """
+    if error is not None and _http_status(error) == 404:
+        return
+    attempts += 1
+    if attempts >= MAX_RETRY_ATTEMPTS:
+        logger.error(f'Giving up on Gmail {key} entry {item_id} after {attempts} failed runs')
+        return
+    state.setdefault(key, {})[item_id] = attempts
+
+
+def scan_categories(service, categories: dict, state: dict,
+                    after_date: str = None, first_run: bool = False,
+                    service_factory=None) -> dict:
+    """
+    List candidate messages once for all categories and fetch each body once.
+
+    With a stored historyId only messages added since the last run are listed
+    (history.list) and their From headers are checked before any body is fetched;
+    on the first run, or when the historyId has expired, the sender queries run as a
+    date-bounded search instead. Each email is routed locally through SenderIndex and
+    returned as {category: [email, ...]} (oldest first, with 'vendor' and
+    'retry_attempts' set). The new historyId is written to state[HISTORY_STATE_KEY]
+    for the caller to save; messages whose headers or body could not be fetched
+    are kept in state[RETRY_STATE_KEY] and fetched again by the next scan.
+    """
+    index = SenderIndex(categories)
+    by_category = {category: [] for category in categories}
+    if not index:
+        return by_category
+
+    new_history_id = current_history_id(service)
+    start_history_id = None if first_run else state.get(HISTORY_STATE_KEY)
+    candidates = list_history(service, start_history_id) if start_history_id else None
+    from_history = candidates is not None
+    if start_history_id and not from_history:
+        logger.warning(f'Gmail historyId {start_history_id} expired; falling back to a date scan')
+
+    if not from_history:
+        candidates = []
+        for query in index.queries():
+            candidates.extend(_fetch_messages(
+                service, query,
+                after_date=after_date,
+                first_run=first_run,
+                include_spam_trash=first_run,
+            ))
+
+    processed_threads = set(state.get('processed_threads', []))
+    ids = []
+    for m in candidates:
+        thread_id = m.get('threadId')
+        if thread_id and thread_id in processed_threads:
+            logger.debug(f"Skipping already processed thread: {thread_id}")
+            continue
+        ids.append(m['id'])
+    retry = dict(state.get(RETRY_STATE_KEY) or {})
+    ids = list(dict.fromkeys(ids + list(retry)))
+    state[RETRY_STATE_KEY] = {}
+
+    def _failed(mid, error, what):
+        logger.warning(f'Failed to fetch {what} for message {mid}: {error}')
+        mark_for_retry(state, mid, retry.get(mid, 0), error=error)
+
+    if from_history and ids:
+        # History lists every new message; only fetch bodies for known senders
+        senders = get_message_senders(service, ids, service_factory=service_factory)
+        for mid, sender in senders.items():
+            if isinstance(sender, Exception):
+                _failed(mid, sender, 'headers')
+        ids = [mid for mid, sender in senders.items()
+               if not isinstance(sender, Exception) and index.match(sender)]
+
+    logger.info(f'Gmail scan: {len(candidates)} listed, {len(ids)} to fetch '
+                f'({"history" if from_history else "search"})')
+    for mid, full in get_full_emails(service, ids, service_factory=service_factory).items():
+        if isinstance(full, Exception):
+            _failed(mid, full, 'body')
+            continue
+        for category, vendor in index.match(full['from']).items():
+            by_category[category].append({**full, 'vendor': vendor, 'retry_attempts': retry.get(mid, 0)})
+
+    for emails in by_category.values():
+        # Process oldest first so confirmation emails precede shipped/delivered
+        emails.sort(key=lambda e: e['date_dt'])
+
+    if new_history_id:
+        state[HISTORY_STATE_KEY] = new_history_id
+    return by_category
@@ -2,12 +2,17 @@
 Drive markdown writer for the email extraction pipeline.
 Writes to 01 - Second Brain/Memory/{category}/{filename}.md
 Appends to existing files (download → append → re-upload).
+
+Inside buffered_memory() the same calls go through a MemoryStore: each touched file
+is downloaded once, edits are applied in memory, and each dirty file is uploaded
+once when the block exits (re-merging if Drive's copy changed in the meantime).
 """
 import io
 import logging
 import os
 import re
 import sys
+from contextlib import contextmanager
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 if BASE_DIR not in sys.path:
@@ -16,7 +21,8 @@ if os.path.dirname(BASE_DIR) not in sys.path:
     sys.path.insert(0, os.path.dirname(BASE_DIR))
 
 from googleapiclient.http import MediaIoBaseUpload
-from toolbox.lib.drive_utils import get_drive_service, escape_query_string
+from toolbox.lib.drive_utils import get_drive_service, escape_query_string, resolve_folder_path
+from toolbox.lib import drive_index, memory_index
 from toolbox.lib.log_manager import LogManager
 
 # Initialize centralized logger
@@ -24,48 +30,24 @@ log_manager = LogManager.get_instance('email-extractor')
 logger = log_manager.logger
 
 MEMORY_ROOT = '01 - Second Brain/Memory'
+MERGE_RETRIES = 3
 
-_folder_cache: dict[str, str] = {}
-
-
-def _find_or_create_folder(service, name: str, parent_id: str) -> str:
-    cache_key = f'{parent_id}/{name}'
-    if cache_key in _folder_cache:
-        return _folder_cache[cache_key]
-
-    safe_name = escape_query_string(name)
-    query = (
-        f"'{parent_id}' in parents and name = '{safe_name}' "
-        f"and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-    )
-    results = service.files().list(q=query, fields='files(id)').execute()
-    files = results.get('files', [])
-    if files:
-        fid = files[0]['id']
-    else:
-        meta = {
-            'name': name,
-            'mimeType': 'application/vnd.google-apps.folder',
-            'parents': [parent_id],
-        }
-        fid = service.files().create(body=meta, fields='id').execute()['id']
-        logger.info(f'Created folder: {name} under {parent_id}')
-
-    _folder_cache[cache_key] = fid
-    return fid
+# Run-scoped write-back buffer; set by buffered_memory(), None means write-through
+_active_store = None
 
 
 def _resolve_path(service, path: str) -> str:
-    """Resolve a Drive path like '01 - Second Brain/Memory/Orders' to a folder ID."""
-    parts = path.strip('/').split('/')
-    parent_id = 'root'
-    for part in parts:
-        parent_id = _find_or_create_folder(service, part, parent_id)
-    return parent_id
+    """Resolve a Drive path like '01 - Second Brain/Memory/Orders' to a folder ID (shared path cache)."""
+    return resolve_folder_path(service, path)
 
 
 def _get_file_in_folder(service, folder_id: str, filename: str) -> str | None:
     """Return file ID if filename exists in folder, else None."""
+    # Index hits are trusted; a miss may just be a file created since the last sync
+    if drive_index.is_fresh(drive_index.LOOKUP_MAX_AGE_SEC):
+        file_id = drive_index.find_in_folder(folder_id, filename)
+        if file_id:
+            return file_id
     safe_filename = escape_query_string(filename)
     query = f"'{folder_id}' in parents and name = '{safe_filename}' and trashed = false"
     results = service.files().list(q=query, fields='files(id)').execute()
@@ -78,6 +60,8 @@ def get_memory_content(category: str | None, filename: str) -> str:
     Download and return the current text content of a Memory file.
     Returns '' if the file doesn't exist yet.
     """
+    if _active_store is not None:
+        return _active_store.get(category, filename)
     service = get_drive_service()
     folder_path = f'{MEMORY_ROOT}/{category}' if category else MEMORY_ROOT
     folder_id = _resolve_path(service, folder_path)
@@ -88,6 +72,28 @@ def get_memory_content(category: str | None, filename: str) -> str:
     return existing_bytes.decode('utf-8') if isinstance(existing_bytes, bytes) else existing_bytes
 
 
+def get_memory_blocks(category: str | None, filename: str, date: str) -> list[str]:
+    """
+    Blocks headed '## {date}' in a Memory file, read from the memory block index.
+    Costs one metadata call when the index is current; otherwise only the missing
+    tail (or, failing that, the whole file) is downloaded.
+    """
+    if _active_store is not None:
+        return _active_store.index(category, filename).blocks_for_date(date)
+    service = get_drive_service()
+    folder_path = f'{MEMORY_ROOT}/{category}' if category else MEMORY_ROOT
+    folder_id = _resolve_path(service, folder_path)
+    file_id = _get_file_in_folder(service, folder_id, filename)
+    if not file_id:
+        return []
+    meta = service.files().get(fileId=file_id, fields='md5Checksum, size, version').execute()
+    blocks = memory_index.query_date(file_id, meta.get('md5Checksum'), date)
+    if blocks is None:
+        index, _ = memory_index.fetch(service, file_id, meta)
+        blocks = index.blocks_for_date(date)
+    return blocks
+
+
 def list_memory_files(category: str | None) -> dict[str, str]:
     """Return {filename: file_id} for all files in a memory folder."""
     service = get_drive_service()
@@ -100,6 +106,9 @@ def list_memory_files(category: str | None) -> dict[str, str]:
 
 def set_memory_content(category: str | None, filename: str, content: str) -> None:
     """Create or replace the full contents of a Memory file."""
+    if _active_store is not None:
+        _active_store.set(category, filename, content)
+        return
     service = get_drive_service()
     folder_path = f'{MEMORY_ROOT}/{category}' if category else MEMORY_ROOT
     folder_id = _resolve_path(service, folder_path)
@@ -111,7 +120,8 @@ def set_memory_content(category: str | None, filename: str, content: str) -> Non
         logger.info(f'Set {category or "Memory"}/{filename}')
     else:
         meta = {'name': filename, 'parents': [folder_id]}
-        service.files().create(body=meta, media_body=media, fields='id').execute()
+        created = service.files().create(body=meta, media_body=media, fields='id').execute()
+        drive_index.record_files([{'id': created['id'], 'name': filename, 'mimeType': 'text/markdown', 'parents': [folder_id]}])
         logger.info(f'Created {category or "Memory"}/{filename}')
 
 
@@ -138,6 +148,8 @@ def update_in_memory(category: str, filename: str, old_text: str, new_text: str)
     Replace old_text with new_text in an existing memory file.
     Returns True if the text was found and replaced, False if not found.
     """
+    if _active_store is not None:
+        return _active_store.replace(category, filename, old_text, new_text)
     service = get_drive_service()
     folder_path = f'{MEMORY_ROOT}/{category}' if category else MEMORY_ROOT
     folder_id = _resolve_path(service, folder_path)
@@ -223,6 +235,8 @@ def append_to_memory(category: str, filename: str, new_content: str,
     If dedup_date is provided, checks block_exists before appending.
     Returns True if content was written, False if skipped as duplicate.
     """
+    if _active_store is not None:
+        return _active_store.append(category, filename, new_content, dedup_date, dedup_ids)
     service = get_drive_service()
 
     if category:
@@ -246,6 +260,172 @@ def append_to_memory(category: str, filename: str, new_content: str,
     else:
         media = MediaIoBaseUpload(io.BytesIO(new_content.encode()), mimetype='text/markdown')
         meta = {'name': filename, 'parents': [folder_id]}
-        service.files().create(body=meta, media_body=media, fields='id').execute()
+        created = service.files().create(body=meta, media_body=media, fields='id').execute()
+        drive_index.record_files([{'id': created['id'], 'name': filename, 'mimeType': 'text/markdown', 'parents': [folder_id]}])
         logger.info(f'Created {category}/{filename}')
     return True
+
+
+# ── Buffered writes ──────────────────────────────────────────────────────────
+
+class _BufferedFile:
+    __slots__ = ('category', 'filename', 'folder_id', 'file_id', 'version', 'index', 'ops')
+
+    def __init__(self, category, filename, folder_id, file_id, version, index):
+        self.category = category
+        self.filename = filename
+        self.folder_id = folder_id
+        self.file_id = file_id
+        self.version = version
+        self.index = index  # memory_index.FileIndex of the buffered content
+        self.ops = []       # edits since load, replayed onto Drive's copy on conflict
+
+    def apply(self, op) -> bool:
+        if op[0] == 'append':
+            _, new_content, dedup_date, dedup_ids = op
+            if dedup_date and self.index.block_exists(dedup_date, *dedup_ids):
+                return False
+            self.index.append(new_content)
+            return True
+        if op[0] == 'replace':
+            return self.index.replace(op[1], op[2])
+        self.index = memory_index.FileIndex.from_content(op[1])
+        return True
+
+    def replay(self, index) -> None:
+        self.index = index
+        for op in self.ops:
+            self.apply(op)
+
+
+class MemoryStore:
+    """
+    Write-back buffer for Memory files. get/append/replace/set mirror the module
+    functions; flush() uploads each dirty file once. Files are read through the
+    memory block index, so an unchanged file is not downloaded at all and dedup
+    checks only look at one date's blocks. A file whose Drive `version` moved since
+    it was loaded is re-fetched and the buffered edits are replayed onto the new
+    content before uploading (up to MERGE_RETRIES times).
+    """
+
+    def __init__(self, service=None):
+        self._service = service
+        self._files: dict[tuple, _BufferedFile] = {}
+        self.failures: list[tuple[str, Exception]] = []
+
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = get_drive_service()
+        return self._service
+
+    def _file(self, category, filename) -> _BufferedFile:
+        key = (category, filename)
+        if key not in self._files:
+            folder_path = f'{MEMORY_ROOT}/{category}' if category else MEMORY_ROOT
+            folder_id = _resolve_path(self.service, folder_path)
+            file_id = _get_file_in_folder(self.service, folder_id, filename)
+            if file_id:
+                index, meta = memory_index.fetch(self.service, file_id)
+                version = meta.get('version')
+            else:
+                index, version = memory_index.FileIndex(), None
+            self._files[key] = _BufferedFile(category, filename, folder_id, file_id, version, index)
+        return self._files[key]
+
+    def get(self, category: str | None, filename: str) -> str:
+        return self._file(category, filename).index.content
+
+    def index(self, category: str | None, filename: str):
+        return self._file(category, filename).index
+
+    def append(self, category, filename, new_content, dedup_date='', dedup_ids=()) -> bool:
+        f = self._file(category, filename)
+        op = ('append', new_content, dedup_date, tuple(dedup_ids))
+        if not f.apply(op):
+            logger.info(f'Skipping duplicate block in {category}/{filename} [{dedup_date}]')
+            return False
+        f.ops.append(op)
+        return True
+
+    def replace(self, category, filename, old_text, new_text) -> bool:
+        f = self._file(category, filename)
+        op = ('replace', old_text, new_text)
+        if not f.apply(op):
+            return False
+        f.ops.append(op)
+        return True
+
+    def set(self, category, filename, content) -> None:
+        f = self._file(category, filename)
+        op = ('set', content)
+        f.apply(op)
+        f.ops.append(op)
+
+    def dirty(self) -> list[str]:
+        return [f'{f.category or "Memory"}/{f.filename}' for f in self._files.values() if f.ops]
+
+    def _flush_file(self, f: _BufferedFile) -> None:
+        label = f'{f.category or "Memory"}/{f.filename}'
+        if f.file_id is None:
+            # Someone else may have created it since we looked
+            f.file_id = _get_file_in_folder(self.service, f.folder_id, f.filename)
+            if f.file_id is None:
+                media = MediaIoBaseUpload(io.BytesIO(f.index.content.encode()), mimetype='text/markdown')
+                meta = {'name': f.filename, 'parents': [f.folder_id]}
+                created = self.service.files().create(body=meta, media_body=media, fields='id').execute()
+                drive_index.record_files([{'id': created['id'], 'name': f.filename, 'mimeType': 'text/markdown', 'parents': [f.folder_id]}])
+                f.index.dirty_from = 0
+                memory_index.save(created['id'], f.index)
+                logger.info(f'Created {label}')
+                return
+            f.version = object()  # force a merge against the file that appeared
+
+        for _ in range(MERGE_RETRIES):
+            current = self.service.files().get(fileId=f.file_id, fields='version').execute().get('version')
+            if current != f.version:
+                logger.info(f'{label} changed on Drive since load; merging {len(f.ops)} buffered edits')
+                remote, meta = memory_index.fetch(self.service, f.file_id)
+                f.replay(remote)
+                f.version = meta.get('version')
+                continue
+            media = MediaIoBaseUpload(io.BytesIO(f.index.content.encode()), mimetype='text/markdown')
+            result = self.service.files().update(fileId=f.file_id, media_body=media, fields='id, version').execute()
+            f.version = result.get('version') if isinstance(result, dict) else None
+            memory_index.save(f.file_id, f.index)
+            logger.info(f'Updated {label} ({len(f.ops)} buffered edits)')
+            return
+        raise RuntimeError(f'{label} kept changing on Drive; gave up after {MERGE_RETRIES} merges')
+
+    def flush(self) -> list[tuple[str, Exception]]:
+        """Upload every dirty file once. Returns [(file label, error)] for files that failed."""
+        failures = []
+        for f in self._files.values():
+            if not f.ops:
+                continue
+            try:
+                self._flush_file(f)
+                f.ops = []
+            except Exception as e:
+                label = f'{f.category or "Memory"}/{f.filename}'
+                logger.error(f'Failed to flush {label}: {e}')
+                failures.append((label, e))
+        self.failures.extend(failures)
+        return failures
+
+
+@contextmanager
+def buffered_memory(service=None):
+    """
+    Route Memory reads/writes through a MemoryStore for the duration of the block and
+    flush it on exit (also when the block raises). Files that failed to upload are
+    left in store.failures.
+    """
+    global _active_store
+    store = MemoryStore(service)
+    previous, _active_store = _active_store, store
+    try:
+        yield store
+    finally:
+        _active_store = previous
+        store.flush()
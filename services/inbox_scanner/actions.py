@@ -83,7 +83,8 @@ def handle_monitored_inquiry(email: dict, classification: dict, monitor_config:
                               telegram_service: str) -> None:
     """Structured extraction + dedicated Drive log + immediate Telegram alert for monitored senders."""
     from toolbox.lib.llm_gateway import call_llm, _parse_json
-    from toolbox.services.email_extractor.scanner import html_to_text
+    from toolbox.lib import prompt_segments
+    from toolbox.services.email_extractor.scanner import email_text
     from toolbox.services.email_extractor.writers import append_to_memory
 
     label = monitor_config.get('label', 'Property')
@@ -91,10 +92,8 @@ def handle_monitored_inquiry(email: dict, classification: dict, monitor_config:
     date = email.get('date', '')
     subject = email.get('subject', '')
     from_h = email.get('from', '')
-    html = email.get('html', '')
-    plain = email.get('plain', '')
 
-    text, _ = html_to_text(html) if html else (plain, [])
+    text, _ = email_text(email)
 
     # LLM extraction
     extracted = {}
@@ -102,7 +101,7 @@ def handle_monitored_inquiry(email: dict, classification: dict, monitor_config:
         try:
             res = call_llm(
                 task_type='automation',
-                prompt=PROPERTY_INQUIRY_PROMPT.format(text=text[:5000])
+                prompt=PROPERTY_INQUIRY_PROMPT.format(text=prompt_segments.payload(text[:5000]))
             )
             extracted = _parse_json(res.get('text', ''))
         except Exception as e:
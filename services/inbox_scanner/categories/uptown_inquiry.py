@@ -73,13 +73,13 @@ def _sender_email(from_header: str) -> str:
 
 
 def _get_plain_body(email: dict) -> str:
-    from toolbox.services.email_extractor.scanner import html_to_text
+    from toolbox.services.email_extractor.scanner import email_text
     plain = email.get('plain') or ''
     html = email.get('html') or ''
     if plain and not re.search(r'<[a-zA-Z]+[\s>]', plain[:500]):
         return plain
     if html:
-        text, _ = html_to_text(html)
+        text, _ = email_text(email)
         return text
     return plain
 
@@ -90,6 +90,7 @@ class UptownInquiryProcessor(CategoryProcessor):
 
     def process(self, email: dict, classification: dict) -> dict | None:
         from toolbox.lib.llm_gateway import call_llm, _parse_json
+        from toolbox.lib import prompt_segments
         from toolbox.services.inbox_scanner.uptown_response_kb import build_prompt_examples
 
         body = _get_plain_body(email)
@@ -110,7 +111,7 @@ class UptownInquiryProcessor(CategoryProcessor):
                 task_type='automation',
                 prompt=INQUIRY_EXTRACT_PROMPT.format(
                     subject=subject,
-                    body=body[:5000],
+                    body=prompt_segments.payload(body[:5000]),
                 )
             )
             extracted = _parse_json(res_ext.get('text', ''))
@@ -137,10 +138,10 @@ class UptownInquiryProcessor(CategoryProcessor):
             res_shadow = call_llm(
                 task_type='final',
                 prompt=SHADOW_RESPONSE_PROMPT.format(
-                    examples=examples or 'No closely matching examples available.',
+                    examples=prompt_segments.examples(examples or 'No closely matching examples available.'),
                     name=tenant or 'there',
                     questions=', '.join(questions) if questions else 'none specified',
-                    body=body[:3000],
+                    body=prompt_segments.payload(body[:3000]),
                 )
             )
             shadow = res_shadow.get('text', '')
@@ -32,6 +32,7 @@ Return ONLY valid JSON: {{"category": "...", "reason": "one sentence", "priority
 
 def classify_email(sender: str, subject: str, body: str) -> dict:
     from toolbox.lib.llm_gateway import call_llm, _parse_json
+    from toolbox.lib import prompt_segments
     from toolbox.lib.telegram import is_automation_generated
     
     # 1. Immediate skip for known automation tags (feedback loop guard)
@@ -50,7 +51,7 @@ def classify_email(sender: str, subject: str, body: str) -> dict:
             prompt=CLASSIFY_PROMPT.format(
                 sender=sender,
                 subject=subject,
-                body=body[:2000],
+                body=prompt_segments.payload(body[:2000]),
             )
         )
         raw = res.get('text', '')
@@ -11,7 +11,7 @@ import os
 import re
 import sys
 import time
-from datetime import date
+from datetime import date, timedelta
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 if BASE_DIR not in sys.path:
@@ -23,7 +23,10 @@ from toolbox.lib.log_manager import LogManager, log
 logger = LogManager.get_instance("inbox-scanner").logger
 
 from toolbox.lib.google_api import GoogleAuth
-from toolbox.services.email_extractor.scanner import get_full_email, html_to_text
+from toolbox.lib import state_store
+from toolbox.services.email_extractor.scanner import (
+    get_full_email, email_text, current_history_id, list_history, mark_for_retry,
+)
 from toolbox.services.inbox_scanner.classifier import classify_email
 from toolbox.services.inbox_scanner.categories.action_required import ActionRequiredProcessor
 from toolbox.services.inbox_scanner.categories.inquiry import InquiryProcessor
@@ -35,6 +38,13 @@ GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 CONFIG_DIR = os.path.join(BASE_DIR, 'config', 'inbox_scanner')
 EXTRACTOR_CONFIG_PATH = os.path.join(BASE_DIR, 'config', 'email_extractor_config.json')
 
+# Gmail history cursor for the inbox (per mailbox state)
+HISTORY_STATE_KEY = 'inbox_history_id'
+# {message_id: failed attempts} for messages the cursor has passed but that failed to process
+RETRY_STATE_KEY = 'inbox_retry_ids'
+# Look-back for the fallback search when the historyId has expired and there is no last_run
+FALLBACK_SCAN_DAYS = 7
+
 # Uptown inquiry response timeout — alert if no reply within this many hours
 UPTOWN_RESPONSE_TIMEOUT_HOURS = 48
 
@@ -60,23 +70,24 @@ def load_mailbox_config(mailbox_id: str) -> dict:
     return config
 
 
+def _state_namespace(mailbox_id: str) -> str:
+    return f'inbox_scanner.{mailbox_id}'
+
+
 def load_state(mailbox_id: str) -> dict:
-    path = os.path.join(CONFIG_DIR, mailbox_id, 'state.json')
-    if os.path.exists(path):
-        try:
-            with open(path) as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return {}
+    """Per-mailbox state from state.db (legacy config/inbox_scanner/<id>/state.json is imported once)."""
+    namespace = _state_namespace(mailbox_id)
+    with state_store.StateStore() as store:
+        store.migrate_json(namespace, os.path.join(CONFIG_DIR, mailbox_id, 'state.json'),
+                           lambda s, data: s.save_document(namespace, data))
+        return store.document(namespace)
 
 
 def save_state(mailbox_id: str, state: dict) -> None:
-    path = os.path.join(CONFIG_DIR, mailbox_id, 'state.json')
-    tmp = path + '.tmp'
-    with open(tmp, 'w') as f:
-        json.dump(state, f, indent=2)
-    os.replace(tmp, path)
+    """Write only the top-level keys that changed since load_state()."""
+    with state_store.StateStore() as store:
+        store.save_document(_state_namespace(mailbox_id), state)
+        store.commit()
 
 
 def get_gmail_service(config: dict):
@@ -138,6 +149,34 @@ def fetch_inbox_since(service, after_date: str | None) -> list:
     return messages
 
 
+def fetch_inbox_changes(service, state: dict, after_date: str | None) -> list:
+    """
+    Inbox messages that arrived since the last run. Uses the stored historyId when
+    there is one; the first run lists the inbox, and an expired historyId (404) falls
+    back to a search bounded by after_date (or FALLBACK_SCAN_DAYS). Messages queued in
+    state[RETRY_STATE_KEY] by the previous run are appended (with 'retry_attempts')
+    and the queue is emptied for this run's failures. The new historyId is written to
+    state[HISTORY_STATE_KEY] for the caller to save.
+    """
+    new_history_id = current_history_id(service)
+    start_history_id = state.get(HISTORY_STATE_KEY)
+    messages = list_history(service, start_history_id, label_id='INBOX') if start_history_id else None
+    if messages is None:
+        if start_history_id:
+            logger.warning(f'Inbox historyId {start_history_id} expired; falling back to a bounded scan')
+            if not after_date:
+                after_date = (date.today() - timedelta(days=FALLBACK_SCAN_DAYS)).strftime('%Y/%m/%d')
+        messages = fetch_inbox_since(service, after_date)
+    retry = state.get(RETRY_STATE_KEY) or {}
+    listed = {m['id'] for m in messages}
+    messages = messages + [{'id': mid, 'retry_attempts': attempts}
+                           for mid, attempts in retry.items() if mid not in listed]
+    state[RETRY_STATE_KEY] = {}
+    if new_history_id:
+        state[HISTORY_STATE_KEY] = new_history_id
+    return messages
+
+
 def _check_uptown_responses(service, state: dict, telegram_service: str) -> None:
     """Check open Uptown inquiries for replies; nudge if unresponded after timeout."""
     open_inquiries = state.get('uptown_open_inquiries', {})
@@ -216,7 +255,7 @@ def run(mailbox_id: str = 'primary') -> None:
     monitored_senders = config.get('monitored_senders', {})
 
     after_date = last_run.replace('-', '/') if last_run else None
-    raw_messages = fetch_inbox_since(service, after_date)
+    raw_messages = fetch_inbox_changes(service, state, after_date)
     logger.info(f'Found {len(raw_messages)} inbox messages to evaluate')
 
     results: dict[str, list] = {cat: [] for cat in processors}
@@ -246,6 +285,7 @@ def run(mailbox_id: str = 'primary') -> None:
             label_ids = meta.get('labelIds', [])
         except Exception as e:
             logger.warning(f'Metadata fetch failed {msg_id}: {e}')
+            mark_for_retry(state, msg_id, m.get('retry_attempts', 0), error=e, key=RETRY_STATE_KEY)
             continue
 
         if _is_known_sender(sender, known_senders):
@@ -276,6 +316,8 @@ def run(mailbox_id: str = 'primary') -> None:
                 except Exception as e:
                     logger.error(f'Monitored inquiry handler error ({subject[:50]}): {e}')
                     errors += 1
+                    mark_for_retry(state, msg_id, m.get('retry_attempts', 0), key=RETRY_STATE_KEY)
+                    continue
             processed_ids.add(msg_id)
             continue
 
@@ -292,21 +334,25 @@ def run(mailbox_id: str = 'primary') -> None:
                     'subject': cached.get('_subject', subject),
                     'date': cached.get('_date', ''),
                 }
-                result = processors[category].process(fake_email, cached)
-                if result:
-                    results[category].append(result)
-                    if category == 'action_required' and cached.get('priority') == 'high':
-                        if not cached.get('_alerted'):
-                            actions.send_immediate_alert(result, telegram_service)
-                            cached['_alerted'] = True
+                try:
+                    result = processors[category].process(fake_email, cached)
+                    if result:
+                        results[category].append(result)
+                        if category == 'action_required' and cached.get('priority') == 'high':
+                            if not cached.get('_alerted'):
+                                actions.send_immediate_alert(result, telegram_service)
+                                cached['_alerted'] = True
+                except Exception as e:
+                    logger.error(f'Processing failed {msg_id} (cached): {e}')
+                    errors += 1
+                    processed_ids.discard(msg_id)
+                    mark_for_retry(state, msg_id, m.get('retry_attempts', 0), key=RETRY_STATE_KEY)
             continue
 
         # Cache miss: fetch full email, classify, store
         try:
             full = get_full_email(service, msg_id)
-            html = full.get('html', '')
-            plain = full.get('plain', '')
-            body, _ = html_to_text(html) if html else (plain, [])
+            body, _ = email_text(full)
             body_clean = '\n'.join(line.strip() for line in body.splitlines() if line.strip())
 
             classification = classify_email(sender, full['subject'], body_clean)
@@ -348,7 +394,9 @@ def run(mailbox_id: str = 'primary') -> None:
         except Exception as e:
             logger.error(f'Processing failed {msg_id}: {e}')
             errors += 1
-            processed_ids.add(msg_id)
+            # Left out of processed_ids so the retry is not skipped as already seen today
+            processed_ids.discard(msg_id)
+            mark_for_retry(state, msg_id, m.get('retry_attempts', 0), key=RETRY_STATE_KEY)
 
     logger.info(
         f'Done: {classified} classified, {skipped_known} skipped (known), '
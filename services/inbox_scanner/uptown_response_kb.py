@@ -8,7 +8,9 @@ import re
 from collections import Counter
 from datetime import date
 
-from toolbox.services.email_extractor.scanner import html_to_text, parse_gmail_message
+from toolbox.services.email_extractor.scanner import (
+    email_text, parse_gmail_messages, current_history_id, list_history, mark_for_retry,
+)
 from toolbox.services.email_extractor.writers import list_memory_files, set_memory_content
 from toolbox.services.inbox_scanner.categories.uptown_inquiry import LISTING_PLATFORMS
 
@@ -19,6 +21,8 @@ MAILBOX_EMAIL = 'operations@uptownedenton.com'
 CC_TARGET = 'takhan@gmail.com'
 CHRISTINA_NAME = 'christina manzella'
 MAX_PROMPT_EXAMPLES = 3
+# {thread_id: failed attempts} for threads the sent-mail cursor has passed but that failed to sync
+RETRY_STATE_KEY = 'uptown_response_kb_retry_threads'
 
 LEAD_KEYWORDS = {
     'availability', 'available', 'apartment', 'application', 'apply', 'bedroom',
@@ -94,7 +98,7 @@ def _message_body(message: dict) -> str:
     if plain and not re.search(r'<[a-zA-Z]+[\s>]', plain[:500]):
         return _clean_body_text(plain)
     if html:
-        text, _ = html_to_text(html)
+        text, _ = email_text(message)
         return _clean_body_text(text)
     return _clean_body_text(plain)
 
@@ -190,8 +194,9 @@ def build_kb_entry(thread: dict) -> dict | None:
     if not raw_messages:
         return None
 
+    parsed = parse_gmail_messages(raw_messages).values()
     messages = sorted(
-        (parse_gmail_message(m) for m in raw_messages),
+        (m for m in parsed if not isinstance(m, Exception)),
         key=lambda m: m.get('date_str', ''),
     )
     outbound = [m for m in messages if _is_identity_match(m)]
@@ -298,13 +303,25 @@ def _parse_kb_markdown(content: str) -> dict:
     }
 
 
-def _candidate_thread_ids(service, after_date: str | None) -> list[str]:
+def _candidate_thread_ids(service, after_date: str | None, start_history_id: str | None = None) -> list[str]:
+    """Threads with sent mail since the stored historyId, else since after_date (or 30 days)."""
+    thread_ids: list[str] = []
+    seen: set[str] = set()
+    messages = list_history(service, start_history_id, label_id='SENT') if start_history_id else None
+    if messages is not None:
+        for message in messages:
+            thread_id = message.get('threadId')
+            if thread_id and thread_id not in seen:
+                seen.add(thread_id)
+                thread_ids.append(thread_id)
+        return thread_ids
+    if start_history_id:
+        logger.warning(f'Sent historyId {start_history_id} expired; falling back to a date scan')
+
     if after_date:
         query = f'in:sent after:{after_date}'
     else:
         query = 'in:sent newer_than:30d'
-    thread_ids: list[str] = []
-    seen: set[str] = set()
     page_token = None
     while True:
         params = {'userId': 'me', 'q': query}
@@ -324,10 +341,15 @@ def _candidate_thread_ids(service, after_date: str | None) -> list[str]:
 
 def sync_response_kb(service, state: dict) -> int:
     after_date = state.get('uptown_response_kb_last_run')
+    new_history_id = current_history_id(service)
     existing = list_memory_files(KB_CATEGORY)
     synced = 0
     synced_entries: list[dict] = []
-    for thread_id in _candidate_thread_ids(service, after_date):
+    thread_ids = _candidate_thread_ids(service, after_date, state.get('uptown_response_kb_history_id'))
+    retry = state.get(RETRY_STATE_KEY) or {}
+    thread_ids += [thread_id for thread_id in retry if thread_id not in thread_ids]
+    state[RETRY_STATE_KEY] = {}
+    for thread_id in thread_ids:
         try:
             thread = service.users().threads().get(userId='me', id=thread_id).execute()
             entry = build_kb_entry(thread)
@@ -341,7 +363,10 @@ def sync_response_kb(service, state: dict) -> int:
             synced += 1
         except Exception as e:
             logger.warning(f'Uptown response KB sync failed for thread {thread_id}: {e}')
+            mark_for_retry(state, thread_id, retry.get(thread_id, 0), error=e, key=RETRY_STATE_KEY)
     state['uptown_response_kb_last_run'] = date.today().strftime('%Y/%m/%d')
+    if new_history_id:
+        state['uptown_response_kb_history_id'] = new_history_id
     state['uptown_response_kb_synced_entries'] = synced_entries
     return synced
 
@@ -31,19 +31,9 @@ def load_health_folder_id():
 
 
 def get_or_create_folder(service, path, parent_id):
-    for name in path.split("/"):
-        q = (f"name='{name}' and mimeType='application/vnd.google-apps.folder' "
-             f"and '{parent_id}' in parents and trashed=false")
-        res = service.files().list(q=q, fields="files(id)").execute()
-        if res["files"]:
-            parent_id = res["files"][0]["id"]
-        else:
-            f = service.files().create(
-                body={"name": name, "mimeType": "application/vnd.google-apps.folder", "parents": [parent_id]},
-                fields="id"
-            ).execute()
-            parent_id = f["id"]
-    return parent_id
+    # Shared folder path cache (toolbox root's parent is on sys.path via main.py)
+    from toolbox.lib.drive_utils import resolve_folder_path
+    return resolve_folder_path(service, path, parent_id)
 
 
 def create_unified_record(gym_session, health_connect=None):
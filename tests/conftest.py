@@ -16,3 +16,53 @@ def setup_env():
     """Ensure environment is ready for tests."""
     # Add any global environment mocks or setup here
     pass
+
+@pytest.fixture(autouse=True)
+def isolated_llm_cache(tmp_path, monkeypatch):
+    """Keep the persistent LLM response cache out of the real config/ dir and per-test fresh."""
+    monkeypatch.setattr("toolbox.lib.llm_cache.CACHE_PATH", str(tmp_path / "llm_cache.db"))
+
+@pytest.fixture(autouse=True)
+def isolated_state_store(tmp_path, monkeypatch):
+    """Keep the shared service state DB out of the real config/ dir."""
+    monkeypatch.setattr("toolbox.lib.state_store.STATE_DB_PATH", str(tmp_path / "state.db"))
+
+@pytest.fixture(autouse=True)
+def isolated_drive_index(tmp_path, monkeypatch):
+    """Tests never see a real Drive index, so lookups fall back to the (mocked) live API."""
+    monkeypatch.setattr("toolbox.lib.drive_index.INDEX_PATH", str(tmp_path / "drive_index.db"))
+    monkeypatch.setattr("toolbox.lib.drive_index.TREE_PATH", str(tmp_path / "drive_tree.json"))
+
+@pytest.fixture(autouse=True)
+def isolated_memory_index(tmp_path, monkeypatch):
+    """Keep the Memory block index out of the real config/ dir."""
+    monkeypatch.setattr("toolbox.lib.memory_index.INDEX_PATH", str(tmp_path / "memory_index.db"))
+
+@pytest.fixture(autouse=True)
+def isolated_message_cache(tmp_path, monkeypatch):
+    """Parsed Gmail messages are cached per test, never in the real config/ dir."""
+    monkeypatch.setattr("toolbox.lib.message_cache.CACHE_PATH", str(tmp_path / "message_cache.db"))
+
+@pytest.fixture(autouse=True)
+def isolated_provider_pool(monkeypatch):
+    """Each test starts without pooled provider clients from earlier tests."""
+    monkeypatch.setattr("toolbox.lib.llm_gateway._provider_pool", {})
+
+@pytest.fixture(autouse=True)
+def isolated_usage_rollup(tmp_path, monkeypatch):
+    """Ledger rollups and their cursors live per test, never in the real config/ dir."""
+    monkeypatch.setattr("toolbox.lib.usage_rollup.ROLLUP_PATH", str(tmp_path / "usage_rollup.db"))
+
+@pytest.fixture(autouse=True)
+def isolated_provider_health(tmp_path, monkeypatch):
+    """Adaptive routing starts from an empty history, so tiers keep their configured order."""
+    monkeypatch.setattr("toolbox.lib.provider_health.HEALTH_PATH", str(tmp_path / "provider_health.db"))
+
+@pytest.fixture(autouse=True)
+def isolated_ledgers(tmp_path, monkeypatch):
+    """Routing and cost records from tests never reach the real logs/ ledgers."""
+    from toolbox.lib import log_sink
+    monkeypatch.setattr("toolbox.lib.llm_gateway.LLM_LOG_PATH", str(tmp_path / "llm_routing.jsonl"))
+    monkeypatch.setattr("toolbox.lib.quota_manager.COST_LOG_PATH", str(tmp_path / "cost_log.jsonl"))
+    yield
+    log_sink.flush()
@@ -1,14 +1,20 @@
+import os
 import pytest
 from unittest.mock import MagicMock, patch
 from toolbox.lib.llm_gateway import LLMGateway
 from toolbox.lib.providers.base import QuotaExhaustedError
 from toolbox.lib import quota_manager
 
+@pytest.fixture
+def quota_paths(tmp_path, monkeypatch):
+    """Point the quota snapshot/journal and cost log at a temp dir."""
+    monkeypatch.setattr(quota_manager, "QUOTA_PATH", str(tmp_path / "quota_state.json"))
+    monkeypatch.setattr(quota_manager, "COST_LOG_PATH", str(tmp_path / "cost_log.jsonl"))
+    return tmp_path
+
 @patch("toolbox.lib.llm_gateway.LLMGateway._load_config")
 @patch("toolbox.lib.llm_gateway.LLMGateway._init_secrets")
-@patch("toolbox.lib.quota_manager.load")
-@patch("toolbox.lib.quota_manager.save")
-def test_circuit_breaker_trips_on_quota_error(mock_save, mock_load, mock_init, mock_config):
+def test_circuit_breaker_trips_on_quota_error(mock_init, mock_config, quota_paths):
     # 1. Setup Config
     mock_config.return_value = {
         "tiers": {
@@ -24,15 +30,6 @@ def test_circuit_breaker_trips_on_quota_error(mock_save, mock_load, mock_init, m
         "costs": {"fail-1": 1.0, "pass-1": 1.0}
     }
     
-    # Mock quota state
-    mock_load.return_value = {
-        "date": "2026-05-16",
-        "total_tokens_used": 0,
-        "total_usd_used": 0.0,
-        "degraded_providers": [],
-        "spend_by_task": {}
-    }
-
     gateway = LLMGateway()
     
     # 2. Mock Providers
@@ -56,41 +53,59 @@ def test_circuit_breaker_trips_on_quota_error(mock_save, mock_load, mock_init, m
         assert res['text'] == "Success!"
         assert res['provider'] == "fallback_provider"
         
-        # Verify broken_provider was marked degraded
-        # (Check mock_save calls to see if it was added to degraded_providers)
-        # Actually easier to just check quota_manager.get_degraded_providers() if we didn't mock it so hard
-        # But since we mocked load/save, we check if broken_provider is in the state passed to save
-        found_degraded = False
-        for call in mock_save.call_args_list:
-            state = call[0][0]
-            if "broken_provider" in state.get("degraded_providers", []):
-                found_degraded = True
-        assert found_degraded, "broken_provider should be in degraded_providers list"
+        # Verify broken_provider was marked degraded in the persisted quota state
+        assert "broken_provider" in quota_manager.get_degraded_providers(), "broken_provider should be in degraded_providers list"
 
         # 4. Second call - should skip broken_provider entirely
-        # Update mock_load to reflect the degraded state
-        mock_load.return_value["degraded_providers"] = ["broken_provider"]
         mock_broken.analyze.reset_mock()
         
         gateway.call("test_task", "Hello again")
         
         mock_broken.analyze.assert_not_called()
 
-def test_spend_aggregation():
+def test_spend_aggregation(quota_paths):
     # Test record_llm_usage aggregates by task_type
-    with patch("toolbox.lib.quota_manager.load") as mock_load,          patch("toolbox.lib.quota_manager.save") as mock_save:
-        
-        mock_load.return_value = {
-            "date": "2026-05-16",
-            "total_usd_used": 0.0,
-            "spend_by_task": {}
-        }
-        
-        quota_manager.record_llm_usage(100, 0.50, metadata={"task_type": "scanner"})
-        quota_manager.record_llm_usage(100, 0.25, metadata={"task_type": "scanner"})
-        quota_manager.record_llm_usage(100, 1.00, metadata={"task_type": "sorter"})
-        
-        # Get final state passed to save
-        final_state = mock_save.call_args[0][0]
-        assert final_state["spend_by_task"]["scanner"] == 0.75
-        assert final_state["spend_by_task"]["sorter"] == 1.00
+    quota_manager.record_llm_usage(100, 0.50, metadata={"task_type": "scanner"})
+    quota_manager.record_llm_usage(100, 0.25, metadata={"task_type": "scanner"})
+    quota_manager.record_llm_usage(100, 1.00, metadata={"task_type": "sorter"})
+
+    final_state = quota_manager.load()
+    assert final_state["spend_by_task"]["scanner"] == 0.75
+    assert final_state["spend_by_task"]["sorter"] == 1.00
+    assert final_state["total_tokens_used"] == 300
+
+def test_journal_survives_compaction_and_concurrent_writers(quota_paths, monkeypatch):
+    import multiprocessing
+    monkeypatch.setattr(quota_manager, "COMPACT_BYTES", 2048)
+
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_record_many, args=(quota_manager.QUOTA_PATH, quota_manager.COST_LOG_PATH, 50)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    _record_many(quota_manager.QUOTA_PATH, quota_manager.COST_LOG_PATH, 50)
+
+    state = quota_manager.load()
+    assert state["total_tokens_used"] == 250
+    # Compaction ran: the snapshot advanced a generation and the journal stayed small
+    assert state["journal_gen"] >= 1
+    assert os.path.getsize(quota_manager.QUOTA_PATH + ".journal") <= 2048 + 200
+
+def test_direct_snapshot_write_is_picked_up(quota_paths):
+    quota_manager.record_tokens(10)
+    assert quota_manager.remaining() == quota_manager.DAILY_BUDGET - 10
+
+    state = quota_manager.load()
+    state["total_tokens_used"] = quota_manager.DAILY_BUDGET
+    quota_manager.save(state)
+    assert quota_manager.is_exhausted()
+
+    quota_manager.record_tokens(5)
+    assert quota_manager.load()["total_tokens_used"] == quota_manager.DAILY_BUDGET + 5
+
+def _record_many(quota_path, cost_path, n):
+    quota_manager.QUOTA_PATH = quota_path
+    quota_manager.COST_LOG_PATH = cost_path
+    for _ in range(n):
+        quota_manager.record_tokens(1)
@@ -0,0 +1,101 @@
+"""Tests for DriveBatch (HTTP batch coalescing of Drive mutations)."""
+from unittest.mock import MagicMock
+
+from toolbox.lib.drive_utils import DriveBatch
+
+
+class FakeHttpError(Exception):
+    def __init__(self, status, message=""):
+        super().__init__(message or f"HTTP {status}")
+        self.resp = MagicMock(status=status)
+
+
+def make_service(fail_plan=None):
+    """
+    Service whose new_batch_http_request() returns a fake batch that invokes the
+    callback per sub-request. fail_plan maps request_id -> list of errors to raise
+    on successive attempts (None = success).
+    """
+    fail_plan = {k: list(v) for k, v in (fail_plan or {}).items()}
+    service = MagicMock()
+    service.batch_sizes = []
+
+    def new_batch_http_request(callback):
+        added = []
+        batch = MagicMock()
+        batch.add.side_effect = lambda request, request_id: added.append((request_id, request))
+
+        def execute():
+            service.batch_sizes.append(len(added))
+            for request_id, request in added:
+                plan = fail_plan.get(request_id)
+                error = plan.pop(0) if plan else None
+                if error is not None:
+                    callback(request_id, None, error)
+                else:
+                    callback(request_id, {"id": request_id}, None)
+        batch.execute.side_effect = execute
+        return batch
+
+    service.new_batch_http_request.side_effect = new_batch_http_request
+    return service
+
+
+def test_chunks_at_batch_limit():
+    service = make_service()
+    batch = DriveBatch(service, sleep=lambda s: None)
+    for i in range(250):
+        batch.add(f"f{i}", MagicMock())
+    outcomes = batch.execute()
+    assert service.batch_sizes == [100, 100, 50]
+    assert list(outcomes) == [f"f{i}" for i in range(250)]
+    assert all(o.ok and o.attempts == 1 for o in outcomes.values())
+    assert len(batch) == 0
+
+
+def test_rate_limited_sub_request_is_retried_with_backoff():
+    service = make_service({"b": [FakeHttpError(429), FakeHttpError(503)]})
+    sleeps = []
+    batch = DriveBatch(service, backoff_base=0.5, sleep=sleeps.append)
+    for key in ("a", "b", "c"):
+        batch.add(key, MagicMock())
+    outcomes = batch.execute()
+    # Only the failed sub-request goes into the retry batches
+    assert service.batch_sizes == [3, 1, 1]
+    assert sleeps == [0.5, 1.0]
+    assert outcomes["b"].ok and outcomes["b"].attempts == 3
+    assert outcomes["a"].attempts == 1
+
+
+def test_non_retryable_failure_is_reported_per_item():
+    service = make_service({"b": [FakeHttpError(404, "File not found")]})
+    batch = DriveBatch(service, sleep=lambda s: None)
+    batch.add("a", MagicMock())
+    batch.add("b", MagicMock())
+    outcomes = batch.execute()
+    assert service.batch_sizes == [2]
+    assert outcomes["a"].ok
+    assert not outcomes["b"].ok
+    assert "File not found" in str(outcomes["b"].error)
+
+
+def test_retries_are_bounded():
+    service = make_service({"a": [FakeHttpError(500)] * 10})
+    batch = DriveBatch(service, max_retries=2, sleep=lambda s: None)
+    batch.add("a", MagicMock())
+    outcome = batch.execute()["a"]
+    assert not outcome.ok
+    assert outcome.attempts == 3
+
+
+def test_rate_limit_403_is_retryable_but_permission_403_is_not():
+    service = make_service({
+        "quota": [FakeHttpError(403, "userRateLimitExceeded")],
+        "denied": [FakeHttpError(403, "insufficientFilePermissions")],
+    })
+    batch = DriveBatch(service, sleep=lambda s: None)
+    batch.add("quota", MagicMock())
+    batch.add("denied", MagicMock())
+    outcomes = batch.execute()
+    assert outcomes["quota"].ok
+    assert not outcomes["denied"].ok
@@ -0,0 +1,208 @@
+"""
+Tests for lib/drive_index.py — bootstrap, Changes-API sync and local queries.
+"""
+from unittest.mock import MagicMock, patch
+
+from toolbox.lib import drive_index
+
+FOLDER = drive_index.FOLDER_MIME
+
+
+def _file(fid, name, parent, mime='application/pdf', **extra):
+    return {'id': fid, 'name': name, 'mimeType': mime, 'parents': [parent], **extra}
+
+
+def _service(listing_pages, change_pages=(), start_token='t0'):
+    svc = MagicMock()
+    svc.changes().getStartPageToken().execute.return_value = {'startPageToken': start_token}
+    svc.files().list().execute.side_effect = list(listing_pages)
+    svc.changes().list().execute.side_effect = list(change_pages)
+    return svc
+
+
+def test_not_fresh_before_bootstrap():
+    assert drive_index.is_fresh() is False
+
+
+def test_bootstrap_then_query_children():
+    svc = _service([
+        {'files': [_file('d1', 'Orders', 'root', FOLDER), _file('f1', 'a.pdf', 'd1', md5Checksum='h1')],
+         'nextPageToken': 'p2'},
+        {'files': [_file('f2', 'b.pdf', 'd1', size='42')]},
+    ])
+    assert drive_index.sync(svc) == 3
+    assert drive_index.is_fresh()
+
+    assert [f['id'] for f in drive_index.list_children('d1')] == ['f1', 'f2']
+    assert [f['id'] for f in drive_index.list_children('root', folders=True)] == ['d1']
+    assert drive_index.list_children('d1', folders=True) == []
+    assert drive_index.find_in_folder('d1', 'b.pdf') == 'f2'
+    assert drive_index.get_file('f1')['md5Checksum'] == 'h1'
+    assert drive_index.get_file('f2')['size'] == '42'
+
+
+def test_sync_applies_changes_incrementally():
+    svc = _service(
+        [{'files': [_file('f1', 'a.pdf', 'd1'), _file('f2', 'b.pdf', 'd1'), _file('f3', 'c.pdf', 'd1')]}],
+        change_pages=[
+            {'changes': [
+                {'fileId': 'f1', 'file': _file('f1', 'a-renamed.pdf', 'd2')},  # rename + move
+                {'fileId': 'f2', 'removed': True},
+            ], 'nextPageToken': 'c2'},
+            {'changes': [
+                {'fileId': 'f3', 'file': _file('f3', 'c.pdf', 'd1', trashed=True)},
+                {'fileId': 'f4', 'file': _file('f4', 'new.pdf', 'd1')},
+            ], 'newStartPageToken': 't9'},
+        ],
+    )
+    drive_index.sync(svc)           # bootstrap
+    assert drive_index.sync(svc) == 4
+
+    assert [f['id'] for f in drive_index.list_children('d1')] == ['f4']
+    assert drive_index.find_in_folder('d2', 'a-renamed.pdf') == 'f1'
+    # The next sync resumes from the newStartPageToken
+    svc.changes().list().execute.side_effect = [{'changes': [], 'newStartPageToken': 't9'}]
+    drive_index.sync(svc)
+    assert svc.changes().list.call_args.kwargs['pageToken'] == 't9'
+
+
+def test_record_files_merges_partial_updates():
+    svc = _service([{'files': [_file('f1', 'a.pdf', 'd1', md5Checksum='h1')]}])
+    drive_index.sync(svc)
+
+    drive_index.record_files([{'id': 'f1', 'name': 'renamed.pdf'}])
+    drive_index.record_files([{'id': 'f1', 'parents': ['d2']}])
+    drive_index.record_files([{'id': 'unknown', 'parents': ['d2']}])  # nothing to merge into
+
+    f = drive_index.get_file('f1')
+    assert (f['name'], f['parents'], f['md5Checksum']) == ('renamed.pdf', ['d2'], 'h1')
+    assert drive_index.get_file('unknown') is None
+    drive_index.forget_files(['f1'])
+    assert drive_index.list_children('d2') == []
+
+
+def test_check_duplicate_uses_fresh_index_without_live_listing():
+    from toolbox.services.drive_organizer import main
+
+    drive_index.sync(_service([{'files': [_file('dup', 'x.pdf', 'id_target', md5Checksum='abc')]}]))
+    svc = MagicMock()
+    assert main.check_duplicate(svc, 'id_target', 'other.pdf', checksum='abc') == ('dup', 'hash_match')
+    assert main.check_duplicate(svc, 'id_target', 'x.pdf') == ('dup', 'name_match')
+    assert main.check_duplicate(svc, 'id_target', 'none.pdf') == (None, None)
+    svc.files().list.assert_not_called()
+
+
+def test_stale_index_falls_back_to_live_listing():
+    from toolbox.services.drive_organizer import main
+
+    drive_index.sync(_service([{'files': []}]))
+    svc = MagicMock()
+    svc.files().list().execute.return_value = {'files': [{'id': 'live', 'name': 'x.pdf'}]}
+    with patch.object(drive_index, 'is_fresh', return_value=False):
+        assert main.check_duplicate(svc, 'id_target', 'x.pdf') == ('live', 'name_match')
+
+
+# ---------------------------------------------------------------------------
+# Folder path cache
+# ---------------------------------------------------------------------------
+
+def _write_tree(path_to_id):
+    import json
+    with open(drive_index.TREE_PATH, 'w') as f:
+        json.dump({'path_to_id': path_to_id}, f)
+
+
+def test_resolve_seeded_path_costs_no_api_calls():
+    from toolbox.lib.drive_utils import resolve_folder_path
+    _write_tree({'01 - Second Brain': 'sb', '01 - Second Brain/Memory': 'mem'})
+    svc = MagicMock()
+    assert resolve_folder_path(svc, '01 - Second Brain/Memory') == 'mem'
+    svc.files().list.assert_not_called()
+
+
+def test_resolve_walks_only_uncached_suffix_and_caches_it():
+    from toolbox.lib.drive_utils import resolve_folder_path
+    _write_tree({'01 - Second Brain': 'sb', '01 - Second Brain/Memory': 'mem'})
+    svc = MagicMock()
+    svc.files().list().execute.return_value = {'files': [{'id': 'orders'}]}
+    svc.files().list.reset_mock()
+    assert resolve_folder_path(svc, '01 - Second Brain/Memory/Orders') == 'orders'
+    assert svc.files().list.call_count == 1
+    assert "'mem' in parents" in svc.files().list.call_args.kwargs['q']
+
+    svc.files().list.reset_mock()
+    assert resolve_folder_path(svc, '/01 - Second Brain/Memory/Orders/') == 'orders'
+    svc.files().list.assert_not_called()
+
+
+def test_resolve_under_base_folder_and_lookup_only_mode():
+    from toolbox.lib.drive_utils import resolve_folder_path
+    svc = MagicMock()
+    svc.files().list().execute.return_value = {'files': []}
+    svc.files().create().execute.return_value = {'id': 'new'}
+    assert resolve_folder_path(svc, 'Fitness/Workouts', parent_id='health', create=False) is None
+    svc.files().create.reset_mock()
+    assert resolve_folder_path(svc, 'Fitness', parent_id='health') == 'new'
+    assert svc.files().create.call_args.kwargs['body']['parents'] == ['health']
+    # Cached per base folder, not under root
+    assert drive_index.lookup_folder_path(['Fitness'], 'health') == (1, 'new')
+    assert drive_index.lookup_folder_path(['Fitness']) == (0, 'root')
+
+
+class _NotFound(Exception):
+    def __init__(self):
+        super().__init__("File not found")
+        self.resp = MagicMock(status=404)
+
+
+def test_resolve_forgets_cached_folder_that_404s():
+    from toolbox.lib.drive_utils import resolve_folder_path
+    _write_tree({'01 - Second Brain': 'sb', '01 - Second Brain/Memory': 'gone'})
+    svc = MagicMock()
+    svc.files().list().execute.return_value = {'files': []}
+    svc.files().create().execute.side_effect = [_NotFound(), {'id': 'mem2'}, {'id': 'orders'}]
+    assert resolve_folder_path(svc, '01 - Second Brain/Memory/Orders') == 'orders'
+    assert drive_index.lookup_folder_path(['01 - Second Brain', 'Memory']) == (2, 'mem2')
+
+
+def test_folder_rename_in_changes_invalidates_cached_subtree():
+    svc = _service(
+        [{'files': [_file('sb', '01 - Second Brain', 'rootid', FOLDER), _file('mem', 'Memory', 'sb', FOLDER),
+                    _file('ord', 'Orders', 'mem', FOLDER)]}],
+        [{'changes': [{'fileId': 'mem', 'file': _file('mem', 'Memory (old)', 'sb', FOLDER)}],
+          'newStartPageToken': 't1'}],
+    )
+    drive_index.sync(svc)
+    drive_index.remember_folder_paths([('01 - Second Brain', 'sb'), ('01 - Second Brain/Memory', 'mem'),
+                                       ('01 - Second Brain/Memory/Orders', 'ord')])
+    assert drive_index.lookup_folder_path(['01 - Second Brain', 'Memory', 'Orders']) == (3, 'ord')
+
+    drive_index.sync(svc)
+    assert drive_index.lookup_folder_path(['01 - Second Brain', 'Memory', 'Orders']) == (1, 'sb')
+
+
+def test_unchanged_folder_metadata_keeps_cache_and_trash_drops_it():
+    svc = _service(
+        [{'files': [_file('sb', 'SB', 'rootid', FOLDER)]}],
+        [{'changes': [{'fileId': 'sb', 'file': _file('sb', 'SB', 'rootid', FOLDER, modifiedTime='x')}],
+          'newStartPageToken': 't1'},
+         {'changes': [{'fileId': 'sb', 'removed': True}], 'newStartPageToken': 't2'}],
+    )
+    drive_index.sync(svc)
+    drive_index.remember_folder_paths([('SB', 'sb')])
+    drive_index.sync(svc)
+    assert drive_index.lookup_folder_path(['SB']) == (1, 'sb')
+    drive_index.sync(svc)
+    assert drive_index.lookup_folder_path(['SB']) == (0, 'root')
+
+
+def test_child_names_filters_and_caps_per_parent_in_sql(monkeypatch):
+    files = [_file('d1', 'A', 'root', FOLDER), _file('d2', 'B', 'root', FOLDER), _file('sub', 'Sub', 'd1', FOLDER)]
+    files += [_file(f'a{i}', f'a{i}.pdf', 'd1', modifiedTime=f'2025-01-{i + 1:02d}T00:00:00Z') for i in range(5)]
+    files += [_file('b0', 'b0.pdf', 'd2'), _file('c0', 'c0.pdf', 'elsewhere')]
+    drive_index.sync(_service([{'files': files}]))
+    monkeypatch.setattr(drive_index, 'SQL_PARAM_CHUNK', 1)
+
+    names = drive_index.child_names(['d1', 'd2', 'missing'], limit_per_parent=3)
+    assert names == {'d1': ['a4.pdf', 'a3.pdf', 'a2.pdf'], 'd2': ['b0.pdf']}
+    assert drive_index.child_names([]) == {}
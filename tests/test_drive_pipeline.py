@@ -0,0 +1,80 @@
+"""
+Tests for drive_organizer/pipeline.py — staged, order-preserving pipeline.
+"""
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from toolbox.services.drive_organizer.pipeline import run_pipeline
+
+
+class TestRunPipeline(unittest.TestCase):
+
+    def test_commits_in_input_order_despite_out_of_order_completion(self):
+        delays = {0: 0.05, 1: 0.0, 2: 0.02}
+        committed = []
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            stages = [(pool, lambda i, _: time.sleep(delays[i]) or i * 10)]
+            run_pipeline([0, 1, 2], stages, lambda i, v, e: committed.append((i, v, e)))
+        self.assertEqual(committed, [(0, 0, None), (1, 10, None), (2, 20, None)])
+
+    def test_stage_error_skips_later_stages(self):
+        later = []
+        committed = []
+
+        def boom(i, _):
+            if i == 1:
+                raise ValueError("bad download")
+            return i
+
+        stages = [(None, boom), (None, lambda i, v: later.append(i) or v)]
+        run_pipeline([0, 1, 2], stages, lambda i, v, e: committed.append((i, type(e).__name__ if e else None)))
+        self.assertEqual(later, [0, 2])
+        self.assertEqual(committed, [(0, None), (1, 'ValueError'), (2, None)])
+
+    def test_depth_bounds_items_in_flight(self):
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def work(i, _):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.01)
+            with lock:
+                active -= 1
+            return i
+
+        committed = []
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            run_pipeline(range(20), [(pool, work)], lambda i, v, e: committed.append(i), depth=3)
+        self.assertEqual(committed, list(range(20)))
+        self.assertLessEqual(peak, 3)
+
+    def test_stages_overlap_across_items(self):
+        """Total time tracks the slowest stage, not the sum of all stages."""
+        with ThreadPoolExecutor(max_workers=4) as dl, ThreadPoolExecutor(max_workers=4) as llm:
+            stages = [(dl, lambda i, _: time.sleep(0.05)), (llm, lambda i, _: time.sleep(0.05))]
+            start = time.time()
+            run_pipeline(range(8), stages, lambda i, v, e: None, depth=8)
+            elapsed = time.time() - start
+        self.assertLess(elapsed, 0.5)  # serial would be 8 * 0.1 = 0.8s
+
+    def test_can_admit_and_admit_filter(self):
+        committed = []
+        admitted_limit = 3
+        run_pipeline(
+            range(10),
+            [(None, lambda i, _: i)],
+            lambda i, v, e: committed.append(i),
+            can_admit=lambda in_flight: len(committed) + in_flight < admitted_limit,
+            admit=lambda i: i % 2 == 0,
+        )
+        self.assertEqual(committed, [0, 2, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
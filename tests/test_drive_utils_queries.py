@@ -47,3 +47,46 @@ def test_get_file_query_generation():
     query = kwargs.get('q')
     assert "name = 'O\\'Reilly\\\\Notes.md'" in query
     assert f"'{folder_id}' in parents" in query
+
+
+def test_move_file_uses_known_parents_without_lookup(monkeypatch):
+    from toolbox.lib import drive_utils
+    monkeypatch.setattr(drive_utils, '_parent_cache', {})
+    service = MagicMock()
+    assert drive_utils.move_file(service, 'f1', 'target', 'a.pdf', current_parents=['src'])
+    service.files().get.assert_not_called()
+    kwargs = service.files().update.call_args.kwargs
+    assert kwargs['removeParents'] == 'src'
+    assert kwargs['addParents'] == 'target'
+
+
+def test_move_file_uses_parents_cached_from_listing(monkeypatch):
+    from toolbox.lib import drive_utils
+    monkeypatch.setattr(drive_utils, '_parent_cache', {})
+    drive_utils.remember_parents([{'id': 'f1', 'name': 'a.pdf'}, {'id': 'f2', 'parents': ['other']}], 'inbox')
+    service = MagicMock()
+    assert drive_utils.move_file(service, 'f1', 'target', 'a.pdf')
+    service.files().get.assert_not_called()
+    assert service.files().update.call_args.kwargs['removeParents'] == 'inbox'
+    # Cache follows the move
+    assert drive_utils._parent_cache == {'f1': ['target'], 'f2': ['other']}
+
+
+def test_move_file_falls_back_to_lookup_when_parents_unknown(monkeypatch):
+    from toolbox.lib import drive_utils
+    monkeypatch.setattr(drive_utils, '_parent_cache', {})
+    service = MagicMock()
+    service.files().get().execute.return_value = {'parents': ['p1']}
+    assert drive_utils.move_file(service, 'f1', 'target', 'a.pdf')
+    service.files().get.assert_called_with(fileId='f1', fields='parents')
+    assert service.files().update.call_args.kwargs['removeParents'] == 'p1'
+
+
+def test_move_file_rechecks_parents_when_cached_parent_is_stale(monkeypatch):
+    from toolbox.lib import drive_utils
+    monkeypatch.setattr(drive_utils, '_parent_cache', {'f1': ['stale']})
+    service = MagicMock()
+    service.files().get().execute.return_value = {'parents': ['actual']}
+    service.files().update().execute.side_effect = [Exception('Increasing the number of parents is not allowed'), {}]
+    assert drive_utils.move_file(service, 'f1', 'target', 'a.pdf')
+    assert service.files().update.call_args.kwargs['removeParents'] == 'actual'
@@ -57,11 +57,6 @@ def _make_service(folder_ids=None, file_id=None, file_content=b''):
 
 class TestResolvePath(unittest.TestCase):
 
-    def setUp(self):
-        # Clear folder cache before each test
-        from toolbox.services.email_extractor import writers
-        writers._folder_cache.clear()
-
     def test_single_level_found(self):
         """Root → 'Folder' resolves using existing folder."""
         from toolbox.services.email_extractor import writers
@@ -104,10 +99,6 @@ class TestResolvePath(unittest.TestCase):
 
 class TestAppendToMemory(unittest.TestCase):
 
-    def setUp(self):
-        from toolbox.services.email_extractor import writers
-        writers._folder_cache.clear()
-
     def _run_append(self, category, filename, new_content, file_id=None, existing_content=b''):
         from toolbox.services.email_extractor import writers
         folder_ids = {
@@ -176,10 +167,6 @@ class TestAppendToMemory(unittest.TestCase):
 
 class TestUpdateInMemory(unittest.TestCase):
 
-    def setUp(self):
-        from toolbox.services.email_extractor import writers
-        writers._folder_cache.clear()
-
     def _run_update(self, category, filename, old_text, new_text, file_id=None, existing_content=b''):
         from toolbox.services.email_extractor import writers
         folder_ids = {
@@ -241,6 +228,79 @@ class TestUpdateInMemory(unittest.TestCase):
         self.assertEqual(content.count('foo'), 1)  # second foo still present
 
 
+class TestBufferedMemory(unittest.TestCase):
+    """MemoryStore: one download and one upload per touched file per run."""
+
+    FOLDERS = {
+        ('root', '01 - Second Brain'): 'id_sb',
+        ('id_sb', 'Memory'): 'id_mem',
+        ('id_mem', 'Orders'): 'id_orders',
+    }
+
+    def _uploaded(self, svc):
+        media_body = svc.files().update.call_args.kwargs['media_body']
+        media_body._fd.seek(0)
+        return media_body._fd.read().decode()
+
+    def test_many_edits_one_download_one_upload(self):
+        from toolbox.services.email_extractor import writers
+        svc = _make_service(folder_ids=self.FOLDERS, file_id='id_file',
+                            file_content=b'## 2026-04-01 Order A\nStatus: [Pending]\n---\n')
+        svc.files().get.return_value.execute.return_value = {'version': '7'}
+        with patch.object(writers, 'get_drive_service', return_value=svc):
+            with writers.buffered_memory() as memory:
+                self.assertTrue(writers.append_to_memory('Orders', 'Amazon.md', '## 2026-04-02 Order B\n---'))
+                self.assertTrue(writers.update_in_memory('Orders', 'Amazon.md', 'Status: [Pending]', 'Status: [Shipped]'))
+                self.assertTrue(writers.append_to_memory('Orders', 'Amazon.md', '## 2026-04-03 Order C\n---'))
+                # Reads see buffered edits; nothing uploaded yet
+                self.assertIn('Order C', writers.get_memory_content('Orders', 'Amazon.md'))
+                svc.files().update.assert_not_called()
+        self.assertEqual(svc.files().get_media.call_count, 1)
+        self.assertEqual(svc.files().update.call_count, 1)
+        self.assertEqual(memory.failures, [])
+        content = self._uploaded(svc)
+        self.assertIn('Status: [Shipped]', content)
+        self.assertLess(content.index('Order B'), content.index('Order C'))
+
+    def test_buffered_dedup_sees_pending_appends(self):
+        from toolbox.services.email_extractor import writers
+        svc = _make_service(folder_ids=self.FOLDERS, file_id=None)
+        with patch.object(writers, 'get_drive_service', return_value=svc):
+            with writers.buffered_memory():
+                block = '## 2026-04-02 — Order\n**Order Number:** 111\n---'
+                self.assertTrue(writers.append_to_memory('Orders', 'New.md', block, dedup_date='2026-04-02', dedup_ids=('111',)))
+                self.assertFalse(writers.append_to_memory('Orders', 'New.md', block, dedup_date='2026-04-02', dedup_ids=('111',)))
+        self.assertEqual(svc.files().create.call_count, 1)
+        svc.files().update.assert_not_called()
+
+    def test_conflict_replays_edits_onto_newer_drive_copy(self):
+        from toolbox.services.email_extractor import writers
+        svc = _make_service(folder_ids=self.FOLDERS, file_id='id_file')
+        svc.files().get_media.return_value.execute.side_effect = [
+            b'## 2026-04-01 A\nStatus: [Pending]\n---\n',
+            b'## 2026-04-01 A\nStatus: [Pending]\n---\n## 2026-04-05 Other writer\n---\n',
+        ]
+        # Loaded at v1, Drive is at v2 when we flush, still v2 after the merge
+        svc.files().get.return_value.execute.side_effect = [{'version': '1'}, {'version': '2'}, {'version': '2'}, {'version': '2'}]
+        with patch.object(writers, 'get_drive_service', return_value=svc):
+            with writers.buffered_memory():
+                writers.update_in_memory('Orders', 'Amazon.md', 'Status: [Pending]', 'Status: [Delivered]')
+                writers.append_to_memory('Orders', 'Amazon.md', '## 2026-04-06 Mine\n---')
+        content = self._uploaded(svc)
+        self.assertIn('Other writer', content)
+        self.assertIn('Status: [Delivered]', content)
+        self.assertTrue(content.rstrip().endswith('Mine\n---'))
+        self.assertEqual(svc.files().update.call_count, 1)
+
+    def test_write_through_outside_buffer(self):
+        from toolbox.services.email_extractor import writers
+        self.assertIsNone(writers._active_store)
+        svc = _make_service(folder_ids=self.FOLDERS, file_id='id_file', file_content=b'x')
+        with patch.object(writers, 'get_drive_service', return_value=svc):
+            writers.append_to_memory('Orders', 'Amazon.md', 'y')
+        svc.files().update.assert_called_once()
+
+
 class TestBlockExists(unittest.TestCase):
 
     def test_match_with_confirmation(self):
@@ -29,13 +29,14 @@ def test_fetch_category_emails_skips_processed_threads():
     config = {'test_cat': {'senders': {'test@example.com': 'Test'}}}
     
     with patch('toolbox.services.email_extractor.scanner._fetch_messages', return_value=raw_messages), \
-         patch('toolbox.services.email_extractor.scanner.get_full_email') as mock_get_full, \
+         patch('toolbox.services.email_extractor.scanner.get_full_emails') as mock_get_full, \
          patch('toolbox.services.email_extractor.scanner._match_sender', return_value='Test'):
         
-        # Mock get_full_email to return basic dicts
-        mock_get_full.side_effect = lambda svc, mid: {
-            'id': mid, 'thread_id': 'thread2' if mid == 'msg2' else 'thread1', 
-            'from': 'test@example.com', 'date_dt': 123, 'subject': 'test'
+        # Mock get_full_emails to return basic dicts
+        mock_get_full.side_effect = lambda svc, ids, service_factory=None: {
+            mid: {'id': mid, 'thread_id': 'thread2' if mid == 'msg2' else 'thread1',
+                  'from': 'test@example.com', 'date_dt': 123, 'subject': 'test'}
+            for mid in ids
         }
         
         results = scanner.fetch_category_emails(mock_service, 'test_cat', config, state=state)
@@ -43,6 +44,8 @@ def test_fetch_category_emails_skips_processed_threads():
         print(f"Results: {len(results)} (Expected: 1)")
         assert len(results) == 1
         assert results[0]['id'] == 'msg2'
+        # The processed thread is never fetched
+        assert mock_get_full.call_args[0][1] == ['msg2']
         print("Thread skipping test passed!")
 
 if __name__ == "__main__":
@@ -36,6 +36,33 @@ def test_route_result_logic():
     assert low_confidence[0]['summary'] == 'Low Conf'
     print("Low confidence routing passed!")
 
+
+def test_sweep_day_state_not_saved_when_memory_flush_fails(monkeypatch):
+    from toolbox.services.email_extractor import scanner, writers
+
+    def failing_flush(store):
+        store.failures.append(('Digests/Email Sweep.md', RuntimeError('Drive unavailable')))
+        return store.failures
+
+    service = MagicMock()
+    service.users().messages().list().execute.return_value = {'messages': []}
+    sent = []
+    monkeypatch.setattr(main, 'load_config', lambda: {})
+    monkeypatch.setattr(main, 'get_gmail_service', lambda: service)
+    monkeypatch.setattr(main, 'scan_categories', lambda service, categories, state, **kw: {c: [] for c in categories})
+    monkeypatch.setattr(main, 'send_message', lambda msg, **kw: sent.append(msg))
+    monkeypatch.setattr(main, 'log', lambda *a, **kw: None)
+    monkeypatch.setattr(writers.MemoryStore, 'flush', failing_flush)
+    scanner.save_state({'last_run': '2026-10-01', 'last_sweep_run': '2026-09-01'})
+
+    main.run()
+
+    # The sweep ran, but neither its marker nor last_run may persist past the failed upload
+    state = scanner.load_state()
+    assert state['last_run'] == '2026-10-01'
+    assert state['last_sweep_run'] == '2026-09-01'
+    assert 'memory/Digests/Email Sweep.md' in sent[0]
+
 if __name__ == "__main__":
     try:
         test_route_result_logic()
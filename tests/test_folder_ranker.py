@@ -0,0 +1,81 @@
+from unittest.mock import patch
+from toolbox.lib import folder_ranker, drive_index, drive_utils, token_estimator
+from toolbox.lib.folder_ranker import FolderIndex, REVIEW_FOLDER
+
+BASE_PATHS = [
+    REVIEW_FOLDER,
+    '02 - Finance/Banking/Chase',
+    '02 - Finance/Banking/Wells Fargo',
+    '02 - Finance/Taxes/2024',
+    '02 - Finance/Insurance/Auto',
+    '03 - Home/Utilities/Electric',
+    '03 - Home/Mortgage',
+    '04 - Health/Medical Records',
+    '05 - Travel/Receipts',
+    '06 - Vehicles/Toyota',
+]
+
+
+def _big_tree(n=600):
+    return BASE_PATHS + [f'09 - Archive/Project {i:03d}/Notes {i:03d}' for i in range(n)]
+
+
+def test_path_tokens_rank_matching_folder_first():
+    index = FolderIndex(_big_tree())
+    assert index.rank('Chase statement March', top_k=5)[0] == '02 - Finance/Banking/Chase'
+    assert index.rank('2024 tax return W-2', top_k=5)[0] == '02 - Finance/Taxes/2024'
+
+
+def test_filed_names_teach_folders_new_words():
+    filed = {'03 - Home/Utilities/Electric': ['2025-01-03 - Dominion Energy - Monthly bill',
+                                              '2025-02-03 - Dominion Energy - Monthly bill']}
+    index = FolderIndex(_big_tree(), filed)
+    assert index.rank('dominion_invoice.pdf', top_k=3)[0] == '03 - Home/Utilities/Electric'
+
+
+def test_candidates_always_include_review_and_cap_size():
+    index = FolderIndex(_big_tree())
+    candidates = index.candidates('Toyota payment.pdf', top_k=20)
+    assert REVIEW_FOLDER in candidates
+    assert '06 - Vehicles/Toyota' in candidates
+    assert len(candidates) <= 21
+    assert candidates == sorted(candidates)
+
+
+def test_no_match_falls_back_to_most_used_folders():
+    filed = {'05 - Travel/Receipts': ['a', 'b', 'c'], '03 - Home/Mortgage': ['d']}
+    index = FolderIndex(_big_tree(), filed)
+    assert index.rank('zzzz qqqq', top_k=2) == ['05 - Travel/Receipts', '03 - Home/Mortgage']
+
+
+def test_small_tree_is_sent_whole():
+    index = FolderIndex(BASE_PATHS)
+    assert index.candidates('anything', top_k=30) == sorted(BASE_PATHS)
+
+
+def test_prompt_tokens_fall_by_an_order_of_magnitude():
+    paths = _big_tree()
+    full = "\n".join(sorted(paths))
+    pruned = FolderIndex(paths).prompt_str('Chase statement.pdf', 'Account summary for your Chase checking')
+    assert token_estimator.estimate_text(pruned) * 10 <= token_estimator.estimate_text(full)
+
+
+def test_content_text_only_reads_text_payloads():
+    assert folder_ranker.content_text(b'Invoice from Chase', 'text/plain') == 'Invoice from Chase'
+    assert folder_ranker.content_text(b'%PDF-1.4 ...', 'application/pdf') == ''
+    assert len(folder_ranker.content_text(b'x' * 50000, 'text/plain')) == folder_ranker.QUERY_TEXT_CHARS
+
+
+def test_get_category_prompt_str_uses_drive_index_history():
+    path_to_id = {p: f'id_{i}' for i, p in enumerate(_big_tree())}
+    drive_index.record_files([
+        {'id': 'f1', 'name': '2025-05-01 - Geico - Policy renewal', 'mimeType': 'application/pdf',
+         'parents': [path_to_id['02 - Finance/Insurance/Auto']]},
+    ])
+    with patch.object(drive_utils, 'DRIVE_TREE', {'path_to_id': path_to_id}), \
+         patch.object(drive_utils, '_folder_index', None):
+        full = drive_utils.get_category_prompt_str()
+        pruned = drive_utils.get_category_prompt_str('geico.pdf')
+    assert len(full.splitlines()) == len(path_to_id)
+    assert '02 - Finance/Insurance/Auto' in pruned.splitlines()
+    assert len(pruned.splitlines()) <= folder_ranker.DEFAULT_TOP_K + 1
@@ -0,0 +1,220 @@
+"""Tests for the batched Gmail fetch in the email extractor scanner."""
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from toolbox.services.email_extractor import scanner
+
+
+class FakeHttpError(Exception):
+    def __init__(self, status, message="", retry_after=None):
+        super().__init__(message or f"HTTP {status}")
+        headers = {'retry-after': str(retry_after)} if retry_after is not None else {}
+        self.resp = MagicMock(status=status)
+        self.resp.get.side_effect = headers.get
+
+
+def raw_message(mid, sender='shop@example.com'):
+    return {
+        'id': mid, 'threadId': f't-{mid}', 'labelIds': ['INBOX'],
+        'payload': {
+            'mimeType': 'text/plain',
+            'headers': [
+                {'name': 'From', 'value': sender},
+                {'name': 'Subject', 'value': f'Order {mid}'},
+                {'name': 'Date', 'value': 'Mon, 05 Oct 2026 10:00:00 +0000'},
+            ],
+            'body': {'data': ''},
+        },
+    }
+
+
+def make_service(fail_plan=None, calls=None, senders=None):
+    """
+    Service whose new_batch_http_request() returns a fake batch that answers each
+    messages.get sub-request. fail_plan maps message id -> errors for successive attempts;
+    senders maps message id -> From header.
+    """
+    fail_plan = {k: list(v) for k, v in (fail_plan or {}).items()}
+    senders = senders or {}
+    service = MagicMock()
+    service.batch_sizes = []
+    service.fetched = []
+    service.users().messages().get.side_effect = lambda userId, id, **kwargs: (id, kwargs)
+
+    def new_batch_http_request(callback):
+        added = []
+        batch = MagicMock()
+        batch.add.side_effect = lambda request, request_id: added.append(request)
+
+        def execute():
+            service.batch_sizes.append(len(added))
+            if calls is not None:
+                calls.append(threading.get_ident())
+            for mid, kwargs in added:
+                service.fetched.append((mid, kwargs.get('format', 'full')))
+                plan = fail_plan.get(mid)
+                error = plan.pop(0) if plan else None
+                if error is not None:
+                    callback(mid, None, error)
+                else:
+                    callback(mid, raw_message(mid, senders.get(mid, 'shop@example.com')), None)
+        batch.execute.side_effect = execute
+        return batch
+
+    service.new_batch_http_request.side_effect = new_batch_http_request
+    return service
+
+
+def test_batches_and_parses_in_input_order():
+    service = make_service()
+    ids = [f"m{i}" for i in range(120)] + ["m3"]
+    emails = scanner.get_full_emails(service, ids, sleep=lambda s: None)
+    assert service.batch_sizes == [50, 50, 20]
+    assert list(emails) == [f"m{i}" for i in range(120)]
+    assert emails["m7"]['subject'] == 'Order m7'
+    assert emails["m7"]['thread_id'] == 't-m7'
+
+
+def test_rate_limited_messages_are_retried_with_backoff():
+    service = make_service({"b": [FakeHttpError(429), FakeHttpError(503, retry_after=5)]})
+    sleeps = []
+    emails = scanner.get_full_emails(service, ["a", "b", "c"], backoff_base=0.5, sleep=sleeps.append)
+    assert service.batch_sizes == [3, 1, 1]
+    # Second round honours Retry-After when it exceeds the exponential backoff
+    assert sleeps == [0.5, 5.0]
+    assert all(isinstance(e, dict) for e in emails.values())
+
+
+def test_permanent_errors_are_returned_not_raised():
+    service = make_service({"gone": [FakeHttpError(404)]})
+    emails = scanner.get_full_emails(service, ["ok", "gone"], sleep=lambda s: None)
+    assert service.batch_sizes == [2]
+    assert isinstance(emails["gone"], FakeHttpError)
+    assert emails["ok"]['id'] == "ok"
+
+
+def test_service_factory_runs_batches_on_worker_services():
+    calls = []
+    built = []
+
+    def factory():
+        svc = make_service(calls=calls)
+        built.append(svc)
+        return svc
+
+    main_service = make_service()
+    emails = scanner.get_full_emails(main_service, [f"m{i}" for i in range(200)],
+                                     service_factory=factory, workers=2, batch_size=25)
+    assert len(emails) == 200
+    assert main_service.batch_sizes == []
+    assert 1 <= len(built) <= 2
+    assert sorted(size for svc in built for size in svc.batch_sizes) == [25] * 8
+
+
+def test_fetch_category_emails_uses_batch_and_matches_vendor(monkeypatch):
+    service = make_service({"x": [FakeHttpError(404)]})
+    monkeypatch.setattr(scanner, '_fetch_messages', lambda *a, **k: [
+        {'id': 'a', 'threadId': 't-a'}, {'id': 'x', 'threadId': 't-x'}, {'id': 'a', 'threadId': 't-a'},
+    ])
+    config = {'orders': {'senders': {'shop@example.com': 'Shop'}}}
+    results = scanner.fetch_category_emails(service, 'orders', config, state={})
+    assert service.batch_sizes == [2]
+    assert [(e['id'], e['vendor']) for e in results] == [('a', 'Shop')]
+
+
+CATEGORIES = {
+    'orders': {'senders': {'shop@example.com': 'Shop'}},
+    'receipts': {'senders': {'Shop@example.com': 'Shop Receipts', 'bank@example.com': 'Bank'}},
+    'trips': {'senders': {}, 'sender_domains': {'airline.com': 'Airline'}},
+}
+
+
+def test_sender_index_routes_to_every_matching_category():
+    index = scanner.SenderIndex(CATEGORIES)
+    assert index.match('Shop <SHOP@example.com>') == {'orders': 'Shop', 'receipts': 'Shop Receipts'}
+    assert index.match('noreply@airline.com') == {'trips': 'Airline'}
+    assert index.match('noreply@sub.airline.com') == {}
+    assert index.queries(max_terms=2) == [
+        '(from:shop@example.com OR from:bank@example.com)', '(from:@airline.com)'
+    ]
+
+
+def history_service(history_pages, senders, profile_history_id='900'):
+    service = make_service(senders=senders)
+    service.users().getProfile().execute.return_value = {'historyId': profile_history_id}
+    service.users().history().list().execute.side_effect = history_pages
+    return service
+
+
+def test_scan_uses_history_and_fetches_each_body_once(monkeypatch):
+    monkeypatch.setattr(scanner, '_fetch_messages', lambda *a, **k: pytest.fail('date scan used'))
+    added = lambda mid, labels=('INBOX',): {'message': {'id': mid, 'threadId': f't-{mid}', 'labelIds': list(labels)}}
+    service = history_service(
+        [{'history': [{'messagesAdded': [added('a'), added('spam', ['SPAM'])]}], 'nextPageToken': 'p2'},
+         {'history': [{'messagesAdded': [added('b'), added('c'), added('a')]}]}],
+        senders={'a': 'shop@example.com', 'b': 'friend@example.com', 'c': 'x@airline.com'},
+    )
+    state = {scanner.HISTORY_STATE_KEY: '500', 'processed_threads': []}
+    by_category = scanner.scan_categories(service, CATEGORIES, state)
+
+    assert [e['id'] for e in by_category['orders']] == ['a']
+    assert [(e['id'], e['vendor']) for e in by_category['receipts']] == [('a', 'Shop Receipts')]
+    assert [e['id'] for e in by_category['trips']] == ['c']
+    # Headers for every new message, bodies only for routed ones — each exactly once
+    assert sorted(service.fetched) == [('a', 'full'), ('a', 'metadata'), ('b', 'metadata'),
+                                       ('c', 'full'), ('c', 'metadata')]
+    assert state[scanner.HISTORY_STATE_KEY] == '900'
+
+
+def test_expired_history_falls_back_to_date_scan(monkeypatch):
+    queries = []
+
+    def fake_fetch(service, query, after_date=None, first_run=False, include_spam_trash=False):
+        queries.append((query, after_date))
+        return [{'id': 'a', 'threadId': 't-a'}, {'id': 'done', 'threadId': 't-done'}]
+
+    monkeypatch.setattr(scanner, '_fetch_messages', fake_fetch)
+    service = history_service(FakeHttpError(404), senders={})
+    state = {scanner.HISTORY_STATE_KEY: '1', 'processed_threads': ['t-done']}
+    by_category = scanner.scan_categories(service, CATEGORIES, state, after_date='2026/10/01')
+
+    assert len(queries) == 1 and queries[0][1] == '2026/10/01'
+    assert service.fetched == [('a', 'full')]
+    assert [e['id'] for e in by_category['orders']] == ['a']
+    assert state[scanner.HISTORY_STATE_KEY] == '900'
+
+
+def test_failed_fetch_is_retried_after_history_moves_on(monkeypatch):
+    monkeypatch.setattr(scanner, '_fetch_messages', lambda *a, **k: pytest.fail('date scan used'))
+    added = lambda mid: {'message': {'id': mid, 'threadId': f't-{mid}', 'labelIds': ['INBOX']}}
+    service = make_service({'b': [None, FakeHttpError(400)], 'c': [FakeHttpError(400)], 'gone': [FakeHttpError(404)]})
+    service.users().getProfile().execute.side_effect = [{'historyId': '900'}, {'historyId': '950'}]
+    service.users().history().list().execute.side_effect = [
+        {'history': [{'messagesAdded': [added('a'), added('b'), added('c'), added('gone')]}]},
+        {'history': []},
+    ]
+    state = {scanner.HISTORY_STATE_KEY: '500', 'processed_threads': []}
+
+    first = scanner.scan_categories(service, CATEGORIES, state)
+    assert [e['id'] for e in first['orders']] == ['a']
+    # The cursor moves on, but the body (b) and header (c) failures are remembered; the 404 is not
+    assert state[scanner.HISTORY_STATE_KEY] == '900'
+    assert state[scanner.RETRY_STATE_KEY] == {'b': 1, 'c': 1}
+
+    service.fetched.clear()
+    second = scanner.scan_categories(service, CATEGORIES, state)
+    assert sorted(e['id'] for e in second['orders']) == ['b', 'c']
+    assert ('b', 'full') in service.fetched and ('c', 'full') in service.fetched
+    assert state[scanner.HISTORY_STATE_KEY] == '950'
+    assert state[scanner.RETRY_STATE_KEY] == {}
+
+
+def test_retry_gives_up_after_max_attempts():
+    state = {}
+    scanner.mark_for_retry(state, 'm', attempts=0)
+    assert state[scanner.RETRY_STATE_KEY] == {'m': 1}
+    state = {}
+    scanner.mark_for_retry(state, 'm', attempts=scanner.MAX_RETRY_ATTEMPTS - 1)
+    assert 'm' not in state.get(scanner.RETRY_STATE_KEY, {})
@@ -0,0 +1,50 @@
+"""Equivalence tests for the html_to_text engines against the stdlib reference."""
+import glob
+import os
+
+import pytest
+
+from toolbox.services.email_extractor import html_text
+from toolbox.services.email_extractor.scanner import html_to_text
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'fixtures', 'emails', '*.html')))
+
+ENGINES = [html_text.html_to_text_regex]
+if html_text._etree is not None:
+    ENGINES.append(html_text.html_to_text_lxml)
+
+SNIPPETS = [
+    '<p>Fish &amp; chips<br/>two lines</p><p>last</p>',
+    '<div>Hi</div><script src="x.js"/>still visible<style>p{}</style>after',
+    '<SCRIPT>if (a < b) { document.write("<b>x</b>") }</SCRIPT><P>Body',
+    '<a href="https://x.com/?a=1&amp;b=2">one</a> <a href=/relative>two</a> <a HREF=\'http://y.com\'>three</a>',
+    '<!-- hidden --><!DOCTYPE html><h2>Title</h2>\n\n\n\n<li>item</li>',
+    'plain text with no tags &mdash; just entities &#8211; and &lt;brackets&gt;',
+    # libxml2 implies a <head> around a leading <title> and drops a <head> after body content
+    '<title>Hi</title><p>Body',
+    '<p>x</p><head>junk</head><p>y</p>',
+    '<HEAD >\n<meta charset=utf-8><p>never closed',
+    '<header>Top</header><p>not a head</p>',
+]
+
+
+@pytest.mark.parametrize('path', FIXTURES, ids=os.path.basename)
+@pytest.mark.parametrize('engine', ENGINES, ids=lambda fn: fn.__name__)
+def test_fixture_output_matches_reference(engine, path):
+    with open(path, encoding='utf-8') as f:
+        html = f.read()
+    assert engine(html) == html_text.html_to_text_stdlib(html)
+
+
+@pytest.mark.parametrize('html', SNIPPETS)
+@pytest.mark.parametrize('engine', ENGINES, ids=lambda fn: fn.__name__)
+def test_snippet_output_matches_reference(engine, html):
+    assert engine(html) == html_text.html_to_text_stdlib(html)
+
+
+def test_pure_python_fallback_without_lxml(monkeypatch):
+    monkeypatch.setattr(html_text, '_etree', None)
+    text, links = html_to_text('<p>Order <b>shipped</b></p><p><a href="https://t.co/1">track</a></p>')
+    assert text == 'Order shipped\ntrack'
+    assert links == ['https://t.co/1']
+    assert html_to_text('') == ('', [])
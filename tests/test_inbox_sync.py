@@ -0,0 +1,130 @@
+"""Tests for historyId-based delta sync in the inbox scanner and Uptown response KB."""
+from unittest.mock import MagicMock
+
+from toolbox.services.inbox_scanner import main as inbox_main
+from toolbox.services.inbox_scanner import uptown_response_kb as kb
+
+
+class FakeHttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.resp = MagicMock(status=status)
+
+
+def make_service(history=None, listed=None, profile_history_id='700'):
+    service = MagicMock()
+    service.users().getProfile().execute.return_value = {'historyId': profile_history_id}
+    service.users().history().list().execute.side_effect = history if history is not None else []
+    service.users().messages().list().execute.return_value = {'messages': listed or []}
+    service.users().history().list.reset_mock()
+    service.users().messages().list.reset_mock()
+    return service
+
+
+def test_inbox_uses_history_when_cursor_is_stored():
+    service = make_service(history=[{'history': [
+        {'messagesAdded': [{'message': {'id': 'm1', 'threadId': 't1', 'labelIds': ['INBOX']}}]},
+        {'labelsAdded': [{'message': {'id': 'm0', 'threadId': 't0', 'labelIds': ['INBOX']},
+                          'labelIds': ['INBOX']}]},
+        {'labelsAdded': [{'message': {'id': 'm2', 'threadId': 't2', 'labelIds': ['STARRED']},
+                          'labelIds': ['STARRED']}]},
+    ]}])
+    state = {inbox_main.HISTORY_STATE_KEY: '500'}
+    messages = inbox_main.fetch_inbox_changes(service, state, '2026/10/17')
+
+    assert [m['id'] for m in messages] == ['m1', 'm0']
+    kwargs = service.users().history().list.call_args.kwargs
+    assert kwargs['startHistoryId'] == '500' and kwargs['labelId'] == 'INBOX'
+    service.users().messages().list.assert_not_called()
+    assert state[inbox_main.HISTORY_STATE_KEY] == '700'
+
+
+def test_inbox_expired_history_falls_back_to_bounded_scan():
+    service = make_service(history=FakeHttpError(404), listed=[{'id': 'm1', 'threadId': 't1'}])
+    state = {inbox_main.HISTORY_STATE_KEY: '1'}
+    messages = inbox_main.fetch_inbox_changes(service, state, None)
+
+    assert [m['id'] for m in messages] == ['m1']
+    query = service.users().messages().list.call_args.kwargs['q']
+    assert query.startswith('in:inbox after:')
+    assert state[inbox_main.HISTORY_STATE_KEY] == '700'
+
+
+def test_inbox_first_run_lists_inbox():
+    service = make_service(listed=[{'id': 'm1', 'threadId': 't1'}])
+    state = {}
+    inbox_main.fetch_inbox_changes(service, state, None)
+    service.users().history().list.assert_not_called()
+    assert service.users().messages().list.call_args.kwargs['q'] == 'in:inbox'
+    assert state[inbox_main.HISTORY_STATE_KEY] == '700'
+
+
+def test_kb_candidate_threads_from_sent_history():
+    service = make_service(history=[{'history': [{'messagesAdded': [
+        {'message': {'id': 'a', 'threadId': 't1', 'labelIds': ['SENT']}},
+        {'message': {'id': 'b', 'threadId': 't1', 'labelIds': ['SENT']}},
+        {'message': {'id': 'c', 'threadId': 't2', 'labelIds': ['SENT']}},
+    ]}]}])
+    assert kb._candidate_thread_ids(service, '2026/10/17', '500') == ['t1', 't2']
+    assert service.users().history().list.call_args.kwargs['labelId'] == 'SENT'
+    service.users().messages().list.assert_not_called()
+
+
+def test_kb_candidate_threads_fall_back_to_date_query():
+    service = make_service(history=FakeHttpError(404), listed=[{'id': 'a', 'threadId': 't1'}])
+    assert kb._candidate_thread_ids(service, '2026/10/17', '1') == ['t1']
+    assert service.users().messages().list.call_args.kwargs['q'] == 'in:sent after:2026/10/17'
+
+
+def test_inbox_failed_message_is_retried_after_cursor_moves(monkeypatch):
+    saved = []
+    monkeypatch.setattr(inbox_main, 'load_mailbox_config', lambda mailbox_id: {})
+    monkeypatch.setattr(inbox_main, 'EXTRACTOR_CONFIG_PATH', '/nonexistent/config.json')
+    monkeypatch.setattr(inbox_main, 'save_state', lambda mailbox_id, state: saved.append(dict(state)))
+    monkeypatch.setattr(inbox_main, 'log', lambda *a, **kw: None)
+    monkeypatch.setattr(inbox_main.actions, 'send_run_summary', lambda *a: None)
+    state = {inbox_main.HISTORY_STATE_KEY: '500', 'last_run': '2026-10-17'}
+    monkeypatch.setattr(inbox_main, 'load_state', lambda mailbox_id: state)
+
+    added = {'messagesAdded': [{'message': {'id': 'm1', 'threadId': 't1', 'labelIds': ['INBOX']}}]}
+    service = make_service(history=[{'history': [added]}, {'history': []}])
+    service.users().getProfile().execute.side_effect = [{'historyId': '700'}, {'historyId': '800'}]
+    metadata = {'payload': {'headers': [{'name': 'From', 'value': 'a@example.com'}]},
+                'labelIds': ['CATEGORY_PROMOTIONS']}
+    service.users().messages().get().execute.side_effect = [FakeHttpError(500), metadata]
+    service.users().messages().get.reset_mock()
+    monkeypatch.setattr(inbox_main, 'get_gmail_service', lambda config: service)
+
+    inbox_main.run()
+    assert saved[-1][inbox_main.HISTORY_STATE_KEY] == '700'
+    assert saved[-1][inbox_main.RETRY_STATE_KEY] == {'m1': 1}
+    assert 'm1' not in saved[-1]['processed_ids']
+
+    inbox_main.run()
+    assert [c.kwargs['id'] for c in service.users().messages().get.call_args_list] == ['m1', 'm1']
+    assert saved[-1][inbox_main.HISTORY_STATE_KEY] == '800'
+    assert saved[-1][inbox_main.RETRY_STATE_KEY] == {}
+    assert 'm1' in saved[-1]['processed_ids']
+
+
+def test_kb_failed_thread_is_retried_after_cursor_moves(monkeypatch):
+    monkeypatch.setattr(kb, 'list_memory_files', lambda category: {})
+    monkeypatch.setattr(kb, 'set_memory_content', lambda *a: None)
+    service = make_service(history=[
+        {'history': [{'messagesAdded': [{'message': {'id': 'a', 'threadId': 't1', 'labelIds': ['SENT']}},
+                                        {'message': {'id': 'b', 'threadId': 't2', 'labelIds': ['SENT']}}]}]},
+        {'history': []},
+    ])
+    service.users().getProfile().execute.side_effect = [{'historyId': '700'}, {'historyId': '800'}]
+    service.users().threads().get().execute.side_effect = [{'messages': []}, FakeHttpError(500), {'messages': []}]
+    service.users().threads().get.reset_mock()
+    state = {'uptown_response_kb_history_id': '500'}
+
+    kb.sync_response_kb(service, state)
+    assert state['uptown_response_kb_history_id'] == '700'
+    assert state[kb.RETRY_STATE_KEY] == {'t2': 1}
+
+    kb.sync_response_kb(service, state)
+    assert [c.kwargs['id'] for c in service.users().threads().get.call_args_list] == ['t1', 't2', 't2']
+    assert state['uptown_response_kb_history_id'] == '800'
+    assert state[kb.RETRY_STATE_KEY] == {}
@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from unittest.mock import patch
+
+from toolbox.lib import drive_utils
+from toolbox.bin import benchmark_import_time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARENT_DIR = os.path.dirname(BASE_DIR)
+
+HEAVY_MODULES = ['google.genai', 'groq', 'openai', 'googleapiclient', 'google_auth_oauthlib', 'yaml', 'asyncio']
+
+
+def _modules_after_import(module: str) -> set:
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    out = subprocess.run([sys.executable, '-c', code], cwd=PARENT_DIR, capture_output=True, text=True, check=True,
+                         env={**os.environ, 'PYTHONPATH': PARENT_DIR}).stdout
+    return set(json.loads(out))
+
+
+@pytest.mark.parametrize("module", ['toolbox.lib.llm_gateway', 'toolbox.lib.drive_utils'])
+def test_import_does_not_load_sdks(module):
+    loaded = _modules_after_import(module)
+    assert [m for m in HEAVY_MODULES if m in loaded] == []
+
+
+def test_drive_utils_reads_no_config_at_import():
+    code = ("import builtins, json\n"
+            "opened = []\n"
+            "real_open = builtins.open\n"
+            "builtins.open = lambda f, *a, **k: (opened.append(str(f)), real_open(f, *a, **k))[1]\n"
+            "import toolbox.lib.drive_utils\n"
+            "print(json.dumps([f for f in opened if f.endswith('.json')]))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=PARENT_DIR, capture_output=True, text=True, check=True,
+                         env={**os.environ, 'PYTHONPATH': PARENT_DIR}).stdout
+    assert json.loads(out) == []
+
+
+def test_lazy_constants_load_on_first_access(tmp_path, monkeypatch):
+    config = tmp_path / 'folder_config.json'
+    config.write_text(json.dumps({'system': {'inbox_id': 'inbox123', 'history_sheet_id': 'sheet9'}}))
+    tree = tmp_path / 'drive_tree.json'
+    tree.write_text(json.dumps({'path_to_id': {'02 - Finance': 'fin1'}}))
+    monkeypatch.setattr(drive_utils, 'CONFIG_PATH', str(config))
+    monkeypatch.setattr(drive_utils, 'TREE_PATH', str(tree))
+    for name in drive_utils._LAZY_CONSTANTS:
+        monkeypatch.delitem(drive_utils.__dict__, name, raising=False)
+
+    from toolbox.lib.drive_utils import INBOX_ID, HISTORY_SHEET_ID, ID_TO_PATH
+    assert INBOX_ID == 'inbox123'
+    assert HISTORY_SHEET_ID == 'sheet9'
+    assert ID_TO_PATH == {'fin1': '02 - Finance'}
+    assert drive_utils.resolve_folder_id('02 - Finance') == 'fin1'
+    with pytest.raises(AttributeError):
+        drive_utils.NOT_A_CONSTANT
+
+
+def test_patched_tree_seen_by_accessors():
+    with patch.object(drive_utils, 'DRIVE_TREE', {'path_to_id': {'A/B': 'id_ab'}}):
+        assert drive_utils.resolve_folder_id('A/B') == 'id_ab'
+
+
+def test_gateway_loads_provider_module_on_first_use():
+    code = ("import sys\n"
+            "from toolbox.lib.llm_gateway import LLMGateway\n"
+            "gw = LLMGateway()\n"
+            "before = 'toolbox.lib.providers.ollama' in sys.modules\n"
+            "gw._get_provider_instance({'name': 'ollama', 'model': 'm'})\n"
+            "print(before, 'toolbox.lib.providers.ollama' in sys.modules, 'google.genai' in sys.modules)")
+    out = subprocess.run([sys.executable, '-c', code], cwd=PARENT_DIR, capture_output=True, text=True, check=True,
+                         env={**os.environ, 'PYTHONPATH': PARENT_DIR}).stdout.split()
+    assert out == ['False', 'True', 'False']
+
+
+def test_parse_importtime():
+    stderr = ("import time: self [us] | cumulative | imported package\n"
+              "import time:       120 |        120 |   json.decoder\n"
+              "import time:      9324 |      60067 | toolbox.lib.llm_gateway\n")
+    assert benchmark_import_time.parse_importtime(stderr, 'toolbox.lib.llm_gateway') == 60067
+    with pytest.raises(ValueError):
+        benchmark_import_time.parse_importtime(stderr, 'toolbox.lib.drive_utils')
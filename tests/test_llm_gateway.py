@@ -3,6 +3,7 @@ import os
 import json
 from unittest.mock import MagicMock, patch
 from toolbox.lib.llm_gateway import LLMGateway
+from toolbox.lib import token_estimator
 from toolbox.lib.providers.base import RateLimitError, ProviderSkip
 
 @pytest.fixture
@@ -58,12 +59,15 @@ def test_token_cap_truncation(gateway, mocker):
     
     mocker.patch.object(gateway, '_get_provider_instance', return_value=mock_provider)
     
-    # Cheapest tier cap is 2000 tokens -> 8000 chars
-    long_prompt = "x" * 20000
+    # Cheapest tier cap is 2000 tokens
+    long_prompt = "The quick brown fox jumps over the lazy dog. " * 1000
     res = gateway.call("heartbeat", long_prompt)
     
-    # 2000 tokens * 4 chars/token = 8000 chars
-    assert "Truncated: 8000" in res['text']
+    sent = int(res['text'].split(": ")[1])
+    assert sent < len(long_prompt)
+    assert token_estimator.estimate_text(long_prompt[:sent]) <= 2000
+    # Proportional cut lands close to the cap rather than far below it
+    assert token_estimator.estimate_text(long_prompt[:sent]) > 1800
 
 def test_fallback_behavior(gateway, mocker):
     mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
@@ -201,3 +205,239 @@ def test_model_specific_cost_lookup(gateway, mocker):
     res = gateway.call("final", "high stakes")
     assert res['model'] == 'gemini-3.1-pro-preview'
     assert res['cost'] == 0.20
+
+def test_identical_call_is_served_from_cache(gateway, mocker):
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    record_usage = mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+
+    mock_provider = MagicMock()
+    mock_provider.supports.return_value = True
+    mock_provider.analyze.return_value = ('{"category": "Finance"}', 50)
+    mocker.patch.object(gateway, '_get_provider_instance', return_value=mock_provider)
+    log_routing = mocker.patch.object(gateway, '_log_routing')
+
+    first = gateway.call("automation", "classify  this", content_bytes=b"pdf", require_json=True)
+    # Whitespace-only prompt differences still hit the same cache entry
+    second = gateway.call("automation", "classify this", content_bytes=b"pdf", require_json=True)
+
+    assert mock_provider.analyze.call_count == 1
+    assert record_usage.call_count == 1
+    assert first['cache_hit'] is False
+    assert second['cache_hit'] is True
+    assert second['json'] == {"category": "Finance"}
+    assert second['cost'] == 0.0
+    assert log_routing.call_args[0][5] == "cache_hit"
+
+def test_cache_key_separates_content_and_json_mode(gateway, mocker):
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+
+    mock_provider = MagicMock()
+    mock_provider.supports.return_value = True
+    mock_provider.analyze.return_value = ('{"ok": true}', 10)
+    mocker.patch.object(gateway, '_get_provider_instance', return_value=mock_provider)
+
+    gateway.call("automation", "prompt", content_bytes=b"a")
+    gateway.call("automation", "prompt", content_bytes=b"b")
+    gateway.call("automation", "prompt", content_bytes=b"a", require_json=True)
+    gateway.call("automation", "prompt", content_bytes=b"a", use_cache=False)
+
+    assert mock_provider.analyze.call_count == 4
+
+def test_heartbeat_is_never_cached(gateway, mocker):
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+
+    mock_provider = MagicMock()
+    mock_provider.supports.return_value = True
+    mock_provider.analyze.return_value = ("pong", 10)
+    mocker.patch.object(gateway, '_get_provider_instance', return_value=mock_provider)
+
+    gateway.call("heartbeat", "ping")
+    gateway.call("heartbeat", "ping")
+
+    assert mock_provider.analyze.call_count == 2
+
+def test_cache_lru_eviction_and_ttl():
+    from toolbox.lib import llm_cache
+
+    for i in range(3):
+        llm_cache.put(f"k{i}", "automation", {"text": f"r{i}", "json": None, "tier": "efficiency"}, max_entries=2)
+
+    assert llm_cache.get("k0", "automation") is None
+    assert llm_cache.get("k2", "automation")["text"] == "r2"
+    assert llm_cache.get("k2", "automation", ttl_seconds=-1) is None
+
+    stats = llm_cache.get_stats(days=1)
+    assert stats["automation"]["hits"] == 1
+    assert stats["automation"]["misses"] == 2
+
+def test_call_many_preserves_order_and_isolates_failures(gateway, mocker):
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+    mocker.patch('time.sleep')
+
+    def analyze(data, mime, prompt):
+        if prompt == "bad":
+            raise ValueError("boom")
+        return (f"echo {prompt}", 5)
+
+    mock_provider = MagicMock()
+    mock_provider.supports.return_value = True
+    mock_provider.analyze.side_effect = analyze
+    mocker.patch.object(gateway, '_get_provider_instance', return_value=mock_provider)
+
+    requests = [{"task_type": "automation", "prompt": p} for p in ["a", "bad", "c", "d"]]
+    results = gateway.call_many(requests, max_workers=4)
+
+    assert [r['text'] if isinstance(r, dict) else "ERR" for r in results] == ["echo a", "ERR", "echo c", "echo d"]
+    assert isinstance(results[1], RuntimeError)
+
+def test_call_many_respects_provider_concurrency_limit(gateway, mocker):
+    import threading
+    import time as _time
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+    gateway.config['concurrency'] = {'max_workers': 8, 'providers': {'deepseek': 2}}
+
+    lock = threading.Lock()
+    in_flight = {"now": 0, "peak": 0}
+    def analyze(data, mime, prompt):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        _time.sleep(0.02)
+        with lock:
+            in_flight["now"] -= 1
+        return ("ok", 1)
+
+    mock_provider = MagicMock()
+    mock_provider.supports.return_value = True
+    mock_provider.analyze.side_effect = analyze
+    mocker.patch.object(gateway, '_get_provider_instance', return_value=mock_provider)
+
+    results = gateway.call_many([{"task_type": "automation", "prompt": f"p{i}", "use_cache": False} for i in range(8)])
+
+    assert all(r['provider'] == 'deepseek' for r in results)
+    assert in_flight["peak"] == 2
+
+def test_acall_returns_call_result(gateway, mocker):
+    import asyncio
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+
+    mock_provider = MagicMock()
+    mock_provider.supports.return_value = True
+    mock_provider.analyze.return_value = ("async ok", 3)
+    mocker.patch.object(gateway, '_get_provider_instance', return_value=mock_provider)
+
+    res = asyncio.run(gateway.acall("automation", "hi", source="test"))
+    assert res['text'] == "async ok"
+
+def test_acall_and_call_many_record_the_calling_module(gateway, mocker):
+    import asyncio
+    mocker.patch.object(gateway, 'call', side_effect=lambda *args, **kwargs: kwargs['source'])
+
+    async def nested():
+        return await gateway.acall("automation", "hi")
+
+    assert asyncio.run(gateway.acall("automation", "hi")).endswith("test_llm_gateway")
+    assert asyncio.run(nested()).endswith("test_llm_gateway")
+    sources = gateway.call_many([{"task_type": "automation", "prompt": "a"}, {"task_type": "automation", "prompt": "b"}])
+    assert all(s.endswith("test_llm_gateway") for s in sources)
+    assert gateway.call_many([{"task_type": "automation", "prompt": "a", "source": "explicit"}]) == ["explicit"]
+
+def test_hedged_tier_fires_next_provider_when_primary_is_slow(gateway, mocker):
+    import threading
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    record_usage = mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+    log_routing = mocker.patch.object(gateway, '_log_routing')
+    gateway.config['tiers']['efficiency']['hedge'] = {
+        'enabled': True, 'default_delay_sec': 0.05, 'min_delay_sec': 0.01, 'max_parallel': 2,
+    }
+
+    release_slow = threading.Event()
+    slow = MagicMock()
+    slow.supports.return_value = True
+    def slow_analyze(data, mime, prompt):
+        release_slow.wait(2)
+        return ('{"who": "slow"}', 10)
+    slow.analyze.side_effect = slow_analyze
+
+    fast = MagicMock()
+    fast.supports.return_value = True
+    fast.analyze.return_value = ('{"who": "fast"}', 20)
+
+    mocker.patch.object(gateway, '_get_provider_instance',
+                        side_effect=lambda cfg: slow if cfg['name'] == 'deepseek' else fast)
+
+    res = gateway.call("automation", "classify", require_json=True, use_cache=False)
+    assert res['provider'] == 'groq'
+    assert res['json'] == {"who": "fast"}
+
+    # The loser finishes in the background; its spend is still recorded, flagged as discarded
+    release_slow.set()
+    for _ in range(100):
+        if record_usage.call_count == 2:
+            break
+        threading.Event().wait(0.01)
+    assert record_usage.call_count == 2
+    discarded = [c for c in record_usage.call_args_list if c.kwargs['metadata'].get('hedge') == 'discarded']
+    assert len(discarded) == 1
+    assert discarded[0].kwargs['metadata']['provider'] == 'deepseek'
+    assert "hedge_discarded" in [c.args[5] for c in log_routing.call_args_list]
+
+def test_hedged_loser_stops_retrying_once_another_provider_wins(gateway, mocker):
+    import threading
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+    log_routing = mocker.patch.object(gateway, '_log_routing')
+    sleep = mocker.patch('toolbox.lib.llm_gateway.time.sleep')
+    gateway.config['tiers']['efficiency']['hedge'] = {
+        'enabled': True, 'default_delay_sec': 0.05, 'min_delay_sec': 0.01, 'max_parallel': 2,
+    }
+
+    release_slow = threading.Event()
+    slow = MagicMock()
+    slow.supports.return_value = True
+    def slow_analyze(data, mime, prompt):
+        release_slow.wait(2)
+        raise RateLimitError("429")
+    slow.analyze.side_effect = slow_analyze
+
+    fast = MagicMock()
+    fast.supports.return_value = True
+    fast.analyze.return_value = ('{"who": "fast"}', 20)
+
+    mocker.patch.object(gateway, '_get_provider_instance',
+                        side_effect=lambda cfg: slow if cfg['name'] == 'deepseek' else fast)
+
+    res = gateway.call("automation", "classify", require_json=True, use_cache=False)
+    assert res['provider'] == 'groq'
+
+    release_slow.set()
+    for _ in range(100):
+        if "rate_limit" in [c.args[5] for c in log_routing.call_args_list]:
+            break
+        threading.Event().wait(0.01)
+    threading.Event().wait(0.05)
+    assert slow.analyze.call_count == 1
+    sleep.assert_not_called()
+
+def test_hedge_delay_uses_latency_percentile(gateway):
+    hedge_cfg = {'percentile': 95, 'min_samples': 20, 'default_delay_sec': 5.0, 'min_delay_sec': 0.5, 'max_delay_sec': 20.0}
+    cfg = {'name': 'deepseek', 'model': 'deepseek-chat'}
+    gateway._latencies_seeded = True
+
+    assert gateway._hedge_delay(cfg, hedge_cfg) == 5.0
+    for i in range(100):
+        gateway._record_latency('deepseek', 'deepseek-chat', (i + 1) / 10)
+    assert gateway._hedge_delay(cfg, hedge_cfg) == 9.6
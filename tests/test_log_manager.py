@@ -2,7 +2,7 @@ import json
 import logging
 from pathlib import Path
 
-from toolbox.lib import log_manager
+from toolbox.lib import log_manager, log_sink
 
 
 def _reset_manager(app_name: str):
@@ -22,6 +22,7 @@ def test_log_event_writes_structured_jsonl(tmp_path):
 
     manager.log_event("RUN_COMPLETE", "SUCCESS", "Sorter finished", {"processed": 3})
 
+    log_sink.flush()
     line = (tmp_path / "activity.jsonl").read_text().strip().splitlines()[-1]
     payload = json.loads(line)
     assert payload["app"] == app_name
@@ -39,6 +40,7 @@ def test_plain_logger_message_is_wrapped_as_json(tmp_path):
 
     manager.logger.info("plain message")
 
+    log_sink.flush()
     line = (tmp_path / "activity.jsonl").read_text().strip().splitlines()[-1]
     payload = json.loads(line)
     assert payload["app"] == app_name
@@ -59,6 +61,7 @@ def test_log_helper_accepts_non_json_native_data(tmp_path):
         log_dir=str(tmp_path),
     )
 
+    log_sink.flush()
     line = (tmp_path / "activity.jsonl").read_text().strip().splitlines()[-1]
     payload = json.loads(line)
     assert payload["event"] == "TOKEN_MONITOR"
@@ -0,0 +1,96 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+
+from toolbox.lib import log_sink
+
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _all_lines(path):
+    lines = []
+    for candidate in [path] + [f"{path}.{i}" for i in range(1, 100)]:
+        if os.path.exists(candidate):
+            with open(candidate) as f:
+                lines.extend(f.read().splitlines())
+    return lines
+
+
+def test_lines_are_batched_per_file(tmp_path, mocker):
+    spy = mocker.spy(log_sink, '_write_group')
+    path = str(tmp_path / "logs" / "routing.jsonl")
+    for i in range(200):
+        log_sink.write(path, json.dumps({"n": i}))
+    assert log_sink.flush()
+
+    with open(path) as f:
+        assert [json.loads(line)["n"] for line in f] == list(range(200))
+    assert spy.call_count < 10
+
+
+def test_flush_fsyncs_even_within_interval(tmp_path, mocker, monkeypatch):
+    monkeypatch.setattr(log_sink, 'FSYNC_INTERVAL_SEC', 3600)
+    path = str(tmp_path / "cost_log.jsonl")
+    log_sink.write(path, '{"a": 1}')
+    log_sink.flush()
+    fsync = mocker.spy(log_sink.os, 'fsync')
+    log_sink.write(path, '{"a": 2}')
+    log_sink.flush()
+    assert fsync.call_count >= 1
+
+
+def test_rotation_keeps_every_line(tmp_path):
+    path = str(tmp_path / "activity.jsonl")
+    for i in range(50):
+        log_sink._write_group(path, [json.dumps({"n": i, "pad": "x" * 80})], 1024, 20)
+
+    assert os.path.exists(path + ".1")
+    assert os.path.getsize(path) <= 1024
+    numbers = sorted(json.loads(line)["n"] for line in _all_lines(path))
+    assert numbers == list(range(50))
+
+
+def test_rotation_drops_oldest_beyond_backup_count(tmp_path):
+    path = str(tmp_path / "activity.jsonl")
+    for i in range(50):
+        log_sink._write_group(path, [json.dumps({"n": i, "pad": "x" * 80})], 512, 2)
+    assert os.path.exists(path + ".2") and not os.path.exists(path + ".3")
+
+
+def _write_many(path, worker, n):
+    for i in range(n):
+        log_sink.write(path, json.dumps({"worker": worker, "n": i, "pad": "y" * 60}), 4096, 90)
+    log_sink.flush()  # multiprocessing children leave via os._exit
+
+
+def test_concurrent_processes_rotate_without_corruption(tmp_path):
+    path = str(tmp_path / "activity.jsonl")
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_write_many, args=(path, w, 300)) for w in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    records = [json.loads(line) for line in _all_lines(path)]
+    assert sorted((r["worker"], r["n"]) for r in records) == [(w, i) for w in range(4) for i in range(300)]
+    assert os.path.exists(path + ".1")
+
+
+def test_pending_lines_written_at_exit(tmp_path):
+    path = tmp_path / "llm_routing.jsonl"
+    code = ("from toolbox.lib import log_sink\n"
+            "log_sink.FLUSH_INTERVAL_SEC = 30\n"
+            f"for i in range(100): log_sink.write({str(path)!r}, str(i))\n")
+    subprocess.run([sys.executable, '-c', code], cwd=PARENT_DIR, check=True, timeout=60,
+                   env={**os.environ, 'PYTHONPATH': PARENT_DIR})
+    assert path.read_text().splitlines() == [str(i) for i in range(100)]
+
+
+def test_writes_after_shutdown_go_straight_to_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_sink, '_closed', True)
+    path = tmp_path / "late.jsonl"
+    log_sink.write(str(path), "late")
+    assert path.read_text() == "late\n"
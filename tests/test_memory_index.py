@@ -0,0 +1,146 @@
+"""
+Tests for lib/memory_index.py — Memory file block index (parse, incremental edits,
+persistence, and Drive refresh with minimal downloads).
+"""
+import hashlib
+from unittest.mock import MagicMock
+
+import pytest
+
+from toolbox.lib import memory_index
+from toolbox.lib.memory_index import FileIndex
+from toolbox.services.email_extractor.writers import block_exists
+
+SAMPLES = [
+    '',
+    '## 2026-04-15 — Flight\n**Confirmation:** HXXKJD\n---\n',
+    '## 2026-04-10 — Hotel\n**Vendor:** Marriott\n---\n## 2026-04-15 — Flight\n**Vendor:** Delta\n---\n\n\n',
+    '## 2026-04-01 — Order #1\n<!-- entity_id: ord_abc -->\nStatus: [Pending]\n---   \n## 2026-04-01 — Order #2\n',
+    '\n\n## 2026-05-01 — Note\nno trailing separator',
+]
+
+
+def _md5(s):
+    return hashlib.md5(s.encode()).hexdigest()
+
+
+def _drive(content, **meta):
+    svc = MagicMock()
+    svc.files().get().execute.return_value = {'md5Checksum': _md5(content), 'size': str(len(content.encode())), **meta}
+    svc.files().get_media().execute.return_value = content.encode()
+    svc.files().get_media.reset_mock()
+    return svc
+
+
+@pytest.mark.parametrize('content', SAMPLES)
+def test_blocks_tile_content_and_match_block_exists(content):
+    index = FileIndex.from_content(content)
+    assert index.content == content
+    assert index.size == len(content.encode())
+    for date in ('2026-04-15', '2026-04-01', '2026-04-10', '2026-05-01', '2026-01-01'):
+        for ids in ((), ('HXXKJD',), ('Delta',), ('Order #2',), ('missing',)):
+            assert index.block_exists(date, *ids) == block_exists(content, date, *ids)
+
+
+@pytest.mark.parametrize('content', SAMPLES)
+def test_append_matches_string_append(content):
+    index = FileIndex.from_content(content)
+    new = '## 2026-06-01 — New\n**Order Number:** 9\n---'
+    index.append(new)
+    expected = content.rstrip('\n') + '\n\n' + new if content else new
+    assert index.content == expected
+    assert index.block_exists('2026-06-01', '9')
+    assert [b.content_hash for b in index._blocks] == [b.content_hash for b in FileIndex.from_content(expected)._blocks]
+
+
+def test_replace_rebuilds_only_from_the_touched_block():
+    content = SAMPLES[3]
+    index = FileIndex.from_content(content)
+    assert index.replace('Status: [Pending]', 'Status: [Shipped]')
+    assert index.content == content.replace('Status: [Pending]', 'Status: [Shipped]', 1)
+    assert not index.replace('not there', 'x')
+    assert index._blocks[0].entity_id == 'ord_abc'
+
+
+def test_blocks_for_date_uses_header_date():
+    index = FileIndex.from_content(SAMPLES[2])
+    assert index.blocks_for_date('2026-04-15') == ['## 2026-04-15 — Flight\n**Vendor:** Delta']
+    assert index.blocks_for_date('2026-04-11') == []
+
+
+def test_save_load_and_incremental_save():
+    index = FileIndex.from_content(SAMPLES[2])
+    memory_index.save('f1', index)
+    index.append('## 2026-04-20 — Train\n---\n')
+    assert index.dirty_from == 1
+    memory_index.save('f1', index)
+
+    loaded = memory_index.load('f1')
+    assert loaded.content == index.content
+    assert loaded.checksum == _md5(index.content)
+    assert memory_index.query_date('f1', loaded.checksum, '2026-04-20') == ['## 2026-04-20 — Train']
+    assert memory_index.query_date('f1', 'other-md5', '2026-04-20') is None
+
+
+def test_fetch_current_index_downloads_nothing():
+    content = SAMPLES[2]
+    memory_index.save('f1', FileIndex.from_content(content))
+    svc = _drive(content)
+    index, meta = memory_index.fetch(svc, 'f1')
+    assert index.content == content
+    svc.files().get_media.assert_not_called()
+
+
+def test_fetch_stale_index_downloads_only_the_tail():
+    old = SAMPLES[2]
+    memory_index.save('f1', FileIndex.from_content(old))
+    new = old.rstrip('\n') + '\n\n## 2026-04-30 — Ferry\n---\n'
+    last_block_start = len(old.encode()) - FileIndex.from_content(old)._blocks[-1].nbytes
+    svc = _drive(new)
+    request = MagicMock(headers={})
+    request.execute.return_value = new.encode()[last_block_start:]
+    svc.files().get_media.side_effect = lambda fileId: request
+
+    index, _ = memory_index.fetch(svc, 'f1')
+    assert index.content == new
+    assert request.headers['Range'] == f'bytes={last_block_start}-'
+    assert memory_index.load('f1').checksum == _md5(new)
+
+
+def test_fetch_rewritten_file_falls_back_to_full_download():
+    memory_index.save('f1', FileIndex.from_content(SAMPLES[2]))
+    rewritten = '## 2026-04-10 — Hotel (edited)\n---\n' * 5
+    svc = _drive(rewritten)
+    index, _ = memory_index.fetch(svc, 'f1')
+    assert index.content == rewritten
+    assert memory_index.load('f1').content == rewritten
+
+
+def test_dedup_memory_skips_files_already_clean_at_current_checksum():
+    from toolbox.bin import dedup_memory
+    content = '## 2026-04-01 — Order #1\n---\n## 2026-04-01 — Order #1\n---\n'
+    svc = _drive(content)
+    assert dedup_memory.dedup_file(svc, 'f1', 'Amazon.md', dedup_memory._order_key, dry_run=False,
+                                   md5=_md5(content)) == 1
+    cleaned = svc.files().update.call_args.kwargs['media_body']._fd.getvalue().decode()
+    assert memory_index.is_deduped('f1', _md5(cleaned))
+
+    svc.files().get_media.reset_mock()
+    assert dedup_memory.dedup_file(svc, 'f1', 'Amazon.md', dedup_memory._order_key, dry_run=False,
+                                   md5=_md5(cleaned)) == 0
+    svc.files().get_media.assert_not_called()
+
+
+def test_reporter_date_slice_served_from_index():
+    from unittest.mock import patch
+    from toolbox.lib import reporter_utils
+    from toolbox.services.email_extractor import writers
+    content = SAMPLES[2]
+    memory_index.save('file_travel', FileIndex.from_content(content))
+    svc = _drive(content)
+    with patch.object(writers, 'get_drive_service', return_value=svc), \
+         patch.object(writers, '_resolve_path', return_value='id_mem'), \
+         patch.object(writers, '_get_file_in_folder', return_value='file_travel'):
+        blocks = reporter_utils.get_memory_blocks(svc, 'Travel.md', '2026-04-10')
+    assert blocks == ['## 2026-04-10 — Hotel\n**Vendor:** Marriott']
+    svc.files().get_media.assert_not_called()
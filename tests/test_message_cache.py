@@ -0,0 +1,75 @@
+"""Tests for the shared parsed-message cache and its use by the Gmail scanner."""
+import sqlite3
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from toolbox.lib import message_cache
+from toolbox.services.email_extractor import scanner
+
+
+def _email(mid, body='hello'):
+    return {
+        'id': mid, 'subject': f'Subject {mid}', 'plain': body, 'html': '',
+        'date_dt': datetime(2026, 10, 5, 10, 0, tzinfo=timezone.utc), 'label_ids': ['INBOX'],
+    }
+
+
+def test_round_trip_restores_datetimes_and_compresses():
+    email = _email('m1', body='order shipped ' * 500)
+    message_cache.put('m1', '100', email)
+    assert message_cache.get('m1') == email
+    assert message_cache.get('m1', history_id='100') == email
+    assert message_cache.get('m1', history_id='200') is None
+    assert message_cache.get('missing') is None
+
+    conn = sqlite3.connect(message_cache.CACHE_PATH)
+    size = conn.execute("SELECT size FROM messages WHERE id = 'm1'").fetchone()[0]
+    conn.close()
+    assert size < len(email['plain']) / 10
+
+
+def test_least_recently_used_entries_are_evicted():
+    message_cache.put_many([(f'm{i}', '1', _email(f'm{i}')) for i in range(3)])
+    message_cache.get('m0')  # m1 is now the least recently used
+    message_cache.put('m3', '1', _email('m3'), max_entries=3)
+    assert set(message_cache.get_many(['m0', 'm1', 'm2', 'm3'])) == {'m0', 'm2', 'm3'}
+
+
+def _raw(mid, history_id, labels=('INBOX',)):
+    return {
+        'id': mid, 'threadId': f't-{mid}', 'historyId': history_id, 'labelIds': list(labels),
+        'payload': {
+            'mimeType': 'text/html',
+            'headers': [{'name': 'From', 'value': 'a@example.com'},
+                        {'name': 'Date', 'value': 'Mon, 05 Oct 2026 10:00:00 +0000'}],
+            'body': {'data': 'PHA-SGk8YSBocmVmPSJodHRwczovL3guY29tIj54PC9hPjwvcD4='},
+        },
+    }
+
+
+def test_parse_reuses_cache_and_refreshes_labels(monkeypatch):
+    first = scanner.parse_gmail_message_cached(_raw('m1', '10'))
+    assert first['text'].startswith('Hi') and first['links'] == ['https://x.com']
+
+    monkeypatch.setattr(scanner, 'parse_gmail_message', lambda msg: (_ for _ in ()).throw(AssertionError('re-parsed')))
+    moved = scanner.parse_gmail_message_cached(_raw('m1', '11', labels=('TRASH',)))
+    assert moved['label_ids'] == ['TRASH'] and moved['text'] == first['text']
+    assert message_cache.get('m1', history_id='11')['label_ids'] == ['TRASH']
+
+
+def test_full_fetches_skip_cached_messages():
+    message_cache.put('cached', '5', {**_email('cached'), 'text': 'hello', 'links': []})
+    service = MagicMock()
+    assert scanner.get_full_email(service, 'cached')['subject'] == 'Subject cached'
+    emails = scanner.get_full_emails(service, ['cached'])
+    assert emails['cached']['subject'] == 'Subject cached'
+    service.users().messages().get.assert_not_called()
+    service.new_batch_http_request.assert_not_called()
+
+
+def test_email_text_prefers_html_and_memoizes():
+    email = {'plain': 'plain body', 'html': '<p>Rich <b>body</b></p>'}
+    text, links = scanner.email_text(email)
+    assert 'Rich' in text and links == []
+    assert email['text'] == text
+    assert scanner.email_text({'plain': 'only plain', 'html': ''}) == ('only plain', [])
@@ -0,0 +1,95 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from toolbox.lib import log_sink, prompt_segments, token_estimator
+from toolbox.lib.drive_utils import SORTER_SYSTEM_PROMPT
+from toolbox.lib.llm_gateway import LLMGateway
+
+TEMPLATE = "Extract the order.\nEmail:\n{body}\nRULES:\n1. Pure JSON only.\n"
+
+
+def test_split_and_join_round_trip():
+    prompt = TEMPLATE.format(body=prompt_segments.payload("Hello Bob"))
+    segments = prompt_segments.split(prompt)
+    assert [kind for kind, _ in segments] == ['instructions', 'payload', 'instructions']
+    assert prompt_segments.join(segments) == TEMPLATE.format(body="Hello Bob")
+
+
+def test_unmarked_prompt_is_one_payload():
+    assert prompt_segments.split("just text") == [('payload', "just text")]
+
+
+def test_marker_characters_in_text_are_neutralised():
+    prompt = "a " + prompt_segments.payload("x\x03y\x02z") + " b"
+    assert prompt_segments.join(prompt_segments.split(prompt)) == "a xyz b"
+
+
+def test_unknown_kind_rejected():
+    with pytest.raises(ValueError):
+        prompt_segments.mark('preamble', 'x')
+
+
+def test_middle_out_keeps_head_and_tail():
+    text = "HEAD " + "filler " * 1000 + " TAIL"
+    out = prompt_segments.middle_out(text, 200)
+    assert out.startswith("HEAD ")
+    assert out.endswith(" TAIL")
+    assert prompt_segments.ELISION in out
+    assert prompt_segments.middle_out("short", 100) == "short"
+
+
+def test_truncate_shrinks_only_payload():
+    body = "Your order of widgets has shipped. " * 2000
+    segments = prompt_segments.split(TEMPLATE.format(body=prompt_segments.payload(body)))
+    text, tokens, saved = prompt_segments.truncate(segments, 1000)
+    assert tokens <= 1000
+    assert token_estimator.estimate_text(text) == tokens
+    assert text.startswith("Extract the order.\nEmail:\nYour order")
+    assert text.endswith("RULES:\n1. Pure JSON only.\n")
+    assert saved == len(prompt_segments.join(segments).encode()) - len(text.encode())
+    assert saved > 0
+
+
+def test_truncate_under_cap_is_noop():
+    segments = prompt_segments.split(TEMPLATE.format(body=prompt_segments.payload("hi")))
+    assert prompt_segments.truncate(segments, 1000) == (prompt_segments.join(segments), token_estimator.estimate_text(prompt_segments.join(segments)), 0)
+
+
+def test_sorter_folder_list_never_truncated():
+    folders = "\n".join(f"Area {i}/Project {i}/Subfolder" for i in range(2000))
+    prompt = SORTER_SYSTEM_PROMPT.format(context_hint="Filename: x.pdf", folder_paths=prompt_segments.schema(folders))
+    text, tokens, saved = prompt_segments.truncate(prompt_segments.split(prompt), 500)
+    assert saved == 0
+    assert folders in text
+    assert text.rstrip().endswith('folder_path to "00 - Staging/Review".')
+
+
+def test_payload_dropped_when_instructions_exceed_cap():
+    prompt = prompt_segments.schema("rule " * 500) + prompt_segments.payload("body " * 500)
+    text, _, saved = prompt_segments.truncate(prompt_segments.split(prompt), 100)
+    assert text == "rule " * 500
+    assert saved == len("body " * 500)
+
+
+def test_gateway_logs_bytes_saved(mocker, tmp_path):
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+    log_path = tmp_path / "llm_routing.jsonl"
+    mocker.patch('toolbox.lib.llm_gateway.LLM_LOG_PATH', str(log_path))
+    gateway = LLMGateway()
+    provider = MagicMock()
+    provider.supports.return_value = True
+    provider.analyze.return_value = ("ok", 10)
+    mocker.patch.object(gateway, '_get_provider_instance', return_value=provider)
+
+    body = "Shipment update for order 1234. " * 2000
+    gateway.call("heartbeat", TEMPLATE.format(body=prompt_segments.payload(body)), use_cache=False)
+
+    sent = provider.analyze.call_args[0][2]
+    log_sink.flush()
+    assert "\x02" not in sent and "\x03" not in sent
+    assert sent.endswith("RULES:\n1. Pure JSON only.\n")
+    entry = json.loads(log_path.read_text().splitlines()[-1])
+    assert entry['result'] == 'success'
+    assert entry['bytes_saved'] == len(TEMPLATE.format(body=body).encode()) - len(sent.encode())
@@ -0,0 +1,158 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from toolbox.lib import log_sink, provider_health
+from toolbox.lib.llm_gateway import LLMGateway
+
+EFFICIENCY = [
+    {'name': 'deepseek', 'model': 'deepseek-chat'},
+    {'name': 'groq', 'model': 'llama-3.3-70b-versatile'},
+    {'name': 'gemini-paid', 'model': 'gemini-2.0-flash'},
+]
+
+
+def _names(providers):
+    return [p['name'] for p in providers]
+
+
+def _record_many(provider, model, outcome, latency, n=10, task_type="automation"):
+    for _ in range(n):
+        provider_health.record(provider, model, task_type, outcome, latency)
+
+
+def test_ewma_tracks_latency_and_rates():
+    provider_health.record("groq", "m", "automation", "success", 1.0)
+    provider_health.record("groq", "m", "automation", "json_error", 2.0, alpha=0.5)
+    row = provider_health.stats("automation")[("groq", "m")]
+    assert row["latency_ewma"] == pytest.approx(1.5)
+    assert row["json_error_rate"] == pytest.approx(0.5)
+    assert row["failure_rate"] == 0.0
+    assert row["samples"] == 2
+    assert provider_health.stats("coding") == {}
+
+
+def test_fast_failures_never_lower_latency():
+    provider_health.record("deepseek", "m", "automation", "success", 10.0)
+    provider_health.record("deepseek", "m", "automation", "failure", 0.1, alpha=0.5)
+    row = provider_health.stats("automation")[("deepseek", "m")]
+    assert row["latency_ewma"] == pytest.approx(10.0)
+    assert row["failure_rate"] == pytest.approx(0.5)
+
+
+def test_unknown_outcome_rejected():
+    with pytest.raises(ValueError):
+        provider_health.record("groq", "m", "automation", "timeout")
+
+
+def test_configured_order_kept_without_data():
+    ordered, skipped, ranking = provider_health.rank("automation", EFFICIENCY)
+    assert _names(ordered) == ['deepseek', 'groq', 'gemini-paid']
+    assert skipped == []
+    assert [r["samples"] for r in ranking] == [0, 0, 0]
+
+
+def test_slow_unreliable_provider_moves_down():
+    _record_many("deepseek", "deepseek-chat", "failure", 30.0, n=3)
+    _record_many("deepseek", "deepseek-chat", "success", 30.0, n=3)
+    _record_many("groq", "llama-3.3-70b-versatile", "success", 1.0)
+    ordered, skipped, ranking = provider_health.rank("automation", EFFICIENCY)
+    assert _names(ordered) == ['groq', 'gemini-paid', 'deepseek']
+    assert skipped == []
+    assert ranking[0]["provider"] == 'groq' and ranking[0]["score"] < ranking[-1]["score"]
+
+
+def test_json_error_rate_only_counts_for_json_calls():
+    _record_many("deepseek", "deepseek-chat", "json_error", 1.0)
+    _record_many("groq", "llama-3.3-70b-versatile", "success", 1.0)
+    assert _names(provider_health.rank("automation", EFFICIENCY[:2])[0]) == ['deepseek', 'groq']
+    assert _names(provider_health.rank("automation", EFFICIENCY[:2], require_json=True)[0]) == ['groq', 'deepseek']
+
+
+def test_failing_provider_skipped_until_probe_window():
+    _record_many("deepseek", "deepseek-chat", "failure", 20.0)
+    ordered, skipped, ranking = provider_health.rank("automation", EFFICIENCY)
+    assert _names(skipped) == ['deepseek']
+    assert 'deepseek' not in _names(ordered)
+    assert ranking[-1] == {**ranking[-1], "provider": "deepseek", "skipped": True}
+
+    with patch('toolbox.lib.provider_health.time.time', return_value=provider_health.time.time() + 301):
+        ordered, skipped, _ = provider_health.rank("automation", EFFICIENCY)
+    assert skipped == [] and 'deepseek' in _names(ordered)
+
+
+def test_all_unhealthy_providers_still_tried():
+    for p in EFFICIENCY:
+        _record_many(p['name'], p['model'], "failure", 5.0)
+    ordered, skipped, _ = provider_health.rank("automation", EFFICIENCY)
+    assert len(ordered) == 3 and skipped == []
+
+
+@pytest.fixture
+def log_path(tmp_path, mocker):
+    path = tmp_path / "llm_routing.jsonl"
+    mocker.patch('toolbox.lib.llm_gateway.LLM_LOG_PATH', str(path))
+    return path
+
+
+@pytest.fixture
+def gateway(mocker, log_path):
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+    gw = LLMGateway()
+    gw.config['tiers']['efficiency'] = {'providers': EFFICIENCY}
+    gw.config['adaptive'] = {'enabled': True}
+    return gw
+
+
+def _providers_by_name(answers):
+    def build(cfg):
+        provider = MagicMock()
+        provider.supports.return_value = True
+        provider.analyze.side_effect = answers[cfg['name']]
+        return provider
+    return build
+
+
+def test_gateway_skips_failing_provider_and_logs_ranking(gateway, log_path, mocker):
+    _record_many("deepseek", "deepseek-chat", "failure", 30.0)
+    called = []
+    def groq_answer(*_):
+        called.append('groq')
+        return ('{"ok": true}', 5)
+    mocker.patch.object(gateway, '_get_provider_instance', side_effect=_providers_by_name({
+        'deepseek': AssertionError("deepseek should be skipped"), 'groq': groq_answer, 'gemini-paid': groq_answer}))
+
+    result = gateway.call("automation", "hello", require_json=True, use_cache=False)
+    log_sink.flush()
+
+    assert result['provider'] == 'groq' and called == ['groq']
+    entry = json.loads(log_path.read_text().splitlines()[-1])
+    assert [r['provider'] for r in entry['ranking']] == ['groq', 'gemini-paid', 'deepseek']
+    assert entry['ranking'][-1]['skipped'] is True
+    assert provider_health.stats("automation")[("groq", "llama-3.3-70b-versatile")]["samples"] == 1
+
+
+def test_gateway_records_failures_and_json_errors(gateway, mocker):
+    mocker.patch.object(gateway, '_get_provider_instance', side_effect=_providers_by_name({
+        'deepseek': ValueError("boom"), 'groq': [('not json', 3)], 'gemini-paid': [('{"ok": 1}', 4)]}))
+
+    assert gateway.call("automation", "hello", require_json=True, use_cache=False)['provider'] == 'gemini-paid'
+
+    known = provider_health.stats("automation")
+    assert known[("deepseek", "deepseek-chat")]["failure_rate"] == 1.0
+    assert known[("groq", "llama-3.3-70b-versatile")]["json_error_rate"] == 1.0
+    assert known[("gemini-paid", "gemini-2.0-flash")]["failure_rate"] == 0.0
+
+
+def test_adaptive_disabled_keeps_static_order_and_log(gateway, log_path, mocker):
+    gateway.config['adaptive'] = {'enabled': False}
+    _record_many("deepseek", "deepseek-chat", "failure", 30.0)
+    mocker.patch.object(gateway, '_get_provider_instance', side_effect=_providers_by_name({
+        'deepseek': [('{"ok": 1}', 2)], 'groq': [], 'gemini-paid': []}))
+
+    assert gateway.call("automation", "hello", use_cache=False)['provider'] == 'deepseek'
+    log_sink.flush()
+    assert 'ranking' not in json.loads(log_path.read_text().splitlines()[-1])
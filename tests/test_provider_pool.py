@@ -0,0 +1,87 @@
+import pytest
+from unittest.mock import patch
+import requests
+from toolbox.lib.llm_gateway import LLMGateway, _is_connection_error
+from toolbox.lib.providers.ollama import OllamaProvider
+from toolbox.lib.providers.deepseek import DeepSeekProvider
+
+OLLAMA = {'name': 'ollama', 'model': 'gemma4:e2b'}
+
+
+@pytest.fixture
+def gateway():
+    gw = LLMGateway()
+    gw.deepseek_key = 'ds-key'
+    gw.gemini_paid_key = 'paid-key'
+    return gw
+
+
+def test_provider_reused_across_calls_and_gateways(gateway):
+    first = gateway._get_provider_instance(OLLAMA)
+    assert gateway._get_provider_instance(OLLAMA) is first
+    assert LLMGateway()._get_provider_instance(OLLAMA) is first
+
+
+def test_pool_keyed_by_model_and_key(gateway):
+    a = gateway._get_provider_instance({'name': 'deepseek', 'model': 'deepseek-chat'})
+    b = gateway._get_provider_instance({'name': 'deepseek', 'model': 'deepseek-reasoner'})
+    assert a is not b
+    gateway.deepseek_key = 'rotated-key'
+    assert gateway._get_provider_instance({'name': 'deepseek', 'model': 'deepseek-chat'}) is not a
+
+
+def test_missing_key_still_raises(gateway):
+    gateway.gemini_free_key = None
+    with pytest.raises(ValueError, match="Gemini Free key missing"):
+        gateway._get_provider_instance({'name': 'gemini-free', 'model': 'gemini-2.5-flash-lite'})
+
+
+def test_idle_client_rebuilt(gateway):
+    gateway.config['clients'] = {'max_idle_sec': 60}
+    with patch('toolbox.lib.llm_gateway.time.monotonic', return_value=1000.0):
+        first = gateway._get_provider_instance(OLLAMA)
+    with patch('toolbox.lib.llm_gateway.time.monotonic', return_value=1030.0):
+        assert gateway._get_provider_instance(OLLAMA) is first
+    with patch('toolbox.lib.llm_gateway.time.monotonic', return_value=1100.0):
+        assert gateway._get_provider_instance(OLLAMA) is not first
+
+
+def test_pool_sized_from_concurrency_config(gateway):
+    gateway.config['concurrency'] = {'providers': {'ollama': 3}}
+    provider = gateway._get_provider_instance(OLLAMA)
+    assert provider._session.get_adapter('http://localhost:11434')._pool_maxsize == 3
+
+
+def test_deepseek_client_built_once():
+    provider = DeepSeekProvider(model_name='deepseek-chat', api_key='k', pool_size=2)
+    assert provider._gateway_client() is provider._gateway_client()
+
+
+def test_ollama_uses_keep_alive_session():
+    provider = OllamaProvider(model_name='m', pool_size=1)
+    with patch.object(provider._session, 'post') as post:
+        post.return_value.status_code = 200
+        post.return_value.json.return_value = {'response': 'ok', 'prompt_eval_count': 1, 'eval_count': 2}
+        assert provider.analyze(b'x', 'text/plain', 'p') == ('ok', 3)
+        assert provider.analyze(b'y', 'text/plain', 'p') == ('ok', 3)
+    assert post.call_count == 2
+
+
+def test_connection_error_discards_pooled_client(gateway, mocker):
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+    gateway.config['tiers']['cheapest']['providers'] = [OLLAMA]
+    broken = gateway._get_provider_instance(OLLAMA)
+    mocker.patch.object(broken._session, 'post', side_effect=requests.exceptions.ConnectionError("reset"))
+
+    with pytest.raises(RuntimeError):
+        gateway.call("heartbeat", "ping")
+    assert gateway._get_provider_instance(OLLAMA) is not broken
+
+
+def test_is_connection_error():
+    assert _is_connection_error(ConnectionResetError())
+    assert _is_connection_error(requests.exceptions.ConnectionError("x"))
+    assert _is_connection_error(RuntimeError("Ollama not reachable"))
+    assert not _is_connection_error(ValueError("bad json"))
@@ -9,7 +9,10 @@ Covers:
   - Execute Medium confidence: rename only, no move
   - Execute Low confidence: nothing
   - Recursive subfolder scan
+  - Staged pipeline: per-thread download clients, in-order commits, limits
 """
+import threading
+import time
 import unittest
 from unittest.mock import MagicMock, patch, call
 from datetime import datetime, timedelta, timezone
@@ -624,3 +627,50 @@ class TestCliCompatibility(unittest.TestCase):
 
         self.assertTrue(args.inbox)
         self.assertTrue(args.execute)
+
+
+class TestScanFolderPipeline(unittest.TestCase):
+
+    def setUp(self):
+        from toolbox.services.drive_organizer import main
+        main.stats = main.RunStats()
+
+    def test_download_threads_get_their_own_client_and_commit_in_order(self):
+        from toolbox.services.drive_organizer import main
+
+        files = [_make_file(f'doc{i}.txt', fid=f'id_{i}') for i in range(6)]
+        svc = _make_service(files)
+        factory_threads = []
+
+        def factory():
+            factory_threads.append(threading.current_thread().name)
+            return object()
+
+        def classify(**kwargs):
+            time.sleep(0.01)
+            return ({**ANALYSIS_HIGH, 'new_filename': f"2026-01-15 - X - {kwargs['filename']}"}, 'r', 10)
+
+        with patch.object(main, 'download_file_content', return_value=b'text') as mock_dl, \
+             patch.object(main, 'call_json_llm', side_effect=classify), \
+             patch.object(main, 'resolve_folder_id', return_value='id_target'), \
+             patch.object(main, 'get_category_prompt_str', return_value='folders...'), \
+             patch.object(main, 'check_duplicate', return_value=(None, None)), \
+             patch.object(main, 'post_process_memory'), \
+             patch.object(main, 'send_message'), \
+             patch.object(main, 'move_file', return_value=True) as mock_move:
+            main.scan_folder('id_inbox', dry_run=False, service=svc, recursive=False,
+                             service_factory=factory)
+
+        self.assertTrue(all(name.startswith('sorter-dl') for name in factory_threads))
+        self.assertNotIn(svc, [c.args[0] for c in mock_dl.call_args_list])
+        self.assertEqual([c.args[1] for c in mock_move.call_args_list], [f['id'] for f in files])
+        self.assertEqual(main.stats.processed, 6)
+
+    def test_limit_counts_committed_files(self):
+        from toolbox.services.drive_organizer import main
+
+        files = [{'id': f'id_{i}', 'name': f'n{i}.txt', 'mimeType': 'text/plain'} for i in range(10)]
+        _run_scan(files, dry_run=True, limit=4)
+        self.assertEqual(main.stats.processed, 4)
+
+
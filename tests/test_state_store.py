@@ -0,0 +1,170 @@
+import json
+import os
+import sqlite3
+import pytest
+
+from toolbox.lib import state_store
+from toolbox.lib.state_store import StateStore
+
+
+def _rows(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_processed_ids_buffer_until_commit():
+    store = StateStore()
+    analyzed = store.processed("sorter.analyzed")
+    analyzed["f1"] = "2024-01-01 - A - B.pdf"
+    assert analyzed["f1"] == "2024-01-01 - A - B.pdf"
+    assert not os.path.exists(state_store.STATE_DB_PATH)  # dry run never hits disk
+
+    store.commit()
+    fresh = StateStore().processed("sorter.analyzed")
+    assert dict(fresh) == {"f1": "2024-01-01 - A - B.pdf"}
+
+
+def test_failure_cooldowns_delete_and_setdefault_semantics():
+    store = StateStore()
+    failures = store.failures("sorter.failed")
+    failures["a"] = {"failure_count": 1, "next_retry_at": "2030-01-01T00:00:00+00:00"}
+    failures["b"] = {"failure_count": 2}
+    store.commit()
+
+    store = StateStore()
+    failures = store.failures("sorter.failed")
+    assert failures.get("a")["failure_count"] == 1
+    failures.pop("a", None)
+    failures.pop("missing", None)
+    assert "a" not in failures
+    store.commit()
+
+    assert set(StateStore().failures("sorter.failed")) == {"b"}
+
+
+def test_queue_pop_is_fifo_and_commit_deletes_consumed_range():
+    store = StateStore()
+    queue = store.queue("backfill")
+    queue.extend([{"id": f"f{i}"} for i in range(5)])
+    store.commit()
+
+    store = StateStore()
+    queue = store.queue("backfill")
+    assert len(queue) == 5
+    assert [queue.pop(0)["id"] for _ in range(2)] == ["f0", "f1"]
+    queue.append({"id": "f5"})
+    assert len(queue) == 4
+    store.commit()
+
+    store = StateStore()
+    queue = store.queue("backfill")
+    assert [item["id"] for item in queue] == ["f2", "f3", "f4", "f5"]
+    while queue:
+        queue.pop(0)
+    store.commit()
+    assert _rows(state_store.STATE_DB_PATH, "queue_items") == 0
+
+
+def test_document_only_writes_changed_keys():
+    with StateStore() as store:
+        store.save_document("mail", {"last_run": "2024-01-01", "pending": ["a"]})
+        store.commit()
+
+    with StateStore() as a:
+        mine = a.document("mail")
+    # Another process updates a different key in between
+    with StateStore() as b:
+        theirs = b.document("mail")
+        theirs["pending"] = ["a", "b"]
+        b.save_document("mail", theirs)
+        b.commit()
+
+    mine["last_run"] = "2024-01-02"
+    with StateStore() as a:
+        a.save_document("mail", mine)
+        a.commit()
+
+    with StateStore() as store:
+        assert store.document("mail") == {"last_run": "2024-01-02", "pending": ["a", "b"]}
+
+
+def test_migrate_json_imports_once(tmp_path):
+    legacy = tmp_path / "legacy.json"
+    legacy.write_text(json.dumps({"analyzed_ids": {"f1": "x.pdf"}}))
+
+    def importer(store, data):
+        store.processed("ns.analyzed").replace(data["analyzed_ids"])
+
+    assert StateStore().migrate_json("ns", str(legacy), importer) is True
+    legacy.write_text(json.dumps({"analyzed_ids": {"f2": "y.pdf"}}))
+    assert StateStore().migrate_json("ns", str(legacy), importer) is False
+    assert dict(StateStore().processed("ns.analyzed")) == {"f1": "x.pdf"}
+
+
+def test_backfill_state_roundtrip(tmp_path, monkeypatch):
+    import toolbox.services.drive_organizer.backfill as bf
+    monkeypatch.setattr(bf, "STATE_PATH", str(tmp_path / "backfill_state.json"))
+
+    state = bf.load_state()
+    assert len(state["pending"]) == 0
+    state["pending"] = [{"id": "f1"}, {"id": "f2"}, {"id": "f3"}]
+    state["changes_page_token"] = "tok"
+    bf.save_state(state)
+
+    state["pending"].pop(0)
+    state["total_processed"] = 1
+    bf.save_state(state)
+
+    state = bf.load_state()
+    assert [item["id"] for item in state["pending"]] == ["f2", "f3"]
+    assert state["changes_page_token"] == "tok"
+    assert state["total_processed"] == 1
+
+
+def test_migrate_json_unreadable_legacy_file_is_retried(tmp_path):
+    legacy = tmp_path / "legacy.json"
+    legacy.write_text('{"last_run": "2024-01-0')
+
+    def importer(store, data):
+        store.save_document("mail", data)
+
+    with pytest.raises(RuntimeError):
+        StateStore().migrate_json("mail", str(legacy), importer)
+
+    legacy.write_text(json.dumps({"last_run": "2024-01-02"}))
+    assert StateStore().migrate_json("mail", str(legacy), importer) is True
+    assert StateStore().document("mail") == {"last_run": "2024-01-02"}
+
+
+def test_migrate_json_marker_and_data_commit_together(tmp_path, monkeypatch):
+    legacy = tmp_path / "legacy.json"
+    legacy.write_text(json.dumps({"analyzed_ids": {"f1": "x.pdf"}}))
+
+    def importer(store, data):
+        store.processed("ns.analyzed").replace(data["analyzed_ids"])
+
+    def broken_flush(self, conn):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    from toolbox.lib.state_store import ProcessedIds
+    with monkeypatch.context() as m:
+        m.setattr(ProcessedIds, "_flush", broken_flush)
+        with pytest.raises(sqlite3.OperationalError):
+            StateStore().migrate_json("ns", str(legacy), importer)
+
+    assert StateStore().migrate_json("ns", str(legacy), importer) is True
+    assert dict(StateStore().processed("ns.analyzed")) == {"f1": "x.pdf"}
+
+
+def test_keyed_view_subclass_must_implement_row_mapping():
+    class Incomplete(state_store._KeyedView):
+        table = "processed_ids"
+
+        def _select(self, key):
+            return None
+
+    with StateStore() as store, pytest.raises(TypeError):
+        Incomplete(store, "ns")
@@ -0,0 +1,101 @@
+import io
+import json
+import pytest
+from unittest.mock import MagicMock
+from toolbox.lib import token_estimator
+from toolbox.lib.llm_gateway import LLMGateway
+
+
+@pytest.fixture(autouse=True)
+def reset_estimator():
+    token_estimator.configure(None)
+    yield
+    token_estimator.configure(None)
+
+
+def test_prose_close_to_len_over_four():
+    text = "Please summarise the attached invoice and list the line items. " * 50
+    tokens = token_estimator.estimate_text(text, family='gemini')
+    assert 0.8 * len(text) / 4 < tokens < 1.3 * len(text) / 4
+
+
+def test_dense_json_counts_higher_than_len_over_four():
+    payload = json.dumps([{"id": f"18c{i:05x}ab", "amount": i * 3.17, "sku": f"X-{i}"} for i in range(200)])
+    assert token_estimator.estimate_text(payload) > len(payload) / 4
+
+
+def test_long_unbroken_runs_are_not_one_token():
+    assert token_estimator.estimate_text("a" * 4000) > 1000
+
+
+def test_cjk_counts_per_character():
+    assert token_estimator.estimate_text("請求書を確認してください" * 10) >= 100
+
+
+def test_family_for():
+    assert token_estimator.family_for('gemini-free', 'gemini-2.5-flash') == 'gemini'
+    assert token_estimator.family_for('groq', 'llama-3.3-70b-versatile') == 'llama'
+    assert token_estimator.family_for('ollama', 'qwen2.5:7b') == 'llama'
+    assert token_estimator.family_for('deepseek', 'deepseek-chat') == 'deepseek'
+    assert token_estimator.family_for('other', 'x') == token_estimator.DEFAULT_FAMILY
+
+
+def test_calibration_from_config():
+    text = "hello world " * 100
+    base = token_estimator.estimate_text(text, family='gemini')
+    token_estimator.configure({'calibration': {'gemini': 2.0}})
+    assert token_estimator.estimate_text(text, family='gemini') == pytest.approx(2 * base, rel=0.02)
+
+
+def test_register_custom_estimator():
+    token_estimator.register('gemini', lambda text: 42)
+    assert token_estimator.estimate_text("anything", family='gemini') == 42
+    assert token_estimator.estimate_text("anything", family='llama') != 42
+
+
+def test_missing_tiktoken_encoding_falls_back_to_heuristic():
+    token_estimator.configure({'tokenizers': {'gemini': 'no-such-encoding'}})
+    assert token_estimator.estimate_text("hello world", family='gemini') == \
+        token_estimator.heuristic_tokens("hello world")
+
+
+def test_estimates_are_memoized():
+    calls = []
+    token_estimator.register('gemini', lambda text: calls.append(text) or 7)
+    for _ in range(3):
+        assert token_estimator.estimate_text("same prompt", family='gemini') == 7
+    assert len(calls) == 1
+
+
+def test_pdf_counted_per_page():
+    pdf = b"%PDF-1.4\n" + b"".join(b"<< /Type /Page /Parent 2 0 R >>\n" for _ in range(3)) + b"<< /Type /Pages >>"
+    assert token_estimator.estimate_content(pdf, 'application/pdf') == 3 * token_estimator.TOKENS_PER_PDF_PAGE
+
+
+def test_image_counted_per_tile():
+    Image = pytest.importorskip("PIL.Image")
+    buf = io.BytesIO()
+    Image.new('RGB', (1600, 800)).save(buf, format='PNG')
+    # 3 x 2 tiles of 768px
+    assert token_estimator.estimate_content(buf.getvalue(), 'image/png') == 6 * token_estimator.TOKENS_PER_IMAGE_TILE
+
+
+def test_text_content_counted_like_prompt():
+    body = "line item, 12.50, USD\n" * 100
+    assert token_estimator.estimate_content(body.encode(), 'text/csv') == token_estimator.estimate_text(body)
+
+
+def test_attachment_tokens_drive_long_context_routing(mocker):
+    mocker.patch('toolbox.lib.quota_manager.get_total_usd_used', return_value=0.0)
+    mocker.patch('toolbox.lib.quota_manager.get_degraded_providers', return_value=[])
+    mocker.patch('toolbox.lib.quota_manager.record_llm_usage')
+    gateway = LLMGateway()
+    provider = MagicMock()
+    provider.supports.return_value = True
+    provider.analyze.return_value = ("ok", 10)
+    mocker.patch.object(gateway, '_get_provider_instance', return_value=provider)
+
+    # ~1000 pages: small prompt, but far over the long-context threshold once the PDF is counted
+    pdf = b"%PDF-1.4\n" + b"<< /Type /Page >>\n" * 1000
+    res = gateway.call("automation", "Summarise this document.", content_bytes=pdf, mime_type='application/pdf')
+    assert res['tier'] == 'long-context'
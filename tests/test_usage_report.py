@@ -38,3 +38,26 @@ def test_format_summary_mentions_source_totals():
     assert "openclaw" in report
     assert "3,000 tokens" in report
     assert "~$0.0600" in report
+
+
+def test_format_cache_summary_reports_hit_rate():
+    stats = {
+        "automation": {"hits": 3, "misses": 1},
+        "high-stakes": {"hits": 0, "misses": 4},
+    }
+
+    report = usage_report.format_cache_summary(stats, days=7)
+
+    assert "automation: 3/4 hits (75.0%)" in report
+    assert "Total: 3/8 hits (37.5%)" in report
+
+
+def test_format_routing_summary_reports_errors_and_latency():
+    totals = {
+        "groq": {"attempts": 10, "successes": 8, "errors": 2, "json_errors": 1, "cache_hits": 3,
+                 "tokens": 500, "cost": 0.0, "p50_sec": 0.42, "p95_sec": 3.1},
+    }
+
+    report = usage_report.format_routing_summary(totals, days=7)
+
+    assert "groq: 8/10 ok, 2 errors (1 JSON), 3 cache hits, p50 0.42s, p95 3.10s" in report
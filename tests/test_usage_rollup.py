@@ -0,0 +1,119 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from toolbox.bin import usage_report
+from toolbox.lib import usage_rollup
+
+TODAY = datetime.now(timezone.utc).isoformat()
+
+
+@pytest.fixture
+def ledgers(tmp_path, monkeypatch):
+    cost = tmp_path / "cost_log.jsonl"
+    routing = tmp_path / "llm_routing.jsonl"
+    monkeypatch.setattr("toolbox.lib.quota_manager.COST_LOG_PATH", str(cost))
+    monkeypatch.setattr("toolbox.lib.llm_gateway.LLM_LOG_PATH", str(routing))
+    return cost, routing
+
+
+def _append(path, *records):
+    with open(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def _cost(source="sorter", tokens=100, usd=0.01, **extra):
+    return {"timestamp": TODAY, "source": source, "tokens_used": tokens, "cost_usd_est": usd, **extra}
+
+
+def _attempt(provider="groq", result="success", latency=0.5, **extra):
+    return {"timestamp": TODAY, "source": "lib/ai_engine", "provider": provider, "model": "m",
+            "actual_tokens": 10, "cost_usd": 0.001, "result": result, "latency_sec": latency, **extra}
+
+
+def test_cost_totals_match_full_scan(ledgers):
+    cost, _ = ledgers
+    records = [_cost("openclaw", 1000, 0.02), _cost("sorter", 500, 0.01), _cost("openclaw", 200, 0.005),
+               {"date": "2020-01-01", "run_type": "backfill", "tokens_used": 7, "cost_usd_est": 0.0}]
+    _append(cost, *records)
+
+    assert usage_rollup.refresh() == 4
+    for days in (7, None):
+        expected = usage_report.summarize_cost_records(records, days=days)
+        got = usage_rollup.cost_totals(days=days)
+        assert got.keys() == expected.keys()
+        for source in expected:
+            assert got[source]["records"] == expected[source]["records"]
+            assert got[source]["tokens"] == expected[source]["tokens"]
+            assert got[source]["cost"] == pytest.approx(expected[source]["cost"])
+
+
+def test_refresh_reads_only_new_complete_lines(ledgers):
+    cost, _ = ledgers
+    _append(cost, _cost(), _cost())
+    assert usage_rollup.refresh() == 2
+    assert usage_rollup.refresh() == 0
+
+    with open(cost, "a") as f:
+        f.write(json.dumps(_cost(tokens=5)) + "\n" + json.dumps(_cost(tokens=7))[:20])
+    assert usage_rollup.refresh() == 1
+    with open(cost, "a") as f:
+        f.write(json.dumps(_cost(tokens=7))[20:] + "\n")
+    assert usage_rollup.refresh() == 1
+    assert usage_rollup.cost_totals()["sorter"]["tokens"] == 212
+
+
+def test_rotation_finishes_old_generation_once(ledgers):
+    cost, _ = ledgers
+    _append(cost, _cost(tokens=1))
+    usage_rollup.refresh()
+    _append(cost, _cost(tokens=2))
+    os.replace(cost, f"{cost}.1")
+    _append(cost, _cost(tokens=4))
+
+    assert usage_rollup.refresh() == 2
+    assert usage_rollup.refresh() == 0
+    assert usage_rollup.cost_totals()["sorter"] == {"records": 3, "tokens": 7, "cost": pytest.approx(0.03)}
+
+
+def test_truncated_ledger_restarts_from_zero(ledgers):
+    cost, _ = ledgers
+    _append(cost, _cost(), _cost(), _cost())
+    usage_rollup.refresh()
+    with open(cost, "w") as f:
+        f.write(json.dumps(_cost(tokens=9)) + "\n")
+    assert usage_rollup.refresh() == 1
+    assert usage_rollup.cost_totals()["sorter"]["records"] == 4
+
+
+def test_routing_totals_count_errors_cache_hits_and_latency(ledgers):
+    _, routing = ledgers
+    _append(routing, *[_attempt(latency=0.2) for _ in range(90)], *[_attempt(latency=4.0) for _ in range(10)],
+            _attempt(result="json_error"), _attempt(result="rate_limit"), _attempt(result="cache_hit", latency=0),
+            _attempt(provider="deepseek", result="error", latency=30.0))
+    usage_rollup.refresh()
+
+    groq = usage_rollup.routing_totals()["groq"]
+    assert (groq["attempts"], groq["successes"], groq["errors"], groq["json_errors"], groq["cache_hits"]) == (103, 100, 2, 1, 1)
+    assert groq["p50_sec"] == pytest.approx(0.2, rel=0.25)
+    assert groq["p95_sec"] == pytest.approx(4.0, rel=0.25)
+    assert usage_rollup.routing_totals()["deepseek"]["p95_sec"] == 0.0
+    assert set(usage_rollup.routing_totals(by="source")) == {"lib/ai_engine"}
+
+
+def test_days_window_and_group_validation(ledgers):
+    cost, _ = ledgers
+    _append(cost, _cost(), {"timestamp": "2020-01-01T00:00:00+00:00", "source": "old", "tokens_used": 1})
+    usage_rollup.refresh()
+    assert set(usage_rollup.cost_totals(days=7)) == {"sorter"}
+    assert set(usage_rollup.cost_totals(days=None)) == {"sorter", "old"}
+    with pytest.raises(ValueError):
+        usage_rollup.cost_totals(by="tokens; DROP TABLE cost_daily")
+
+
+def test_queries_before_any_refresh_are_empty(ledgers):
+    assert usage_rollup.cost_totals() == {}
+    assert usage_rollup.routing_totals() == {}
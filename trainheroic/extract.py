@@ -122,27 +122,10 @@ def load_health_folder_id():
 
 def get_or_create_drive_folder(service, subfolder_path, parent_id):
     """Create nested subfolders under an existing parent. Returns folder ID."""
-    for folder_name in subfolder_path.split("/"):
-        query = (
-            f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' "
-            f"and '{parent_id}' in parents and trashed=false"
-        )
-        results = service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get("files", [])
-
-        if files:
-            parent_id = files[0]["id"]
-        else:
-            metadata = {
-                "name": folder_name,
-                "mimeType": "application/vnd.google-apps.folder",
-                "parents": [parent_id],
-            }
-            folder = service.files().create(body=metadata, fields="id").execute()
-            parent_id = folder["id"]
-            logger.info("Created Drive folder: %s", folder_name)
+    # Resolved through the shared toolbox folder path cache (sys.path set up by get_drive_service)
+    from toolbox.lib.drive_utils import resolve_folder_path
 
-    return parent_id
+    return resolve_folder_path(service, subfolder_path, parent_id)
 
 
 def sanitize_filename(name):
@@ -313,13 +296,16 @@ def extract_with_gemini(image_bytes, api_key, filename="screenshot.png"):
         return None
 
 
-def upload_json(drive_service, folder_id, filename, data):
-    """Upload extracted JSON to Drive. Returns file ID."""
+def upload_json(drive_service, folder_id, filename, data, file_id=None):
+    """Upload extracted JSON to Drive. Returns file ID. With file_id, that file is updated in place."""
     from googleapiclient.http import MediaFileUpload
 
     # Check if already exists
-    query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
-    existing = drive_service.files().list(q=query, fields="files(id)").execute().get("files", [])
+    if file_id:
+        existing = [{"id": file_id}]
+    else:
+        query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
+        existing = drive_service.files().list(q=query, fields="files(id)").execute().get("files", [])
 
     with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".json", encoding="utf-8") as tmp:
         json.dump(data, tmp, indent=2, default=str)
@@ -376,6 +362,17 @@ def move_file_to_folder(drive_service, file_id, current_parent_id, target_folder
     ).execute()
 
 
+def new_drive_batch(drive_service):
+    """DriveBatch from the toolbox lib, for coalescing many updates into HTTP batch calls."""
+    for p in [str(TOOLBOX_ROOT), str(TOOLBOX_ROOT.parent)]:
+        if p not in sys.path:
+            sys.path.insert(0, p)
+
+    from toolbox.lib.drive_utils import DriveBatch
+
+    return DriveBatch(drive_service)
+
+
 def get_month_folder_id(drive_service, root_folder_id, date_str):
     """Get or create the {YYYY}/{MM} subfolder under root for a given date string.
 
@@ -460,11 +457,18 @@ def extract_screenshots(drive_service, api_key, root_folder_id, dry_run=False, f
         # Move screenshot to month subfolder and rename
         new_ss_name = f"{base_name}.png"
         current_parent = ss.get("_parent_id", root_folder_id)
+        # Move and rename go out as a single update
+        update = {"fileId": ss["id"], "body": {}}
         if current_parent != month_folder_id:
-            move_file_to_folder(drive_service, ss["id"], current_parent, month_folder_id)
-            logger.info("Moved screenshot to month folder")
+            update.update(addParents=month_folder_id, removeParents=current_parent, fields="id, parents")
         if ss["name"] != new_ss_name:
-            rename_drive_file(drive_service, ss["id"], new_ss_name)
+            update["body"]["name"] = new_ss_name
+        if len(update) > 2 or update["body"]:
+            drive_service.files().update(**update).execute()
+            if current_parent != month_folder_id:
+                logger.info("Moved screenshot to month folder")
+            if ss["name"] != new_ss_name:
+                logger.info("Renamed → %s", new_ss_name)
 
         all_extracted.append(data)
 
@@ -478,6 +482,7 @@ def reorganize_files(drive_service, root_folder_id, dry_run=False):
     json_files = list_existing_jsons(drive_service, all_folder_ids)
     logger.info("Found %d JSON files to check for reorganization", len(json_files))
 
+    batch = None if dry_run else new_drive_batch(drive_service)
     moved_count = 0
     for jf in json_files:
         try:
@@ -508,8 +513,9 @@ def reorganize_files(drive_service, root_folder_id, dry_run=False):
                 target_path = "unknown"
             logger.info("[DRY RUN] %s → %s/", jf["name"], target_path)
         else:
-            move_file_to_folder(drive_service, jf["id"], current_parent, month_folder_id)
-            logger.info("Moved %s to month folder", jf["name"])
+            batch.add(f"json:{jf['id']}", drive_service.files().update(
+                fileId=jf["id"], addParents=month_folder_id, removeParents=current_parent, fields="id, parents",
+            ))
 
             # Also move the source screenshot if it exists
             source_ss_id = data.get("_source", {}).get("drive_file_id")
@@ -521,15 +527,27 @@ def reorganize_files(drive_service, root_folder_id, dry_run=False):
                     ).execute()
                     ss_parent = ss_info.get("parents", [root_folder_id])[0]
                     if ss_parent != month_folder_id:
-                        move_file_to_folder(
-                            drive_service, source_ss_id, ss_parent, month_folder_id
-                        )
-                        logger.info("Moved screenshot to month folder")
+                        batch.add(f"png:{source_ss_id}", drive_service.files().update(
+                            fileId=source_ss_id, addParents=month_folder_id, removeParents=ss_parent,
+                            fields="id, parents",
+                        ))
                 except Exception as e:
                     logger.warning("Could not move screenshot: %s", e)
 
         moved_count += 1
 
+    # All moves go out together in batched round trips
+    if batch is not None and len(batch):
+        for key, outcome in batch.execute().items():
+            kind, file_id = key.split(":", 1)
+            if outcome.ok:
+                logger.info("Moved %s %s to month folder", "screenshot" if kind == "png" else "JSON", file_id)
+            elif kind == "png":
+                logger.warning("Could not move screenshot %s: %s", file_id, outcome.error)
+            else:
+                logger.error("Could not move %s: %s", file_id, outcome.error)
+                moved_count -= 1
+
     logger.info("Reorganized %d files", moved_count)
 
 
@@ -542,6 +560,8 @@ def rename_existing_files(drive_service, root_folder_id, dry_run=False):
     # Track used names to add _pN suffix for multi-screenshot sessions
     used_names = {}  # base_name → count
     renamed_count = 0
+    batch = None if dry_run else new_drive_batch(drive_service)
+    screenshot_renames = {}  # batch key → (old name, new name, parent, json id, json name, data)
 
     # Sort by screenshot name so pages come in order
     def sort_key(jf):
@@ -580,7 +600,9 @@ def rename_existing_files(drive_service, root_folder_id, dry_run=False):
             if dry_run:
                 logger.info("[DRY RUN] %s → %s", jf["name"], target_json_name)
             else:
-                rename_drive_file(drive_service, jf["id"], target_json_name)
+                batch.add(f"json:{jf['id']}", drive_service.files().update(
+                    fileId=jf["id"], body={"name": target_json_name}
+                ))
             renamed_count += 1
 
         # Rename source screenshot if it still has old name
@@ -591,13 +613,35 @@ def rename_existing_files(drive_service, root_folder_id, dry_run=False):
             if dry_run:
                 logger.info("[DRY RUN] %s → %s", source_ss_name, target_ss_name)
             else:
-                try:
-                    rename_drive_file(drive_service, source_ss_id, target_ss_name)
-                    # Update the _source in the JSON to reflect new screenshot name
-                    data["_source"]["screenshot"] = target_ss_name
-                    upload_json(drive_service, current_parent, target_json_name, data)
-                except Exception as e:
-                    logger.warning("Could not rename screenshot %s: %s", source_ss_name, e)
+                key = f"png:{source_ss_id}"
+                batch.add(key, drive_service.files().update(fileId=source_ss_id, body={"name": target_ss_name}))
+                screenshot_renames[key] = (source_ss_name, target_ss_name, current_parent, jf["id"], target_json_name, data)
+
+    # Renames go out together in batched round trips; JSONs whose screenshot was
+    # renamed are re-uploaded afterwards so _source reflects the new name
+    results = batch.execute() if batch is not None and len(batch) else {}
+    for key, outcome in results.items():
+        if key in screenshot_renames:
+            source_ss_name, target_ss_name, parent_id, json_id, json_name, data = screenshot_renames[key]
+            if not outcome.ok:
+                logger.warning("Could not rename screenshot %s: %s", source_ss_name, outcome.error)
+                continue
+            logger.info("Renamed → %s", target_ss_name)
+            data["_source"]["screenshot"] = target_ss_name
+            json_outcome = results.get(f"json:{json_id}")
+            try:
+                if json_outcome is None or json_outcome.ok:
+                    upload_json(drive_service, parent_id, json_name, data)
+                else:
+                    # The JSON kept its old name; update it by id rather than creating a second file
+                    upload_json(drive_service, parent_id, json_name, data, file_id=json_id)
+            except Exception as e:
+                logger.warning("Could not update %s: %s", json_name, e)
+        elif outcome.ok:
+            logger.info("Renamed → %s", outcome.response.get("name", key) if outcome.response else key)
+        else:
+            logger.error("Could not rename %s: %s", key.split(":", 1)[1], outcome.error)
+            renamed_count -= 1
 
     logger.info("Renamed %d files", renamed_count)
 